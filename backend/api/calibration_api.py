@@ -4,10 +4,14 @@
 提供 ArUco 標記校正和投影機控制 API
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
 import time
+
 import cv2
 import numpy as np
+from fastapi import APIRouter, HTTPException, Response
+
+import config
 
 # 創建 API Router
 router = APIRouter()
@@ -21,12 +25,16 @@ aruco_detector = None
 projector_overlay = None
 calibrator = None
 ProjectorMode = None
+camera_frames = None
+
+# 預覽 JPEG 快取：每個檢測結果只疊加 / 編碼一次
+_preview_cache = {"key": None, "jpeg": None}
 
 
 def init_calibration_api(main_module):
     """初始化校正 API,從 main 模組導入必要的變數"""
     global calibration_state, projector_renderer, camera_state
-    global aruco_detector, projector_overlay, calibrator, ProjectorMode
+    global aruco_detector, projector_overlay, calibrator, ProjectorMode, camera_frames
     
     calibration_state = main_module.calibration_state
     projector_renderer = main_module.projector_renderer
@@ -35,6 +43,7 @@ def init_calibration_api(main_module):
     projector_overlay = main_module.projector_overlay
     calibrator = main_module.calibrator
     ProjectorMode = main_module.ProjectorMode
+    camera_frames = main_module.camera_frames
 
 
 # ==================== 測試端點 ====================
@@ -81,22 +90,33 @@ async def move_corner(data: dict):
     return {"status": "ok", "corner": corner, "offset": offset}
 
 
+async def _get_detection():
+    """
+    取得 ArUco 檢測結果
+
+    校正中直接使用捕獲循環快取的結果；沒有（或已過期）時，對捕獲循環發布的最新幀
+    在背景線程檢測一次並寫入快取。不直接讀取相機，避免與捕獲循環搶幀。
+    """
+    result = aruco_detector.get_last_result(max_age=config.CALIBRATION_RESULT_MAX_AGE_SEC)
+    if result is not None:
+        return result
+
+    _, camera_frame = await camera_frames.wait_fresh(config.CAMERA_FRAME_MAX_AGE_SEC, config.CAMERA_FRAME_WAIT_SEC)
+    if camera_frame is None:
+        raise HTTPException(status_code=500, detail="無法取得相機畫面（捕獲循環未執行）")
+
+    # 執行檢測（調試信息會在後端控制台輸出）
+    return await asyncio.to_thread(aruco_detector.update, camera_frame.image, camera_frame.frame_id)
+
+
 @router.get("/api/calibration/detect")
 async def detect_aruco_markers():
-    """檢測當前相機畫面中的 ArUco 標記"""
-    cap = camera_state.get("current_cap")
-    if cap is None:
-        raise HTTPException(status_code=500, detail="相機未初始化")
-    
-    ret, frame = cap.read()
-    if not ret:
-        raise HTTPException(status_code=500, detail="無法讀取相機畫面")
-    
+    """檢測當前相機畫面中的 ArUco 標記（讀取捕獲循環的最新檢測結果 / 最新幀）"""
     if aruco_detector is None:
         raise HTTPException(status_code=500, detail="ArUco 檢測器未初始化")
-    
-    # 執行檢測（調試信息會在後端控制台輸出）
-    corners = aruco_detector.detect(frame)
+
+    result = await _get_detection()
+    corners = result.corners
     
     if corners is None:
         # 返回更詳細的診斷信息
@@ -112,31 +132,41 @@ async def detect_aruco_markers():
         "detected": True,
         "corners": corners.tolist(),
         "marker_ids": [0, 1, 2, 3],
-        "message": "ArUco 標記檢測成功"
+        "message": "ArUco 標記檢測成功",
+        "frame_id": result.frame_id,
+        "age_ms": round((time.time() - result.timestamp) * 1000, 1),
+        "detection_ms": round(result.duration_ms, 1),
+        "detection_mode": result.mode,
     }
 
 
+def _render_preview(frame, corners) -> bytes:
+    if corners is not None and projector_overlay is not None:
+        frame = projector_overlay.draw_preview_overlay(frame, corners)
+    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buffer.tobytes()
+
+
 @router.get("/api/calibration/preview")
 async def get_calibration_preview():
-    """獲取校正預覽畫面"""
-    from fastapi import Response
-    
-    cap = camera_state.get("current_cap")
-    if cap is None:
-        raise HTTPException(status_code=500, detail="相機未初始化")
-    
-    ret, frame = cap.read()
-    if not ret:
-        raise HTTPException(status_code=500, detail="無法讀取相機畫面")
-    
-    if aruco_detector is not None:
-        corners = aruco_detector.detect(frame)
-        
-        if corners is not None and projector_overlay is not None:
-            frame = projector_overlay.draw_preview_overlay(frame, corners)
-    
-    ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-    return Response(content=buffer.tobytes(), media_type="image/jpeg")
+    """獲取校正預覽畫面（快取讀取：每個新的檢測結果只疊加 / 編碼一次）"""
+    if aruco_detector is None:
+        _, camera_frame = await camera_frames.wait_fresh(config.CAMERA_FRAME_MAX_AGE_SEC, config.CAMERA_FRAME_WAIT_SEC)
+        if camera_frame is None:
+            raise HTTPException(status_code=500, detail="無法取得相機畫面（捕獲循環未執行）")
+        jpeg = await asyncio.to_thread(_render_preview, camera_frame.image, None)
+        return Response(content=jpeg, media_type="image/jpeg")
+
+    result = await _get_detection()
+    key = (result.frame_id, result.timestamp)
+    if _preview_cache["key"] != key:
+        _preview_cache["jpeg"] = await asyncio.to_thread(_render_preview, result.frame, result.corners)
+        _preview_cache["key"] = key
+    return Response(
+        content=_preview_cache["jpeg"],
+        media_type="image/jpeg",
+        headers={"X-Detection-Age-Ms": f"{(time.time() - result.timestamp) * 1000:.0f}"},
+    )
 
 
 @router.post("/api/calibration/confirm")
@@ -163,7 +193,6 @@ async def confirm_calibration():
     dst_points = np.array(projector_corners, dtype="float32")
     
     calibrator.homography_matrix, _ = cv2.findHomography(src_points, dst_points)
-    np.save("calibration_matrix.npy", calibrator.homography_matrix)
     
     # 計算投影範圍
     xs = [p[0] for p in projector_corners]
@@ -175,13 +204,37 @@ async def confirm_calibration():
         "height": int(max(ys) - min(ys))
     }
     calibrator.set_projection_bounds(bounds)
+    calibrator.save_calibration()
     
     calibration_state["is_calibrating"] = False
     
     if projector_renderer is not None:
         projector_renderer.set_mode(ProjectorMode.IDLE)
     
-    return {"status": "ok", "message": "校正完成", "bounds": bounds}
+    return {
+        "status": "ok",
+        "message": "校正完成",
+        "bounds": bounds,
+        "profile": calibrator.get_profile_info()["profile"],
+    }
+
+
+@router.get("/api/calibration/profiles")
+async def list_calibration_profiles():
+    """列出所有相機 / 投影機校正設定檔與目前使用中的設定檔"""
+    if calibrator is None:
+        raise HTTPException(status_code=500, detail="Calibrator 未初始化")
+    profiles = calibrator.store.list_profiles() if calibrator.store is not None else []
+    return {"status": "ok", "active": calibrator.get_profile_info(), "profiles": profiles}
+
+
+@router.post("/api/calibration/profiles/select")
+async def select_calibration_profile(data: dict):
+    """切換校正設定檔（不改變實際開啟的相機）"""
+    if calibrator is None:
+        raise HTTPException(status_code=500, detail="Calibrator 未初始化")
+    calibrator.select_profile(data.get("camera_id"), data.get("projector_id"))
+    return {"status": "ok", "active": calibrator.get_profile_info()}
 
 
 # ==================== 投影機控制 API ====================
@@ -8,16 +8,25 @@
 from fastapi import APIRouter, Query, Response, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional, Annotated
+from collections import OrderedDict
+import asyncio
 import os
+import json
+import threading
 import cv2
 
 from fastapi import Body
-from core.error_codes import ERR_INTERNAL
+from core.error_codes import ERR_INTERNAL, ERR_INVALID_ARGUMENT, ERR_NOT_FOUND, create_error_response
 
 # 導入資料庫
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from database.database import Database
+from streaming.video_file import VideoFileResponse
+from streaming.replay_session import REPLAY_JPEG_QUALITY, ReplaySessionManager
+from streaming.seek_index import SeekIndex, load_or_build_seek_index, seek_capture
+from api.thumbnail_api import thumbnail_service
+import config
 
 # 創建 API Router
 router = APIRouter()
@@ -27,6 +36,17 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "recordings.db")
 db = Database(db_path)
 
+# 回放解碼器管理（多位觀眾共用解碼器）
+replay_sessions = ReplaySessionManager(
+    cache_mb=config.REPLAY_FRAME_CACHE_MB,
+    idle_timeout_sec=config.REPLAY_SESSION_IDLE_SEC,
+    max_rate=config.REPLAY_MAX_RATE
+)
+
+# 已載入的跳轉索引（LRU，(game_id, 影片 mtime) → SeekIndex；影片改寫後舊索引自然失效）
+_seek_indexes: "OrderedDict[tuple[str, float], SeekIndex]" = OrderedDict()
+_seek_indexes_lock = threading.Lock()
+
 # Global variables shared from main.py
 recording_manager = None
 
@@ -290,6 +310,11 @@ async def delete_recording(game_id: str):
                 }
             )
         
+        # 先關閉此錄影的回放解碼器（釋放檔案）
+        replay_sessions.close_game(game_id)
+        _forget_seek_index(game_id)
+        thumbnail_service.invalidate(game_id)
+        
         # 刪除資料庫記錄（級聯刪除）
         success = db.delete_recording(game_id)
         
@@ -584,12 +609,17 @@ async def get_stats_summary(
 @router.get("/replay/burnin/{game_id}.mjpg")
 async def replay_video_stream(
     game_id: str,
-    quality: str = Query("med", regex="^(low|med|high)$")
+    quality: str = Query("med", regex="^(low|med|high)$"),
+    session: str = Query("default", regex="^[A-Za-z0-9_-]{1,32}$"),
+    start_ms: Optional[float] = Query(None, ge=0)
 ):
     """
     影片回放串流（MJPEG 格式）
     
     符合 v1.5 P1 Replay 規範
+    - 同一 (game_id, session) 的觀眾共用一個解碼器與播放位置
+    - start_ms 只在該回放尚未建立時生效；加入既有回放請用控制 API 的 seek
+    - 依錄影 video_fps × 播放速率輸出，控制請用 /replay/sessions/{game_id}/control
     """
     try:
         # 檢查錄影是否存在
@@ -620,37 +650,30 @@ async def replay_video_stream(
                 }
             )
         
-        # 設定畫質參數
-        quality_settings = {
-            "low": 55,
-            "med": 75,
-            "high": 85
-        }
-        jpeg_quality = quality_settings.get(quality, 75)
+        # 取得（或建立）共用解碼器；開啟影片檔與載入跳轉索引在線程池執行
+        seek_index = await asyncio.to_thread(_get_seek_index, recording)
+        # start_ms 只在建立回放時生效，不會讓已在觀看的觀眾跳轉
+        replay = await asyncio.to_thread(
+            replay_sessions.get_or_create,
+            game_id, video_path, session, recording.get("video_fps"), seek_index, start_ms
+        )
         
         # 生成 MJPEG 串流
-        def generate_mjpeg():
-            cap = cv2.VideoCapture(video_path)
-            
+        async def generate_mjpeg():
+            subscriber = replay.subscribe(quality)
             try:
                 while True:
-                    ret, frame = cap.read()
-                    if not ret:
-                        # 影片結束，重新開始（循環播放）
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        continue
-                    
-                    # 編碼為 JPEG
-                    ret, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
-                    if not ret:
-                        continue
+                    jpeg = await subscriber.queue.get()
+                    if jpeg is None:
+                        # 回放已關閉（例如錄影被刪除）
+                        break
                     
                     # 輸出 MJPEG 幀
                     yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
             
             finally:
-                cap.release()
+                replay.unsubscribe(subscriber)
         
         return StreamingResponse(
             generate_mjpeg(),
@@ -670,12 +693,304 @@ async def replay_video_stream(
         )
 
 
-@router.get("/api/recordings/{game_id}/video")
+@router.get("/replay/sessions")
+async def list_replay_sessions():
+    """列出進行中的回放與 JPEG 快取統計"""
+    return replay_sessions.get_stats()
+
+
+@router.post("/replay/sessions/{game_id}/control")
+async def control_replay_session(
+    game_id: str,
+    request: Annotated[dict, Body(...)],
+    session: str = Query("default")
+):
+    """
+    回放控制（同一回放的所有觀眾同步）
+    
+    Body:
+    - {"action": "seek", "position_ms": 12000} 或 {"action": "seek", "frame": 360}
+    - {"action": "seek", "event_id": 42} 或 {"action": "seek", "timestamp": 1768461000.5}（經跳轉索引）
+    - {"action": "pause"} / {"action": "resume"}
+    - {"action": "rate", "rate": 2.0}
+    """
+    replay = replay_sessions.get(game_id, session)
+    if replay is None:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "error": {
+                    "code": ERR_NOT_FOUND,
+                    "message": "Replay session not found",
+                    "details": {"game_id": game_id, "session": session}
+                }
+            }
+        )
+    
+    action = request.get("action")
+    try:
+        if action == "seek":
+            if request.get("frame") is not None:
+                replay.seek(int(request["frame"]))
+            elif request.get("position_ms") is not None:
+                replay.seek_ms(float(request["position_ms"]))
+            elif request.get("event_id") is not None:
+                event = db.get_event(game_id, int(request["event_id"]))
+                if event is None:
+                    raise ValueError(f"Event not found: {request['event_id']}")
+                replay.seek_timestamp(event["timestamp"])
+            elif request.get("timestamp") is not None:
+                replay.seek_timestamp(float(request["timestamp"]))
+            else:
+                raise ValueError("seek requires 'position_ms', 'frame', 'event_id' or 'timestamp'")
+        elif action == "pause":
+            replay.pause()
+        elif action == "resume":
+            replay.resume()
+        elif action == "rate":
+            replay.set_rate(float(request.get("rate", 1.0)))
+        else:
+            raise ValueError(f"Unknown action: {action}")
+    except (TypeError, ValueError) as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": ERR_INVALID_ARGUMENT,
+                    "message": str(e),
+                    "details": {"action": action}
+                }
+            }
+        )
+    
+    return replay.get_state()
+
+
+def _get_seek_index(recording: dict) -> Optional[SeekIndex]:
+    """取得錄影的跳轉索引（快取；舊錄影第一次使用時建立）"""
+    game_id = recording["game_id"]
+    video_path = recording.get("video_path")
+    if not video_path:
+        return None
+    try:
+        key = (game_id, os.stat(video_path).st_mtime)
+    except OSError:
+        return None
+
+    with _seek_indexes_lock:
+        index = _seek_indexes.get(key)
+        if index is not None:
+            _seek_indexes.move_to_end(key)
+    if index is not None and index.matches(video_path):
+        return index
+
+    try:
+        index = load_or_build_seek_index(video_path, recording.get("video_fps"), recording.get("start_time"))
+    except Exception as e:
+        print(f"[SeekIndex] Failed to build index for {game_id}: {e}")
+        return None
+    with _seek_indexes_lock:
+        for stale in [k for k in _seek_indexes if k[0] == game_id]:
+            del _seek_indexes[stale]
+        _seek_indexes[key] = index
+        while len(_seek_indexes) > max(1, config.REPLAY_SEEK_INDEX_CACHE):
+            _seek_indexes.popitem(last=False)
+    return index
+
+
+def _forget_seek_index(game_id: str):
+    """移除錄影的所有已載入索引（刪除錄影時）"""
+    with _seek_indexes_lock:
+        for key in [k for k in _seek_indexes if k[0] == game_id]:
+            del _seek_indexes[key]
+
+
+def _resolve_seek_target(
+    game_id: str,
+    index: SeekIndex,
+    event_id: Optional[int],
+    timestamp: Optional[float],
+    frame: Optional[int]
+):
+    """
+    解析跳轉目標（event_id / timestamp / frame 擇一）
+    
+    Returns:
+        (幀號, 事件或 None, 錯誤回應或 None)
+    """
+    if event_id is not None:
+        event = db.get_event(game_id, event_id)
+        if event is None:
+            return None, None, JSONResponse(
+                status_code=404,
+                content={
+                    "error": {
+                        "code": ERR_NOT_FOUND,
+                        "message": "Event not found",
+                        "details": {"game_id": game_id, "event_id": event_id}
+                    }
+                }
+            )
+        timestamp = event["timestamp"]
+    else:
+        event = None
+    
+    try:
+        if timestamp is not None:
+            return index.frame_for_timestamp(timestamp), event, None
+        if frame is not None:
+            return index.locate(frame)["frame"], None, None
+        raise ValueError("One of 'event_id', 'timestamp' or 'frame' is required")
+    except ValueError as e:
+        return None, None, JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "code": ERR_INVALID_ARGUMENT,
+                    "message": str(e),
+                    "details": {}
+                }
+            }
+        )
+
+
+def _recording_not_found(game_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404,
+        content={
+            "error": {
+                "code": "ERR_RECORDING_NOT_FOUND",
+                "message": "Recording not found",
+                "details": {"game_id": game_id}
+            }
+        }
+    )
+
+
+@router.get("/api/recordings/{game_id}/seek-index")
+async def get_seek_index(game_id: str, include_frame_times: bool = Query(False)):
+    """
+    獲取錄影跳轉索引（關鍵幀幀號、影片時間、位元組偏移）
+    
+    舊錄影第一次請求時由 MP4 解析建立
+    """
+    recording = db.get_recording(game_id)
+    if not recording:
+        return _recording_not_found(game_id)
+    
+    index = await asyncio.to_thread(_get_seek_index, recording)
+    if index is None:
+        return _recording_not_found(game_id)
+    
+    return index.summary(include_frame_times=include_frame_times)
+
+
+@router.get("/api/recordings/{game_id}/seek")
+async def seek_recording(
+    game_id: str,
+    event_id: Optional[int] = Query(None),
+    timestamp: Optional[float] = Query(None),
+    frame: Optional[int] = Query(None, ge=0)
+):
+    """
+    事件 / 時間戳 / 幀號 → 跳轉位置
+    
+    回傳目標幀號、影片時間（播放器 currentTime）與前一個關鍵幀的位元組偏移
+    """
+    recording = db.get_recording(game_id)
+    if not recording:
+        return _recording_not_found(game_id)
+    
+    index = await asyncio.to_thread(_get_seek_index, recording)
+    if index is None:
+        return _recording_not_found(game_id)
+    
+    target, event, error = _resolve_seek_target(game_id, index, event_id, timestamp, frame)
+    if error is not None:
+        return error
+    
+    result = index.locate(target)
+    if event is not None:
+        result["event"] = {
+            "id": event["id"],
+            "timestamp": event["timestamp"],
+            "event_type": event["event_type"]
+        }
+    return result
+
+
+@router.get("/api/recordings/{game_id}/frame.jpg")
+async def get_recording_frame(
+    game_id: str,
+    event_id: Optional[int] = Query(None),
+    timestamp: Optional[float] = Query(None),
+    frame: Optional[int] = Query(None, ge=0),
+    quality: str = Query("med", regex="^(low|med|high)$")
+):
+    """
+    獲取事件 / 時間戳 / 幀號對應的單張畫面（JPEG）
+    
+    從前一個關鍵幀開始解碼，不需解碼之前的影片
+    """
+    recording = db.get_recording(game_id)
+    if not recording:
+        return _recording_not_found(game_id)
+    
+    index = await asyncio.to_thread(_get_seek_index, recording)
+    if index is None:
+        return _recording_not_found(game_id)
+    
+    target, _, error = _resolve_seek_target(game_id, index, event_id, timestamp, frame)
+    if error is not None:
+        return error
+    
+    cache_key = (game_id, target, quality)
+    jpeg = replay_sessions.cache.get(cache_key)
+    if jpeg is None:
+        video_path = recording["video_path"]
+        
+        def decode_frame():
+            cap = cv2.VideoCapture(video_path)
+            try:
+                seek_capture(cap, target, index)
+                ret, image = cap.read()
+                if not ret:
+                    return None
+                ret, buffer = cv2.imencode(
+                    '.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), REPLAY_JPEG_QUALITY[quality]]
+                )
+                return buffer.tobytes() if ret else None
+            finally:
+                cap.release()
+        
+        jpeg = await asyncio.to_thread(decode_frame)
+        if jpeg is None:
+            return JSONResponse(
+                status_code=500,
+                content={
+                    "error": {
+                        "code": "ERR_INTERNAL",
+                        "message": "Failed to decode frame",
+                        "details": {"frame": target}
+                    }
+                }
+            )
+        replay_sessions.cache.put(cache_key, jpeg)
+    
+    return Response(
+        content=jpeg,
+        media_type="image/jpeg",
+        headers={"X-Frame-Index": str(target), "Cache-Control": "public, max-age=3600"}
+    )
+
+
+@router.api_route("/api/recordings/{game_id}/video", methods=["GET", "HEAD"])
 async def get_video_file(game_id: str, request: Request):
     """
     獲取錄影影片檔案（MP4 格式）
     
-    支援 HTTP 範圍請求（Range Request）用於影片播放
+    支援 HTTP 範圍請求（Range Request，含多段範圍與 If-Range）用於影片播放，
+    並以 ETag / Last-Modified 回應條件請求（304）
     """
     try:
         # 檢查錄影是否存在
@@ -706,55 +1021,8 @@ async def get_video_file(game_id: str, request: Request):
                 }
             )
         
-        # 獲取檔案大小
-        file_size = os.path.getsize(video_path)
-        
-        # 處理範圍請求
-        range_header = request.headers.get("range")
-        
-        if range_header:
-            # 解析範圍
-            range_match = range_header.replace("bytes=", "").split("-")
-            start = int(range_match[0]) if range_match[0] else 0
-            end = int(range_match[1]) if len(range_match) > 1 and range_match[1] else file_size - 1
-            
-            # 讀取指定範圍
-            def range_iterator():
-                with open(video_path, "rb") as f:
-                    f.seek(start)
-                    remaining = end - start + 1
-                    while remaining > 0:
-                        chunk_size = min(8192, remaining)
-                        data = f.read(chunk_size)
-                        if not data:
-                            break
-                        remaining -= len(data)
-                        yield data
-            
-            return StreamingResponse(
-                range_iterator(),
-                status_code=206,
-                media_type="video/mp4",
-                headers={
-                    "Content-Range": f"bytes {start}-{end}/{file_size}",
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(end - start + 1)
-                }
-            )
-        else:
-            # 返回完整影片檔案
-            def file_iterator():
-                with open(video_path, "rb") as f:
-                    yield from f
-            
-            return StreamingResponse(
-                file_iterator(),
-                media_type="video/mp4",
-                headers={
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(file_size)
-                }
-            )
+        # 範圍請求、ETag / Last-Modified 條件請求由 VideoFileResponse 處理
+        return VideoFileResponse(video_path, stat_result=os.stat(video_path))
     
     except Exception as e:
         return JSONResponse(
@@ -769,11 +1037,90 @@ async def get_video_file(game_id: str, request: Request):
         )
 
 
+def _event_row_to_json(row) -> str:
+    """
+    將 events 表的一列轉為 JSON 字串
+
+    data 欄位在寫入時已是 JSON，直接嵌入而不重新解析/序列化
+    """
+    return (
+        '{"id": ' + str(row["id"])
+        + ', "game_id": ' + json.dumps(row["game_id"], ensure_ascii=False)
+        + ', "timestamp": ' + json.dumps(row["timestamp"])
+        + ', "event_type": ' + json.dumps(row["event_type"], ensure_ascii=False)
+        + ', "data": ' + (row["data"] or "{}")
+        + ', "target_ball": ' + json.dumps(row["target_ball"])
+        + ', "potted_ball": ' + json.dumps(row["potted_ball"])
+        + ', "first_contact": ' + json.dumps(row["first_contact"])
+        + '}'
+    )
+
+
+def _stream_events(rows, format: str, limit: Optional[int], chunk_rows: int = 100):
+    """
+    將事件游標轉為 NDJSON / JSON 串流
+
+    每累積 chunk_rows 筆輸出一次，記憶體使用與遊戲長度無關。
+    中途出錯時串流已開始、無法再改變狀態碼，改在結尾附上 error（含最後送出事件的游標），
+    客戶端可據此得知內容不完整並以 after_ts / after_id 續傳
+    """
+    buffer = []
+    count = 0
+    last_ts = None
+    last_id = None
+    error = None
+
+    if format == "json":
+        yield b'{"events": ['
+
+    try:
+        for row in rows:
+            line = _event_row_to_json(row)
+            if format == "json":
+                buffer.append(line if count == 0 else "," + line)
+            else:
+                buffer.append(line + "\n")
+            count += 1
+            last_ts = row["timestamp"]
+            last_id = row["id"]
+
+            if len(buffer) >= chunk_rows:
+                yield "".join(buffer).encode("utf-8")
+                buffer = []
+    except Exception as e:
+        print(f"[Replay] Event stream error: {e}")
+        error = create_error_response(
+            ERR_INTERNAL,
+            f"Event stream interrupted: {e}",
+            {"next_after_ts": last_ts, "next_after_id": last_id}
+        )["error"]
+
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+    if format == "json":
+        # 取滿一頁（或中途出錯）才提供下一頁游標 (timestamp, id)
+        has_next = error is not None or (limit is not None and count >= limit)
+        yield (
+            '], "count": ' + str(count)
+            + ', "next_after_ts": ' + json.dumps(last_ts if has_next else None)
+            + ', "next_after_id": ' + json.dumps(last_id if has_next else None)
+            + (', "error": ' + json.dumps(error, ensure_ascii=False) if error is not None else '')
+            + '}'
+        ).encode("utf-8")
+    elif error is not None:
+        # 最後一行為 {"error": ...}（事件行不會有 error 欄位）
+        yield (json.dumps({"error": error}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
 @router.get("/replay/events/{game_id}")
 async def replay_events(
     game_id: str,
     from_time: Optional[float] = Query(None, alias="from"),
     to_time: Optional[float] = Query(None, alias="to"),
+    after_ts: Optional[float] = Query(None),
+    after_id: Optional[int] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=100000),
     downsample: int = Query(1, ge=1),
     format: str = Query("jsonl", regex="^(jsonl|json)$")
 ):
@@ -781,6 +1128,9 @@ async def replay_events(
     事件回放（JSONL 或 JSON 格式）
     
     符合 v1.5 P1 Replay 規範
+    - 直接從資料庫游標串流輸出，記憶體用量固定
+    - 降採樣在 SQL 中完成
+    - 分頁：以上一頁最後一筆的 timestamp / id 作為 after_ts / after_id
     """
     try:
         # 檢查錄影是否存在
@@ -797,32 +1147,22 @@ async def replay_events(
                 }
             )
         
-        # 查詢事件
-        events = db.get_events(
+        # 查詢事件（惰性游標，串流開始時才執行）
+        rows = db.iter_events(
             game_id=game_id,
             from_time=from_time,
-            to_time=to_time
+            to_time=to_time,
+            after_ts=after_ts,
+            after_id=after_id,
+            downsample=downsample,
+            limit=limit
         )
         
-        # 降採樣
-        if downsample > 1:
-            events = events[::downsample]
-        
-        # 根據格式返回
-        if format == "jsonl":
-            # JSONL 格式（每行一個事件）
-            import json
-            jsonl_content = "\n".join(json.dumps(event, ensure_ascii=False) for event in events)
-            
-            return Response(
-                content=jsonl_content,
-                media_type="application/x-ndjson"
-            )
-        else:
-            # JSON 格式
-            return JSONResponse({
-                "events": events
-            })
+        media_type = "application/x-ndjson" if format == "jsonl" else "application/json"
+        return StreamingResponse(
+            _stream_events(rows, format, limit),
+            media_type=media_type
+        )
     
     except Exception as e:
         return JSONResponse(
@@ -1,33 +1,156 @@
 """
 縮圖 API - 提供錄影縮圖圖片（支援分類資料夾）
+
+- 多尺寸 / JPEG、WebP，記憶體 LRU 快取
+- ETag + Cache-Control: no-cache（網址不含版本，瀏覽器每次以 If-None-Match 驗證，未變動回 304）
+- sprite sheet 供列表滑鼠移動預覽
+- 批次端點：錄影列表一次取得多張縮圖
 """
-from fastapi import APIRouter, Response
+import asyncio
+import base64
 import os
+from typing import Annotated, Dict, Optional
+
+from fastapi import APIRouter, Body, Query, Request, Response
+from fastapi.responses import JSONResponse
+
+import config
+from database.database import Database
+from streaming.thumbnail_service import THUMBNAIL_FORMATS, THUMBNAIL_SIZES, Thumbnail, ThumbnailService
 
 router = APIRouter()
 
+# 使用絕對路徑
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+recordings_dir = os.path.join(project_root, "recordings")
+db = Database(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "recordings.db"))
+
+THUMBNAIL_CACHE_CONTROL = "no-cache"
+MAX_BATCH_SIZE = 100
+
+# 資料庫沒有記錄的舊錄影：掃描資料夾後記住位置
+_legacy_dirs: Dict[str, str] = {}
+
+
+def _resolve_recording(game_id: str) -> Optional[dict]:
+    """game_id → 錄影資料夾（優先使用資料庫的 video_path，避免每次遍歷目錄）"""
+    recording = db.get_recording(game_id)
+    if recording and recording.get("video_path"):
+        return {
+            "recording_dir": os.path.dirname(recording["video_path"]),
+            "video_path": recording["video_path"],
+            "video_fps": recording.get("video_fps"),
+        }
+
+    recording_dir = _legacy_dirs.get(game_id)
+    if recording_dir is None and os.path.exists(recordings_dir):
+        for root, _dirs, _files in os.walk(recordings_dir):
+            if os.path.basename(root) == game_id:
+                recording_dir = root
+                _legacy_dirs[game_id] = root
+                break
+    if recording_dir is None:
+        return None
+    return {
+        "recording_dir": recording_dir,
+        "video_path": os.path.join(recording_dir, "video.mp4"),
+        "video_fps": None,
+    }
+
+
+thumbnail_service = ThumbnailService(
+    _resolve_recording,
+    cache_mb=config.THUMBNAIL_CACHE_MB,
+    sprite_frames=config.THUMBNAIL_SPRITE_FRAMES
+)
+
+
+def _invalid_argument(message: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=400,
+        content={
+            "error": {
+                "code": "ERR_INVALID_ARGUMENT",
+                "message": message,
+                "details": {}
+            }
+        }
+    )
+
+
+def _image_response(thumb: Optional[Thumbnail], request: Request) -> Response:
+    """縮圖回應（含 ETag 條件請求）"""
+    if thumb is None:
+        # 如果縮圖不存在，返回 404
+        return Response(status_code=404)
+
+    headers = {"ETag": thumb.etag, "Cache-Control": THUMBNAIL_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or thumb.etag in if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(content=thumb.content, media_type=thumb.media_type, headers=headers)
+
+
 @router.get("/api/recordings/{game_id}/thumbnail")
-async def get_thumbnail(game_id: str):
+async def get_thumbnail(
+    game_id: str,
+    request: Request,
+    size: str = Query("lg", regex="^(sm|md|lg)$"),
+    format: str = Query("jpeg", regex="^(jpeg|webp)$")
+):
     """
     獲取錄影縮圖（支援分類資料夾結構）
+
+    預設 lg（640x360）JPEG，與舊版相同
     """
-    # 使用絕對路徑
-    project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    recordings_dir = os.path.join(project_root, "recordings")
-    
-    # 在所有分類資料夾中搜尋該 game_id 的縮圖
-    thumbnail_path = None
-    if os.path.exists(recordings_dir):
-        for root, dirs, files in os.walk(recordings_dir):
-            if "thumbnail.jpg" in files and game_id in root:
-                thumbnail_path = os.path.join(root, "thumbnail.jpg")
-                break
-    
-    if not thumbnail_path or not os.path.exists(thumbnail_path):
-        # 如果縮圖不存在，返回 404
+    thumb = await asyncio.to_thread(thumbnail_service.get, game_id, size, format)
+    return _image_response(thumb, request)
+
+
+@router.get("/api/recordings/{game_id}/sprite.jpg")
+async def get_sprite(game_id: str, request: Request):
+    """獲取 sprite sheet（整場均勻取樣的小圖，排列方式見 sprite.json）"""
+    thumb = await asyncio.to_thread(thumbnail_service.get_sprite, game_id)
+    return _image_response(thumb, request)
+
+
+@router.get("/api/recordings/{game_id}/sprite.json")
+async def get_sprite_meta(game_id: str):
+    """獲取 sprite sheet 描述（小圖尺寸、欄列數、每張對應的幀號與影片時間）"""
+    meta = await asyncio.to_thread(thumbnail_service.get_sprite_meta, game_id)
+    if meta is None:
         return Response(status_code=404)
-    
-    # 讀取並返回縮圖
-    with open(thumbnail_path, "rb") as f:
-        return Response(content=f.read(), media_type="image/jpeg")
+    return JSONResponse(meta, headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL})
+
+
+@router.post("/api/thumbnails/batch")
+async def get_thumbnails_batch(request: Annotated[dict, Body(...)]):
+    """
+    批次獲取縮圖（一次請求取得多張）
+
+    Body: {"game_ids": [...], "size": "sm", "format": "webp"}
+    回傳 data URI；不存在的錄影為 null
+    """
+    game_ids = request.get("game_ids")
+    size = request.get("size", "sm")
+    fmt = request.get("format", "webp")
+
+    if not isinstance(game_ids, list) or not all(isinstance(g, str) for g in game_ids):
+        return _invalid_argument("'game_ids' must be a list of strings")
+    if len(game_ids) > MAX_BATCH_SIZE:
+        return _invalid_argument(f"At most {MAX_BATCH_SIZE} game_ids per request")
+    if size not in THUMBNAIL_SIZES or fmt not in THUMBNAIL_FORMATS:
+        return _invalid_argument("Invalid size or format")
+
+    thumbs = await asyncio.to_thread(thumbnail_service.get_many, game_ids, size, fmt)
 
+    result: Dict[str, Optional[Dict[str, str]]] = {}
+    for game_id, thumb in thumbs.items():
+        if thumb is None:
+            result[game_id] = None
+            continue
+        result[game_id] = {
+            "data_uri": f"data:{thumb.media_type};base64," + base64.b64encode(thumb.content).decode("ascii"),
+            "etag": thumb.etag,
+        }
+    return {"thumbnails": result, "size": size, "format": fmt}
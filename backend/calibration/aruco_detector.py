@@ -3,14 +3,29 @@ ArUco 標記檢測器
 用於投影機自動校正,檢測 ID 0-3 的 ArUco 標記
 """
 
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
 import cv2
 import numpy as np
-from typing import Optional, Dict
+
+
+class DetectionResult(NamedTuple):
+    """一次標記檢測的結果（快取於 ArucoDetector.last_result）"""
+    corners: Optional[np.ndarray]  # 4 個標記中心點；未檢測到完整 4 個為 None
+    marker_ids: List[int]
+    timestamp: float
+    frame_id: Optional[int]
+    duration_ms: float
+    mode: str  # pyramid / tracked / full
+    frame: Any = None  # 檢測所用的畫面（預覽疊加使用）
+
 
 class ArucoDetector:
     """ArUco 標記自動檢測器"""
     
-    def __init__(self):
+    def __init__(self, detect_scale: float = 0.5):
         # 使用 4x4 字典 (50 個標記)
         self.aruco_dict = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
         
@@ -31,11 +46,27 @@ class ArucoDetector:
         
         # 建立 ArUco 檢測器 (OpenCV 4.7+ 新版 API)
         self.detector = cv2.aruco.ArucoDetector(self.aruco_dict, self.aruco_params)
-        self.last_corners = None
+        self.last_corners: Optional[np.ndarray] = None
+
+        # 金字塔檢測：縮小倍率與全解析度精細化參數
+        self.detect_scale = detect_scale
+        self._subpix_criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+        self._tracked: Dict[int, np.ndarray] = {}  # 上一次各標記的全解析度角點
+
+        # 最近一次檢測結果（version 每次捕獲循環更新 +1）
+        # 捕獲循環與 API 背景線程都可能檢測：detector / _tracked 不可同時使用，以鎖序列化；
+        # 結果一次建立完整（含畫面）後才整個替換，讀取端不需加鎖
+        self._lock = threading.Lock()
+        self.last_result: Optional[DetectionResult] = None
+        self.version = 0
+        self._last_logged_ids: Optional[List[int]] = None
     
     def detect(self, frame: np.ndarray) -> Optional[np.ndarray]:
         """
         檢測 ArUco 標記 (ID 0-3)
+
+        金字塔檢測：先在縮小的畫面上找標記，再於全解析度下只在角點附近的小視窗做次像素精細化；
+        縮小畫面漏掉的標記，改在上一次位置附近的全解析度視窗中重新搜尋。
         
         Args:
             frame: 輸入影像 (BGR)
@@ -45,43 +76,125 @@ class ArucoDetector:
                     順序: 左上(ID=0), 右上(ID=1), 右下(ID=2), 左下(ID=3)
             None: 未檢測到完整的 4 個標記
         """
-        # 轉灰階
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        # 檢測 ArUco 標記 (使用 OpenCV 4.7+ 新版 API)
-        corners, ids, rejected = self.detector.detectMarkers(gray)
-        
-        # 調試信息
-        if ids is not None:
-            print(f"[ArUco] 檢測到 {len(ids)} 個標記, IDs: {ids.flatten().tolist()}")
-        else:
-            print(f"[ArUco] 未檢測到任何標記")
-        
-        if ids is None or len(ids) < 4:
+        with self._lock:
+            return self._detect_and_cache(frame, None).corners
+
+    def update(self, frame: np.ndarray, frame_id: Optional[int] = None) -> DetectionResult:
+        """
+        由捕獲循環（或 API 背景線程）呼叫：檢測並快取結果（含畫面，供預覽使用）
+        """
+        with self._lock:
+            result = self._detect_and_cache(frame, frame_id)
+            self.version += 1
+        return result
+
+    def _detect_and_cache(self, frame: np.ndarray, frame_id: Optional[int]) -> DetectionResult:
+        """檢測並以一次賦值更新 last_result（呼叫端需持有 _lock）"""
+        start = time.perf_counter()
+        markers, mode = self._detect_markers(frame)
+
+        # 調試信息（只在檢測到的標記改變時輸出）
+        found = sorted(markers)
+        if found != self._last_logged_ids:
+            if found:
+                print(f"[ArUco] 檢測到 {len(found)} 個標記, IDs: {found} ({mode})")
+            else:
+                print("[ArUco] 未檢測到任何標記")
+            self._last_logged_ids = found
+
+        result = None
+        if len(markers) == 4:
+            # 按 ID 順序排列，每個標記取 4 個角點的平均作為中心點
+            result = np.array([markers[marker_id].mean(axis=0) for marker_id in range(4)], dtype=np.float32)
+            self.last_corners = result
+        if markers:
+            self._tracked = markers
+
+        detection = DetectionResult(
+            corners=result,
+            marker_ids=found,
+            timestamp=time.time(),
+            frame_id=frame_id,
+            duration_ms=(time.perf_counter() - start) * 1000,
+            mode=mode,
+            frame=frame,
+        )
+        self.last_result = detection
+        return detection
+
+    def get_last_result(self, max_age: Optional[float] = None) -> Optional["DetectionResult"]:
+        """取得快取的檢測結果；超過 max_age 秒視為過期回傳 None"""
+        result = self.last_result
+        if result is None:
             return None
-        
-        # 提取 ID 0-3 的標記中心點
-        detected_corners = {}
-        for i, marker_id in enumerate(ids.flatten()):
-            if marker_id < 4:  # 只處理 ID 0-3
-                # 計算標記中心點 (4個角點的平均)
-                center = corners[i][0].mean(axis=0)
-                detected_corners[marker_id] = center
-        
-        # 檢查是否檢測到全部 4 個標記
-        if len(detected_corners) != 4:
+        if max_age is not None and time.time() - result.timestamp > max_age:
             return None
-        
-        # 按 ID 順序排列
-        result = np.array([
-            detected_corners[0],  # 左上
-            detected_corners[1],  # 右上
-            detected_corners[2],  # 右下
-            detected_corners[3]   # 左下
-        ], dtype=np.float32)
-        
-        self.last_corners = result
         return result
+
+    def _detect_markers(self, frame: np.ndarray) -> Tuple[Dict[int, np.ndarray], str]:
+        """回傳 {marker_id: 4x2 全解析度角點}（只含 ID 0-3）與使用的檢測方式"""
+        height, width = frame.shape[:2]
+        scale = self.detect_scale if min(height, width) * self.detect_scale >= 240 else 1.0
+
+        # 1. 縮小畫面上的檢測
+        if scale < 1.0:
+            small = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        gray_small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        corners, ids, _ = self.detector.detectMarkers(gray_small)
+        markers: Dict[int, np.ndarray] = {}
+        if ids is not None:
+            for marker_corners, marker_id in zip(corners, ids.flatten()):
+                if marker_id < 4:
+                    markers[int(marker_id)] = marker_corners[0] / scale
+        mode = "pyramid" if scale < 1.0 else "full"
+
+        # 2. 縮小後漏掉的標記：在上一次位置附近的全解析度視窗中搜尋
+        missing = [marker_id for marker_id in self._tracked if marker_id not in markers]
+        for marker_id in missing:
+            window = self._window(self._tracked[marker_id], width, height, padding=1.0)
+            x0, y0, x1, y1 = window
+            gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            corners, ids, _ = self.detector.detectMarkers(gray)
+            if ids is None:
+                continue
+            for marker_corners, found_id in zip(corners, ids.flatten()):
+                if found_id == marker_id:
+                    markers[marker_id] = marker_corners[0] + np.array([x0, y0], dtype=np.float32)
+                    mode = "tracked"
+
+        # 3. 全解析度次像素精細化（只轉換角點附近的小視窗）
+        if scale < 1.0:
+            for marker_id, points in markers.items():
+                markers[marker_id] = self._refine(frame, points, width, height)
+        return markers, mode
+
+    def _window(self, points: np.ndarray, width: int, height: int, padding: float) -> Tuple[int, int, int, int]:
+        """標記外接矩形加上 padding 倍邊長的視窗"""
+        x_min, y_min = points.min(axis=0)
+        x_max, y_max = points.max(axis=0)
+        pad = max(x_max - x_min, y_max - y_min) * padding + 8
+        return (
+            max(0, int(x_min - pad)),
+            max(0, int(y_min - pad)),
+            min(width, int(x_max + pad) + 1),
+            min(height, int(y_max + pad) + 1),
+        )
+
+    def _refine(self, frame: np.ndarray, points: np.ndarray, width: int, height: int) -> np.ndarray:
+        x0, y0, x1, y1 = self._window(points, width, height, padding=0.1)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return points
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        local: np.ndarray = (points - np.array([x0, y0], dtype=np.float32)).reshape(-1, 1, 2).astype(np.float32)
+        # 視窗大小約為縮放倍率（縮小畫面上 1 像素的誤差）
+        half = max(2, int(round(1.0 / self.detect_scale)) + 1)
+        try:
+            cv2.cornerSubPix(gray, local, (half, half), (-1, -1), self._subpix_criteria)
+        except cv2.error:
+            return points
+        return local.reshape(-1, 2) + np.array([x0, y0], dtype=np.float32)
     
     def draw_detection(self, frame: np.ndarray, corners: np.ndarray) -> np.ndarray:
         """
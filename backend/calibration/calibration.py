@@ -1,26 +1,104 @@
 # backend/calibration.py
 
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 import cv2
 import numpy as np
 
+import config
+from calibration.calibration_store import CalibrationProfile, CalibrationStore
+from core.pipeline_profiler import profiler
+
+
+class _WarpMaps:
+    """一組預先計算的 remap 表（定點格式），只涵蓋投影畫面中有來源像素的矩形"""
+
+    __slots__ = ("key", "rect", "map1", "map2", "build_ms")
+
+    def __init__(self, key, rect, map1, map2, build_ms):
+        self.key = key
+        self.rect = rect  # 投影座標 (x, y, w, h)
+        self.map1 = map1  # CV_16SC2：整數來源座標
+        self.map2 = map2  # CV_16UC1：插值係數索引
+        self.build_ms = build_ms
+
 
 class Calibrator:
-    def __init__(self):
-        self.homography_matrix = None
-        self.projection_bounds = None
+    def __init__(self, store: Optional[CalibrationStore] = None, camera_id=0, projector_id=None):
+        self.homography_matrix: Optional[np.ndarray] = None
+        self.projection_bounds: Optional[dict] = None
         # 預設的投影畫面解析度 (假設投影機是 1080p)
         self.projector_width = 1920
         self.projector_height = 1080
 
+        # 校正設定檔：每組相機 / 投影機一份，由 store 快取並偵測檔案更新
+        self.store = store
+        self.camera_id = camera_id
+        self.projector_id = projector_id if projector_id is not None else config.PROJECTOR_ID
+        self.profile: Optional[CalibrationProfile] = None
+
+        # 投影變形：homography / 畫面尺寸 / ROI 改變時才重建 remap 表
+        self._warp_maps: Optional[_WarpMaps] = None
+        self._warp_lock = threading.Lock()
+        self._warp_pool: Optional[ThreadPoolExecutor] = None
+        self._warp_threads = config.WARP_THREADS or min(4, os.cpu_count() or 1)
+        self.warp_map_builds = 0
+
     def has_homography(self) -> bool:
-        """Return True if a homography matrix is available on disk or in memory."""
-        if self.homography_matrix is not None:
-            return True
-        try:
-            self.homography_matrix = np.load("calibration_matrix.npy")
-            return True
-        except Exception:
-            return False
+        """Return True if a homography matrix is available (cached; no disk read per call)."""
+        if self.store is not None:
+            profile = self.store.get(self.camera_id, self.projector_id)
+            if profile is not self.profile:
+                self._apply_profile(profile)
+        return self.homography_matrix is not None
+
+    def _apply_profile(self, profile: Optional[CalibrationProfile]):
+        self.profile = profile
+        if profile is None:
+            self.homography_matrix = None
+            return
+        self.homography_matrix = profile.homography
+        if profile.projection_bounds is not None:
+            self.projection_bounds = profile.projection_bounds
+
+    def select_profile(self, camera_id=None, projector_id=None) -> bool:
+        """
+        切換到指定相機 / 投影機的校正設定檔（已預載，不需讀檔）
+
+        Returns:
+            bool: 該組合是否已有校正
+        """
+        if camera_id is not None:
+            self.camera_id = camera_id
+        if projector_id is not None:
+            self.projector_id = projector_id
+        return self.has_homography()
+
+    def save_calibration(self):
+        """儲存目前的 homography 與投影範圍到設定檔，下次不用重校正"""
+        if self.store is None:
+            np.save(config.LEGACY_CALIBRATION_PATH, self.homography_matrix)
+            return
+        self.profile = self.store.save(
+            self.camera_id,
+            self.projector_id,
+            self.homography_matrix,
+            projection_bounds=self.projection_bounds,
+            projector_size=(self.projector_width, self.projector_height),
+        )
+
+    def get_profile_info(self) -> dict:
+        return {
+            "camera_id": self.camera_id,
+            "projector_id": self.projector_id,
+            "calibrated": self.has_homography(),
+            "profile": self.profile.to_dict() if self.profile else None,
+        }
 
     def compute_homography(self, camera_points):
         """
@@ -43,10 +121,8 @@ class Calibrator:
         # 計算矩陣
         self.homography_matrix, status = cv2.findHomography(src_points, dst_points)
 
-        # 儲存矩陣到檔案，下次不用重校正
-        np.save("calibration_matrix.npy", self.homography_matrix)
-        # Use ASCII log to avoid encoding issues in some consoles
-        print("Calibration saved to calibration_matrix.npy")
+        # 儲存矩陣到設定檔，下次不用重校正
+        self.save_calibration()
         return True
 
     def transform_points(self, points_list):
@@ -67,20 +143,181 @@ class Calibrator:
         # 轉回 List 格式 [[x, y], ...]
         return dst_pts[0].astype(int).tolist()
 
-    def warp_frame_to_projector(self, frame):
+    def project_scene(self, data):
         """
-        將相機畫面透過 homography 轉換成投影機座標大小；失敗則回傳原始畫面。
+        將追蹤結果（相機座標）轉換為投影座標的向量場景，供 ProjectorRenderer 直接繪製
+
+        球位、預測路徑（含反彈點）、瞄準輔助線的所有點合併成一次 perspectiveTransform，
+        不需變形任何相機像素。
+
+        Args:
+            data: PoolTracker.process_frame 回傳的數據包
+
+        Returns:
+            {"balls": [...], "trajectories": [...], "aim_lines": [...]}；尚未校正回傳 None
         """
         if not self.has_homography():
+            return None
+        scene = {"balls": [], "trajectories": [], "aim_lines": []}
+        if not data:
+            return scene
+
+        points = []
+        balls = []  # (type, number, 點索引)；每顆球兩個點：球心、球心 + 半徑
+
+        def add_ball(ball_type, number, x, y, w, h, radius):
+            cx, cy = x + w / 2, y + h / 2
+            balls.append((ball_type, number, len(points)))
+            points.extend(((cx, cy), (cx + (radius or w / 2), cy)))
+
+        white = data.get("white_ball")
+        if white:
+            add_ball("cue", None, white[0], white[1], white[2], white[3], white[4] if len(white) > 4 else None)
+        for ball in data.get("balls") or []:
+            number = ball.get("number")
+            ball_type = "8" if number == 8 else "ball"
+            add_ball(ball_type, number, ball["x"], ball["y"], ball["w"], ball["h"], ball.get("radius"))
+
+        paths = (data.get("prediction") or {}).get("paths") or []
+        path_start = len(points)
+        points.extend(paths)
+
+        aim = data.get("aim_assist")
+        aim_start = len(points)
+        if aim:
+            points.extend(aim["cue_to_target"])
+            points.extend(aim["target_to_hole"])
+
+        if not points:
+            return scene
+        projected = cv2.perspectiveTransform(np.array([points], dtype="float32"), self.homography_matrix)[0]
+
+        for ball_type, number, index in balls:
+            (cx, cy), (rx, ry) = projected[index], projected[index + 1]
+            scene["balls"].append({
+                "x": int(cx),
+                "y": int(cy),
+                "radius": max(1, int(round(math.hypot(rx - cx, ry - cy)))),
+                "type": ball_type,
+                "number": number,
+            })
+        if len(paths) > 1:
+            scene["trajectories"].append(projected[path_start:path_start + len(paths)].astype(int).tolist())
+        if aim:
+            segment = projected[aim_start:aim_start + 4].astype(int).tolist()
+            scene["aim_lines"].append({"start": segment[0], "end": segment[1]})
+            scene["aim_lines"].append({"start": segment[2], "end": segment[3]})
+        return scene
+
+    def warp_frame_to_projector(self, frame, roi=None):
+        """
+        將相機畫面透過 homography 轉換成投影機座標大小；失敗則回傳原始畫面。
+
+        使用預先計算的定點 remap 表（homography 改變時才重建），只計算投影畫面中
+        有來源像素的矩形；多核心時切成水平條帶平行處理。
+
+        Args:
+            frame: 相機畫面
+            roi: 只變形此相機區域 [x, y, w, h]（例如球桌 ROI），其餘為黑色
+        """
+        matrix = self.homography_matrix if self.has_homography() else None
+        if matrix is None:
             return frame
         try:
-            return cv2.warpPerspective(
-                frame,
-                self.homography_matrix,
-                (self.projector_width, self.projector_height),
-            )
+            maps = self._get_warp_maps(matrix, frame.shape[:2], roi)
+            output = np.zeros((self.projector_height, self.projector_width) + frame.shape[2:], dtype=frame.dtype)
+            if maps.rect is None:
+                return output
+            x, y, w, h = maps.rect
+            target = output[y:y + h, x:x + w]
+
+            strips = self._warp_threads if h >= 64 * self._warp_threads else 1
+            if strips <= 1:
+                cv2.remap(frame, maps.map1, maps.map2, cv2.INTER_LINEAR, dst=target,
+                          borderMode=cv2.BORDER_CONSTANT)
+                return output
+
+            # cv2.remap 執行期間釋放 GIL，條帶可真正平行
+            if self._warp_pool is None:
+                self._warp_pool = ThreadPoolExecutor(max_workers=strips, thread_name_prefix="warp")
+            bounds = np.linspace(0, h, strips + 1).astype(int)
+            futures = [
+                self._warp_pool.submit(
+                    cv2.remap, frame, maps.map1[top:bottom], maps.map2[top:bottom], cv2.INTER_LINEAR,
+                    dst=target[top:bottom], borderMode=cv2.BORDER_CONSTANT
+                )
+                for top, bottom in zip(bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                future.result()
+            return output
         except Exception:
             return frame
+
+    def _get_warp_maps(self, matrix: np.ndarray, frame_shape, roi=None) -> _WarpMaps:
+        src_h, src_w = frame_shape
+        roi_key = tuple(int(v) for v in roi) if roi else None
+        key = (matrix.tobytes(), src_w, src_h, roi_key, self.projector_width, self.projector_height)
+        maps = self._warp_maps
+        if maps is not None and maps.key == key:
+            return maps
+
+        with self._warp_lock:
+            maps = self._warp_maps
+            if maps is not None and maps.key == key:
+                return maps
+            with profiler.stage("calibration.build_warp_maps"):
+                maps = self._build_warp_maps(key, matrix, src_w, src_h, roi_key)
+            self._warp_maps = maps
+            self.warp_map_builds += 1
+            return maps
+
+    def _build_warp_maps(self, key, matrix, src_w, src_h, roi) -> _WarpMaps:
+        start = time.perf_counter()
+        # 來源區域（整張畫面或 ROI）投影到投影機座標後的外接矩形
+        if roi:
+            rx, ry, rw, rh = roi
+            rx, ry = max(0, rx), max(0, ry)
+            rw, rh = min(src_w, rx + rw) - rx, min(src_h, ry + rh) - ry
+        else:
+            rx, ry, rw, rh = 0, 0, src_w, src_h
+        if rw <= 0 or rh <= 0:
+            return _WarpMaps(key, None, None, None, 0.0)
+
+        corners = np.array([[[rx, ry], [rx + rw, ry], [rx + rw, ry + rh], [rx, ry + rh]]], dtype=np.float32)
+        projected = cv2.perspectiveTransform(corners, matrix)[0]
+        x0 = int(np.clip(np.floor(projected[:, 0].min()), 0, self.projector_width))
+        y0 = int(np.clip(np.floor(projected[:, 1].min()), 0, self.projector_height))
+        x1 = int(np.clip(np.ceil(projected[:, 0].max()), 0, self.projector_width))
+        y1 = int(np.clip(np.ceil(projected[:, 1].max()), 0, self.projector_height))
+        if x1 <= x0 or y1 <= y0:
+            return _WarpMaps(key, None, None, None, 0.0)
+
+        # 反向映射：投影座標 → 相機座標（與 warpPerspective 相同的取樣方式）
+        inverse = np.linalg.inv(matrix)
+        xs, ys = np.meshgrid(np.arange(x0, x1, dtype=np.float32), np.arange(y0, y1, dtype=np.float32))
+        grid = np.stack([xs, ys], axis=-1)
+        source = cv2.perspectiveTransform(grid.reshape(1, -1, 2), inverse).reshape(y1 - y0, x1 - x0, 2)
+        map_x = source[..., 0]
+        map_y = source[..., 1]
+        if roi:
+            # ROI 以外的來源像素不變形（輸出為黑色）
+            outside = (map_x < rx) | (map_x >= rx + rw) | (map_y < ry) | (map_y >= ry + rh)
+            map_x[outside] = -1
+            map_y[outside] = -1
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+        build_ms = (time.perf_counter() - start) * 1000
+        print(f"Warp maps rebuilt: rect=({x0}, {y0}, {x1 - x0}, {y1 - y0}) in {build_ms:.1f} ms")
+        return _WarpMaps(key, (x0, y0, x1 - x0, y1 - y0), map1, map2, build_ms)
+
+    def get_warp_stats(self) -> dict:
+        maps = self._warp_maps
+        return {
+            "map_builds": self.warp_map_builds,
+            "rect": maps.rect if maps else None,
+            "last_build_ms": round(maps.build_ms, 1) if maps else None,
+            "threads": self._warp_threads,
+        }
     
     def set_projection_bounds(self, bounds):
         """
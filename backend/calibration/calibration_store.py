@@ -0,0 +1,247 @@
+"""
+校正設定檔儲存 - 每組「相機 / 投影機」一份 homography
+
+- 設定檔存成 JSON（{camera}__{projector}.json），記錄版本號與更新時間
+- 啟動時預載整個資料夾，切換相機 / 投影機不需讀檔
+- 讀取結果（包含「沒有校正」）快取在記憶體，每幀查詢只是字典查找
+- 最多每 check_interval 秒檢查一次檔案 mtime，外部更新（另一個程序、手動複製）會自動重新載入
+- 舊版單一矩陣檔 calibration_matrix.npy 作為沒有專屬設定檔時的預設
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+PROFILE_SUFFIX = ".json"
+
+
+@dataclass
+class CalibrationProfile:
+    """一組相機 / 投影機的校正結果"""
+
+    camera_id: str
+    projector_id: str
+    homography: np.ndarray
+    version: int = 1
+    updated_at: float = field(default_factory=time.time)
+    projection_bounds: Optional[dict] = None
+    projector_size: Optional[Tuple[int, int]] = None
+    source: str = "profile"  # profile / legacy
+
+    @property
+    def key(self) -> str:
+        return profile_key(self.camera_id, self.projector_id)
+
+    def to_dict(self) -> dict:
+        return {
+            "camera_id": self.camera_id,
+            "projector_id": self.projector_id,
+            "version": self.version,
+            "updated_at": self.updated_at,
+            "projection_bounds": self.projection_bounds,
+            "projector_size": list(self.projector_size) if self.projector_size else None,
+            "source": self.source,
+        }
+
+
+def profile_key(camera_id, projector_id) -> str:
+    """設定檔名稱（只保留檔名安全字元）"""
+    def clean(value) -> str:
+        return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value)) or "_"
+    return f"{clean(camera_id)}__{clean(projector_id)}"
+
+
+class _Entry:
+    __slots__ = ("profile", "stamp", "checked_at")
+
+    def __init__(self, profile: Optional[CalibrationProfile], stamp, checked_at: float):
+        self.profile = profile
+        self.stamp = stamp  # (mtime_ns, size)；檔案不存在為 None
+        self.checked_at = checked_at
+
+
+class CalibrationStore:
+    """校正設定檔快取（含負向快取與檔案變更偵測）"""
+
+    def __init__(self, directory: str, legacy_path: Optional[str] = None, check_interval: float = 1.0):
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._legacy: Optional[_Entry] = None
+        self._keys: Dict[Tuple, str] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # 讀取
+    # ------------------------------------------------------------------
+
+    def path_for(self, camera_id, projector_id) -> str:
+        return os.path.join(self.directory, profile_key(camera_id, projector_id) + PROFILE_SUFFIX)
+
+    def get(self, camera_id, projector_id) -> Optional[CalibrationProfile]:
+        """
+        取得校正設定檔；沒有專屬設定檔時回傳舊版矩陣，兩者皆無回傳 None
+
+        同一設定檔在 check_interval 內重複查詢不會碰到檔案系統。
+        """
+        key = self._keys.get((camera_id, projector_id))
+        if key is None:
+            key = self._keys[(camera_id, projector_id)] = profile_key(camera_id, projector_id)
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is None or now - entry.checked_at >= self.check_interval:
+            entry = self._refresh(key, camera_id, projector_id, now)
+        if entry.profile is not None:
+            return entry.profile
+        return self._get_legacy(camera_id, projector_id, now)
+
+    def preload(self) -> int:
+        """載入資料夾中所有設定檔，回傳數量"""
+        count = 0
+        now = time.monotonic()
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(PROFILE_SUFFIX):
+                continue
+            key = name[:-len(PROFILE_SUFFIX)]
+            camera_id, _, projector_id = key.partition("__")
+            if self._refresh(key, camera_id, projector_id, now).profile is not None:
+                count += 1
+        return count
+
+    def list_profiles(self) -> List[dict]:
+        self.preload()
+        return [
+            entry.profile.to_dict()
+            for key, entry in sorted(self._entries.items())
+            if entry.profile is not None
+        ]
+
+    def _stamp(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _refresh(self, key: str, camera_id, projector_id, now: float) -> _Entry:
+        path = os.path.join(self.directory, key + PROFILE_SUFFIX)
+        with self._lock:
+            entry = self._entries.get(key)
+            stamp = self._stamp(path)
+            if entry is not None and entry.stamp == stamp:
+                entry.checked_at = now
+                return entry
+
+            profile = None
+            if stamp is not None:
+                try:
+                    profile = self._read_profile(path, camera_id, projector_id)
+                    print(f"📐 Calibration profile loaded: {key} (v{profile.version})")
+                except Exception as e:
+                    print(f"⚠️ Failed to load calibration profile {path}: {e}")
+            entry = _Entry(profile, stamp, now)
+            self._entries[key] = entry
+            return entry
+
+    def _read_profile(self, path: str, camera_id, projector_id) -> CalibrationProfile:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        homography = np.array(data["homography"], dtype=np.float64)
+        if homography.shape != (3, 3):
+            raise ValueError(f"homography shape {homography.shape}")
+        size = data.get("projector_size")
+        return CalibrationProfile(
+            camera_id=str(data.get("camera_id", camera_id)),
+            projector_id=str(data.get("projector_id", projector_id)),
+            homography=homography,
+            version=int(data.get("version", 1)),
+            updated_at=float(data.get("updated_at", 0.0)),
+            projection_bounds=data.get("projection_bounds"),
+            projector_size=tuple(size) if size else None,
+        )
+
+    def _stored_version(self, path: str) -> int:
+        """檔案上的版本號；檔案不存在或無法解析為 0"""
+        try:
+            with open(path, encoding="utf-8") as f:
+                return int(json.load(f).get("version", 1))
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️ Failed to read calibration profile version {path}: {e}")
+            return 0
+
+    def _get_legacy(self, camera_id, projector_id, now: float) -> Optional[CalibrationProfile]:
+        if not self.legacy_path:
+            return None
+        entry = self._legacy
+        if entry is None or now - entry.checked_at >= self.check_interval:
+            with self._lock:
+                stamp = self._stamp(self.legacy_path)
+                if entry is not None and entry.stamp == stamp:
+                    entry.checked_at = now
+                else:
+                    profile = None
+                    if stamp is not None:
+                        try:
+                            profile = CalibrationProfile(
+                                camera_id="*",
+                                projector_id="*",
+                                homography=np.load(self.legacy_path),
+                                updated_at=stamp[0] / 1e9,
+                                source="legacy",
+                            )
+                            print(f"📐 Legacy calibration loaded: {self.legacy_path}")
+                        except Exception as e:
+                            print(f"⚠️ Failed to load legacy calibration {self.legacy_path}: {e}")
+                    entry = self._legacy = _Entry(profile, stamp, now)
+        return entry.profile
+
+    # ------------------------------------------------------------------
+    # 寫入
+    # ------------------------------------------------------------------
+
+    def save(
+        self,
+        camera_id,
+        projector_id,
+        homography: np.ndarray,
+        projection_bounds: Optional[dict] = None,
+        projector_size: Optional[Tuple[int, int]] = None,
+    ) -> CalibrationProfile:
+        """寫入設定檔（版本號 +1），並立即更新快取"""
+        key = profile_key(camera_id, projector_id)
+        path = os.path.join(self.directory, key + PROFILE_SUFFIX)
+        with self._lock:
+            # 以檔案上的版本為準：快取可能尚未載入，或檔案已被其他程序更新
+            previous = self._entries.get(key)
+            cached = previous.profile.version if previous and previous.profile else 0
+            version = max(cached, self._stored_version(path)) + 1
+            profile = CalibrationProfile(
+                camera_id=str(camera_id),
+                projector_id=str(projector_id),
+                homography=np.array(homography, dtype=np.float64),
+                version=version,
+                projection_bounds=projection_bounds,
+                projector_size=(int(projector_size[0]), int(projector_size[1])) if projector_size else None,
+            )
+            data = profile.to_dict()
+            data.pop("source")
+            data["homography"] = profile.homography.tolist()
+
+            # 先寫暫存檔再取代，避免其他程序讀到寫一半的檔案
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+            self._entries[key] = _Entry(profile, self._stamp(path), time.monotonic())
+        print(f"📐 Calibration profile saved: {key} (v{version})")
+        return profile
@@ -2,12 +2,20 @@
 投影機獨立渲染器
 負責投影機畫面的獨立渲染,不依賴相機畫面
 支援多種模式: 待機、校正、遊戲、練習
+
+保留模式 (retained mode) 渲染:
+- 靜態層（背景、待機文字、ArUco 標記）依「模式 + 標記偏移」快取，只在切換時複製一次
+- 動態層（球位、軌跡、瞄準線）畫在預先配置的畫面緩衝上，重繪時只還原上一次畫過的矩形
+- 內容沒有變化時 render() 回傳同一個緩衝且 generation 不變，串流端可沿用上次的 JPEG
 """
 
+from collections import OrderedDict
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
+
 import cv2
 import numpy as np
-from enum import Enum
-from typing import Optional, Dict, Any, List
+
 
 class ProjectorMode(Enum):
     """投影機模式"""
@@ -17,6 +25,15 @@ class ProjectorMode(Enum):
     GAME = "game"              # 遊戲模式 (AR 疊加)
     PRACTICE = "practice"      # 練習模式 (球外框 + 球形)
 
+
+# 有動態層（AR 資料）的模式
+_DYNAMIC_MODES = (ProjectorMode.DETECTION, ProjectorMode.GAME, ProjectorMode.PRACTICE)
+
+# 最多快取幾種靜態層（拖曳校正標記時每個偏移都是一種）
+_STATIC_CACHE_SIZE = 8
+
+Rect = Tuple[int, int, int, int]  # (x0, y0, x1, y1)
+
 class ProjectorRenderer:
     """投影機獨立渲染器"""
     
@@ -40,6 +57,24 @@ class ProjectorRenderer:
             "balls": [],         # 球位
             "aim_lines": []      # 瞄準線
         }
+
+        # 畫面內容每改變一次 +1（串流端據此判斷是否需要重新編碼）
+        self.generation = 0
+
+        # 保留模式狀態
+        self._frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self._static_layers: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._black = np.zeros((height, width, 3), dtype=np.uint8)
+        self._static_key: Optional[tuple] = None  # None：第一次 render() 時建立靜態層
+        self._static: np.ndarray = self._black
+        self._dirty_rects: List[Rect] = []  # 上一次動態層畫過的區域
+        self._ar_dirty = True
+        self._markers: Dict[int, np.ndarray] = {}
+
+        # 統計
+        self.render_calls = 0
+        self.static_redraws = 0
+        self.dynamic_redraws = 0
     
     def set_mode(self, mode: ProjectorMode):
         """切換投影機模式"""
@@ -50,21 +85,69 @@ class ProjectorRenderer:
         """
         根據當前模式渲染投影機畫面
         
+        回傳的是內部緩衝：內容沒變時為同一張畫面，呼叫端需要保留時請自行複製。
+
         Returns:
             1920×1080 BGR 影像
         """
-        if self.mode == ProjectorMode.IDLE:
-            return self._render_idle()
-        elif self.mode == ProjectorMode.CALIBRATION:
-            return self._render_calibration()
-        elif self.mode == ProjectorMode.DETECTION:
-            return self._render_detection()
-        elif self.mode == ProjectorMode.GAME:
-            return self._render_game()
-        elif self.mode == ProjectorMode.PRACTICE:
-            return self._render_practice()
+        self.render_calls += 1
+        mode = self.mode if self.mode in ProjectorMode else ProjectorMode.IDLE
+        static_key = self._static_layer_key(mode)
+
+        if static_key != self._static_key:
+            self._static = self._get_static_layer(static_key)
+            np.copyto(self._frame, self._static)
+            self._static_key = static_key
+            self._dirty_rects = []
+            self._ar_dirty = True
+            self.static_redraws += 1
+            self.generation += 1
+
+        if self._ar_dirty and mode in _DYNAMIC_MODES:
+            # 只還原上一次動態層畫過的矩形，再畫上新的疊加
+            for x0, y0, x1, y1 in self._dirty_rects:
+                self._frame[y0:y1, x0:x1] = self._static[y0:y1, x0:x1]
+            if mode == ProjectorMode.DETECTION:
+                self._dirty_rects = self._draw_detection(self._frame)
+            elif mode == ProjectorMode.GAME:
+                self._dirty_rects = self._draw_game(self._frame)
+            else:
+                self._dirty_rects = self._draw_practice(self._frame)
+            self.dynamic_redraws += 1
+            self.generation += 1
+        self._ar_dirty = False
+
+        return self._frame
+
+    # ==================== 靜態層 ====================
+
+    def _static_layer_key(self, mode: ProjectorMode) -> tuple:
+        if mode == ProjectorMode.CALIBRATION:
+            offsets = tuple(
+                (key, value.get("x", 0), value.get("y", 0))
+                for key, value in sorted(self.calibration_offsets.items())
+            )
+            return (mode, offsets)
+        return (mode,)
+
+    def _get_static_layer(self, key: tuple) -> np.ndarray:
+        layer = self._static_layers.get(key)
+        if layer is not None:
+            self._static_layers.move_to_end(key)
+            return layer
+
+        mode = key[0]
+        if mode == ProjectorMode.IDLE:
+            layer = self._render_idle()
+        elif mode == ProjectorMode.CALIBRATION:
+            layer = self._render_calibration()
         else:
-            return self._render_idle()
+            # 動態模式共用同一張純黑底圖
+            layer = self._black
+        self._static_layers[key] = layer
+        if len(self._static_layers) > _STATIC_CACHE_SIZE:
+            self._static_layers.popitem(last=False)
+        return layer
     
     def _render_idle(self) -> np.ndarray:
         """待機模式: 純黑畫面"""
@@ -79,6 +162,14 @@ class ProjectorRenderer:
         cv2.putText(frame, text, (text_x, text_y), font, 1.5, (50, 50, 50), 3)
         
         return frame
+
+    def _get_marker(self, marker_id: int, marker_size: int) -> np.ndarray:
+        """ArUco 標記影像（產生一次後快取）"""
+        marker_bgr = self._markers.get(marker_id)
+        if marker_bgr is None or marker_bgr.shape[0] != marker_size:
+            marker = cv2.aruco.generateImageMarker(self.aruco_dict, marker_id, marker_size)
+            marker_bgr = self._markers[marker_id] = cv2.cvtColor(marker, cv2.COLOR_GRAY2BGR)
+        return marker_bgr
     
     def _render_calibration(self) -> np.ndarray:
         """校正模式: ArUco 標記圖案"""
@@ -120,13 +211,8 @@ class ProjectorRenderer:
                          (255, 255, 255), 
                          -1)  # 填充白色
             
-            # 產生 ArUco 標記
-            marker = cv2.aruco.generateImageMarker(
-                self.aruco_dict, 
-                marker_id, 
-                marker_size
-            )
-            marker_bgr = cv2.cvtColor(marker, cv2.COLOR_GRAY2BGR)
+            # ArUco 標記（快取）
+            marker_bgr = self._get_marker(marker_id, marker_size)
             
             # 將標記放在白色背景中心
             marker_x = x + border_width
@@ -143,14 +229,34 @@ class ProjectorRenderer:
                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 3)
         
         return frame
+
+    # ==================== 動態層 ====================
+
+    def _clip(self, x0: float, y0: float, x1: float, y1: float) -> Optional[Rect]:
+        left, top = max(0, int(x0)), max(0, int(y0))
+        right, bottom = min(self.width, int(x1) + 1), min(self.height, int(y1) + 1)
+        if right <= left or bottom <= top:
+            return None
+        return (left, top, right, bottom)
+
+    def _text_rect(self, text: str, org: Tuple[int, int], scale: float, thickness: int) -> Optional[Rect]:
+        (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        x, y = org
+        return self._clip(x - thickness, y - th - thickness, x + tw + thickness, y + baseline + thickness)
+
+    @staticmethod
+    def _add(rects: List[Rect], rect: Optional[Rect]):
+        if rect is not None:
+            rects.append(rect)
     
-    def _render_detection(self) -> np.ndarray:
+    def _draw_detection(self, frame: np.ndarray) -> List[Rect]:
         """啟動辨識模式: 單純投影球的外框"""
-        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        rects: List[Rect] = []
         
         # 繪製球位外框 (不填充)
         for ball in self.ar_data.get("balls", []):
             x, y = int(ball.get("x", 0)), int(ball.get("y", 0))
+            radius = int(ball.get("radius", 20))
             ball_type = ball.get("type", "unknown")
             
             # 根據球類型選擇顏色
@@ -163,48 +269,57 @@ class ProjectorRenderer:
                 color = (0, 255, 0)  # 其他球: 綠色
             
             # 繪製外框圓圈 (不填充)
-            cv2.circle(frame, (x, y), 20, color, 2, cv2.LINE_AA)
+            cv2.circle(frame, (x, y), radius, color, 2, cv2.LINE_AA)
+            self._add(rects, self._clip(x - radius - 3, y - radius - 3, x + radius + 3, y + radius + 3))
             
             # 可選: 顯示球號
             if ball.get("number"):
                 cv2.putText(frame, str(ball["number"]), 
                            (x - 8, y + 5),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+                self._add(rects, self._text_rect(str(ball["number"]), (x - 8, y + 5), 0.5, 1))
         
-        return frame
+        return rects
     
-    def _render_game(self) -> np.ndarray:
+    def _draw_game(self, frame: np.ndarray) -> List[Rect]:
         """遊戲模式: AR 疊加 (軌跡、球位、輔助線)"""
-        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        rects: List[Rect] = []
         
         # 繪製軌跡
         for trajectory in self.ar_data.get("trajectories", []):
             if len(trajectory) > 1:
                 pts = np.array(trajectory, np.int32).reshape((-1, 1, 2))
                 cv2.polylines(frame, [pts], False, (0, 255, 0), 3, cv2.LINE_AA)
+                x, y, w, h = cv2.boundingRect(pts)
+                self._add(rects, self._clip(x - 3, y - 3, x + w + 3, y + h + 3))
         
         # 繪製球位 (填充)
         for ball in self.ar_data.get("balls", []):
             x, y = int(ball.get("x", 0)), int(ball.get("y", 0))
+            radius = int(ball.get("radius", 20))
             ball_type = ball.get("type", "unknown")
             color = (255, 255, 255) if ball_type == "cue" else (0, 255, 0)
-            cv2.circle(frame, (x, y), 20, color, -1, cv2.LINE_AA)
+            cv2.circle(frame, (x, y), radius, color, -1, cv2.LINE_AA)
+            self._add(rects, self._clip(x - radius - 2, y - radius - 2, x + radius + 2, y + radius + 2))
         
         # 繪製瞄準線
         for aim_line in self.ar_data.get("aim_lines", []):
             start = tuple(aim_line["start"])
             end = tuple(aim_line["end"])
             cv2.line(frame, start, end, (255, 255, 0), 2, cv2.LINE_AA)
+            self._add(rects, self._clip(min(start[0], end[0]) - 3, min(start[1], end[1]) - 3,
+                                        max(start[0], end[0]) + 3, max(start[1], end[1]) + 3))
         
-        return frame
+        return rects
     
-    def _render_practice(self) -> np.ndarray:
+    def _draw_practice(self, frame: np.ndarray) -> List[Rect]:
         """練習模式: 球外框 + 球形"""
-        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        rects: List[Rect] = []
         
         # 繪製球位 (外框 + 半透明填充)
         for ball in self.ar_data.get("balls", []):
             x, y = int(ball.get("x", 0)), int(ball.get("y", 0))
+            radius = int(ball.get("radius", 20))
             ball_type = ball.get("type", "unknown")
             
             # 根據球類型選擇顏色
@@ -215,26 +330,46 @@ class ProjectorRenderer:
             else:
                 color = (0, 255, 0)  # 其他球 (綠色)
             
-            # 繪製半透明填充球形
-            overlay = frame.copy()
-            cv2.circle(overlay, (x, y), 20, color, -1, cv2.LINE_AA)
-            cv2.addWeighted(frame, 0.7, overlay, 0.3, 0, frame)
+            # 繪製半透明填充球形（只混合球所在的小區域）
+            rect = self._clip(x - radius - 3, y - radius - 3, x + radius + 3, y + radius + 3)
+            if rect is not None:
+                x0, y0, x1, y1 = rect
+                region = frame[y0:y1, x0:x1]
+                overlay = region.copy()
+                cv2.circle(overlay, (x - x0, y - y0), radius, color, -1, cv2.LINE_AA)
+                cv2.addWeighted(region, 0.7, overlay, 0.3, 0, region)
+                rects.append(rect)
             
             # 繪製外框
-            cv2.circle(frame, (x, y), 20, color, 2, cv2.LINE_AA)
+            cv2.circle(frame, (x, y), radius, color, 2, cv2.LINE_AA)
             
             # 顯示球號
             if ball.get("number"):
                 cv2.putText(frame, str(ball["number"]), 
                            (x - 8, y + 5),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+                self._add(rects, self._text_rect(str(ball["number"]), (x - 8, y + 5), 0.5, 2))
         
-        return frame
+        return rects
     
     def update_calibration_offsets(self, offsets: Dict):
         """更新校正模式的標記偏移"""
         self.calibration_offsets.update(offsets)
     
     def update_ar_data(self, ar_data: Dict):
-        """更新 AR 疊加資料"""
-        self.ar_data.update(ar_data)
+        """更新 AR 疊加資料（內容相同時不觸發重繪）"""
+        updated = {**self.ar_data, **ar_data}
+        if updated != self.ar_data:
+            self.ar_data = updated
+            self._ar_dirty = True
+
+    def get_stats(self) -> dict:
+        return {
+            "mode": self.mode.value,
+            "generation": self.generation,
+            "render_calls": self.render_calls,
+            "static_redraws": self.static_redraws,
+            "dynamic_redraws": self.dynamic_redraws,
+            "cached_static_layers": len(self._static_layers),
+            "dirty_rects": len(self._dirty_rects),
+        }
@@ -120,6 +120,18 @@ JPEG_QUALITY = get_env("JPEG_QUALITY", "70", int)  # 影像傳輸品質 (0-100)
 VIDEO_SOURCE = os.getenv("VIDEO_SOURCE", "")
 STREAM_PROJECTOR_VIEW = get_bool_env("STREAM_PROJECTOR_VIEW", "true")
 LOOP_VIDEO_SOURCE = get_bool_env("LOOP_VIDEO_SOURCE", "true")
+CAPTURE_MAX_FPS = get_env("CAPTURE_MAX_FPS", "30", float)  # 捕獲循環幀率上限
+CAMERA_FRAME_MAX_AGE_SEC = get_env("CAMERA_FRAME_MAX_AGE_SEC", "0.5", float)  # 校正 / 截圖可直接使用的最新幀年齡上限
+CAMERA_FRAME_WAIT_SEC = get_env("CAMERA_FRAME_WAIT_SEC", "1.0", float)  # 最新幀過舊時等待下一幀的時間
+_snapshot_dir_env = os.getenv("SNAPSHOT_DIR", "data/snapshots")
+SNAPSHOT_DIR = _snapshot_dir_env if os.path.isabs(_snapshot_dir_env) else os.path.join(BASE_DIR, _snapshot_dir_env)
+
+# --- Synthetic Scene (VIDEO_SOURCE=synthetic) ---
+SYNTHETIC_FPS = get_env("SYNTHETIC_FPS", "30", float)  # 合成畫面產生速率（0 = 不限速）
+SYNTHETIC_BALLS = get_env("SYNTHETIC_BALLS", "10", int)  # 彩球數量（不含白球）
+SYNTHETIC_SEED = get_env("SYNTHETIC_SEED", "0", int)  # 相同 seed 產生相同畫面序列
+SYNTHETIC_NOISE = get_env("SYNTHETIC_NOISE", "2.0", float)  # 影像雜訊標準差
+SYNTHETIC_TRUTH_MODEL = get_bool_env("SYNTHETIC_TRUTH_MODEL", "true")  # 以真實標註取代 YOLO
 
 # --- Session Management (v1.5) ---
 SESSION_TTL = get_env("SESSION_TTL", "3600", int)  # Session 有效期（秒）
@@ -133,10 +145,15 @@ WS_CLIENT_TIMEOUT = get_env("WS_CLIENT_TIMEOUT", "15", int)  # Client heartbeat
 # --- Stream Settings (v1.5) ---
 MJPEG_QUALITY = get_env("MJPEG_QUALITY", "80", int)
 MJPEG_MAX_FPS = get_env("MJPEG_MAX_FPS", "30", int)
+MJPEG_KEEPALIVE_SEC = get_env("MJPEG_KEEPALIVE_SEC", "1.0", float)  # MJPEG 畫面靜止時重送同一幀的間隔（秒）
 
 # --- Metadata Settings (v1.5) ---
 METADATA_RATE_HZ = get_env("METADATA_RATE_HZ", "10", int)  # Metadata 推送頻率
 METADATA_BUFFER_SIZE = get_env("METADATA_BUFFER_SIZE", "100", int)  # Buffer 大小限制
+METADATA_KEEPALIVE_SEC = get_env("METADATA_KEEPALIVE_SEC", "1.0", float)  # 無新數據時的重送間隔（秒）
+METADATA_V2_ENABLED = get_bool_env("METADATA_V2_ENABLED", True)  # 允許協商 v2（MessagePack 差量，需安裝 msgpack）
+METADATA_V2_KEYFRAME_SEC = get_env("METADATA_V2_KEYFRAME_SEC", "2.0", float)  # v2 完整狀態間隔（秒）
+METADATA_V2_QUANT_PX = get_env("METADATA_V2_QUANT_PX", "2", int)  # v2 座標量化單位（像素）
 
 # --- Feature Flags (v1.5) ---
 ENABLE_DEV_MODE = get_bool_env("ENABLE_DEV_MODE", "false")
@@ -146,3 +163,55 @@ ENABLE_MULTI_TABLE = get_bool_env("ENABLE_MULTI_TABLE", "false")
 # --- Burn-in Performance Settings ---
 ENABLE_ADAPTIVE_QUALITY = get_bool_env("ENABLE_ADAPTIVE_QUALITY", "false")  # 預設關閉,由用戶啟用
 ENABLE_SUBSCRIBER_CHECK = get_bool_env("ENABLE_SUBSCRIBER_CHECK", "true")  # 啟用訂閱者檢查
+
+# --- Recording Event Sink ---
+EVENT_BATCH_SIZE = get_env("EVENT_BATCH_SIZE", "50", int)  # 累積多少筆事件就批次寫入資料庫
+EVENT_FLUSH_INTERVAL_MS = get_env("EVENT_FLUSH_INTERVAL_MS", "500", int)  # 最長寫入間隔（毫秒）
+
+# --- Replay Sessions ---
+REPLAY_FRAME_CACHE_MB = get_env("REPLAY_FRAME_CACHE_MB", "64", int)  # 回放 JPEG 快取上限（MB）
+REPLAY_SESSION_IDLE_SEC = get_env("REPLAY_SESSION_IDLE_SEC", "30", float)  # 無觀眾多久後釋放解碼器
+REPLAY_MAX_RATE = get_env("REPLAY_MAX_RATE", "4.0", float)  # 最大播放速率
+REPLAY_SEEK_INDEX_CACHE = get_env("REPLAY_SEEK_INDEX_CACHE", "32", int)  # 記憶體中保留的跳轉索引數量
+
+# --- Thumbnails ---
+THUMBNAIL_CACHE_MB = get_env("THUMBNAIL_CACHE_MB", "32", int)  # 縮圖記憶體快取上限（MB）
+THUMBNAIL_SPRITE_FRAMES = get_env("THUMBNAIL_SPRITE_FRAMES", "20", int)  # sprite sheet 取樣張數
+
+# --- Instrumentation ---
+LOOP_LAG_INTERVAL_MS = get_env("LOOP_LAG_INTERVAL_MS", "50", float)  # event loop 延遲取樣間隔（毫秒）
+LOOP_STALL_THRESHOLD_MS = get_env("LOOP_STALL_THRESHOLD_MS", "100", float)  # 超過此值記錄 loop 卡住的堆疊（毫秒）
+PIPELINE_PROFILER_ENABLED = get_bool_env("PIPELINE_PROFILER_ENABLED", True)  # 每幀各階段耗時量測
+PIPELINE_TRACE_FRAMES = get_env("PIPELINE_TRACE_FRAMES", "120", int)  # 保留最近幾幀的完整追蹤
+SAMPLING_PROFILER_MAX_SEC = get_env("SAMPLING_PROFILER_MAX_SEC", "60", float)  # /api/admin/profile 單次取樣上限（秒）
+
+# --- Projector Warp ---
+WARP_THREADS = get_env("WARP_THREADS", "0", int)  # 投影變形平行條帶數（0 = 依 CPU 核心數，最多 4）
+WARP_TABLE_ROI_ONLY = get_bool_env("WARP_TABLE_ROI_ONLY", "true")  # 只變形球桌 ROI（其餘為黑色）
+AR_VECTOR_PIPELINE = get_bool_env("AR_VECTOR_PIPELINE", "true")  # 投影視圖直接以向量繪製 AR，不變形相機畫面
+
+# --- Calibration Profiles ---
+# 校正設定檔資料夾（相對於 backend 資料夾），每組相機 / 投影機一個 JSON
+_calibration_dir_env = os.getenv("CALIBRATION_DIR", "data/calibration")
+CALIBRATION_DIR = (
+    _calibration_dir_env if os.path.isabs(_calibration_dir_env) else os.path.join(BASE_DIR, _calibration_dir_env)
+)
+# 舊版單一矩陣檔，沒有專屬設定檔時作為預設
+LEGACY_CALIBRATION_PATH = os.path.join(BASE_DIR, "calibration_matrix.npy")
+# 檢查設定檔是否被外部更新的間隔
+CALIBRATION_CHECK_INTERVAL_SEC = get_env("CALIBRATION_CHECK_INTERVAL_SEC", "1.0", float)
+PROJECTOR_ID = get_env("PROJECTOR_ID", "default", str)  # 目前使用的投影機識別（校正設定檔的一部分）
+CALIBRATION_DETECT_HZ = get_env("CALIBRATION_DETECT_HZ", "5", float)  # 校正中 ArUco 檢測頻率（捕獲循環）
+ARUCO_DETECT_SCALE = get_env("ARUCO_DETECT_SCALE", "0.5", float)  # ArUco 先在縮小畫面檢測的倍率
+CALIBRATION_RESULT_MAX_AGE_SEC = get_env("CALIBRATION_RESULT_MAX_AGE_SEC", "2.0", float)  # 快取檢測結果的有效時間
+
+# --- Table Geometry ---
+TABLE_SEGMENT_SCALE = get_env("TABLE_SEGMENT_SCALE", "0.25", float)  # 桌布分割縮小倍率（1.0 = 舊版全解析度 RETR_TREE）
+TABLE_DRIFT_CHECK_SEC = get_env("TABLE_DRIFT_CHECK_SEC", "2.0", float)  # 背景檢查球桌是否移動的間隔（秒）
+TABLE_DRIFT_CHECK_SCALE = get_env("TABLE_DRIFT_CHECK_SCALE", "0.25", float)  # 漂移檢查使用的縮小倍率
+TABLE_DRIFT_MIN_SHIFT_PX = get_env("TABLE_DRIFT_MIN_SHIFT_PX", "6", float)  # 四角位移超過此值才發布新幾何
+TABLE_POCKET_RADIUS_RATIO = get_env("TABLE_POCKET_RADIUS_RATIO", "0.025", float)  # 袋口半徑 / 球桌長邊
+TABLE_LENGTH_MM = get_env("TABLE_LENGTH_MM", "2540", float)  # 桌面（庫邊內）長度，9 呎球桌 2540 mm
+TABLE_WIDTH_MM = get_env("TABLE_WIDTH_MM", "1270", float)  # 桌面（庫邊內）寬度
+BALL_DIAMETER_MM = get_env("BALL_DIAMETER_MM", "57.15", float)  # 球直徑
+TRACK_RECTIFIED_ROI = get_bool_env("TRACK_RECTIFIED_ROI", "false")  # 推論輸入改用校正後只含桌面的畫面
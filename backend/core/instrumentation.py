@@ -0,0 +1,432 @@
+"""
+執行期量測 - event loop 延遲、各端點延遲分佈、WebSocket 發送時間
+
+- LatencyHistogram：對數分桶（每 2 倍分 4 桶），可求 p50/p95/p99，固定記憶體
+- LoopMonitor：asyncio 取樣 event loop 延遲；看門狗線程在 loop 卡住時抓下 loop 線程的堆疊，
+  直接指出是哪個 handler 阻塞
+- InstrumentationMiddleware：純 ASGI middleware，依路由樣板（/api/recordings/{game_id}）記錄
+  首位元組時間與總時間，並追蹤進行中的請求
+- 匯出：get_stats()（/api/performance）與 render_prometheus()（/metrics）
+"""
+
+import asyncio
+import math
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# 直方圖分桶：10 µs 起，每 2 倍分 4 桶（相對誤差 < 19%，插值後更小），上限約 335 秒
+_BUCKETS_PER_DOUBLING = 4
+_BUCKET_BASE_SEC = 1e-5
+_BUCKET_COUNT = 100
+BUCKET_BOUNDS = [_BUCKET_BASE_SEC * 2 ** (i / _BUCKETS_PER_DOUBLING) for i in range(_BUCKET_COUNT)]
+
+# Prometheus 匯出的 le 邊界：取每個 2 倍點（10 µs, 20 µs, 40 µs, ...）
+_PROM_BOUND_INDEXES = list(range(0, _BUCKET_COUNT, _BUCKETS_PER_DOUBLING))
+
+# 未匹配任何路由的請求統一歸類，避免任意路徑造成標籤爆量
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def bucket_index(seconds: float) -> int:
+    """秒數 → 分桶索引（最後一桶為溢位）"""
+    if seconds <= _BUCKET_BASE_SEC:
+        return 0
+    index = int(math.ceil(math.log2(seconds / _BUCKET_BASE_SEC) * _BUCKETS_PER_DOUBLING - 1e-9))
+    return min(index, _BUCKET_COUNT)
+
+
+def empty_bucket_counts() -> List[int]:
+    return [0] * (_BUCKET_COUNT + 1)
+
+
+class LatencyHistogram:
+    """對數分桶延遲直方圖（秒，執行緒安全）"""
+
+    __slots__ = ("_counts", "count", "total", "max", "_lock")
+
+    def __init__(self):
+        self._counts = empty_bucket_counts()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        if seconds < 0:
+            seconds = 0.0
+        index = bucket_index(seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def merge(self, counts: List[int], count: int, total: float, max_value: float):
+        """併入另一組分桶計數（彙總各線程的分片）"""
+        with self._lock:
+            for index, n in enumerate(counts):
+                if n:
+                    self._counts[index] += n
+            self.count += count
+            self.total += total
+            if max_value > self.max:
+                self.max = max_value
+
+    def percentile(self, p: float) -> float:
+        """p 介於 0~1；於桶內線性插值"""
+        with self._lock:
+            if self.count == 0:
+                return 0.0
+            target = p * self.count
+            seen = 0
+            for index, n in enumerate(self._counts):
+                if n and seen + n >= target:
+                    upper = BUCKET_BOUNDS[index] if index < _BUCKET_COUNT else self.max
+                    lower = BUCKET_BOUNDS[index - 1] if index > 0 else 0.0
+                    fraction = (target - seen) / n
+                    return min(lower + (upper - lower) * fraction, self.max)
+                seen += n
+            return self.max
+
+    def summary(self) -> dict:
+        """毫秒摘要"""
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": round(self.total / count * 1000, 3) if count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 3),
+            "p95_ms": round(self.percentile(0.95) * 1000, 3),
+            "p99_ms": round(self.percentile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+    def prometheus_lines(self, name: str, labels: str) -> List[str]:
+        """Prometheus histogram 格式（累計 bucket + sum + count）"""
+        with self._lock:
+            counts = list(self._counts)
+            count = self.count
+            total = self.total
+        lines = []
+        cumulative = 0
+        position = 0
+        sep = "," if labels else ""
+        for bound_index in _PROM_BOUND_INDEXES:
+            while position <= bound_index:
+                cumulative += counts[position]
+                position += 1
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{BUCKET_BOUNDS[bound_index]:.6g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {total:.9g}")
+        lines.append(f"{name}_count{{{labels}}} {count}")
+        return lines
+
+
+class _RouteStats:
+    __slots__ = ("ttfb", "duration", "status")
+
+    def __init__(self):
+        self.ttfb = LatencyHistogram()
+        self.duration = LatencyHistogram()
+        self.status: Dict[str, int] = {}
+
+
+class Instrumentation:
+    """量測資料登錄處（全域單例 metrics）"""
+
+    def __init__(self, stall_history: int = 20):
+        self._lock = threading.Lock()
+        self.routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self.ws_send: Dict[str, LatencyHistogram] = {}
+        self.ws_bytes: Dict[str, int] = {}
+        self.ws_active: Dict[str, int] = {}
+        self.loop_lag = LatencyHistogram()
+        self.stalls: Deque[dict] = deque(maxlen=stall_history)
+        self.stall_count = 0
+        self.inflight: Dict[int, Tuple[str, str, float]] = {}
+        self.started_at = time.time()
+        self.monitor: Optional["LoopMonitor"] = None
+
+    # ------------------------------------------------------------------
+    # 記錄
+    # ------------------------------------------------------------------
+
+    def _route_stats(self, method: str, route: str) -> _RouteStats:
+        key = (method, route)
+        stats = self.routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self.routes.setdefault(key, _RouteStats())
+        return stats
+
+    def record_request(self, method: str, route: str, status: int, ttfb: Optional[float], duration: float):
+        stats = self._route_stats(method, route)
+        if ttfb is not None:
+            stats.ttfb.record(ttfb)
+        stats.duration.record(duration)
+        status_class = f"{status // 100}xx"
+        with self._lock:
+            stats.status[status_class] = stats.status.get(status_class, 0) + 1
+
+    def record_ws_send(self, channel: str, seconds: float, nbytes: int = 0):
+        """記錄一次 WebSocket 發送（await send_text / send_bytes 的時間）"""
+        histogram = self.ws_send.get(channel)
+        if histogram is None:
+            with self._lock:
+                histogram = self.ws_send.setdefault(channel, LatencyHistogram())
+        histogram.record(seconds)
+        if nbytes:
+            with self._lock:
+                self.ws_bytes[channel] = self.ws_bytes.get(channel, 0) + nbytes
+
+    def ws_connected(self, route: str, delta: int):
+        with self._lock:
+            self.ws_active[route] = self.ws_active.get(route, 0) + delta
+
+    # ------------------------------------------------------------------
+    # 匯出
+    # ------------------------------------------------------------------
+
+    def get_stats(self) -> dict:
+        routes = {}
+        for (method, route), stats in sorted(list(self.routes.items()), key=lambda kv: (kv[0][1], kv[0][0])):
+            routes[f"{method} {route}"] = {
+                "ttfb": stats.ttfb.summary(),
+                "duration": stats.duration.summary(),
+                "status": dict(stats.status),
+            }
+        now = time.perf_counter()
+        with self._lock:
+            inflight = [
+                {"method": method, "route": route, "elapsed_ms": round((now - start) * 1000, 1)}
+                for method, route, start in self.inflight.values()
+            ]
+        return {
+            "uptime_sec": round(time.time() - self.started_at, 1),
+            "event_loop": {
+                "lag": self.loop_lag.summary(),
+                "interval_ms": self.monitor.interval * 1000 if self.monitor else None,
+                "stall_threshold_ms": self.monitor.stall_threshold * 1000 if self.monitor else None,
+                "stall_count": self.stall_count,
+                "recent_stalls": list(self.stalls),
+            },
+            "routes": routes,
+            "inflight": sorted(inflight, key=lambda r: -r["elapsed_ms"]),
+            "websocket": {
+                "active": dict(self.ws_active),
+                "send": {name: h.summary() for name, h in sorted(list(self.ws_send.items()))},
+                "bytes": dict(self.ws_bytes),
+            },
+        }
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP billiards_event_loop_lag_seconds asyncio event loop scheduling lag",
+            "# TYPE billiards_event_loop_lag_seconds histogram",
+        ]
+        lines += self.loop_lag.prometheus_lines("billiards_event_loop_lag_seconds", "")
+        lines += [
+            "# HELP billiards_event_loop_stalls_total event loop stalls over the threshold",
+            "# TYPE billiards_event_loop_stalls_total counter",
+            f"billiards_event_loop_stalls_total {self.stall_count}",
+        ]
+
+        for metric, attr, help_text in (
+            ("billiards_http_request_ttfb_seconds", "ttfb", "time until response headers"),
+            ("billiards_http_request_duration_seconds", "duration", "time until response complete"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (method, route), stats in sorted(list(self.routes.items())):
+                labels = f'method="{method}",route="{_escape(route)}"'
+                lines += getattr(stats, attr).prometheus_lines(metric, labels)
+
+        lines.append("# HELP billiards_http_responses_total responses by status class")
+        lines.append("# TYPE billiards_http_responses_total counter")
+        for (method, route), stats in sorted(list(self.routes.items())):
+            for status_class, n in sorted(stats.status.items()):
+                lines.append(
+                    f'billiards_http_responses_total{{method="{method}",route="{_escape(route)}",'
+                    f'status="{status_class}"}} {n}'
+                )
+
+        lines.append("# HELP billiards_ws_send_seconds WebSocket send duration")
+        lines.append("# TYPE billiards_ws_send_seconds histogram")
+        for channel, histogram in sorted(self.ws_send.items()):
+            lines += histogram.prometheus_lines("billiards_ws_send_seconds", f'channel="{_escape(channel)}"')
+        lines.append("# HELP billiards_ws_sent_bytes_total WebSocket bytes sent")
+        lines.append("# TYPE billiards_ws_sent_bytes_total counter")
+        for channel, n in sorted(self.ws_bytes.items()):
+            lines.append(f'billiards_ws_sent_bytes_total{{channel="{_escape(channel)}"}} {n}')
+        lines.append("# HELP billiards_ws_connections active WebSocket connections")
+        lines.append("# TYPE billiards_ws_connections gauge")
+        for route, n in sorted(self.ws_active.items()):
+            lines.append(f'billiards_ws_connections{{route="{_escape(route)}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.routes = {}
+            self.ws_send = {}
+            self.ws_bytes = {}
+            self.loop_lag = LatencyHistogram()
+            self.stalls.clear()
+            self.stall_count = 0
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class LoopMonitor:
+    """
+    event loop 延遲取樣 + 卡住偵測
+
+    - 取樣協程每 interval 秒醒來一次，實際延遲 - interval 即為 loop lag
+    - 看門狗線程發現 loop 超過 stall_threshold 未醒來時，抓下 loop 線程目前的堆疊
+      （此時阻塞的程式碼仍在執行，堆疊即為兇手）與進行中的請求
+    """
+
+    def __init__(self, metrics: Instrumentation, interval: float = 0.05, stall_threshold: float = 0.1):
+        self.metrics = metrics
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_tick = time.perf_counter()
+        self._stall_reported = False
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick = time.perf_counter()
+        self._stop.clear()
+        self._task = loop.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        self.metrics.monitor = self
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _sample(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(self.interval)
+                now = time.perf_counter()
+                self.metrics.loop_lag.record(now - start - self.interval)
+                self._last_tick = now
+                self._stall_reported = False
+        except asyncio.CancelledError:
+            pass
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            blocked = time.perf_counter() - self._last_tick - self.interval
+            if blocked < self.stall_threshold or self._stall_reported:
+                continue
+            self._stall_reported = True
+            self._record_stall(blocked)
+
+    def _record_stall(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = []
+        if frame is not None:
+            stack = [
+                f"{entry.filename}:{entry.lineno} {entry.name}"
+                for entry in traceback.extract_stack(frame)[-12:]
+            ]
+        now = time.perf_counter()
+        with self.metrics._lock:
+            inflight = [
+                f"{method} {route} ({(now - start) * 1000:.0f} ms)"
+                for method, route, start in self.metrics.inflight.values()
+            ]
+        self.metrics.stall_count += 1
+        self.metrics.stalls.append({
+            "ts": time.time(),
+            "blocked_ms": round(blocked * 1000, 1),
+            "inflight": inflight,
+            "stack": stack,
+        })
+        print(f"⚠️ Event loop blocked > {blocked * 1000:.0f} ms: {stack[-1] if stack else '?'}")
+
+
+class InstrumentationMiddleware:
+    """純 ASGI middleware：每個路由樣板的首位元組時間 / 總時間、WebSocket 連線數"""
+
+    def __init__(self, app, metrics: Instrumentation):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope["type"]
+        if scope_type == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+        if scope_type != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = self.metrics
+        method = scope.get("method", "GET")
+        start = time.perf_counter()
+        state: Dict[str, Any] = {"status": 500, "ttfb": None}
+        key = id(scope)
+        with metrics._lock:
+            metrics.inflight[key] = (method, scope.get("path", ""), start)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                state["ttfb"] = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            with metrics._lock:
+                metrics.inflight.pop(key, None)
+            metrics.record_request(
+                method, _route_template(scope), state["status"], state["ttfb"], time.perf_counter() - start
+            )
+
+    async def _websocket(self, scope, receive, send):
+        accepted = False
+        route_holder: Dict[str, str] = {}
+
+        async def send_wrapper(message):
+            nonlocal accepted
+            if message["type"] == "websocket.accept" and not accepted:
+                accepted = True
+                route_holder["route"] = _route_template(scope)
+                self.metrics.ws_connected(route_holder["route"], 1)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if accepted:
+                self.metrics.ws_connected(route_holder["route"], -1)
+
+
+def _route_template(scope) -> str:
+    """路由樣板（FastAPI 匹配後寫入 scope["route"]）"""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path if path else UNMATCHED_ROUTE
+
+
+# 全域量測登錄處
+metrics = Instrumentation()
@@ -0,0 +1,308 @@
+"""
+管線分段量測 - 每幀各階段耗時分佈 + 最近 N 幀完整時間軸
+
+- 各階段延遲以對數分桶直方圖記錄（與 core.instrumentation 同一套分桶），可求 p50/p95/p99
+- 無鎖記錄：每個線程寫入自己的分片（單一寫入者），讀取統計時才彙總
+- 環狀緩衝保留最近 N 幀的完整追蹤（捕獲線程 + 推論線程的所有階段）
+- 追蹤可匯出為 Chrome trace JSON（chrome://tracing、Perfetto 直接開啟）
+
+使用方式:
+    trace = profiler.begin_frame(frame_id)          # 捕獲線程：開始一幀
+    with profiler.stage("capture.read"):
+        ...
+    executor.submit(profiler.bind(trace, fn), ...)  # 推論線程的階段歸入同一幀
+    profiler.end_frame(trace)
+
+階段名稱以「模組.階段」命名（capture.read、track.inference、mjpeg.encode.monitor ...）。
+沒有進行中的幀時（例如 MJPEG 在 event loop 上編碼）只記入直方圖。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from core.instrumentation import LatencyHistogram, bucket_index, empty_bucket_counts
+
+
+class FrameTrace:
+    """單幀追蹤：(階段, 線程 id, 開始, 耗時) 的清單"""
+
+    __slots__ = ("frame_id", "start", "end", "spans")
+
+    def __init__(self, frame_id: int, start: float):
+        self.frame_id = frame_id
+        self.start = start
+        self.end: Optional[float] = None
+        # list.append 在 GIL 下為原子操作；推論線程可能在幀結束後才補上階段
+        self.spans: List[Tuple[str, int, float, float]] = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or self.start) - self.start
+
+
+class _ShardHistogram:
+    """單一線程寫入的分桶計數（不加鎖）"""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = empty_bucket_counts()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bucket_index(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class _Shard:
+    __slots__ = ("thread_id", "thread_name", "stages", "trace")
+
+    def __init__(self):
+        thread = threading.current_thread()
+        self.thread_id = thread.ident or 0
+        self.thread_name = thread.name
+        self.stages: Dict[str, _ShardHistogram] = {}
+        self.trace: Optional[FrameTrace] = None
+
+
+class _Stage:
+    """with profiler.stage(name) 的計時器"""
+
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler: "PipelineProfiler", name: str):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profiler.record(self._name, self._start, time.perf_counter() - self._start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class PipelineProfiler:
+    """每幀管線分段量測（全域單例 profiler）"""
+
+    FRAME_STAGE = "frame"
+
+    def __init__(self, trace_capacity: int = 120, enabled: bool = True):
+        self.enabled = enabled
+        self.trace_capacity = trace_capacity
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+        self._traces: Deque[FrameTrace] = deque(maxlen=trace_capacity)
+        self._epoch = time.perf_counter()
+        self._epoch_wall = time.time()
+        self._reset_generation = 0
+
+    def configure(self, enabled: bool, trace_capacity: int):
+        """套用設定（啟動時呼叫）"""
+        self.enabled = enabled
+        if trace_capacity != self.trace_capacity:
+            self.trace_capacity = trace_capacity
+            self._traces = deque(self._traces, maxlen=trace_capacity)
+
+    # ------------------------------------------------------------------
+    # 記錄
+    # ------------------------------------------------------------------
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None or getattr(self._local, "generation", -1) != self._reset_generation:
+            previous = shard
+            shard = _Shard()
+            if previous is not None:
+                shard.trace = previous.trace
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            self._local.generation = self._reset_generation
+        return shard
+
+    def stage(self, name: str):
+        """計時一個階段（context manager）；停用時為空操作"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name: str, start: float, duration: float):
+        """直接記錄一段已量測的耗時（start 為 perf_counter 值）"""
+        if not self.enabled:
+            return
+        shard = self._shard()
+        histogram = shard.stages.get(name)
+        if histogram is None:
+            histogram = shard.stages[name] = _ShardHistogram()
+        histogram.record(duration)
+        trace = shard.trace
+        if trace is not None:
+            trace.spans.append((name, shard.thread_id, start, duration))
+
+    def begin_frame(self, frame_id: int, start: Optional[float] = None) -> Optional[FrameTrace]:
+        """開始一幀；之後本線程的階段都歸入此幀（start 可回溯到讀取幀之前）"""
+        if not self.enabled:
+            return None
+        trace = FrameTrace(frame_id, start if start is not None else time.perf_counter())
+        self._shard().trace = trace
+        return trace
+
+    def end_frame(self, trace: Optional[FrameTrace]):
+        """結束一幀：記錄整幀耗時並放入環狀緩衝"""
+        if trace is None:
+            return
+        shard = self._shard()
+        if shard.trace is trace:
+            shard.trace = None
+        trace.end = time.perf_counter()
+        histogram = shard.stages.get(self.FRAME_STAGE)
+        if histogram is None:
+            histogram = shard.stages[self.FRAME_STAGE] = _ShardHistogram()
+        histogram.record(trace.duration)
+        self._traces.append(trace)
+
+    def bind(self, trace: Optional[FrameTrace], fn: Callable) -> Callable:
+        """包裝要在其他線程執行的函式，使其階段歸入 trace 所屬的幀"""
+        if trace is None:
+            return fn
+
+        def run(*args, **kwargs):
+            shard = self._shard()
+            previous = shard.trace
+            shard.trace = trace
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                shard.trace = previous
+
+        return run
+
+    # ------------------------------------------------------------------
+    # 匯出
+    # ------------------------------------------------------------------
+
+    def _merged(self) -> Dict[str, LatencyHistogram]:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged: Dict[str, LatencyHistogram] = {}
+        for shard in shards:
+            for name, part in list(shard.stages.items()):
+                histogram = merged.get(name)
+                if histogram is None:
+                    histogram = merged[name] = LatencyHistogram()
+                histogram.merge(list(part.counts), part.count, part.total, part.max)
+        return merged
+
+    def get_stats(self) -> dict:
+        merged = self._merged()
+        frame = merged.pop(self.FRAME_STAGE, None)
+        traces = list(self._traces)
+        slowest = sorted((t for t in traces if t.end is not None), key=lambda t: -t.duration)[:5]
+        return {
+            "enabled": self.enabled,
+            "frame": frame.summary() if frame else LatencyHistogram().summary(),
+            "stages": {name: merged[name].summary() for name in sorted(merged)},
+            "traces": {
+                "capacity": self.trace_capacity,
+                "buffered": len(traces),
+                "first_frame_id": traces[0].frame_id if traces else None,
+                "last_frame_id": traces[-1].frame_id if traces else None,
+                "slowest": [
+                    {"frame_id": t.frame_id, "total_ms": round(t.duration * 1000, 3)}
+                    for t in slowest
+                ],
+            },
+        }
+
+    def get_traces(self, frame_id: Optional[int] = None, last: Optional[int] = None) -> List[FrameTrace]:
+        """取出緩衝中的追蹤：指定 frame_id 或最近 last 幀（預設全部）"""
+        traces = list(self._traces)
+        if frame_id is not None:
+            return [t for t in traces if t.frame_id == frame_id]
+        if last is not None:
+            return traces[-last:] if last > 0 else []
+        return traces
+
+    def export_chrome_trace(self, traces: List[FrameTrace]) -> dict:
+        """轉為 Chrome trace event 格式（時間單位：微秒）"""
+        with self._shards_lock:
+            thread_names = {shard.thread_id: shard.thread_name for shard in self._shards}
+
+        events: List[Dict[str, Any]] = []
+        used_threads = set()
+        for trace in traces:
+            end = trace.end if trace.end is not None else time.perf_counter()
+            owner = None
+            for name, thread_id, start, duration in list(trace.spans):
+                used_threads.add(thread_id)
+                if owner is None:
+                    owner = thread_id
+                events.append({
+                    "name": name,
+                    "cat": name.split(".", 1)[0],
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": thread_id,
+                    "ts": round((start - self._epoch) * 1e6, 1),
+                    "dur": round(duration * 1e6, 1),
+                    "args": {"frame_id": trace.frame_id},
+                })
+            # 整幀區段畫在第一個記錄階段的線程（捕獲線程）上
+            events.append({
+                "name": f"{self.FRAME_STAGE} {trace.frame_id}",
+                "cat": self.FRAME_STAGE,
+                "ph": "X",
+                "pid": 1,
+                "tid": owner if owner is not None else 0,
+                "ts": round((trace.start - self._epoch) * 1e6, 1),
+                "dur": round((end - trace.start) * 1e6, 1),
+                "args": {"frame_id": trace.frame_id},
+            })
+
+        events.append({"name": "process_name", "ph": "M", "pid": 1, "args": {"name": "billiards-backend"}})
+        for thread_id in sorted(used_threads):
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": thread_id,
+                "args": {"name": thread_names.get(thread_id, str(thread_id))},
+            })
+        events.sort(key=lambda e: e.get("ts", -1))
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {"epoch_unix": self._epoch_wall},
+        }
+
+    def reset(self):
+        """清除直方圖與追蹤；各線程於下次記錄時建立新分片"""
+        with self._shards_lock:
+            self._shards = []
+            self._reset_generation += 1
+        self._traces.clear()
+
+
+# 全域管線量測
+profiler = PipelineProfiler()
@@ -0,0 +1,122 @@
+"""
+取樣式效能剖析 - 執行期以 API 啟動，輸出 collapsed stack（火焰圖）
+
+- 取樣線程每 interval 秒以 sys._current_frames() 抓下所有線程的堆疊
+  （捕獲線程、推論 worker、event loop 都在內），累計相同堆疊的次數
+- 輸出 Brendan Gregg collapsed 格式：「線程;外層函式;...;內層函式 次數」，
+  可直接給 flamegraph.pl、speedscope、Perfetto 使用
+- 未啟動時沒有任何 hook 或背景線程，對系統零額外負擔
+- 同一時間只允許一次剖析
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+# 堆疊最多保留的層數（由內往外），避免遞迴或過深的呼叫鏈
+_MAX_DEPTH = 128
+
+
+class ProfilerBusyError(RuntimeError):
+    """已有剖析進行中"""
+
+
+def _frame_label(code) -> str:
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """全線程統計取樣剖析器（全域單例 sampling_profiler）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread_labels: Dict[int, str] = {}
+        self.last_run: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def label_thread(self, thread_id: int, label: str):
+        """為線程指定顯示名稱（例如 event loop 所在的 MainThread）"""
+        self._thread_labels[thread_id] = label
+
+    def run(self, duration: float, interval: float = 0.005) -> str:
+        """
+        阻塞取樣 duration 秒，回傳 collapsed stack 文字
+
+        Raises:
+            ProfilerBusyError: 已有剖析進行中
+        """
+        with self._lock:
+            if self._running:
+                raise ProfilerBusyError("A profiling run is already in progress")
+            self._running = True
+
+        own_id = threading.get_ident()
+        stacks: Counter = Counter()
+        labels: Dict = {}
+        samples = 0
+        started = time.perf_counter()
+        deadline = started + duration
+        try:
+            next_tick = started
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    thread_name = self._thread_labels.get(thread_id) or names.get(thread_id) or str(thread_id)
+                    codes = []
+                    depth = 0
+                    while frame is not None and depth < _MAX_DEPTH:
+                        codes.append(frame.f_code)
+                        frame = frame.f_back
+                        depth += 1
+                    stacks[(thread_name, tuple(codes))] += 1
+                samples += 1
+                next_tick += interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # 落後時不追趕，避免連續取樣拉高負擔
+                    next_tick = time.perf_counter()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._running = False
+
+        lines = []
+        for (thread_name, codes), count in stacks.most_common():
+            parts = [thread_name.replace(";", "_").replace(" ", "_")]
+            for code in reversed(codes):
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code).replace(";", "_")
+                parts.append(label)
+            lines.append(f"{';'.join(parts)} {count}")
+
+        self.last_run = {
+            "finished_at": time.time(),
+            "duration_sec": round(elapsed, 3),
+            "interval_ms": interval * 1000,
+            "samples": samples,
+            "unique_stacks": len(stacks),
+        }
+        return "\n".join(lines) + "\n"
+
+    def get_status(self) -> dict:
+        return {"running": self._running, "last_run": self.last_run}
+
+
+# 全域剖析器
+sampling_profiler = SamplingProfiler()
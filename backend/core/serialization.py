@@ -0,0 +1,98 @@
+"""
+JSON 序列化 - 熱路徑共用（WebSocket 推播、REST 統計、事件記錄）
+
+- 安裝 orjson 時使用 orjson（C 實作，直接輸出 UTF-8 bytes），否則退回標準 json
+- numpy 陣列與純量直接序列化，不需事先 .tolist()
+- 輸出格式一致：緊湊分隔符、UTF-8（不跳脫非 ASCII）、NaN / Infinity 轉為 null
+- FastJSONResponse 作為 FastAPI 預設回應類別
+"""
+
+import json
+import math
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy 為必要套件，保險起見
+    np = None
+
+try:
+    import orjson
+    HAS_ORJSON = True
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+    _ORJSON_OPTIONS = 0
+
+
+def _default(obj: Any) -> Any:
+    """兩種後端都無法直接處理的型別"""
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            # orjson 只支援連續記憶體的陣列；其他情況（切片、非原生 dtype）才複製
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, "to_dict"):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _sanitize(obj: Any) -> Any:
+    """標準 json 退路：NaN / Infinity → None（與 orjson 行為一致）"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    return obj
+
+
+class _FallbackEncoder(json.JSONEncoder):
+    def default(self, obj):
+        return _default(obj)
+
+
+_fallback_encoder = _FallbackEncoder(ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+
+
+def _fallback_dumps(obj: Any) -> str:
+    try:
+        return _fallback_encoder.encode(obj)
+    except ValueError:
+        # 含 NaN / Infinity
+        return _fallback_encoder.encode(_sanitize(obj))
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化為 UTF-8 bytes（HTTP 回應、二進位傳輸、檔案）"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+    return _fallback_dumps(obj).encode("utf-8")
+
+
+def dumps_text(obj: Any) -> str:
+    """序列化為 str（WebSocket 文字訊息；瀏覽器端以 JSON.parse 解析）"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode("utf-8")
+    return _fallback_dumps(obj)
+
+
+def loads(data: Any) -> Any:
+    """反序列化（接受 str / bytes）"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """使用本模組序列化的 JSONResponse（可直接回傳含 numpy 的內容）"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
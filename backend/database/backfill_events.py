@@ -0,0 +1,176 @@
+"""
+事件回填工具 - 將既有錄影的 events.jsonl 批次匯入 events 表
+
+功能:
+- 依資料庫中的錄影記錄找到對應的 events.jsonl
+- 以 executemany 分批寫入（每批一個事務）
+- 已有事件的錄影預設跳過，--force 會先刪除再重新匯入
+
+使用方式（於 backend 資料夾執行）:
+    python -m database.backfill_events
+    python -m database.backfill_events --game-id game_20260115_152908 --force
+"""
+
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+from database.database import Database, event_record_to_row
+
+
+class EventBackfiller:
+    """events.jsonl → events 表回填器"""
+
+    def __init__(self, db_path: str, batch_size: int = 500, force: bool = False):
+        """
+        初始化回填器
+
+        Args:
+            db_path: 資料庫路徑
+            batch_size: 每批寫入筆數
+            force: 是否覆寫已存在的事件
+        """
+        self.db = Database(db_path)
+        self.batch_size = max(1, batch_size)
+        self.force = force
+        self.errors: List[Dict[str, Any]] = []
+        self.success_count = 0
+        self.skip_count = 0
+        self.event_count = 0
+
+    def backfill_all(self, game_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        回填所有（或指定）錄影的事件
+
+        Args:
+            game_id: 只回填指定遊戲（可選）
+
+        Returns:
+            回填結果統計
+        """
+        if game_id:
+            recording = self.db.get_recording(game_id)
+            recordings = [recording] if recording else []
+        else:
+            recordings = self._all_recordings()
+
+        total = len(recordings)
+        print(f"[i] 找到 {total} 筆錄影記錄\n")
+
+        for idx, recording in enumerate(recordings, 1):
+            gid = recording["game_id"]
+            print(f"[{idx}/{total}] 處理: {gid}...", end=" ")
+            try:
+                inserted = self._backfill_single(recording)
+                if inserted is None:
+                    print("[SKIP]")
+                    self.skip_count += 1
+                else:
+                    print(f"[OK] {inserted} 筆")
+                    self.success_count += 1
+                    self.event_count += inserted
+            except Exception as e:
+                print(f"[FAIL] {e}")
+                self.errors.append({"game_id": gid, "error": str(e)})
+
+        print()
+        print("=" * 60)
+        print(f"[+] 成功: {self.success_count} ({self.event_count} 筆事件)")
+        print(f"[-] 跳過: {self.skip_count}")
+        print(f"[!] 錯誤: {len(self.errors)}")
+        print("=" * 60)
+
+        return {
+            "success": self.success_count,
+            "skipped": self.skip_count,
+            "events": self.event_count,
+            "errors": len(self.errors),
+            "error_details": self.errors
+        }
+
+    def _all_recordings(self) -> List[Dict[str, Any]]:
+        """分頁讀取所有錄影記錄"""
+        recordings: List[Dict[str, Any]] = []
+        offset = 0
+        while True:
+            page, total = self.db.get_recordings(limit=100, offset=offset)
+            recordings.extend(page)
+            offset += len(page)
+            if not page or offset >= total:
+                break
+        return recordings
+
+    def _backfill_single(self, recording: Dict[str, Any]) -> Optional[int]:
+        """
+        回填單一錄影
+
+        Returns:
+            寫入筆數；若跳過則回傳 None
+        """
+        game_id = recording["game_id"]
+        events_path = os.path.join(os.path.dirname(recording.get("video_path") or ""), "events.jsonl")
+        if not os.path.exists(events_path):
+            raise Exception(f"events.jsonl 不存在: {events_path}")
+
+        if self.db.count_events(game_id) > 0:
+            if not self.force:
+                return None
+            self.db.delete_events(game_id)
+
+        inserted = 0
+        batch: List[Dict[str, Any]] = []
+        with open(events_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(event_record_to_row(game_id, json.loads(line)))
+                except json.JSONDecodeError as e:
+                    print(f"\n  [!] 事件解析錯誤: {e}")
+                    continue
+
+                if len(batch) >= self.batch_size:
+                    inserted += self.db.insert_events(batch)
+                    batch = []
+
+        inserted += self.db.insert_events(batch)
+        return inserted
+
+
+def main():
+    """主函數"""
+    script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description="將 events.jsonl 回填至 events 表")
+    parser.add_argument("--db", default=os.path.join(script_dir, "data", "recordings.db"), help="資料庫路徑")
+    parser.add_argument("--game-id", default=None, help="只回填指定遊戲")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批寫入筆數")
+    parser.add_argument("--force", action="store_true", help="刪除已存在的事件後重新匯入")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("撞球分析系統 - 事件回填工具")
+    print("=" * 60)
+    print(f"[>] 資料庫: {args.db}\n")
+
+    backfiller = EventBackfiller(args.db, batch_size=args.batch_size, force=args.force)
+    return backfiller.backfill_all(game_id=args.game_id)
+
+
+if __name__ == "__main__":
+    try:
+        result = main()
+        sys.exit(0 if result["errors"] == 0 else 1)
+    except Exception as e:
+        print(f"\n[X] 回填失敗: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
@@ -10,10 +10,56 @@
 import sqlite3
 import json
 import os
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from datetime import datetime
 from contextlib import contextmanager
 
+from core.serialization import dumps_text
+
+
+def _as_ball_number(value: Any) -> Optional[int]:
+    """將事件資料中的球號轉為整數（無法解析則回傳 None）"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
+def event_record_to_row(game_id: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    將 events.jsonl 的單筆記錄轉換為 events 表欄位
+
+    Args:
+        game_id: 遊戲 ID
+        event: {"timestamp": ..., "event": ..., "data": {...}}
+
+    Returns:
+        可傳入 insert_event / insert_events 的事件資料字典
+    """
+    data = event.get("data") or {}
+    row = {
+        "game_id": game_id,
+        "timestamp": event.get("timestamp"),
+        "event_type": event.get("event"),
+        "data": data,
+        "target_ball": None,
+        "potted_ball": None,
+        "first_contact": None
+    }
+
+    # 從 data 中提取球檯狀態快照
+    if isinstance(data, dict):
+        row["target_ball"] = _as_ball_number(data.get("target_ball"))
+        row["potted_ball"] = _as_ball_number(data.get("potted_ball"))
+        row["first_contact"] = _as_ball_number(data.get("first_contact"))
+
+    return row
+
 
 class Database:
     """SQLite 資料庫管理器"""
@@ -33,14 +79,18 @@ class Database:
         # 初始化資料庫
         self._init_database()
     
-    def _get_connection(self) -> sqlite3.Connection:
+    def _get_connection(self, check_same_thread: bool = True) -> sqlite3.Connection:
         """
         獲取資料庫連線（啟用 WAL 模式）
         
+        Args:
+            check_same_thread: 是否限制只能在建立連線的線程使用
+                （串流查詢會在 threadpool 的不同線程間依序存取）
+        
         Returns:
             資料庫連線
         """
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(self.db_path, check_same_thread=check_same_thread)
         conn.row_factory = sqlite3.Row  # 啟用字典式存取
         
         # 啟用 WAL 模式（Write-Ahead Logging）提升並發效能
@@ -97,12 +147,20 @@ class Database:
                     video_fps INTEGER,
                     file_size_mb REAL,
                     
+                    -- 錄影狀態：recording（錄影中 / 異常中斷）、completed（已正常結束）
+                    status TEXT NOT NULL DEFAULT 'completed',
+
                     -- 元資料
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
             
+            # 舊版資料庫沒有 status 欄位：補上（既有記錄皆為已完成的錄影）
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(recordings)")}
+            if "status" not in columns:
+                conn.execute("ALTER TABLE recordings ADD COLUMN status TEXT NOT NULL DEFAULT 'completed'")
+
             # 創建索引
             conn.execute("CREATE INDEX IF NOT EXISTS idx_game_type ON recordings(game_type)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_start_time ON recordings(start_time)")
@@ -133,6 +191,8 @@ class Database:
             conn.execute("CREATE INDEX IF NOT EXISTS idx_events_game_id ON events(game_id)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type ON events(event_type)")
             conn.execute("CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events(timestamp)")
+            # 回放查詢以 (game_id, timestamp) 範圍掃描為主，長局也能走索引
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_game_ts ON events(game_id, timestamp)")
             
             # 3. practice_stats - 練習統計表
             conn.execute("""
@@ -213,6 +273,60 @@ class Database:
             ))
             return cursor.lastrowid
     
+    def upsert_recording(self, recording_data: Dict[str, Any]) -> None:
+        """
+        插入或更新錄影記錄
+
+        錄影開始時會先建立一筆 status='recording' 的記錄（讓事件可即時寫入 events 表），
+        結束時再以完整元資料覆寫並標記為 completed；列表與統計只計入 completed。
+
+        Args:
+            recording_data: 錄影資料字典
+        """
+        with self.transaction() as conn:
+            conn.execute("""
+                INSERT INTO recordings (
+                    game_id, game_type, start_time, end_time, duration_seconds,
+                    player1_name, player2_name, winner,
+                    player1_score, player2_score, target_rounds,
+                    video_path, video_resolution, video_fps, file_size_mb, status
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(game_id) DO UPDATE SET
+                    game_type = excluded.game_type,
+                    start_time = excluded.start_time,
+                    end_time = excluded.end_time,
+                    duration_seconds = excluded.duration_seconds,
+                    player1_name = excluded.player1_name,
+                    player2_name = excluded.player2_name,
+                    winner = excluded.winner,
+                    player1_score = excluded.player1_score,
+                    player2_score = excluded.player2_score,
+                    target_rounds = excluded.target_rounds,
+                    video_path = excluded.video_path,
+                    video_resolution = excluded.video_resolution,
+                    video_fps = excluded.video_fps,
+                    file_size_mb = excluded.file_size_mb,
+                    status = excluded.status,
+                    updated_at = CURRENT_TIMESTAMP
+            """, (
+                recording_data.get("game_id"),
+                recording_data.get("game_type"),
+                recording_data.get("start_time"),
+                recording_data.get("end_time"),
+                recording_data.get("duration_seconds"),
+                recording_data.get("player1_name"),
+                recording_data.get("player2_name"),
+                recording_data.get("winner"),
+                recording_data.get("player1_score", 0),
+                recording_data.get("player2_score", 0),
+                recording_data.get("target_rounds", 0),
+                recording_data.get("video_path"),
+                recording_data.get("video_resolution"),
+                recording_data.get("video_fps"),
+                recording_data.get("file_size_mb"),
+                recording_data.get("status", "completed")
+            ))
+    
     def get_recording(self, game_id: str) -> Optional[Dict[str, Any]]:
         """
         獲取單一錄影記錄
@@ -238,7 +352,8 @@ class Database:
         start_date: Optional[str] = None,
         end_date: Optional[str] = None,
         limit: int = 20,
-        offset: int = 0
+        offset: int = 0,
+        include_in_progress: bool = False
     ) -> Tuple[List[Dict[str, Any]], int]:
         """
         查詢錄影列表（支援篩選、分頁）
@@ -250,6 +365,7 @@ class Database:
             end_date: 結束日期篩選
             limit: 每頁筆數
             offset: 偏移量
+            include_in_progress: 是否包含錄影中 / 異常中斷（status='recording'）的記錄
         
         Returns:
             (錄影列表, 總筆數)
@@ -259,6 +375,9 @@ class Database:
             conditions = []
             params = []
             
+            if not include_in_progress:
+                conditions.append("status = 'completed'")
+
             if game_type:
                 conditions.append("game_type = ?")
                 params.append(game_type)
@@ -372,13 +491,102 @@ class Database:
                 event_data.get("game_id"),
                 event_data.get("timestamp"),
                 event_data.get("event_type"),
-                json.dumps(event_data.get("data", {}), ensure_ascii=False),
+                dumps_text(event_data.get("data", {})),
                 event_data.get("target_ball"),
                 event_data.get("potted_ball"),
                 event_data.get("first_contact")
             ))
             return cursor.lastrowid
     
+    def insert_events(self, events: List[Dict[str, Any]]) -> int:
+        """
+        批次插入事件記錄（單一事務 + executemany）
+        
+        Args:
+            events: 事件資料字典列表
+        
+        Returns:
+            插入的筆數
+        """
+        if not events:
+            return 0
+        
+        with self.transaction() as conn:
+            conn.executemany("""
+                INSERT INTO events (
+                    game_id, timestamp, event_type, data,
+                    target_ball, potted_ball, first_contact
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (
+                    event_data.get("game_id"),
+                    event_data.get("timestamp"),
+                    event_data.get("event_type"),
+                    dumps_text(event_data.get("data", {})),
+                    event_data.get("target_ball"),
+                    event_data.get("potted_ball"),
+                    event_data.get("first_contact")
+                )
+                for event_data in events
+            ])
+            return len(events)
+    
+    def count_events(self, game_id: str) -> int:
+        """
+        計算遊戲的事件筆數
+        
+        Args:
+            game_id: 遊戲 ID
+        
+        Returns:
+            事件筆數
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute("SELECT COUNT(*) FROM events WHERE game_id = ?", (game_id,))
+            return cursor.fetchone()[0]
+    
+    def delete_events(self, game_id: str) -> int:
+        """
+        刪除遊戲的所有事件（用於重新匯入）
+        
+        Args:
+            game_id: 遊戲 ID
+        
+        Returns:
+            刪除的筆數
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute("DELETE FROM events WHERE game_id = ?", (game_id,))
+            return cursor.rowcount
+    
+    def get_event(self, game_id: str, event_id: int) -> Optional[Dict[str, Any]]:
+        """
+        獲取單一事件
+        
+        Args:
+            game_id: 遊戲 ID
+            event_id: 事件 ID
+        
+        Returns:
+            事件資料（data 已解析），若不存在則返回 None
+        """
+        with self.transaction() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM events WHERE game_id = ? AND id = ?",
+                (game_id, event_id)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            
+            event = dict(row)
+            if event.get("data"):
+                try:
+                    event["data"] = json.loads(event["data"])
+                except json.JSONDecodeError:
+                    event["data"] = {}
+            return event
+    
     def get_events(
         self,
         game_id: str,
@@ -434,6 +642,88 @@ class Database:
             
             return events
     
+    def iter_events(
+        self,
+        game_id: str,
+        event_type: Optional[str] = None,
+        from_time: Optional[float] = None,
+        to_time: Optional[float] = None,
+        after_ts: Optional[float] = None,
+        after_id: Optional[int] = None,
+        downsample: int = 1,
+        limit: Optional[int] = None
+    ) -> Iterator[sqlite3.Row]:
+        """
+        以伺服器端游標逐筆讀取事件（不一次載入記憶體）
+
+        排序為 (timestamp, id)。分頁游標為上一頁最後一筆的 (timestamp, id)：
+        同一 timestamp 的多筆事件跨越分頁時不會遺漏。
+
+        降採樣在 SQL 中完成：以 ROW_NUMBER() 對篩選後（event_type / from / to）的事件編號，
+        取編號 % n = 0；游標在編號之後才套用，因此各分頁的取樣位置一致。
+
+        Args:
+            game_id: 遊戲 ID
+            event_type: 事件類型篩選
+            from_time: 開始時間篩選（含）
+            to_time: 結束時間篩選（含）
+            after_ts: 分頁游標，上一頁最後一筆的 timestamp
+            after_id: 分頁游標，上一頁最後一筆的 id（未提供時只比較 timestamp，同一 timestamp 的事件會被略過）
+            downsample: 降採樣率（1=不降採樣）
+            limit: 最多回傳筆數
+
+        Yields:
+            sqlite3.Row（data 欄位保持原始 JSON 字串）
+        """
+        conditions = ["game_id = ?"]
+        params: List[Any] = [game_id]
+
+        if event_type:
+            conditions.append("event_type = ?")
+            params.append(event_type)
+
+        if from_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(from_time)
+
+        if to_time is not None:
+            conditions.append("timestamp <= ?")
+            params.append(to_time)
+
+        where_clause = " AND ".join(conditions)
+        if downsample > 1:
+            sql = f"""
+                SELECT * FROM (
+                    SELECT *, ROW_NUMBER() OVER (ORDER BY timestamp ASC, id ASC) - 1 AS row_number
+                    FROM events WHERE {where_clause}
+                ) WHERE row_number % ? = 0
+            """
+            params.append(downsample)
+        else:
+            sql = f"SELECT * FROM events WHERE {where_clause}"
+
+        if after_ts is not None:
+            if after_id is not None:
+                sql += " AND (timestamp > ? OR (timestamp = ? AND id > ?))"
+                params.extend([after_ts, after_ts, after_id])
+            else:
+                sql += " AND timestamp > ?"
+                params.append(after_ts)
+
+        sql += " ORDER BY timestamp ASC, id ASC"
+
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        conn = self._get_connection(check_same_thread=False)
+        try:
+            cursor = conn.execute(sql, params)
+            for row in cursor:
+                yield row
+        finally:
+            conn.close()
+
     # ==================== Practice Stats CRUD ====================
     
     def insert_practice_stats(self, stats_data: Dict[str, Any]) -> int:
@@ -559,7 +849,7 @@ class Database:
                     COUNT(*) as total_games,
                     SUM(CASE WHEN winner = ? THEN 1 ELSE 0 END) as total_wins
                 FROM recordings
-                WHERE player1_name = ? OR player2_name = ?
+                WHERE (player1_name = ? OR player2_name = ?) AND status = 'completed'
             """, (player_name, player_name, player_name))
             
             row = cursor.fetchone()
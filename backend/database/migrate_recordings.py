@@ -21,7 +21,7 @@ if sys.platform == "win32":
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
-from database import Database
+from database import Database, event_record_to_row
 
 
 class RecordingMigrator:
@@ -192,41 +192,29 @@ class RecordingMigrator:
     
     def _migrate_events(self, events_path: str, game_id: str):
         """
-        遷移事件日誌
+        遷移事件日誌（批次寫入）
         
         Args:
             events_path: events.jsonl 路徑
             game_id: 遊戲 ID
         """
+        batch: List[Dict[str, Any]] = []
         with open(events_path, 'r', encoding='utf-8') as f:
             for line in f:
                 if not line.strip():
                     continue
                 
                 try:
-                    event = json.loads(line)
-                    
-                    event_data = {
-                        "game_id": game_id,
-                        "timestamp": event.get("timestamp"),
-                        "event_type": event.get("event"),
-                        "data": event.get("data", {}),
-                        "target_ball": None,  # 可從 data 中提取
-                        "potted_ball": None,
-                        "first_contact": None
-                    }
-                    
-                    # 嘗試從 data 中提取球檯狀態
-                    data = event.get("data", {})
-                    if isinstance(data, dict):
-                        event_data["target_ball"] = data.get("target_ball")
-                        event_data["potted_ball"] = data.get("potted_ball")
-                        event_data["first_contact"] = data.get("first_contact")
-                    
-                    self.db.insert_event(event_data)
-                
+                    batch.append(event_record_to_row(game_id, json.loads(line)))
                 except json.JSONDecodeError as e:
                     print(f"\n  [!] 事件解析錯誤: {e}")
+                    continue
+                
+                if len(batch) >= 500:
+                    self.db.insert_events(batch)
+                    batch = []
+        
+        self.db.insert_events(batch)
     
     def _migrate_practice_stats(self, metadata: Dict[str, Any], game_id: str):
         """
@@ -5,28 +5,47 @@ import json
 import threading
 import time
 import uuid
-from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Annotated, Any, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Annotated, Any, NamedTuple, Optional
 
-import config
 import cv2
 import uvicorn
-from calibration.calibration import Calibrator
 from dotenv import load_dotenv
-from fastapi import Body, FastAPI, HTTPException, Response, WebSocket, WebSocketDisconnect, Query
+from fastapi import Body, FastAPI, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
-from tracking.tracking_engine import PoolTracker
-from streaming.mjpeg_streamer import DualMJPEGManager
-from core.session_manager import session_manager, Role, SessionState
+from fastapi.responses import StreamingResponse
+
+import config
+from api.replay_api import replay_sessions
+from api.replay_api import router as replay_router
+from calibration.aruco_detector import ArucoDetector
+from calibration.calibration import Calibrator
+from calibration.calibration_store import CalibrationStore
+from calibration.projector_overlay import ProjectorOverlay
+from calibration.projector_renderer import ProjectorMode, ProjectorRenderer
 from core.error_codes import (
-    ERR_INVALID_ARGUMENT, ERR_NOT_FOUND, ERR_FORBIDDEN, ERR_SESSION_EXPIRED,
-    ERR_STREAM_UNAVAILABLE, ERR_INTERNAL, create_error_response
+    ERR_BACKEND_BUSY,
+    ERR_FORBIDDEN,
+    ERR_INTERNAL,
+    ERR_INVALID_ARGUMENT,
+    ERR_NOT_FOUND,
+    ERR_SESSION_EXPIRED,
+    ERR_STREAM_UNAVAILABLE,
+    create_error_response,
 )
+from core.instrumentation import InstrumentationMiddleware, LoopMonitor, metrics
 from core.performance_monitor import PerformanceMonitor
-from calibration.aruco_detector import ArucoDetector
-from calibration.projector_renderer import ProjectorRenderer, ProjectorMode
-from calibration.projector_overlay import ProjectorOverlay
+from core.pipeline_profiler import profiler
+from core.sampling_profiler import ProfilerBusyError, sampling_profiler
+from core.serialization import FastJSONResponse, dumps_text
+from core.session_manager import Role, SessionState, session_manager
+from streaming.frame_bus import FrameBus
+from streaming.metadata_codec import HAS_MSGPACK, METADATA_V2_ENCODING, DeltaMetadataEncoder, negotiate_version
+from streaming.metadata_hub import MetadataHub, MetadataSubscriber
+from streaming.mjpeg_streamer import DualMJPEGManager
+from tracking.synthetic_scene import TruthModel
+from tracking.synthetic_scene import create_capture_from_config as create_synthetic_capture
+from tracking.tracking_engine import PoolTracker
 
 perf_stats: dict[str, Any] = {
     "total_frames": 0,
@@ -38,7 +57,7 @@ perf_stats: dict[str, Any] = {
 
 load_dotenv()  # Must be called before other imports that rely on environment variables
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,8 +67,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 各端點延遲 / WebSocket 連線量測（/api/performance、/metrics）
+app.add_middleware(InstrumentationMiddleware, metrics=metrics)
+loop_monitor = LoopMonitor(
+    metrics,
+    interval=config.LOOP_LAG_INTERVAL_MS / 1000,
+    stall_threshold=config.LOOP_STALL_THRESHOLD_MS / 1000
+)
+
+# 捕獲 / 推論 / MJPEG / 錄影 各階段量測（/api/performance/pipeline、/api/performance/trace）
+profiler.configure(config.PIPELINE_PROFILER_ENABLED, config.PIPELINE_TRACE_FRAMES)
+
 # 註冊 API 路由
-from api.replay_api import router as replay_router
 app.include_router(replay_router)
 
 from api.thumbnail_api import router as thumbnail_router
@@ -64,8 +93,15 @@ app.include_router(camera_router)
 # 載入追蹤引擎
 tracker: Optional[PoolTracker] = None
 try:
-    tracker = PoolTracker(model_path=config.MODEL_PATH)
-    print(f"✅ YOLO model loaded successfully from {config.MODEL_PATH}")
+    if config.VIDEO_SOURCE == "synthetic" and config.SYNTHETIC_TRUTH_MODEL:
+        # 合成場景：以真實標註取代 YOLO，測試完整管線而不需模型
+        truth_model = TruthModel(lambda: getattr(camera_state["current_cap"], "last", None))
+        tracker = PoolTracker(model=truth_model)
+        truth_model.tracker = tracker
+        print("✅ Synthetic truth model loaded (VIDEO_SOURCE=synthetic)")
+    else:
+        tracker = PoolTracker(model_path=config.MODEL_PATH)
+        print(f"✅ YOLO model loaded successfully from {config.MODEL_PATH}")
 except Exception as e:
     print(f"⚠️  Warning: Failed to load YOLO model: {e}")
     print("   Continuing without YOLO inference...")
@@ -73,7 +109,13 @@ except Exception as e:
 
 calibrator: Optional[Calibrator] = None
 try:
-    calibrator = Calibrator()
+    calibration_store = CalibrationStore(
+        config.CALIBRATION_DIR,
+        legacy_path=config.LEGACY_CALIBRATION_PATH,
+        check_interval=config.CALIBRATION_CHECK_INTERVAL_SEC,
+    )
+    print(f"✅ Calibration profiles loaded: {calibration_store.preload()}")
+    calibrator = Calibrator(store=calibration_store, camera_id=0)
     print("✅ Calibrator initialized successfully")
 except Exception as e:
     print(f"⚠️  Warning: Failed to initialize Calibrator: {e}")
@@ -90,17 +132,36 @@ camera_state: dict[str, Any] = {
     "last_frame_time": 0.0,  # ✅ 追蹤最新畫面時間戳
 }
 
+
+class CameraFrame(NamedTuple):
+    """捕獲循環讀到的原始畫面（唯讀，消費者不可原地修改 image）"""
+    image: Any
+    frame_id: int
+    timestamp: float
+
+
+# 捕獲循環 → 臨時讀取畫面的消費者（校正檢測 / 預覽、截圖、球桌漂移檢查）；只保留最新一幀，不再直接讀取相機
+camera_frames = FrameBus("camera")
+
+
+def latest_camera_image() -> Optional[Any]:
+    """最新幀的影像（超過 CAMERA_FRAME_MAX_AGE_SEC 視為沒有畫面）"""
+    camera_frame = camera_frames.latest()[1]
+    if camera_frame is None or time.time() - camera_frame.timestamp > config.CAMERA_FRAME_MAX_AGE_SEC:
+        return None
+    return camera_frame.image
+
 system_state: dict[str, Any] = {
     "is_analyzing": False,  # 預設不開啟 YOLO，只送純影像
     "yolo_skip_frames": 2,  # ✅ 每 3 幀執行一次 YOLO（加速）
 }
 
 # 線程池用於異步攝像頭切換（不阻塞 WebSocket）
-executor = ThreadPoolExecutor(max_workers=6)  # ✅ 增加到 6 個工作線程
+executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix="yolo-worker")  # ✅ 增加到 6 個工作線程
 
 # MJPEG 串流管理器 - 簡單可靠的 HTTP 視頻流
 try:
-    mjpeg_manager = DualMJPEGManager(quality=70, max_fps=30)
+    mjpeg_manager = DualMJPEGManager(quality=70, max_fps=30, keepalive_sec=config.MJPEG_KEEPALIVE_SEC)
     print("✅ MJPEG Stream Manager initialized")
 except Exception as e:
     print(f"⚠️  Warning: Failed to initialize MJPEG: {e}")
@@ -116,7 +177,7 @@ except Exception as e:
 
 # ArUco 檢測器
 try:
-    aruco_detector = ArucoDetector()
+    aruco_detector = ArucoDetector(detect_scale=config.ARUCO_DETECT_SCALE)
     print("✅ ArUco Detector initialized")
 except Exception as e:
     print(f"⚠️  Warning: Failed to initialize ArUco Detector: {e}")
@@ -203,6 +264,71 @@ def encode_image_buffer(frame: Any, quality: int = 70) -> Optional[bytes]:
         return None
 
 
+class VideoPacket(NamedTuple):
+    """/ws/video 的一幀：分析數據 JSON + JPEG"""
+    text: str
+    jpeg: Optional[bytes]
+
+
+# 捕獲循環 → /ws/video 連線（只保留最新一幀）
+video_bus = FrameBus("video")
+
+# /ws/video 投影視圖的上一次 JPEG：(generation, quality) → bytes；投影畫面沒變時不重新編碼
+_projector_jpeg_cache: dict[str, Any] = {"key": None, "jpeg": None}
+
+
+def build_video_packet(
+    display_frame: Any,
+    data_packet: dict[str, Any],
+    ar_paths: list[Any],
+    frame_count: int,
+    consecutive_successes: int,
+    yolo_ms: float,
+    projector_frame: Any = None,
+    projector_generation: Optional[int] = None
+) -> VideoPacket:
+    """在捕獲線程建立 /ws/video 封包（每幀只編碼 / 序列化一次）"""
+    encode_start = time.time()
+    quality = getattr(config, "JPEG_QUALITY", 70)
+    frame_for_stream = display_frame
+    image_buffer = None
+    if getattr(config, "STREAM_PROJECTOR_VIEW", True) and projector_frame is not None:
+        # 向量 AR：直接使用投影機畫布，不變形相機像素；畫布沒變時沿用上次的 JPEG
+        frame_for_stream = projector_frame
+        cache_key = (projector_generation, quality) if projector_generation is not None else None
+        if cache_key is not None and _projector_jpeg_cache["key"] == cache_key:
+            image_buffer = _projector_jpeg_cache["jpeg"]
+    elif getattr(config, "STREAM_PROJECTOR_VIEW", True) and calibrator is not None:
+        with profiler.stage("video.warp"):
+            roi = tracker.table_roi if tracker is not None and config.WARP_TABLE_ROI_ONLY else None
+            frame_for_stream = calibrator.warp_frame_to_projector(display_frame, roi=roi)
+    if image_buffer is None:
+        with profiler.stage("video.encode"):
+            image_buffer = encode_image_buffer(frame_for_stream, quality)
+        if frame_for_stream is projector_frame and projector_generation is not None:
+            _projector_jpeg_cache["key"] = (projector_generation, quality)
+            _projector_jpeg_cache["jpeg"] = image_buffer
+    encode_elapsed = time.time() - encode_start
+    record_perf("encode", encode_elapsed)
+
+    payload = {
+        "data": data_packet,
+        "ar_paths": ar_paths,
+        "status": "Analyzing" if system_state["is_analyzing"] else "Idle",
+        "current_device_id": camera_state["selected_device_id"],
+        "is_switching": camera_state["is_switching"],
+        "frame_count": frame_count,
+        "consecutive_successes": consecutive_successes,
+        "perf": {
+            "yolo_ms": yolo_ms,
+            "encode_ms": encode_elapsed * 1000,
+        },
+    }
+    with profiler.stage("video.serialize"):
+        text = dumps_text(payload)
+    return VideoPacket(text, image_buffer)
+
+
 def record_perf(operation: str, duration: float):
     """記錄性能指標"""
     with perf_stats["lock"]:
@@ -248,6 +374,15 @@ def open_camera(device_id: int):
     """開啟指定攝像頭：確保能持續讀取幀"""
     print(f"🔄 Opening camera device {device_id}...")
 
+    # VIDEO_SOURCE=synthetic：合成球桌場景（無相機的壓力 / 準確度測試）
+    if getattr(config, "VIDEO_SOURCE", "") == "synthetic":
+        cap_synthetic = create_synthetic_capture()
+        size = f"{config.CAMERA_WIDTH}x{config.CAMERA_HEIGHT}@{config.SYNTHETIC_FPS}fps"
+        print(f"✅ Synthetic table scene opened ({size})")
+        camera_state["current_cap"] = cap_synthetic
+        camera_state["selected_device_id"] = device_id
+        return cap_synthetic
+
     # 若設定了 VIDEO_SOURCE，直接以影片檔為來源，不再嘗試裝置列表
     if getattr(config, "VIDEO_SOURCE", ""):
         source_path = config.VIDEO_SOURCE
@@ -351,6 +486,8 @@ def switch_camera_background(device_id: int):
     try:
         print(f"🔄 Background: Starting camera switch from {camera_state['selected_device_id']} to {device_id}")
         open_camera(device_id)
+        if calibrator is not None:
+            calibrator.select_profile(camera_id=device_id)
         print(f"✅ Background: Camera switch to device {device_id} completed")
     except Exception as e:
         print(f"❌ Background: Camera switch failed: {e}")
@@ -405,13 +542,28 @@ def camera_capture_loop():
     global_perf_monitor = perf_monitor
     
     last_data_packet: Optional[dict[str, Any]] = None
+    last_aruco_time = 0.0
     last_ar_paths: list[Any] = []
+    last_yolo_ms = 0.0
+    yolo_submit_time = 0.0
+    consecutive_successes = 0
 
     while camera_running.is_set():
         frame_start = time.time()
         
         try:
+            # ✅ 攝像頭切換（/api/camera/select）：在捕獲線程內執行，避免與 read() 同時 release
+            if camera_state["needs_switch"] and not camera_state["is_switching"]:
+                print(f"📱 Capture loop: Switching camera to device {camera_state['new_device_id']}")
+                camera_state["needs_switch"] = False
+                camera_state["is_switching"] = True
+                switch_camera_background(camera_state["new_device_id"])
+                if camera_state["current_cap"] is not None:
+                    cap = camera_state["current_cap"]
+                continue
+
             # 讀取幀
+            read_start = time.perf_counter()
             ret, frame = cap.read()
 
             # 若使用影片來源，嘗試迴圈播放
@@ -426,6 +578,7 @@ def camera_capture_loop():
 
             if not ret or frame is None:
                 # ✅ 處理切換狀態：如果是正在切換，則等待切換完成，不要嘗試重開舊相機
+                consecutive_successes = 0
                 if camera_state.get("is_switching", False):
                     # print("🔄 Camera loop: Switching in progress, waiting...") # 減少 log
                     time.sleep(0.1)
@@ -450,7 +603,21 @@ def camera_capture_loop():
                 continue
 
             frame_count += 1
+            consecutive_successes += 1
             camera_state["last_frame_time"] = time.time()
+            camera_frames.publish(CameraFrame(frame, frame_count, camera_state["last_frame_time"]))
+            trace = profiler.begin_frame(frame_count, read_start)
+            profiler.record("capture.read", read_start, time.perf_counter() - read_start)
+
+            # 校正中：以捕獲循環的畫面做 ArUco 檢測並快取結果（detect / preview API 只讀快取）
+            if (calibration_state["is_calibrating"] and aruco_detector is not None
+                    and time.time() - last_aruco_time >= 1.0 / config.CALIBRATION_DETECT_HZ):
+                last_aruco_time = time.time()
+                try:
+                    with profiler.stage("calibration.aruco_detect"):
+                        aruco_detector.update(frame, frame_count)
+                except Exception as e:
+                    print(f"⚠️ ArUco detection error: {e}")
 
             # ✅ 優化 1: ThreadPool 非阻塞 YOLO 推論
             if system_state["is_analyzing"] and tracker is not None:
@@ -459,23 +626,28 @@ def camera_capture_loop():
                     try:
                         processed_frame, data = yolo_future.result(timeout=0)
                         cached_overlay = processed_frame.copy()
-                        latest_analysis_data["data"] = data
+                        last_yolo_ms = (time.time() - yolo_submit_time) * 1000
+                        record_perf("yolo", last_yolo_ms / 1000)
                         
-                        # AR 座標轉換
+                        # AR 座標轉換：球位、預測路徑、瞄準線一次轉到投影座標
                         ar_paths = []
-                        if data.get("prediction") and calibrator is not None:
+                        if calibrator is not None:
                             try:
-                                raw_paths = data["prediction"]["paths"]
-                                ar_paths = calibrator.transform_points(raw_paths)
+                                with profiler.stage("capture.ar_transform"):
+                                    ar_scene = calibrator.project_scene(data)
+                                if ar_scene is not None:
+                                    if ar_scene["trajectories"]:
+                                        ar_paths = ar_scene["trajectories"][0]
+                                    if projector_renderer is not None:
+                                        projector_renderer.update_ar_data(ar_scene)
                             except Exception:
                                 pass
                         last_ar_paths = ar_paths
+                        last_data_packet = data
                         
-                        # 更新低頻分析數據
-                        latest_analysis_data["data"] = data  # ✅ 修正: 使用 data 而非 data_packet
-                        latest_analysis_data["ar_paths"] = ar_paths
-                        latest_analysis_data["status"] = "Analyzing"
-                        latest_analysis_data["timestamp"] = time.time()
+                        # 更新低頻分析數據並推播給 /ws/control、/ws/analytics
+                        with profiler.stage("capture.publish_metadata"):
+                            update_analysis_data(data, ar_paths, "Analyzing")
                     except Exception as e:
                         print(f"⚠️ YOLO result retrieval error: {e}")
                     finally:
@@ -484,13 +656,23 @@ def camera_capture_loop():
                 # 提交新的推論任務 (非阻塞)
                 skip_yolo = frame_count % (system_state.get("yolo_skip_frames", 2) + 1) != 0
                 if yolo_future is None and not skip_yolo:
-                    yolo_future = executor.submit(tracker.process_frame, frame.copy())
+                    yolo_submit_time = time.time()
+                    # 推論線程的各階段歸入提交當下的這一幀
+                    yolo_future = executor.submit(profiler.bind(trace, tracker.process_frame), frame.copy())
                 
                 # 使用快取的 overlay (如果有)
                 display_frame = cached_overlay if cached_overlay is not None else frame.copy()
             else:
                 display_frame = frame.copy()
                 yolo_future = None  # 清除未完成的 future
+                if last_data_packet is not None and projector_renderer is not None:
+                    # 停止分析時清除投影機上的 AR 疊加
+                    projector_renderer.update_ar_data({"trajectories": [], "balls": [], "aim_lines": []})
+                cached_overlay = None
+                last_data_packet = None
+
+            # 投影機畫面每幀最多渲染一次（MJPEG 投影流與 /ws/video 共用）
+            projector_frame = None
 
             # ✅ 優化 2: 訂閱者檢查 - 只在有訂閱者時才編碼
             if mjpeg_manager is not None and config.ENABLE_SUBSCRIBER_CHECK:
@@ -502,33 +684,61 @@ def camera_capture_loop():
                 if has_subscribers:
                     try:
                         # 監控流：原始或處理後的幀 (1280×720)
-                        monitor_frame = cv2.resize(display_frame, (1920, 1080))
+                        with profiler.stage("capture.resize_monitor"):
+                            monitor_frame = cv2.resize(display_frame, (1920, 1080))
                         mjpeg_manager.update_monitor(monitor_frame)
 
                         # 投影流：使用獨立渲染器 (1920×1080)
                         if projector_renderer is not None:
-                            projector_frame = projector_renderer.render()
-                            mjpeg_manager.update_projector(projector_frame)
+                            with profiler.stage("projector.render"):
+                                projector_frame = projector_renderer.render()
+                            # 畫面沒變時（generation 相同）MJPEG 沿用上次編碼的 JPEG
+                            mjpeg_manager.update_projector(projector_frame, projector_renderer.generation)
                     except Exception as e:
                         print(f"⚠️ MJPEG frame update error: {e}")
             elif mjpeg_manager is not None:
                 # 未啟用訂閱者檢查,總是編碼
                 try:
-                    monitor_frame = cv2.resize(display_frame, (1920, 1080))
+                    with profiler.stage("capture.resize_monitor"):
+                        monitor_frame = cv2.resize(display_frame, (1920, 1080))
                     mjpeg_manager.update_monitor(monitor_frame)
                     
                     # 投影流：使用獨立渲染器
                     if projector_renderer is not None:
-                        projector_frame = projector_renderer.render()
-                        mjpeg_manager.update_projector(projector_frame)
+                        with profiler.stage("projector.render"):
+                            projector_frame = projector_renderer.render()
+                        mjpeg_manager.update_projector(projector_frame, projector_renderer.generation)
                 except Exception as e:
                     print(f"⚠️ MJPEG frame update error: {e}")
             
+            # ✅ /ws/video：有訂閱者時編碼一次，所有連線共用
+            if video_bus.subscriber_count > 0:
+                try:
+                    if (projector_frame is None and config.AR_VECTOR_PIPELINE and config.STREAM_PROJECTOR_VIEW
+                            and projector_renderer is not None):
+                        with profiler.stage("projector.render"):
+                            projector_frame = projector_renderer.render()
+                    analyzing = system_state["is_analyzing"] and tracker is not None
+                    video_bus.publish(build_video_packet(
+                        display_frame,
+                        last_data_packet if analyzing and last_data_packet is not None
+                        else {"status": "idle", "frame_count": frame_count},
+                        last_ar_paths if analyzing else [],
+                        frame_count,
+                        consecutive_successes,
+                        last_yolo_ms,
+                        projector_frame if config.AR_VECTOR_PIPELINE else None,
+                        projector_renderer.generation if projector_frame is not None else None
+                    ))
+                except Exception as e:
+                    print(f"⚠️ Video packet error: {e}")
+
             # ✅ 錄影功能：寫入幀到錄影檔
             if recording_manager.is_recording:
                 try:
                     # 使用 1080p 進行錄影
-                    recording_frame = cv2.resize(display_frame, (1920, 1080))
+                    with profiler.stage("capture.resize_recording"):
+                        recording_frame = cv2.resize(display_frame, (1920, 1080))
                     recording_manager.write_frame(recording_frame)
                 except Exception as e:
                     print(f"⚠️ Recording frame write error: {e}")
@@ -536,14 +746,15 @@ def camera_capture_loop():
             # ✅ 優化 3: 效能監控與智能幀率控制
             frame_time = time.time() - frame_start
             perf_monitor.record_frame(frame_time)
+            profiler.end_frame(trace)
             
             # 每 30 幀輸出一次效能統計
             #if frame_count % 30 == 0:
             #    stats = perf_monitor.get_stats()
             #    print(f"📊 Performance: FPS={stats['current_fps']:.1f}, Latency={stats['avg_latency_ms']:.1f}ms")
             
-            # 控制幀率（30 FPS）
-            target_time = 1.0 / 30.0
+            # 控制幀率（預設 30 FPS）
+            target_time = 1.0 / config.CAPTURE_MAX_FPS
             sleep_time = max(0.001, target_time - frame_time)
             time.sleep(sleep_time)
 
@@ -598,7 +809,10 @@ async def send_ws_envelope(
         "stream_id": stream_id,
         "payload": payload
     }
-    await websocket.send_text(json.dumps(envelope))
+    text = dumps_text(envelope)
+    send_start = time.perf_counter()
+    await websocket.send_text(text)
+    metrics.record_ws_send("control", time.perf_counter() - send_start, len(text))
 
 
 async def heartbeat_loop(websocket: WebSocket, session_id: str, stream_id: str, connection_id: str):
@@ -722,106 +936,88 @@ async def control_websocket(websocket: WebSocket, session_id: str = Query(...)):
             "session_id": session_id,
             "connection_id": connection_id,
             "features": ["heartbeat", "metadata", "commands", "stream_switch"]
+            + (["metadata_v2"] if HAS_MSGPACK and config.METADATA_V2_ENABLED else [])
         },
         session_id,
         session.stream_id
     )
     
+    # metadata 由 metadata_hub 推播，獨立的發送任務；本協程只負責接收
+    # 預設 v1 JSON；protocol.hello 協商為 v2 後改訂閱 MessagePack 差量頻道
+    metadata_version = 1
+    metadata_sub = metadata_hub.subscribe("control", session_id, session.stream_id)
+    metadata_task = asyncio.create_task(pump_metadata(websocket, metadata_sub))
+
     try:
-        metadata_counter = 0
-        last_metadata_time = time.time()
-        metadata_interval = 1.0 / config.METADATA_RATE_HZ  # 10Hz = 0.1s
-        
         while True:
-            # 非阻塞接收消息（超時檢查）
+            message = await websocket.receive_text()
+
+            # 處理客戶端消息
             try:
-                message = await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
-                
-                # 處理客戶端消息
-                try:
-                    msg = json.loads(message)
-                    msg_type = msg.get("type")
-                    payload = msg.get("payload", {})
-                    
-                    # 處理 protocol.hello（版本協商）
-                    if msg_type == "protocol.hello":
-                        client_version = payload.get("preferred_version", 1)
-                        # 目前只支援 v1
-                        negotiated_version = 1 if client_version == 1 else 1
-                        # protocol.welcome 已在連線建立時發送，這裡不重複發送
-                        print(f"✅ Client protocol.hello received, version: {client_version}")
-                    
-                    # 處理 client.heartbeat
-                    elif msg_type == "client.heartbeat":
-                        session_manager.update_heartbeat(session_id)
-                    
-                    # 處理 cmd.*
-                    elif msg_type and msg_type.startswith("cmd."):
-                        request_id = payload.get("request_id")
-                        
-                        # 這裡可以處理各種命令
-                        # 目前簡化實現
-                        await send_ws_envelope(
-                            websocket,
-                            "cmd.ack",
-                            {"request_id": request_id, "status": "accepted"},
+                msg = json.loads(message)
+                msg_type = msg.get("type")
+                payload = msg.get("payload", {})
+
+                # 處理 protocol.hello（版本協商）
+                if msg_type == "protocol.hello":
+                    negotiated_version = negotiate_version(payload, enabled=config.METADATA_V2_ENABLED)
+                    print(f"✅ Client protocol.hello received, negotiated version: {negotiated_version}")
+
+                    await send_ws_envelope(
+                        websocket,
+                        "protocol.welcome",
+                        {
+                            "negotiated_version": negotiated_version,
+                            "metadata_encoding": METADATA_V2_ENCODING if negotiated_version == 2 else "json",
+                        },
+                        session_id,
+                        session.stream_id
+                    )
+
+                    if negotiated_version != metadata_version:
+                        metadata_hub.unsubscribe(metadata_sub)
+                        metadata_task.cancel()
+                        metadata_version = negotiated_version
+                        metadata_sub = metadata_hub.subscribe(
+                            "control_v2" if metadata_version == 2 else "control",
                             session_id,
                             session.stream_id
                         )
-                    
-                    # 處理 stream.changed.ack
-                    elif msg_type == "stream.changed.ack":
-                        print(f"Client ACKed stream change: {payload}")
-                    
-                except json.JSONDecodeError:
-                    print(f"Invalid JSON from client: {message}")
-                
-            except asyncio.TimeoutError:
-                # 超時正常，繼續處理
-                pass
-            
-            # 推送 metadata（按頻率限制）
-            current_time = time.time()
-            if current_time - last_metadata_time >= metadata_interval:
-                last_metadata_time = current_time
-                
-                # 從 latest_analysis_data 獲取數據
-                data_packet = latest_analysis_data.get("data", {})
-                ar_paths = latest_analysis_data.get("ar_paths", [])
-                
-                # 構造 metadata payload
-                metadata_payload = {
-                    "frame_id": metadata_counter,
-                    "ts_backend": int(current_time * 1000),
-                    "detected_count": len(data_packet.get("balls", [])),
-                    "tracking_state": "active" if system_state["is_analyzing"] else "idle",
-                    "detections": data_packet.get("balls", []),
-                    "prediction": data_packet.get("prediction"),
-                    "ar_paths": ar_paths,
-                    "bbox": None,  # 可以添加
-                    "keypoints": None,  # 可以添加
-                    "rate_hz": config.METADATA_RATE_HZ
-                }
-                
-                await send_ws_envelope(
-                    websocket,
-                    "metadata.update",
-                    metadata_payload,
-                    session_id,
-                    session.stream_id
-                )
-                
-                metadata_counter += 1
-            
-            # 小延遲避免 CPU 佔用過高
-            await asyncio.sleep(0.01)
-            
+                        metadata_task = asyncio.create_task(pump_metadata(websocket, metadata_sub))
+
+                # 處理 client.heartbeat
+                elif msg_type == "client.heartbeat":
+                    session_manager.update_heartbeat(session_id)
+
+                # 處理 cmd.*
+                elif msg_type and msg_type.startswith("cmd."):
+                    request_id = payload.get("request_id")
+
+                    # 這裡可以處理各種命令
+                    # 目前簡化實現
+                    await send_ws_envelope(
+                        websocket,
+                        "cmd.ack",
+                        {"request_id": request_id, "status": "accepted"},
+                        session_id,
+                        session.stream_id
+                    )
+
+                # 處理 stream.changed.ack
+                elif msg_type == "stream.changed.ack":
+                    print(f"Client ACKed stream change: {payload}")
+
+            except json.JSONDecodeError:
+                print(f"Invalid JSON from client: {message}")
+
     except WebSocketDisconnect:
         print(f"👋 WebSocket disconnected: {connection_id}")
     except Exception as e:
         print(f"❌ WebSocket error: {e}")
     finally:
         # 清理
+        metadata_hub.unsubscribe(metadata_sub)
+        metadata_task.cancel()
         if connection_id in ws_connections:
             del ws_connections[connection_id]
         if connection_id in ws_heartbeat_tasks:
@@ -841,6 +1037,81 @@ latest_analysis_data: dict[str, Any] = {
 }
 
 
+def render_control_metadata(snapshot: dict[str, Any], seq: int, now: float) -> dict:
+    """/ws/control 的 metadata.update payload"""
+    data_packet = snapshot.get("data") or {}
+    balls = data_packet.get("balls", [])
+    return {
+        "frame_id": seq,
+        "ts_backend": int(now * 1000),
+        "detected_count": len(balls),
+        "tracking_state": "active" if system_state["is_analyzing"] else "idle",
+        "detections": balls,
+        "prediction": data_packet.get("prediction"),
+        "ar_paths": snapshot.get("ar_paths", []),
+        "bbox": None,  # 可以添加
+        "keypoints": None,  # 可以添加
+        "rate_hz": config.METADATA_RATE_HZ
+    }
+
+
+def render_analytics(snapshot: dict[str, Any], seq: int, now: float) -> dict:
+    """/ws/analytics 的 payload（HLS 模式）"""
+    return {
+        "data": snapshot.get("data", {}),
+        "ar_paths": snapshot.get("ar_paths", []),
+        "status": snapshot.get("status", "Idle"),
+        "is_analyzing": system_state["is_analyzing"],
+        "timestamp": now,
+        "mjpeg_stats": mjpeg_manager.get_stats() if mjpeg_manager else None,
+    }
+
+
+# ✅ 每個頻道每次推播只序列化一次，所有連線共用
+metadata_hub = MetadataHub(keepalive_sec=config.METADATA_KEEPALIVE_SEC)
+metadata_hub.add_channel("control", config.METADATA_RATE_HZ, render_control_metadata, envelope_type="metadata.update")
+metadata_hub.add_channel(
+    "control_v2",
+    config.METADATA_RATE_HZ,
+    render_control_metadata,
+    envelope_type="metadata.update",
+    encoder=DeltaMetadataEncoder(config.METADATA_V2_KEYFRAME_SEC, config.METADATA_V2_QUANT_PX)
+)
+metadata_hub.add_channel("analytics", 10, render_analytics)  # 約 10 Hz
+
+
+def update_analysis_data(data: dict[str, Any], ar_paths: list[Any], status: str):
+    """更新最新分析數據並推播（可在捕獲線程呼叫）"""
+    snapshot = {
+        "data": data,
+        "ar_paths": ar_paths,
+        "status": status,
+        "timestamp": time.time(),
+    }
+    latest_analysis_data.update(snapshot)
+    metadata_hub.publish(snapshot)
+
+
+async def pump_metadata(websocket: WebSocket, subscriber: MetadataSubscriber):
+    """發送任務：等待推播中心的最新訊息並送出（無輪詢）"""
+    try:
+        while True:
+            frames = await subscriber.get()
+            if frames is None:
+                break
+            for frame in frames:
+                send_start = time.perf_counter()
+                if isinstance(frame, bytes):
+                    await websocket.send_bytes(frame)
+                else:
+                    await websocket.send_text(frame)
+                metrics.record_ws_send(subscriber.channel.name, time.perf_counter() - send_start, len(frame))
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"⚠️ Metadata send error: {e}")
+
+
 @app.websocket("/ws/analytics")
 async def analytics_endpoint(websocket: WebSocket):
     """
@@ -851,233 +1122,86 @@ async def analytics_endpoint(websocket: WebSocket):
     await websocket.accept()
     print("✅ Analytics WebSocket connected (low-frequency data channel)")
 
+    metadata_sub = metadata_hub.subscribe("analytics")
+    metadata_task = asyncio.create_task(pump_metadata(websocket, metadata_sub))
+
     try:
+        # 客戶端不會傳送資料，這裡只等待斷線
         while True:
-            # 發送最新分析數據
-            payload = {
-                "data": latest_analysis_data.get("data", {}),
-                "ar_paths": latest_analysis_data.get("ar_paths", []),
-                "status": latest_analysis_data.get("status", "Idle"),
-                "is_analyzing": system_state["is_analyzing"],
-                "timestamp": time.time(),
-                "mjpeg_stats": mjpeg_manager.get_stats() if mjpeg_manager else None,
-            }
-            await websocket.send_text(json.dumps(payload))
-
-            # 低頻更新：100ms 間隔 (10 Hz)
-            await asyncio.sleep(0.1)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
 
     except WebSocketDisconnect:
         print("👋 Analytics WebSocket disconnected")
     except Exception as e:
         print(f"❌ Analytics WebSocket error: {e}")
+    finally:
+        metadata_hub.unsubscribe(metadata_sub)
+        metadata_task.cancel()
 
 
 @app.websocket("/ws/video")
 async def video_endpoint(websocket: WebSocket):
+    """
+    影像 + 分析數據 WebSocket
+
+    訂閱共用捕獲循環的 video_bus（不再各自開啟攝像頭 / 推論 / 編碼），
+    N 個連線只需 N 次 socket 寫入；連線較慢時直接跳到最新一幀
+    """
     await websocket.accept()
     print(f"✅ Client connected, using camera device: {camera_state['selected_device_id']}")
 
-    # 開啟所選的攝像頭設備
-    cap = open_camera(camera_state["selected_device_id"])
-    if cap is None:
-        print("❌ Failed to open camera on WebSocket connect")
+    if camera_capture_thread is None or not camera_capture_thread.is_alive():
+        print("❌ Camera capture loop is not running")
         await websocket.send_text(json.dumps({"status": "error", "message": "Failed to open camera device"}))
         await websocket.close()
         return
 
-    try:
-        failure_count = 0
-        max_failures = 10  # ✅ 增加到 10 次，更寬容
-        frame_count = 0
-        consecutive_successes = 0
-        last_processed_frame: Optional[Any] = None
-        last_data_packet: Optional[dict[str, Any]] = None
-        last_ar_paths: list[Any] = []
-
+    async def send_frames():
+        version = 0
         while True:
-            # 檢查是否需要切換攝像頭
-            if camera_state["needs_switch"] and not camera_state["is_switching"]:
-                print(f"📱 WebSocket: Initiating async camera switch to device {camera_state['new_device_id']}")
-                camera_state["is_switching"] = True
-                camera_state["needs_switch"] = False
-                loop = asyncio.get_event_loop()
-                loop.run_in_executor(executor, switch_camera_background, camera_state["new_device_id"])
-                cap = camera_state["current_cap"]
-                if cap is None:
-                    await websocket.send_text(
-                        json.dumps(
-                            {
-                                "status": "error",
-                                "message": f"Failed to switch to camera {camera_state['new_device_id']}",
-                            }
-                        )
-                    )
-                    break
-
-            # ✅ 嘗試讀取幀
-            ret, frame = cap.read()
-
-            # 若使用影片來源，嘗試迴圈播放避免讀到結尾造成閃爍
-            if getattr(config, "VIDEO_SOURCE", "") and (not ret or frame is None):
-                try:
-                    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-                    if getattr(config, "LOOP_VIDEO_SOURCE", True) and total_frames > 0:
-                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        ret, frame = cap.read()
-                except Exception:
-                    pass
-
-            if not ret or frame is None:
-                if failure_count >= max_failures:
-                    print(f"🔁 Reopening camera after {failure_count} failures")
-                    try:
-                        cap.release()
-                    except Exception:
-                        pass
-
-                    # 重新開啟
-                    cap = open_camera(camera_state["selected_device_id"])
-                    if cap is not None:
-                        print("   ✅ Camera reopened")
-                        failure_count = 0
-                    else:
-                        print("❌ Failed to reopen camera")
-                        await websocket.send_text(json.dumps({"status": "error", "message": "Camera unavailable"}))
-                        break
-
-                await asyncio.sleep(0.01)
+            new_version, packet = await video_bus.wait_newer(version, timeout=1.0)
+            if new_version == version or packet is None:
                 continue
-            else:
-                # ✅ 成功讀取
-                failure_count = 0
-                consecutive_successes += 1
-                frame_count += 1
-
-            # ✅ YOLO 處理（線程池）- ⭐ 支援跳幀加速
-            yolo_start = time.time()
-            skip_yolo = False
-            used_cached = False
-            try:
-                # ✅ 推論跳幀：每 N 幀執行一次 YOLO（減少 CPU 負載）
-                skip_yolo = frame_count % (system_state.get("yolo_skip_frames", 2) + 1) != 0
-
-                if system_state["is_analyzing"] and tracker is not None and not skip_yolo:
-                    loop = asyncio.get_event_loop()
-                    processed_frame, data_packet = await loop.run_in_executor(executor, tracker.process_frame, frame)
-                elif skip_yolo and last_processed_frame is not None and last_data_packet is not None:
-                    processed_frame = last_processed_frame.copy()
-                    data_packet = {**last_data_packet, "status": last_data_packet.get("status", "cached"), "skipped": True, "frame_count": frame_count}
-                    used_cached = True
-                else:
-                    processed_frame = frame.copy()
-                    skip_reason = "skipped" if skip_yolo else "idle"
-                    data_packet = {"status": skip_reason, "frame_count": frame_count}
-            except Exception as e:
-                print(f"❌ Frame processing error: {e}")
-                processed_frame = frame.copy()
-                data_packet = {"error": str(e), "frame_count": frame_count}
-            yolo_elapsed = time.time() - yolo_start
-            record_perf("yolo", yolo_elapsed)
-
-            # ✅ AR 座標轉換
-            ar_paths: list[Any] = []
-            if used_cached:
-                ar_paths = list(last_ar_paths)
-            elif data_packet.get("prediction") and calibrator is not None:
-                try:
-                    raw_paths = data_packet["prediction"]["paths"]
-                    ar_paths = calibrator.transform_points(raw_paths)
-                except Exception:
-                    pass
-
-            if not used_cached and system_state["is_analyzing"] and tracker is not None and not skip_yolo:
-                last_processed_frame = processed_frame.copy()
-                last_data_packet = data_packet
-                last_ar_paths = ar_paths
-
-            # ✅ 添加幀到 MJPEG 串流（監控和投影）
-            if mjpeg_manager is not None:
-                try:
-                    # 監控流：原始或處理後的幀 (1280×720)
-                    monitor_frame = cv2.resize(processed_frame, (1280, 720))
-                    mjpeg_manager.update_monitor(monitor_frame)
-
-                    # 投影流：通過投影機校準變形 (1920×1080)
-                    projector_frame = processed_frame
-                    if calibrator is not None:
-                        projector_frame = calibrator.warp_frame_to_projector(processed_frame)
-                    else:
-                        projector_frame = cv2.resize(processed_frame, (1920, 1080))
-                    mjpeg_manager.update_projector(projector_frame)
-                except Exception as e:
-                    print(f"⚠️  MJPEG frame update error: {e}")
-
-            # ✅ 更新低頻分析數據（供 HLS 模式的 /ws/analytics 使用）
-            latest_analysis_data["data"] = data_packet
-            latest_analysis_data["ar_paths"] = ar_paths
-            latest_analysis_data["status"] = "Analyzing" if system_state["is_analyzing"] else "Idle"
-            latest_analysis_data["timestamp"] = time.time()
-
-            # ✅ 影像編碼（線程池，避免阻塞 event loop）
-            encode_start = time.time()
-            loop = asyncio.get_event_loop()
-
-            frame_for_stream = processed_frame
-            if getattr(config, "STREAM_PROJECTOR_VIEW", True) and calibrator is not None:
-                frame_for_stream = calibrator.warp_frame_to_projector(processed_frame)
-
-            image_buffer = await loop.run_in_executor(
-                executor, encode_image_buffer, frame_for_stream, getattr(config, "JPEG_QUALITY", 70)
-            )
-            encode_elapsed = time.time() - encode_start
-            record_perf("encode", encode_elapsed)
-
-            # ✅ 傳送（線程池）
-            websocket_start = time.time()
-            payload = {
-                "data": data_packet,
-                "ar_paths": ar_paths,
-                "status": "Analyzing" if system_state["is_analyzing"] else "Idle",
-                "current_device_id": camera_state["selected_device_id"],
-                "is_switching": camera_state["is_switching"],
-                "frame_count": frame_count,
-                "consecutive_successes": consecutive_successes,
-                "perf": {
-                    "yolo_ms": yolo_elapsed * 1000,
-                    "encode_ms": encode_elapsed * 1000,
-                },
-            }
-
-            try:
-                await websocket.send_text(json.dumps(payload))
-                if image_buffer is not None:
-                    await websocket.send_bytes(image_buffer)
-            except Exception as e:
-                print(f"❌ WebSocket send error: {e}")
+            version = new_version
+            websocket_start = time.perf_counter()
+            await websocket.send_text(packet.text)
+            if packet.jpeg is not None:
+                await websocket.send_bytes(packet.jpeg)
+            elapsed = time.perf_counter() - websocket_start
+            record_perf("websocket", elapsed)
+            metrics.record_ws_send("video", elapsed, len(packet.text) + len(packet.jpeg or b""))
+
+    video_bus.add_subscriber()
+    sender = asyncio.create_task(send_frames())
+    try:
+        # 客戶端不傳送資料，這裡只等待斷線；發送失敗也結束連線
+        receiver = asyncio.create_task(websocket.receive())
+        while True:
+            done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                error = sender.exception()
+                if error is not None:
+                    print(f"❌ WebSocket send error: {error}")
                 break
-
-            websocket_elapsed = time.time() - websocket_start
-            record_perf("websocket", websocket_elapsed)
-
-            # ✅ 30 FPS
-            await asyncio.sleep(0.033)
-    except WebSocketDisconnect:
-        print("👋 Client disconnected")
+            if receiver.result()["type"] == "websocket.disconnect":
+                print("👋 Client disconnected")
+                break
+            receiver = asyncio.create_task(websocket.receive())
+        receiver.cancel()
     except Exception as e:
         print(f"❌ WebSocket error: {e}")
     finally:
-        if cap is not None:
-            try:
-                cap.release()
-            except Exception:
-                pass
+        sender.cancel()
+        video_bus.remove_subscriber()
         print("📴 Video endpoint closed")
 
 
 @app.post("/api/control/toggle")
 async def toggle_analysis():
     system_state["is_analyzing"] = not system_state["is_analyzing"]
+    metadata_hub.publish()  # tracking_state 變化立即推播
     print(f"🎛️  YOLO Analysis toggled: {system_state['is_analyzing']}")
     print(f"   Tracker available: {tracker is not None}")
     return {"status": "success", "is_analyzing": system_state["is_analyzing"]}
@@ -1127,10 +1251,34 @@ async def select_camera(request: Annotated[dict, Body(...)]):
 # --- 新增 API 2: 截圖功能 ---
 @app.post("/api/control/snapshot")
 async def take_snapshot():
-    # 這裡簡單實作：告訴前端「已截圖」，實際存檔邏輯可以加在這裡
-    # 若要在後端存檔：
-    # cv2.imwrite(f"snapshot_{int(time.time())}.jpg", current_frame)
-    return {"status": "success", "message": "Screenshot saved"}
+    """將捕獲循環的最新畫面存成 JPEG（不直接讀取相機）"""
+    _, camera_frame = await camera_frames.wait_fresh(config.CAMERA_FRAME_MAX_AGE_SEC, config.CAMERA_FRAME_WAIT_SEC)
+    if camera_frame is None:
+        return FastJSONResponse(
+            status_code=503,
+            content=create_error_response(ERR_STREAM_UNAVAILABLE, "No camera frame available")
+        )
+
+    stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(camera_frame.timestamp))
+    filename = f"snapshot_{stamp}_{camera_frame.frame_id}.jpg"
+    path = os.path.join(config.SNAPSHOT_DIR, filename)
+
+    def save():
+        os.makedirs(config.SNAPSHOT_DIR, exist_ok=True)
+        return cv2.imwrite(path, camera_frame.image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+
+    if not await asyncio.to_thread(save):
+        return FastJSONResponse(
+            status_code=500,
+            content=create_error_response(ERR_INTERNAL, "Failed to write snapshot")
+        )
+    return {
+        "status": "success",
+        "message": "Screenshot saved",
+        "filename": filename,
+        "frame_id": camera_frame.frame_id,
+        "timestamp": camera_frame.timestamp,
+    }
 
 
 # --- 新增 API 3: 品質控制 (v1.5 P1 功能) ---
@@ -1163,7 +1311,7 @@ async def set_stream_quality(request: Annotated[dict, Body(...)]):
         quality_map = {"low": 55, "med": 70, "high": 85}
         stream.set_quality(quality_map[quality])
     
-    return JSONResponse({
+    return FastJSONResponse({
         "stream_id": stream_id,
         "quality": quality,
         "auto_quality_enabled": stream.auto_quality,
@@ -1199,7 +1347,7 @@ async def get_performance_stats():
         mjpeg_stats = mjpeg_manager.get_stats()
         stats["mjpeg_stats"] = mjpeg_stats
     
-    return JSONResponse(stats)
+    return FastJSONResponse(stats)
 
 
 
@@ -1243,7 +1391,7 @@ async def get_streams():
 async def get_stream_status(stream_id: str = Query(...)):
     """獲取指定 stream 的狀態（v1.5 規範）"""
     if not stream_id or stream_id not in ["camera1", "file1"]:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=400,
             content=create_error_response(ERR_INVALID_ARGUMENT, "Invalid stream_id")
         )
@@ -1279,7 +1427,7 @@ async def create_session(request: Annotated[dict, Body(...)]):
     
     # 驗證 stream_id
     if stream_id not in ["camera1", "file1"]:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=400,
             content=create_error_response(ERR_INVALID_ARGUMENT, "Invalid stream_id")
         )
@@ -1312,7 +1460,7 @@ async def create_session(request: Annotated[dict, Body(...)]):
 async def renew_session(session_id: str):
     """續期 session（v1.5 規範）"""
     if not session_manager.renew_session(session_id):
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=404,
             content=create_error_response(ERR_SESSION_EXPIRED, "Session not found or expired")
         )
@@ -1331,13 +1479,13 @@ async def switch_session_stream(session_id: str, request: Annotated[dict, Body(.
     new_stream_id = request.get("stream_id")
     
     if not new_stream_id or new_stream_id not in ["camera1", "file1"]:
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=400,
             content=create_error_response(ERR_INVALID_ARGUMENT, "Invalid stream_id")
         )
     
     if not session_manager.switch_stream(session_id, new_stream_id):
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=404,
             content=create_error_response(ERR_NOT_FOUND, "Session not found")
         )
@@ -1353,7 +1501,7 @@ async def switch_session_stream(session_id: str, request: Annotated[dict, Body(.
 async def delete_session(session_id: str):
     """刪除 session（v1.5 規範）"""
     if not session_manager.delete_session(session_id):
-        return JSONResponse(
+        return FastJSONResponse(
             status_code=404,
             content=create_error_response(ERR_NOT_FOUND, "Session not found")
         )
@@ -1387,19 +1535,113 @@ async def get_config():
 # ✅ 新增性能監控 API
 @app.get("/api/performance")
 async def get_performance_metrics():
-    """獲取系統性能指標"""
+    """獲取系統性能指標（含 event loop 延遲、各端點延遲分佈、WebSocket 發送時間）"""
     stats = get_perf_stats()
     return {
         **stats,
-        "event_loop_lag": "⚠️ Monitor if > 100ms",
+        **metrics.get_stats(),
+        "projector_renderer": projector_renderer.get_stats() if projector_renderer is not None else None,
+        "frame_buses": {bus.name: bus.get_stats() for bus in (camera_frames, video_bus)},
         "recommendations": [
             "If yolo_ms > 300, consider reducing resolution or using smaller model",
             "If encode_ms > 50, try reducing JPEG_QUALITY",
             "If websocket_ms > 30, check network bandwidth",
+            "If event_loop.lag.p99_ms > 100, check event_loop.recent_stalls for the blocking stack",
         ],
     }
 
 
+@app.get("/api/performance/pipeline")
+async def get_pipeline_profile():
+    """每幀各階段耗時分佈（p50/p95/p99）與最近幀追蹤摘要"""
+    return profiler.get_stats()
+
+
+@app.get("/api/performance/trace")
+async def export_pipeline_trace(
+    frame_id: Optional[int] = Query(None, description="指定幀號（需仍在緩衝中）"),
+    last: Optional[int] = Query(None, ge=1, description="最近 N 幀（預設全部緩衝）")
+):
+    """匯出幀追蹤為 Chrome trace JSON（chrome://tracing 或 Perfetto 開啟）"""
+    traces = profiler.get_traces(frame_id=frame_id, last=last)
+    if frame_id is not None and not traces:
+        return FastJSONResponse(
+            status_code=404,
+            content=create_error_response(ERR_NOT_FOUND, f"Frame {frame_id} is not in the trace buffer")
+        )
+    filename = f"pipeline-trace-{frame_id}.json" if frame_id is not None else "pipeline-trace.json"
+    return FastJSONResponse(
+        content=profiler.export_chrome_trace(traces),
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.post("/api/admin/profile")
+async def run_sampling_profile(
+    session_id: str = Query(..., description="需具備 admin 權限的 session"),
+    seconds: float = Query(10.0, gt=0, description="取樣秒數"),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="取樣間隔（毫秒）")
+):
+    """
+    對所有線程進行統計取樣剖析，回傳 collapsed stack 火焰圖檔案
+
+    可用 flamegraph.pl 或 https://www.speedscope.app 開啟
+    """
+    session = session_manager.get_session(session_id)
+    if not session or session.state != SessionState.ACTIVE:
+        return FastJSONResponse(
+            status_code=404,
+            content=create_error_response(ERR_SESSION_EXPIRED, "Session not found or expired")
+        )
+    if "admin" not in session.permission_flags:
+        return FastJSONResponse(
+            status_code=403,
+            content=create_error_response(ERR_FORBIDDEN, "Admin permission required")
+        )
+    if seconds > config.SAMPLING_PROFILER_MAX_SEC:
+        return FastJSONResponse(
+            status_code=400,
+            content=create_error_response(
+                ERR_INVALID_ARGUMENT, f"seconds must be <= {config.SAMPLING_PROFILER_MAX_SEC}"
+            )
+        )
+    if sampling_profiler.running:
+        return FastJSONResponse(
+            status_code=409,
+            content=create_error_response(ERR_BACKEND_BUSY, "A profiling run is already in progress")
+        )
+
+    # 取樣線程獨立執行，不佔用 YOLO executor
+    try:
+        collapsed = await asyncio.to_thread(sampling_profiler.run, seconds, interval_ms / 1000)
+    except ProfilerBusyError as e:
+        return FastJSONResponse(
+            status_code=409,
+            content=create_error_response(ERR_BACKEND_BUSY, str(e))
+        )
+
+    stats = sampling_profiler.last_run or {}
+    filename = f"profile-{time.strftime('%Y%m%d-%H%M%S')}.collapsed"
+    return Response(
+        content=collapsed,
+        media_type="text/plain; charset=utf-8",
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(stats.get("samples", 0)),
+            "X-Profile-Duration": str(stats.get("duration_sec", 0)),
+        }
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus 文字格式指標"""
+    return Response(
+        content=metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 # ✅ 重置性能統計
 @app.post("/api/performance/reset")
 async def reset_performance_metrics():
@@ -1409,6 +1651,8 @@ async def reset_performance_metrics():
         perf_stats["yolo_time"] = 0.0
         perf_stats["encode_time"] = 0.0
         perf_stats["websocket_time"] = 0.0
+    metrics.reset()
+    profiler.reset()
     return {"status": "reset", "message": "Performance metrics cleared"}
 
 
@@ -1485,6 +1729,37 @@ async def update_table_color(request: dict = Body(...)):
     }
 
 
+@app.get("/api/table/geometry")
+async def get_table_geometry():
+    """目前的球桌幾何（四角、ROI、球袋）、漂移檢查與最近一次桌布分割統計"""
+    if not tracker:
+        raise HTTPException(status_code=500, detail="Tracker not initialized")
+    stats = tracker.geometry.get_stats()
+    stats["last_detection"] = tracker.last_table_detection
+    return FastJSONResponse(stats)
+
+
+@app.post("/api/table/geometry/redetect")
+async def redetect_table_geometry():
+    """以最新幀立即重新偵測球桌（略過漂移判斷與二次確認）"""
+    if not tracker:
+        raise HTTPException(status_code=500, detail="Tracker not initialized")
+
+    _, camera_frame = await camera_frames.wait_fresh(config.CAMERA_FRAME_MAX_AGE_SEC, config.CAMERA_FRAME_WAIT_SEC)
+    if camera_frame is None:
+        return FastJSONResponse(
+            status_code=503,
+            content=create_error_response(ERR_STREAM_UNAVAILABLE, "No camera frame available")
+        )
+
+    geometry = await asyncio.to_thread(tracker.geometry.check, camera_frame.image, True)
+    return FastJSONResponse({
+        "status": "success",
+        "changed": geometry is not None,
+        **tracker.geometry.get_stats(),
+    })
+
+
 # ================== MJPEG 流媒體 API ==================
 
 # ✅ v1.5 Burn-in MJPEG 端點
@@ -1569,9 +1844,22 @@ async def startup_event():
 
     print("🚀 Starting camera capture thread for burn-in stream...")
     # 在背景線程中啟動攝像頭捕獲循環
-    camera_capture_thread = threading.Thread(target=camera_capture_loop, daemon=True)
+    camera_capture_thread = threading.Thread(target=camera_capture_loop, name="camera-capture", daemon=True)
     camera_capture_thread.start()
 
+    # 分析數據推播：捕獲線程透過此 event loop 發送
+    metadata_hub.attach_loop(asyncio.get_running_loop())
+
+    # event loop 延遲取樣與卡住偵測
+    loop_monitor.start(asyncio.get_running_loop())
+
+    # 取樣剖析時將 event loop 所在線程標示出來
+    sampling_profiler.label_thread(threading.get_ident(), "event-loop")
+
+    # 球桌漂移檢查：背景線程定期讀取最新幀，球桌移動時重新偵測並發布
+    if tracker is not None:
+        tracker.geometry.start(latest_camera_image)
+
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -1582,6 +1870,17 @@ async def shutdown_event():
     if camera_capture_thread is not None:
         camera_capture_thread.join(timeout=5.0)
 
+    # 釋放回放解碼器
+    replay_sessions.close_all()
+
+    # 結束 metadata 訂閱
+    metadata_hub.close()
+
+    loop_monitor.stop()
+
+    if tracker is not None:
+        tracker.geometry.stop()
+
 
 # ================== Game Mode APIs ==================
 
@@ -1605,7 +1904,7 @@ async def start_game(request: Annotated[dict, Body(...)]):
                 return create_error_response(ERR_INVALID_ARGUMENT, result["error"])
             
             print(f"✅ Game started successfully: {result}")
-            return JSONResponse(result)
+            return FastJSONResponse(result)
         else:
             print(f"❌ Unsupported mode: {mode}")
             return create_error_response(ERR_INVALID_ARGUMENT, f"Unsupported mode: {mode}")
@@ -1625,7 +1924,7 @@ async def check_game_rules(request: Annotated[dict, Body(...)]):
     
     try:
         result = game_manager.check_nine_ball_rules(first_contact, potted_ball)
-        return JSONResponse(result)
+        return FastJSONResponse(result)
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1650,7 +1949,7 @@ async def end_turn():
             print(f"⏱️ Timer reset to {game_manager.game_state.shot_time_limit} seconds")
         
         state = game_manager.get_game_state()
-        return JSONResponse(state)
+        return FastJSONResponse(state)
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1685,7 +1984,7 @@ async def forfeit_round(request: Annotated[dict, Body(...)]):
             game_manager.game_state.delay_used = [False, False]
             game_manager.game_state.last_update_time = time.time()
         
-        return JSONResponse(game_manager.get_game_state())
+        return FastJSONResponse(game_manager.get_game_state())
     except Exception as e:
         print(f"❌ Error in forfeit: {e}")
         import traceback
@@ -1698,8 +1997,8 @@ async def get_game_state():
     """獲取遊戲狀態"""
     state = game_manager.get_game_state()
     if state:
-        return JSONResponse(state)
-    return JSONResponse({"active": False})
+        return FastJSONResponse(state)
+    return FastJSONResponse({"active": False})
 
 
 @app.post("/api/game/end")
@@ -1707,7 +2006,7 @@ async def end_game():
     """結束遊戲"""
     try:
         game_manager.end_game()
-        return JSONResponse({"status": "game_ended"})
+        return FastJSONResponse({"status": "game_ended"})
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1721,7 +2020,7 @@ async def start_practice(request: Annotated[dict, Body(...)]):
     
     try:
         result = game_manager.start_practice(mode, pattern, player_name)
-        return JSONResponse(result)
+        return FastJSONResponse(result)
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1733,7 +2032,7 @@ async def record_practice(request: Annotated[dict, Body(...)]):
     
     try:
         result = game_manager.record_practice_attempt(success)
-        return JSONResponse(result)
+        return FastJSONResponse(result)
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1743,8 +2042,8 @@ async def get_practice_state():
     """獲取練習狀態"""
     state = game_manager.get_practice_state()
     if state:
-        return JSONResponse(state)
-    return JSONResponse({"active": False})
+        return FastJSONResponse(state)
+    return FastJSONResponse({"active": False})
 
 
 @app.post("/api/practice/end")
@@ -1752,7 +2051,7 @@ async def end_practice():
     """結束練習"""
     try:
         game_manager.end_practice()
-        return JSONResponse({"status": "practice_ended"})
+        return FastJSONResponse({"status": "practice_ended"})
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1804,7 +2103,7 @@ if __name__ == "__main__":
             state = game_manager.get_timer_state()
             if "error" in state:
                 return create_error_response("TIMER_ERROR", state["error"])
-            return JSONResponse(state)
+            return FastJSONResponse(state)
         except Exception as e:
             return create_error_response(ERR_INTERNAL, str(e))
     
@@ -1817,7 +2116,7 @@ if __name__ == "__main__":
             result = game_manager.apply_delay(player)
             if "error" in result:
                 return create_error_response("DELAY_ERROR", result["error"])
-            return JSONResponse(result)
+            return FastJSONResponse(result)
         except Exception as e:
             return create_error_response(ERR_INTERNAL, str(e))
     
@@ -1836,7 +2135,7 @@ async def start_recording(request: Annotated[dict, Body(...)]):
             game_type=game_type,
             players=players
         )
-        return JSONResponse({
+        return FastJSONResponse({
             "status": "recording_started",
             "game_id": game_id
         })
@@ -1857,7 +2156,7 @@ async def stop_recording(request: Annotated[dict, Body(...)]):
             winner=winner,
             total_rounds=total_rounds
         )
-        return JSONResponse(result)
+        return FastJSONResponse(result)
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1870,7 +2169,7 @@ async def log_recording_event(request: Annotated[dict, Body(...)]):
     
     try:
         recording_manager.log_event(event_type, data)
-        return JSONResponse({"status": "logged"})
+        return FastJSONResponse({"status": "logged"})
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1880,7 +2179,7 @@ async def get_recordings():
     """獲取錄影列表"""
     try:
         recordings = recording_manager.get_recordings_list()
-        return JSONResponse({"recordings": recordings})
+        return FastJSONResponse({"recordings": recordings})
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 
@@ -1891,7 +2190,7 @@ async def get_recording_metadata(game_id: str):
     metadata = recording_manager.get_recording_metadata(game_id)
     
     if metadata:
-        return JSONResponse(metadata)
+        return FastJSONResponse(metadata)
     return create_error_response(ERR_NOT_FOUND, "Recording not found")
 
 
@@ -1900,7 +2199,7 @@ async def get_recording_events(game_id: str):
     """獲取錄影的事件日誌"""
     try:
         events = recording_manager.get_recording_events(game_id)
-        return JSONResponse({"events": events})
+        return FastJSONResponse({"events": events})
     except Exception as e:
         return create_error_response(ERR_INTERNAL, str(e))
 # ==================== 錄影相關 API (已移至 api/replay_api.py 模組) ====================
@@ -0,0 +1,138 @@
+"""
+事件寫入器 - 緩衝遊戲事件並批次寫入
+
+- 保留 events.jsonl 檔案（向後兼容、可用於回填）
+- 同步寫入 SQLite events 表，供 /replay/events 查詢
+- 每累積 N 筆或每隔 T 毫秒以單一事務 executemany 寫入
+- 資料庫寫入在背景線程執行，不阻塞 API 或攝像頭循環
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from core.serialization import dumps_text
+from database.database import Database, event_record_to_row
+
+
+class EventSink:
+    """緩衝事件寫入器（JSONL + SQLite）"""
+
+    def __init__(
+        self,
+        db: Database,
+        game_id: str,
+        events_path: str,
+        batch_size: int = 50,
+        flush_interval_ms: int = 500
+    ):
+        """
+        初始化事件寫入器
+
+        Args:
+            db: 資料庫管理器
+            game_id: 遊戲 ID
+            events_path: events.jsonl 路徑
+            batch_size: 累積多少筆事件觸發寫入
+            flush_interval_ms: 最長寫入間隔（毫秒）
+        """
+        self.db = db
+        self.game_id = game_id
+        self.events_path = events_path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_interval_ms / 1000.0)
+
+        self._file: Optional[Any] = open(events_path, 'w', encoding='utf-8')
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        # 統計
+        self.total_events = 0
+        self.total_flushed = 0
+        self.failed_rows = 0
+
+        self._thread = threading.Thread(
+            target=self._flush_loop,
+            name=f"event-sink-{game_id}",
+            daemon=True
+        )
+        self._thread.start()
+
+    def write(self, event: Dict[str, Any]):
+        """
+        寫入一筆事件（僅寫入緩衝，不做磁碟同步）
+
+        Args:
+            event: {"timestamp": ..., "event": ..., "data": {...}}
+        """
+        line = dumps_text(event) + '\n'
+        row = event_record_to_row(self.game_id, event)
+
+        with self._lock:
+            if self._closed or self._file is None:
+                return
+            self._file.write(line)
+            self._pending.append(row)
+            self.total_events += 1
+            batch_ready = len(self._pending) >= self.batch_size
+
+        if batch_ready:
+            self._wakeup.set()
+
+    def flush(self):
+        """立即將緩衝的事件寫入檔案與資料庫"""
+        with self._lock:
+            rows = self._pending
+            self._pending = []
+            if self._file is not None:
+                self._file.flush()
+
+        if not rows:
+            return
+
+        try:
+            self.db.insert_events(rows)
+            self.total_flushed += len(rows)
+        except Exception as e:
+            # 資料庫失敗不影響 JSONL，之後可用 backfill_events 回填
+            self.failed_rows += len(rows)
+            print(f"[EventSink] Database write error ({self.game_id}, {len(rows)} events): {e}")
+
+    def _flush_loop(self):
+        """背景線程：依時間或批次大小觸發寫入"""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[EventSink] Flush error ({self.game_id}): {e}")
+
+    def close(self):
+        """停止背景線程，寫入剩餘事件並關閉檔案"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+
+        self._wakeup.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5.0)
+
+        self.flush()
+
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def get_stats(self) -> dict:
+        """獲取寫入統計"""
+        return {
+            "game_id": self.game_id,
+            "total_events": self.total_events,
+            "total_flushed": self.total_flushed,
+            "pending": len(self._pending),
+            "failed_rows": self.failed_rows,
+        }
@@ -0,0 +1,125 @@
+"""
+幀匯流排 - 捕獲線程與多個消費者之間的最新幀交換
+
+- 版本化單槽緩衝：只保留最新一筆，發布者永遠不等待消費者
+- 消費者以版本號等待「比手上更新」的資料，落後時直接取得最新一筆（不堆積）
+- 同時支援 asyncio（WebSocket 端點）與一般線程等待
+- 訂閱者計數讓發布端在無人訂閱時略過編碼等昂貴工作
+- 最新一筆存成單一 tuple 屬性，latest() 讀取不需要取鎖（發布端整個替換）
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, List, Optional, Tuple
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FrameBus:
+    """版本化單槽緩衝（執行緒安全）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._cond = threading.Condition()
+        # (版本號, 資料, 發布時間)；整個 tuple 一次替換，讀取端不會看到不一致的組合
+        self._slot: Tuple[int, Any, float] = (0, None, 0.0)
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._subscribers = 0
+
+    # ------------------------------------------------------------------
+    # 發布端
+    # ------------------------------------------------------------------
+
+    def publish(self, value: Any) -> int:
+        """發布新資料，喚醒所有等待者，回傳新版本號"""
+        with self._cond:
+            version = self._slot[0] + 1
+            self._slot = (version, value, time.time())
+            waiters, self._waiters = self._waiters, []
+            self._cond.notify_all()
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # 等待者的 event loop 已關閉
+                pass
+        return version
+
+    @property
+    def subscriber_count(self) -> int:
+        return self._subscribers
+
+    def add_subscriber(self):
+        with self._cond:
+            self._subscribers += 1
+
+    def remove_subscriber(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    # ------------------------------------------------------------------
+    # 消費端
+    # ------------------------------------------------------------------
+
+    def latest(self) -> Tuple[int, Any]:
+        """目前最新的 (版本號, 資料)；尚未發布時為 (0, None)"""
+        version, value, _ = self._slot
+        return version, value
+
+    async def wait_newer(self, version: int, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """
+        等待版本號大於 version 的資料（asyncio）
+
+        逾時回傳目前最新（版本號可能仍等於 version）
+        """
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            current, value, _ = self._slot
+            if current > version:
+                return current, value
+            future = loop.create_future()
+            entry = (loop, future)
+            self._waiters.append(entry)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+        return self.latest()
+
+    async def wait_fresh(self, max_age: float, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """
+        取得 max_age 秒內發布的資料；目前這筆太舊（或尚未發布）時等待下一筆
+
+        逾時仍沒有新資料時回傳 (版本號, None)
+        """
+        version, value, published_at = self._slot
+        if value is not None and time.time() - published_at <= max_age:
+            return version, value
+        new_version, value = await self.wait_newer(version, timeout)
+        if new_version <= version:
+            return version, None
+        return new_version, value
+
+    def wait_newer_sync(self, version: int, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """等待版本號大於 version 的資料（一般線程）；逾時回傳目前最新"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._slot[0] > version, timeout)
+            return self.latest()
+
+    def get_stats(self) -> dict:
+        version, _, published_at = self._slot
+        return {
+            "version": version,
+            "subscribers": self._subscribers,
+            "age_ms": round((time.time() - published_at) * 1000, 1) if published_at else None,
+        }
@@ -0,0 +1,267 @@
+"""
+metadata v2 二進位協議 - MessagePack + 差量編碼
+
+- 透過 protocol.hello 協商（preferred_version=2 或 supported_versions 含 2）；
+  未安裝 msgpack 或停用時維持 v1 JSON
+- 球以穩定 ID 識別（相鄰幀最近距離配對），座標量化為 q 像素單位，微小抖動不視為變化
+- 每 keyframe_sec 送一次完整狀態（keyframe），其餘只送相對於最近 keyframe 的變化（delta）
+- delta 一律相對 keyframe（不是前一則），慢速連線略過任何 delta 都不影響正確性
+- 與上一則 delta 內容相同時不送（靜止的球桌只有週期 keyframe）
+
+v2 payload 格式:
+    keyframe: {"k": 1, "seq", "key", "q", "ts_backend", "rate_hz", "state",
+               "balls": {id: [x, y, w, h, r, conf, color, style, number]},
+               "prediction", "ar_paths"}
+    delta:    {"k": 0, "seq", "key", "ts_backend", "balls": {id: [...]}, "removed": [id...],
+               以及有變化時才出現的 "state" / "prediction" / "ar_paths"}
+    x/y/w/h/r 與所有路徑座標需乘以 q；conf 為百分比整數。
+    客戶端狀態 = 最近 keyframe 套用最新一則 delta（delta 之間不累加）。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    msgpack = None
+    HAS_MSGPACK = False
+
+METADATA_V2_ENCODING = "msgpack"
+
+# 球的欄位順序（v2 tuple）
+BALL_FIELDS = ("x", "y", "w", "h", "radius", "conf", "color", "style", "number")
+
+# 相鄰幀同一顆球的最大位移（像素），超過視為新球
+BALL_MATCH_DIST_PX = 40.0
+
+# 抖動死區：量化後位移 ≤ 1 單位、信心度變化 ≤ 5% 視為未變化
+SPATIAL_DEADBAND = 1
+CONF_DEADBAND = 5
+
+
+def negotiate_version(hello_payload: dict, enabled: bool = True) -> int:
+    """依 protocol.hello 決定 metadata 版本（2 = MessagePack 差量；1 = JSON）"""
+    versions = hello_payload.get("supported_versions")
+    if not isinstance(versions, list):
+        versions = [hello_payload.get("preferred_version", 1)]
+    if enabled and HAS_MSGPACK and 2 in versions:
+        return 2
+    return 1
+
+
+def pack_envelope_parts(msg_type: str, ts_ms: int, payload_bytes: bytes) -> Tuple[bytes, bytes]:
+    """
+    v2 envelope 的前段與後段（MessagePack map，6 個欄位）
+
+    各連線的 session_id / stream_id（pack_ident）插在中間，欄位順序與 v1 相同
+    """
+    packb = msgpack.packb
+    head = b"\x86" + packb("v") + packb(2) + packb("type") + packb(msg_type) + packb("ts") + packb(ts_ms)
+    tail = packb("payload") + payload_bytes
+    return head, tail
+
+
+def pack_ident(session_id: str, stream_id: str) -> bytes:
+    packb = msgpack.packb
+    return packb("session_id") + packb(session_id) + packb("stream_id") + packb(stream_id)
+
+
+def _quantize(value: Any, q: int) -> Any:
+    """座標量化：數字 → q 像素單位整數；巢狀 list 逐項處理"""
+    if isinstance(value, (list, tuple)):
+        return [_quantize(v, q) for v in value]
+    if isinstance(value, bool) or value is None:
+        return value
+    try:
+        return int(round(float(value) / q))
+    except (TypeError, ValueError):
+        return value
+
+
+def _plain(value: Any) -> Any:
+    """轉為 MessagePack 可序列化的原生型別（numpy 純量等）"""
+    if isinstance(value, dict):
+        return {str(k): _plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class BallIdAssigner:
+    """以相鄰幀最近距離配對，為每顆球指定穩定 ID"""
+
+    def __init__(self, match_dist_px: float = BALL_MATCH_DIST_PX):
+        self.match_dist2 = match_dist_px * match_dist_px
+        self._prev: Dict[int, Tuple[float, float]] = {}
+        self._next_id = 1
+
+    def assign(self, balls: List[dict]) -> List[int]:
+        centers = [
+            (float(b.get("x", 0)) + float(b.get("w", 0)) / 2, float(b.get("y", 0)) + float(b.get("h", 0)) / 2)
+            for b in balls
+        ]
+        pairs = []
+        for i, (cx, cy) in enumerate(centers):
+            for ball_id, (px, py) in self._prev.items():
+                d2 = (cx - px) ** 2 + (cy - py) ** 2
+                if d2 <= self.match_dist2:
+                    pairs.append((d2, i, ball_id))
+        pairs.sort()
+
+        ids: List[Optional[int]] = [None] * len(balls)
+        used = set()
+        for _, i, ball_id in pairs:
+            if ids[i] is None and ball_id not in used:
+                ids[i] = ball_id
+                used.add(ball_id)
+        for i in range(len(ids)):
+            if ids[i] is None:
+                while self._next_id in used:
+                    self._next_id = self._next_id % 65535 + 1
+                ids[i] = self._next_id
+                used.add(self._next_id)
+                self._next_id = self._next_id % 65535 + 1
+
+        self._prev = {ball_id: center for ball_id, center in zip(ids, centers)}
+        return ids
+
+
+class EncodedUpdate:
+    """一次推播的編碼結果（所有 v2 訂閱者共用）"""
+
+    __slots__ = ("key_seq", "keyframe", "delta", "changed")
+
+    def __init__(self, key_seq: int, keyframe: bytes, delta: Optional[bytes], changed: bool):
+        self.key_seq = key_seq
+        self.keyframe = keyframe    # 最近 keyframe 的 payload（MessagePack）
+        self.delta = delta          # 相對 keyframe 的 delta；None 表示本次即為 keyframe
+        self.changed = changed      # 與上一則內容不同
+
+
+class DeltaMetadataEncoder:
+    """將 v1 metadata payload 轉為 v2 keyframe / delta（每次推播只編碼一次）"""
+
+    def __init__(self, keyframe_sec: float = 2.0, quant_px: int = 2):
+        self.keyframe_sec = keyframe_sec
+        self.quant_px = max(1, int(quant_px))
+        self.ids = BallIdAssigner()
+        self._emitted: Dict[int, list] = {}
+        self._key_state: Optional[dict] = None
+        self._key_bytes = b""
+        self._key_seq = 0
+        self._key_time = 0.0
+        self._last_body: Any = None
+        self.seq = 0
+        self.keyframes = 0
+        self.deltas = 0
+
+    def _ball_tuple(self, ball_id: int, ball: dict) -> list:
+        q = self.quant_px
+        radius = ball.get("radius") or 0
+        conf = ball.get("conf") or 0
+        current = [
+            _quantize(ball.get("x", 0), q),
+            _quantize(ball.get("y", 0), q),
+            _quantize(ball.get("w", 0), q),
+            _quantize(ball.get("h", 0), q),
+            _quantize(radius, q),
+            int(round(float(conf) * 100)) if not isinstance(conf, str) else 0,
+            _plain(ball.get("color")),
+            _plain(ball.get("style")),
+            _plain(ball.get("number")),
+        ]
+        # 抖動死區：變化很小時沿用上次送出的值
+        previous = self._emitted.get(ball_id)
+        if previous is not None:
+            for i in range(5):
+                if abs(current[i] - previous[i]) <= SPATIAL_DEADBAND:
+                    current[i] = previous[i]
+            if abs(current[5] - previous[5]) <= CONF_DEADBAND:
+                current[5] = previous[5]
+        return current
+
+    def _current_state(self, payload: dict) -> dict:
+        balls = payload.get("detections") or []
+        ids = self.ids.assign(balls)
+        tuples = {ball_id: self._ball_tuple(ball_id, ball) for ball_id, ball in zip(ids, balls)}
+        self._emitted = tuples
+
+        prediction = payload.get("prediction")
+        if isinstance(prediction, dict):
+            prediction = _plain(prediction)
+            for key in ("paths", "collision_point"):
+                if key in prediction:
+                    prediction[key] = _quantize(prediction[key], self.quant_px)
+
+        return {
+            "balls": tuples,
+            "prediction": prediction,
+            "ar_paths": _quantize(_plain(payload.get("ar_paths") or []), self.quant_px),
+            "state": payload.get("tracking_state"),
+        }
+
+    def _make_keyframe(self, state: dict, payload: dict, now: float) -> bytes:
+        self._key_seq = self.seq
+        self._key_state = state
+        self._key_time = now
+        self.keyframes += 1
+        self._key_bytes = msgpack.packb({
+            "k": 1,
+            "seq": self.seq,
+            "key": self._key_seq,
+            "q": self.quant_px,
+            "ts_backend": int(now * 1000),
+            "rate_hz": payload.get("rate_hz"),
+            "state": state["state"],
+            "balls": state["balls"],
+            "prediction": state["prediction"],
+            "ar_paths": state["ar_paths"],
+        })
+        return self._key_bytes
+
+    def encode(self, payload: dict, now: float) -> EncodedUpdate:
+        """編碼一則 v1 metadata payload（render_control_metadata 的輸出）"""
+        state = self._current_state(payload)
+        self.seq += 1
+
+        if self._key_state is None or now - self._key_time >= self.keyframe_sec:
+            self._make_keyframe(state, payload, now)
+            self._last_body = None
+            return EncodedUpdate(self._key_seq, self._key_bytes, None, True)
+
+        key = self._key_state
+        changed_balls = {i: t for i, t in state["balls"].items() if key["balls"].get(i) != t}
+        removed = [i for i in key["balls"] if i not in state["balls"]]
+        delta: Dict[str, Any] = {
+            "k": 0,
+            "seq": self.seq,
+            "key": self._key_seq,
+            "ts_backend": int(now * 1000),
+            "balls": changed_balls,
+            "removed": removed,
+        }
+        for field in ("state", "prediction", "ar_paths"):
+            if state[field] != key[field]:
+                delta[field] = state[field]
+
+        body = (changed_balls, removed, delta.get("state"), delta.get("prediction"), delta.get("ar_paths"))
+        changed = body != self._last_body
+        self._last_body = body
+
+        delta_bytes = msgpack.packb(delta)
+        # delta 已不比完整狀態小時直接改送 keyframe
+        if len(delta_bytes) >= len(self._key_bytes):
+            self._make_keyframe(state, payload, now)
+            self._last_body = None
+            return EncodedUpdate(self._key_seq, self._key_bytes, None, True)
+
+        self.deltas += 1
+        return EncodedUpdate(self._key_seq, self._key_bytes, delta_bytes, changed)
+
+    def get_stats(self) -> dict:
+        return {"keyframes": self.keyframes, "deltas": self.deltas, "quant_px": self.quant_px}
@@ -0,0 +1,365 @@
+"""
+分析數據推播中心 - /ws/control 與 /ws/analytics 的 metadata 扇出
+
+- 捕獲線程有新分析結果時 publish()，由 event loop 推播，連線端不再輪詢
+- 每個頻道（推送頻率 / 編碼）每次推播只序列化一次，所有訂閱者共用同一份內容
+- envelope 頻道只在共用內容中間插入各連線的 session_id / stream_id，不重新序列化
+- 訂閱者佇列只保留最新一則（慢速連線直接跳過舊資料，不會堆積）
+- 無新資料時每個頻道只做低頻 keepalive；沒有訂閱者時完全不做事
+- v2 頻道（MessagePack 差量，見 metadata_codec）：內容未變化時不送
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, AnyStr, Callable, Dict, Generic, List, Optional, Set, Union, overload
+
+from core.serialization import dumps_text
+from streaming.metadata_codec import DeltaMetadataEncoder, EncodedUpdate, pack_envelope_parts, pack_ident
+
+Frame = Union[str, bytes]
+
+
+class _Message(Generic[AnyStr]):
+    """共用的已序列化訊息（文字或二進位）；tail 不為 None 時在中間插入訂閱者的 ident"""
+
+    __slots__ = ("head", "tail")
+
+    def __init__(self, head: AnyStr, tail: Optional[AnyStr] = None):
+        self.head: AnyStr = head
+        self.tail: Optional[AnyStr] = tail
+
+    def frames(self, subscriber: "MetadataSubscriber") -> List[Frame]:
+        if self.tail is None:
+            return [self.head]
+        return [self.head + subscriber.ident_for(self.head) + self.tail]
+
+
+class _DeltaMessage:
+    """v2 差量訊息：尚未收到對應 keyframe 的訂閱者先補送 keyframe"""
+
+    __slots__ = ("key_seq", "keyframe", "delta")
+
+    def __init__(self, key_seq: int, keyframe: _Message[bytes], delta: Optional[_Message[bytes]]):
+        self.key_seq = key_seq
+        self.keyframe = keyframe
+        self.delta = delta
+
+    def frames(self, subscriber: "MetadataSubscriber") -> List[Frame]:
+        # 在發送當下判斷（佇列可能已略過 keyframe）
+        frames: List[Frame] = []
+        if subscriber.key_seq != self.key_seq:
+            frames += self.keyframe.frames(subscriber)
+            subscriber.key_seq = self.key_seq
+        if self.delta is not None:
+            frames += self.delta.frames(subscriber)
+        return frames
+
+
+class MetadataSubscriber:
+    """單一 WebSocket 連線的訂閱（只保留最新一則訊息）"""
+
+    def __init__(self, channel: "_Channel", session_id: Optional[str] = None, stream_id: Optional[str] = None):
+        self.channel = channel
+        self.session_id = session_id
+        self.stream_id = stream_id
+        self._ident_text: Optional[str] = None
+        self._ident_bytes: Optional[bytes] = None
+        self.key_seq: Optional[int] = None
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue(maxsize=1)
+        self.dropped = 0
+
+    @overload
+    def ident_for(self, head: str) -> str: ...
+
+    @overload
+    def ident_for(self, head: bytes) -> bytes: ...
+
+    def ident_for(self, head: Frame) -> Frame:
+        """envelope 中各連線不同的片段（第一次使用時序列化並保留）"""
+        if isinstance(head, bytes):
+            if self._ident_bytes is None:
+                self._ident_bytes = pack_ident(self.session_id or "", self.stream_id or "")
+            return self._ident_bytes
+        if self._ident_text is None:
+            self._ident_text = (
+                f'"session_id":{dumps_text(self.session_id or "")},'
+                f'"stream_id":{dumps_text(self.stream_id or "")}'
+            )
+        return self._ident_text
+
+    def offer(self, message: Any):
+        """放入最新訊息（於 event loop 中呼叫；舊訊息未送出則直接取代）"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(message)
+
+    async def get(self) -> Optional[List[Frame]]:
+        """等待下一則訊息，回傳要送出的 frame（str 為文字、bytes 為二進位）；None 表示頻道已關閉"""
+        message = await self.queue.get()
+        if message is None:
+            return None
+        return message.frames(self)
+
+
+class _Channel:
+    """一個推送頻率層級：render → 序列化一次 → 發給所有訂閱者"""
+
+    def __init__(
+        self,
+        name: str,
+        rate_hz: float,
+        render: Callable[[Dict[str, Any], int, float], dict],
+        envelope_type: Optional[str] = None,
+        encoder: Optional[DeltaMetadataEncoder] = None
+    ):
+        self.name = name
+        self.interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self.render = render
+        self.envelope_type = envelope_type
+        self.encoder = encoder
+        self.subscribers: Set[MetadataSubscriber] = set()
+        self.seq = 0
+        self.last_sent = 0.0
+        self.last_message: Any = None
+        self.keyframe: Optional[_Message[bytes]] = None
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.keepalive_handle: Optional[asyncio.TimerHandle] = None
+        self.broadcasts = 0
+        self.skipped = 0
+        self.bytes_sent = 0
+        self.serialize_time = 0.0
+
+    def cancel_timers(self):
+        for handle in (self.flush_handle, self.keepalive_handle):
+            if handle is not None:
+                handle.cancel()
+        self.flush_handle = None
+        self.keepalive_handle = None
+
+
+class MetadataHub:
+    """
+    分析數據推播中心
+
+    使用方式:
+        hub.add_channel("control", 10, render_fn, envelope_type="metadata.update")
+        hub.attach_loop(asyncio.get_running_loop())   # 應用啟動時
+        hub.publish({...})                             # 任意線程
+        sub = hub.subscribe("control", session_id, stream_id)
+        frames = await sub.get()
+    """
+
+    def __init__(self, keepalive_sec: float = 1.0):
+        self.keepalive_sec = keepalive_sec
+        self._channels: Dict[str, _Channel] = {}
+        self._snapshot: Dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._wakeup_pending = False
+        self.publishes = 0
+
+    # ------------------------------------------------------------------
+    # 設定
+    # ------------------------------------------------------------------
+
+    def add_channel(
+        self,
+        name: str,
+        rate_hz: float,
+        render: Callable[[Dict[str, Any], int, float], dict],
+        envelope_type: Optional[str] = None,
+        encoder: Optional[DeltaMetadataEncoder] = None
+    ):
+        """
+        新增推送頻道
+
+        render(snapshot, seq, now) 回傳 payload dict；
+        envelope_type 不為 None 時包成 v1.5 envelope（session_id / stream_id 由訂閱者提供）；
+        encoder 不為 None 時以 MessagePack 差量編碼（v2，需搭配 envelope_type）
+        """
+        if encoder is not None and envelope_type is None:
+            raise ValueError(f"Channel {name}: delta encoder requires envelope_type")
+        self._channels[name] = _Channel(name, rate_hz, render, envelope_type, encoder)
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """綁定推播用的 event loop（應用啟動時呼叫）"""
+        self._loop = loop
+
+    # ------------------------------------------------------------------
+    # 發布（任意線程）
+    # ------------------------------------------------------------------
+
+    def publish(self, snapshot: Optional[Dict[str, Any]] = None):
+        """
+        發布新的分析數據（可在捕獲線程呼叫）
+
+        snapshot 為 None 時只通知狀態變化（例如切換分析開關），沿用上次的數據。
+        連續多次發布在 event loop 處理前會合併成一次推播。
+        """
+        with self._lock:
+            if snapshot is not None:
+                self._snapshot = snapshot
+            self.publishes += 1
+            if self._wakeup_pending or self._loop is None:
+                return
+            self._wakeup_pending = True
+            loop = self._loop
+
+        try:
+            loop.call_soon_threadsafe(self._on_publish)
+        except RuntimeError:
+            # event loop 已關閉（應用結束中）
+            with self._lock:
+                self._wakeup_pending = False
+
+    # ------------------------------------------------------------------
+    # 訂閱（event loop 內）
+    # ------------------------------------------------------------------
+
+    def subscribe(
+        self,
+        channel_name: str,
+        session_id: Optional[str] = None,
+        stream_id: Optional[str] = None
+    ) -> MetadataSubscriber:
+        """訂閱頻道，並立即收到一則目前狀態"""
+        channel = self._channels[channel_name]
+        subscriber = MetadataSubscriber(channel, session_id, stream_id)
+        channel.subscribers.add(subscriber)
+        if channel.encoder is not None and channel.last_message is not None:
+            # 差量頻道不能為單一訂閱者重新編碼（會改變共用的差量基準），沿用最後一則
+            message = channel.last_message
+        else:
+            message = self._serialize(channel, time.time(), force=True)
+        subscriber.offer(message)
+        self._schedule_keepalive(channel)
+        return subscriber
+
+    def unsubscribe(self, subscriber: MetadataSubscriber):
+        channel = subscriber.channel
+        channel.subscribers.discard(subscriber)
+        if not channel.subscribers:
+            channel.cancel_timers()
+
+    def close(self):
+        """關閉所有訂閱（應用結束時）"""
+        for channel in self._channels.values():
+            channel.cancel_timers()
+            for subscriber in list(channel.subscribers):
+                subscriber.offer(None)
+            channel.subscribers.clear()
+
+    def get_stats(self) -> dict:
+        channels = {}
+        for name, channel in self._channels.items():
+            stats = {
+                "subscribers": len(channel.subscribers),
+                "rate_hz": round(1.0 / channel.interval, 2) if channel.interval else None,
+                "broadcasts": channel.broadcasts,
+                "skipped_unchanged": channel.skipped,
+                "bytes_broadcast": channel.bytes_sent,
+                "serialize_ms_total": round(channel.serialize_time * 1000, 2),
+                "dropped": sum(s.dropped for s in channel.subscribers),
+            }
+            if channel.encoder is not None:
+                stats.update(channel.encoder.get_stats())
+            channels[name] = stats
+        return {"publishes": self.publishes, "channels": channels}
+
+    # ------------------------------------------------------------------
+    # 推播（event loop 內）
+    # ------------------------------------------------------------------
+
+    def _on_publish(self):
+        with self._lock:
+            self._wakeup_pending = False
+        now = time.time()
+        for channel in self._channels.values():
+            if not channel.subscribers or channel.flush_handle is not None:
+                continue
+            # 依頻道頻率節流：距上次推播未滿間隔則排程到期時推播（期間的發布自然合併）
+            delay = channel.last_sent + channel.interval - now
+            if delay <= 0:
+                self._flush(channel)
+            else:
+                channel.flush_handle = self._loop.call_later(delay, self._flush, channel)
+
+    def _flush(self, channel: _Channel):
+        channel.flush_handle = None
+        if not channel.subscribers:
+            return
+        now = time.time()
+        message = self._serialize(channel, now)
+        channel.last_sent = now
+        if message is not None:
+            for subscriber in channel.subscribers:
+                subscriber.offer(message)
+            channel.broadcasts += 1
+        else:
+            channel.skipped += 1
+        self._schedule_keepalive(channel)
+
+    def _schedule_keepalive(self, channel: _Channel):
+        """無新資料時定期重送（單一計時器，與連線數無關）"""
+        if channel.keepalive_handle is not None:
+            channel.keepalive_handle.cancel()
+        channel.keepalive_handle = None
+        if self.keepalive_sec > 0 and channel.subscribers and self._loop is not None:
+            channel.keepalive_handle = self._loop.call_later(self.keepalive_sec, self._flush, channel)
+
+    def _serialize(self, channel: _Channel, now: float, force: bool = False) -> Any:
+        """每次推播序列化一次；差量頻道內容未變化時回傳 None（不送）"""
+        start = time.perf_counter()
+        with self._lock:
+            snapshot = self._snapshot
+        payload = channel.render(snapshot, channel.seq, now)
+        channel.seq += 1
+
+        message: Union[_Message[str], _DeltaMessage, None]
+        if channel.encoder is not None:
+            message = self._encode_delta(channel, channel.encoder, payload, now, force)
+        else:
+            if channel.envelope_type is None:
+                message = _Message(dumps_text(payload))
+            else:
+                # 與 send_ws_envelope 相同的欄位順序：v, type, ts, session_id, stream_id, payload
+                head = f'{{"v":1,"type":{dumps_text(channel.envelope_type)},"ts":{int(now * 1000)},'
+                tail = f',"payload":{dumps_text(payload)}}}'
+                message = _Message(head, tail)
+            channel.bytes_sent += len(message.head) + len(message.tail or "")
+
+        channel.serialize_time += time.perf_counter() - start
+        if message is not None:
+            channel.last_message = message
+        return message
+
+    def _encode_delta(
+        self,
+        channel: _Channel,
+        encoder: DeltaMetadataEncoder,
+        payload: dict,
+        now: float,
+        force: bool
+    ) -> Optional[_DeltaMessage]:
+        envelope_type = channel.envelope_type
+        assert envelope_type is not None  # add_channel 已檢查
+        update: EncodedUpdate = encoder.encode(payload, now)
+        ts_ms = int(now * 1000)
+        if update.delta is None:
+            keyframe = _Message(*pack_envelope_parts(envelope_type, ts_ms, update.keyframe))
+            channel.keyframe = keyframe
+            channel.bytes_sent += len(keyframe.head) + len(keyframe.tail or b"")
+            return _DeltaMessage(update.key_seq, keyframe, None)
+        if not update.changed and not force:
+            return None
+        # encoder 第一次一定產生 keyframe，之後的差量都對應已保留的 keyframe
+        base = channel.keyframe
+        assert base is not None
+        delta = _Message(*pack_envelope_parts(envelope_type, ts_ms, update.delta))
+        channel.bytes_sent += len(delta.head) + len(delta.tail or b"")
+        return _DeltaMessage(update.key_seq, base, delta)
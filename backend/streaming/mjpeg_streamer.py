@@ -5,25 +5,54 @@ MJPEG 串流模組 - 簡單可靠的 HTTP 視頻串流
 - 瀏覽器原生支持，不需要額外播放器
 - 直接用 <img src="..."> 即可顯示
 - 低延遲，即時顯示
+- 畫面沒變時（渲染器 generation 相同或取樣雜湊相同）沿用上次的 JPEG，
+  客戶端只以低頻率收到重送的同一幀（keepalive）
 """
 
 import asyncio
 import threading
 import time
+import zlib
 from collections import deque
 from typing import Any, Deque, Optional
 
 import cv2
+import numpy as np
+
+from core.pipeline_profiler import profiler
+
+
+def frame_signature(frame: Any) -> tuple:
+    """
+    畫面取樣雜湊：隔行取樣（整列）後 CRC32
+
+    高度 2 像素以上的變化都會反映在雜湊上；1080p 約 1.5 ms，遠低於 JPEG 編碼。
+    """
+    return (frame.shape, zlib.crc32(np.ascontiguousarray(frame[::2]).data))
 
 
 class MJPEGStream:
     """MJPEG 串流生成器"""
 
-    def __init__(self, name: str = "stream", quality: int = 70, max_fps: int = 30):
+    def __init__(
+        self,
+        name: str = "stream",
+        quality: int = 70,
+        max_fps: int = 30,
+        detect_changes: bool = False,
+        keepalive_sec: float = 1.0
+    ):
         self.name = name
         self.quality = quality
         self.max_fps = max_fps
         self.frame_interval = 1.0 / max_fps
+
+        # 畫面變化偵測：沒變時不複製、不清除編碼快取
+        # 相機畫面每幀都不同，雜湊只是浪費，僅投影流（畫面常不變）開啟
+        self.detect_changes = detect_changes
+        self.keepalive_sec = keepalive_sec
+        self._frame_key: Optional[tuple] = None
+        self.frame_seq = 0  # 畫面內容每改變一次 +1
         
         # ✅ 自適應品質控制
         self.auto_quality = False  # 預設關閉
@@ -41,7 +70,13 @@ class MJPEGStream:
 
         # 統計
         self.total_frames = 0
-        self.last_frame_time = 0
+        self.last_frame_time = 0.0
+        self.skipped_frames = 0  # 內容未變而略過的更新
+        self.encode_count = 0
+
+        # 管線量測階段名稱
+        self._stage_update = f"mjpeg.update.{name}"
+        self._stage_encode = f"mjpeg.encode.{name}"
 
     def set_quality(self, quality: int):
         """動態設置 JPEG 畫質 (1-100)"""
@@ -82,15 +117,35 @@ class MJPEGStream:
             self.set_quality(new_quality)
             print(f"📊 {self.name} auto-adjusted quality to {new_quality} (FPS: {current_fps:.1f})")
 
-    def update_frame(self, frame: Any):
-        """更新當前幀（儲存原始幀，按需編碼不同畫質）"""
+    def update_frame(self, frame: Any, generation: Optional[int] = None):
+        """
+        更新當前幀（儲存原始幀，按需編碼不同畫質）
+
+        Args:
+            frame: BGR 影像
+            generation: 渲染器提供的畫面版本號；與上一幀相同時直接略過（不需計算雜湊）
+        """
         try:
-            with self._frame_lock:
-                self._current_raw_frame = frame.copy()
-                # 清空舊的編碼緩存，因為有新幀了
-                self._encoded_frames.clear()
-                self.total_frames += 1
-                self.last_frame_time = time.time()
+            with profiler.stage(self._stage_update):
+                key: Optional[tuple]
+                if generation is not None:
+                    key = ("generation", generation)
+                elif self.detect_changes:
+                    key = ("hash", frame_signature(frame))
+                else:
+                    key = None
+                if key is not None and key == self._frame_key:
+                    self.skipped_frames += 1
+                    return
+
+                with self._frame_lock:
+                    self._current_raw_frame = frame.copy()
+                    # 清空舊的編碼緩存，因為有新幀了
+                    self._encoded_frames.clear()
+                    self._frame_key = key
+                    self.frame_seq += 1
+                    self.total_frames += 1
+                    self.last_frame_time = time.time()
         except Exception as e:
             print(f"❌ MJPEG frame update error ({self.name}): {e}")
 
@@ -112,12 +167,14 @@ class MJPEGStream:
 
             # 編碼新畫質
             try:
-                ret, buffer = cv2.imencode(
-                    ".jpg",
-                    self._current_raw_frame,
-                    [int(cv2.IMWRITE_JPEG_QUALITY), target_quality]
-                )
+                with profiler.stage(self._stage_encode):
+                    ret, buffer = cv2.imencode(
+                        ".jpg",
+                        self._current_raw_frame,
+                        [int(cv2.IMWRITE_JPEG_QUALITY), target_quality]
+                    )
                 if ret:
+                    self.encode_count += 1
                     encoded = buffer.tobytes()
                     # 緩存編碼結果（最多保留3種畫質）
                     if len(self._encoded_frames) >= 3:
@@ -150,26 +207,31 @@ class MJPEGStream:
 
         boundary = b"--frame\r\n"
         last_send_time = time.time()
+        last_sent_seq = -1
         stale_timeout = 10.0  # 10秒無數據發送則視為連接已斷開
         
         try:
             while True:
-                # 使用指定畫質獲取幀
-                frame_data = self.get_frame(quality=target_quality)
-                if frame_data:
-                    try:
-                        yield (
-                            boundary
-                            + b"Content-Type: image/jpeg\r\n"
-                            + f"Content-Length: {len(frame_data)}\r\n\r\n".encode()
-                            + frame_data
-                            + b"\r\n"
-                        )
-                        last_send_time = time.time()
-                    except Exception as e:
-                        # 客戶端已斷開，立即退出
-                        print(f"🔌 {self.name} client disconnected during send [conn:{connection_id}]: {e}")
-                        break
+                # 只在畫面改變時發送；畫面靜止時以 keepalive_sec 的間隔重送同一幀
+                seq = self.frame_seq
+                if seq != last_sent_seq or time.time() - last_send_time >= self.keepalive_sec:
+                    # 使用指定畫質獲取幀
+                    frame_data = self.get_frame(quality=target_quality)
+                    if frame_data:
+                        try:
+                            yield (
+                                boundary
+                                + b"Content-Type: image/jpeg\r\n"
+                                + f"Content-Length: {len(frame_data)}\r\n\r\n".encode()
+                                + frame_data
+                                + b"\r\n"
+                            )
+                            last_send_time = time.time()
+                            last_sent_seq = seq
+                        except Exception as e:
+                            # 客戶端已斷開，立即退出
+                            print(f"🔌 {self.name} client disconnected during send [conn:{connection_id}]: {e}")
+                            break
                 
                 # 檢測殭屍連接：如果超過10秒沒有成功發送數據，主動斷開
                 if time.time() - last_send_time > stale_timeout:
@@ -197,6 +259,8 @@ class MJPEGStream:
         return {
             "name": self.name,
             "total_frames": self.total_frames,
+            "skipped_frames": self.skipped_frames,
+            "encode_count": self.encode_count,
             "quality": self.quality,
             "max_fps": self.max_fps,
             "has_frame": self._current_raw_frame is not None,
@@ -213,18 +277,18 @@ class DualMJPEGManager:
     - projector: 投影畫面
     """
 
-    def __init__(self, quality: int = 70, max_fps: int = 30):
-        self.monitor = MJPEGStream("monitor", quality, max_fps)
-        self.projector = MJPEGStream("projector", quality, max_fps)
+    def __init__(self, quality: int = 70, max_fps: int = 30, keepalive_sec: float = 1.0):
+        self.monitor = MJPEGStream("monitor", quality, max_fps, keepalive_sec=keepalive_sec)
+        self.projector = MJPEGStream("projector", quality, max_fps, detect_changes=True, keepalive_sec=keepalive_sec)
         print(f"✅ MJPEG Stream Manager initialized (quality={quality}, fps={max_fps})")
 
     def update_monitor(self, frame: Any):
         """更新監控流"""
         self.monitor.update_frame(frame)
 
-    def update_projector(self, frame: Any):
-        """更新投影流"""
-        self.projector.update_frame(frame)
+    def update_projector(self, frame: Any, generation: Optional[int] = None):
+        """更新投影流（generation 為 ProjectorRenderer 的畫面版本號）"""
+        self.projector.update_frame(frame, generation)
 
     def get_stats(self) -> dict:
         """獲取雙流統計"""
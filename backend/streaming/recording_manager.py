@@ -7,6 +7,9 @@
 - 檔案結構化儲存
 - 預留回放分析接口
 - 自動同步至資料庫
+- 事件即時批次寫入 events 表（EventSink）
+- 錄影結束時建立跳轉索引 seek_index.json（事件 → 幀號 → 關鍵幀）
+- 錄影期間取樣縮圖畫面，結束時產生多尺寸縮圖與 sprite sheet（不重新解碼影片）
 """
 
 import os
@@ -18,8 +21,14 @@ from typing import Optional, Dict, List, Any
 from dataclasses import dataclass, asdict
 import threading
 
+import config
+
 # 導入資料庫
+from core.pipeline_profiler import profiler
 from database import Database
+from streaming.event_sink import EventSink
+from streaming.seek_index import SEEK_INDEX_FILENAME, SeekIndex
+from streaming.thumbnail_service import ThumbnailCollector, generate_from_video, write_thumbnails
 
 
 @dataclass
@@ -58,7 +67,7 @@ class RecordingManager:
         
         self.current_recording: Optional[Dict[str, Any]] = None
         self.video_writer: Optional[cv2.VideoWriter] = None
-        self.events_file: Optional[Any] = None
+        self.event_sink: Optional[EventSink] = None
         self.recording_lock = threading.Lock()
     
     def start_recording(
@@ -105,10 +114,6 @@ class RecordingManager:
             if not self.video_writer.isOpened():
                 raise RuntimeError(f"Failed to open video writer: {video_path}")
             
-            # 初始化事件日誌
-            events_path = os.path.join(recording_dir, "events.jsonl")
-            self.events_file = open(events_path, 'w', encoding='utf-8')
-            
             # 記錄元資料
             metadata = RecordingMetadata(
                 game_id=game_id,
@@ -119,12 +124,30 @@ class RecordingManager:
                 video_fps=fps
             )
             
+            # 先建立資料庫記錄，事件才能即時寫入 events 表（外鍵約束）
+            try:
+                self.db.upsert_recording(self._build_recording_row(metadata, video_path, status="recording"))
+            except Exception as e:
+                print(f"[Recording] Database pre-registration error: {e}")
+            
+            # 初始化事件日誌（JSONL + 資料庫批次寫入）
+            events_path = os.path.join(recording_dir, "events.jsonl")
+            self.event_sink = EventSink(
+                self.db,
+                game_id,
+                events_path,
+                batch_size=config.EVENT_BATCH_SIZE,
+                flush_interval_ms=config.EVENT_FLUSH_INTERVAL_MS
+            )
+            
             self.current_recording = {
                 "game_id": game_id,
                 "recording_dir": recording_dir,
                 "metadata": metadata,
                 "start_time": time.time(),
-                "frame_count": 0
+                "frame_count": 0,
+                "frame_times": [],  # 每幀寫入的牆鐘時間，供跳轉索引對應事件
+                "thumbnails": ThumbnailCollector(fps, config.THUMBNAIL_SPRITE_FRAMES)
             }
             
             # 記錄開始事件
@@ -179,7 +202,11 @@ class RecordingManager:
                 return False
             
             try:
-                self.video_writer.write(frame)
+                with profiler.stage("recording.write"):
+                    self.video_writer.write(frame)
+                self.current_recording["frame_times"].append(time.time())
+                with profiler.stage("recording.thumbnail"):
+                    self.current_recording["thumbnails"].add(frame, self.current_recording["frame_count"])
                 self.current_recording["frame_count"] += 1
                 return True
             except Exception as e:
@@ -198,7 +225,8 @@ class RecordingManager:
     
     def _log_event(self, event_type: str, data: Dict[str, Any]):
         """內部事件記錄方法"""
-        if not self.events_file:
+        sink = self.event_sink
+        if not sink:
             return
         
         event = {
@@ -208,11 +236,33 @@ class RecordingManager:
         }
         
         try:
-            self.events_file.write(json.dumps(event, ensure_ascii=False) + '\n')
-            self.events_file.flush()
+            sink.write(event)
         except Exception as e:
             print(f"[Recording] Event log error: {e}")
     
+    def _build_recording_row(
+        self, metadata: RecordingMetadata, video_path: str, status: str = "completed"
+    ) -> Dict[str, Any]:
+        """將錄影元資料轉換為資料庫記錄（status: recording 錄影中 / completed 已結束）"""
+        return {
+            "game_id": metadata.game_id,
+            "game_type": metadata.game_type,
+            "start_time": metadata.start_time,
+            "end_time": metadata.end_time,
+            "duration_seconds": metadata.duration_seconds,
+            "player1_name": metadata.players[0] if metadata.players and len(metadata.players) > 0 else None,
+            "player2_name": metadata.players[1] if metadata.players and len(metadata.players) > 1 else None,
+            "winner": metadata.winner,
+            "player1_score": metadata.final_score[0] if metadata.final_score and len(metadata.final_score) > 0 else 0,
+            "player2_score": metadata.final_score[1] if metadata.final_score and len(metadata.final_score) > 1 else 0,
+            "target_rounds": metadata.total_rounds,
+            "video_path": video_path,
+            "video_resolution": metadata.video_resolution,
+            "video_fps": metadata.video_fps,
+            "file_size_mb": metadata.file_size_mb,
+            "status": status
+        }
+    
     def stop_recording(
         self,
         final_score: Optional[List[int]] = None,
@@ -248,8 +298,8 @@ class RecordingManager:
             if self.video_writer:
                 self.video_writer.release()
                 self.video_writer = None # Explicitly clear reference
-            if self.events_file:
-                self.events_file.close()
+            if self.event_sink:
+                self.event_sink.close()
 
             # Wait for file system to finalize
             time.sleep(0.5)
@@ -272,25 +322,17 @@ class RecordingManager:
                 file_size_bytes = os.path.getsize(video_path)
                 metadata.file_size_mb = file_size_bytes / (1024 * 1024)
                 
-                # 生成縮圖（提取第一幀）
+                # 生成縮圖（使用錄影期間取樣的畫面）
                 try:
-                    cap = cv2.VideoCapture(video_path)
-                    if cap.isOpened():
-                        # Try to read a few frames to find a valid one if the first one is empty
-                        for _ in range(5):
-                            ret, frame = cap.read()
-                            if ret and frame is not None and frame.size > 0:
-                                thumbnail_path = os.path.join(
-                                    self.current_recording["recording_dir"], "thumbnail.jpg"
-                                )
-                                # 調整大小為 640x360 以節省空間
-                                thumbnail = cv2.resize(frame, (640, 360))
-                                cv2.imwrite(thumbnail_path, thumbnail, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                                print(f"[Recording] Thumbnail generated: {thumbnail_path}")
-                                break
-                        cap.release()
+                    collector = self.current_recording["thumbnails"]
+                    recording_dir = self.current_recording["recording_dir"]
+                    if collector.poster is not None:
+                        write_thumbnails(recording_dir, collector.poster, collector.select_tiles(), metadata.video_fps)
                     else:
-                        print(f"[Recording] Could not open video for thumbnail: {video_path}")
+                        generate_from_video(
+                            recording_dir, video_path, metadata.video_fps, config.THUMBNAIL_SPRITE_FRAMES
+                        )
+                    print(f"[Recording] Thumbnails generated: {recording_dir}")
                 except Exception as e:
                     print(f"[Recording] Thumbnail generation error: {e}")
                 # 轉換影片為 H.264（如果使用了 mp4v 編碼）
@@ -338,6 +380,18 @@ class RecordingManager:
                 except Exception as e:
                     print(f"[Recording] Video conversion error: {e}")
 
+                # 建立跳轉索引（須在轉檔之後，關鍵幀位置以最終檔案為準）
+                try:
+                    seek_index = SeekIndex.build(
+                        video_path,
+                        metadata.video_fps,
+                        frame_times=self.current_recording["frame_times"]
+                    )
+                    seek_index.save(os.path.join(self.current_recording["recording_dir"], SEEK_INDEX_FILENAME))
+                    print(f"[Recording] Seek index built: {len(seek_index.keyframes)} keyframes")
+                except Exception as e:
+                    print(f"[Recording] Seek index error: {e}")
+
             else:
                  print(f"[Recording] Video file empty or missing: {video_path}")
                  metadata.file_size_mb = 0
@@ -355,26 +409,10 @@ class RecordingManager:
                     self.current_recording["recording_dir"], "video.mp4"
                 )
                 
-                # 準備資料庫記錄
-                recording_data = {
-                    "game_id": metadata.game_id,
-                    "game_type": metadata.game_type,
-                    "start_time": metadata.start_time,
-                    "end_time": metadata.end_time,
-                    "duration_seconds": metadata.duration_seconds,
-                    "player1_name": metadata.players[0] if metadata.players and len(metadata.players) > 0 else None,
-                    "player2_name": metadata.players[1] if metadata.players and len(metadata.players) > 1 else None,
-                    "winner": metadata.winner,
-                    "player1_score": metadata.final_score[0] if metadata.final_score and len(metadata.final_score) > 0 else 0,
-                    "player2_score": metadata.final_score[1] if metadata.final_score and len(metadata.final_score) > 1 else 0,
-                    "target_rounds": metadata.total_rounds,
-                    "video_path": video_path,
-                    "video_resolution": metadata.video_resolution,
-                    "video_fps": metadata.video_fps,
-                    "file_size_mb": metadata.file_size_mb
-                }
+                # 準備資料庫記錄（開始錄影時已建立，這裡覆寫為完整元資料並標記為已完成）
+                recording_data = self._build_recording_row(metadata, video_path, status="completed")
                 
-                self.db.insert_recording(recording_data)
+                self.db.upsert_recording(recording_data)
                 print(f"[Recording] Synced to database: {metadata.game_id}")
             except Exception as e:
                 print(f"[Recording] Database sync error: {e}")
@@ -391,7 +429,7 @@ class RecordingManager:
             # 清理狀態
             self.current_recording = None
             self.video_writer = None
-            self.events_file = None
+            self.event_sink = None
             
             return result
     
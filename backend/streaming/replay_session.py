@@ -0,0 +1,546 @@
+"""
+回放串流管理 - 多位觀眾共用同一個解碼器的錄影回放
+
+- 每個 (game_id, session) 只有一個解碼線程，依錄影 video_fps × 播放速率節流
+- 同一場回放的所有觀眾（不同畫質也一樣）共用解碼結果，JPEG 依畫質各編碼一次
+- 支援 seek / pause / resume / rate 控制，所有觀眾同步
+- 最近播放片段的 JPEG 以 LRU 快取（依位元組上限），重播或來回拖曳不需重新編碼
+- 無觀眾的回放閒置超過時限後由回收線程釋放解碼器
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+
+from streaming.seek_index import SeekIndex, seek_capture
+
+# 畫質 → JPEG 品質
+REPLAY_JPEG_QUALITY = {
+    "low": 55,
+    "med": 75,
+    "high": 85,
+}
+
+# 暫停時重送最後一幀的間隔（秒），避免代理/瀏覽器判定連線閒置
+PAUSED_KEEPALIVE_SEC = 1.0
+
+# 落後超過此秒數時放棄追趕，重新對齊節拍（例如 CPU 短暫滿載）
+MAX_PACING_LAG_SEC = 0.5
+
+
+class EncodedFrameCache:
+    """已編碼 JPEG 的 LRU 快取（以位元組數為上限，跨回放共用）"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._frames: "OrderedDict[Tuple[str, int, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, int, str]) -> Optional[bytes]:
+        with self._lock:
+            jpeg = self._frames.get(key)
+            if jpeg is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return jpeg
+
+    def put(self, key: Tuple[str, int, str], jpeg: bytes):
+        if len(jpeg) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._frames[key] = jpeg
+            self._bytes += len(jpeg)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def discard_game(self, game_id: str):
+        """移除某場錄影的所有快取（錄影刪除時使用）"""
+        with self._lock:
+            for key in [k for k in self._frames if k[0] == game_id]:
+                self._bytes -= len(self._frames.pop(key))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "frames": len(self._frames),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+class _Subscriber:
+    """單一觀眾：最新幀優先的佇列（慢速觀眾只會跳幀，不會累積延遲）"""
+
+    __slots__ = ("loop", "queue", "quality", "closed", "_ended")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, quality: str):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.quality = quality
+        self.closed = False  # 已送出結束訊號，之後的幀一律丟棄（任意線程）
+        self._ended = False  # 結束訊號已放入佇列（事件循環線程）
+
+    def offer(self, jpeg: Optional[bytes]):
+        """由解碼線程呼叫，交給事件循環放入佇列（None 表示回放已關閉）"""
+        if self.closed:
+            return
+        if jpeg is None:
+            self.closed = True
+        try:
+            self.loop.call_soon_threadsafe(self._put_latest, jpeg)
+        except RuntimeError:
+            # 事件循環已關閉
+            pass
+
+    def _put_latest(self, jpeg: Optional[bytes]):
+        # 結束訊號之後才排入的幀（close 前已取得觀眾清單的 _deliver）不可覆蓋 None，否則觀眾永遠等不到結束
+        if self._ended:
+            return
+        if jpeg is None:
+            self._ended = True
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(jpeg)
+
+
+class ReplaySession:
+    """單一回放：一個解碼線程 + 多位觀眾"""
+
+    def __init__(
+        self,
+        game_id: str,
+        name: str,
+        video_path: str,
+        cache: EncodedFrameCache,
+        fps: Optional[float] = None,
+        max_rate: float = 4.0,
+        seek_index: Optional[SeekIndex] = None,
+    ):
+        """
+        初始化回放
+
+        Args:
+            game_id: 遊戲 ID
+            name: 回放名稱（同名觀眾共用播放位置）
+            video_path: 影片路徑
+            cache: 共用 JPEG 快取
+            fps: 錄影幀率（None 則讀取影片檔資訊）
+            max_rate: 最大播放速率
+            seek_index: 跳轉索引（可選，提供時 seek 從關鍵幀開始解碼，並支援依事件時間跳轉）
+        """
+        self.game_id = game_id
+        self.name = name
+        self.video_path = video_path
+        self.cache = cache
+        self.max_rate = max_rate
+        self.seek_index = seek_index
+
+        self._cap = cv2.VideoCapture(video_path)
+        if not self._cap.isOpened():
+            self._cap.release()
+            raise IOError(f"Cannot open video: {video_path}")
+
+        file_fps = self._cap.get(cv2.CAP_PROP_FPS) or 0.0
+        self.fps = float(fps or file_fps or 30.0)
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+
+        # 播放狀態（受 _lock 保護）
+        self._lock = threading.Lock()
+        self._subscribers: List[_Subscriber] = []
+        self.position = 0  # 下一個要輸出的幀索引
+        self.paused = False
+        self.rate = 1.0
+        self._seek_to: Optional[int] = None
+        self._last_frame = None
+        self._last_index = -1
+        self._last_jpeg: Dict[str, bytes] = {}
+        self.last_active = time.monotonic()
+
+        # 統計
+        self.frames_decoded = 0
+        self.frames_encoded = 0
+
+        self._wakeup = threading.Event()
+        self._running = True
+        self._closed = False  # 受 _lock 保護；關閉後（含解碼線程異常結束）不再接受觀眾
+        self._thread = threading.Thread(
+            target=self._decode_loop,
+            name=f"replay-{game_id}-{name}",
+            daemon=True
+        )
+        self._thread.start()
+
+    # ==================== 觀眾 ====================
+
+    def subscribe(self, quality: str) -> _Subscriber:
+        """新增觀眾（須在事件循環中呼叫）；回放已關閉時立即送出結束訊號"""
+        subscriber = _Subscriber(asyncio.get_running_loop(), quality)
+        with self._lock:
+            if self._closed:
+                subscriber.offer(None)
+                return subscriber
+            self._subscribers.append(subscriber)
+            self.last_active = time.monotonic()
+            last_jpeg = self._last_jpeg.get(quality)
+        if last_jpeg is not None:
+            # 立即送出目前畫面（暫停中加入的觀眾也看得到）
+            subscriber.offer(last_jpeg)
+        self._wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+            self.last_active = time.monotonic()
+
+    @property
+    def alive(self) -> bool:
+        """解碼線程仍在執行且未關閉"""
+        with self._lock:
+            return not self._closed and self._thread.is_alive()
+
+    @property
+    def viewer_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    # ==================== 控制 ====================
+
+    def seek(self, frame_index: int):
+        """跳轉至指定幀（暫停中也會更新畫面）"""
+        if self.frame_count > 0:
+            frame_index = min(frame_index, self.frame_count - 1)
+        with self._lock:
+            self._seek_to = max(0, frame_index)
+            self.last_active = time.monotonic()
+        self._wakeup.set()
+
+    def seek_ms(self, position_ms: float):
+        self.seek(int(round(position_ms / 1000.0 * self.fps)))
+
+    def seek_timestamp(self, timestamp: float):
+        """跳轉至牆鐘時間戳（事件時間）對應的幀"""
+        if self.seek_index is None:
+            raise ValueError("Seek index not available")
+        self.seek(self.seek_index.frame_for_timestamp(timestamp))
+
+    def pause(self):
+        with self._lock:
+            self.paused = True
+        self._wakeup.set()
+
+    def resume(self):
+        with self._lock:
+            self.paused = False
+        self._wakeup.set()
+
+    def set_rate(self, rate: float):
+        """設定播放速率（0 < rate <= max_rate）"""
+        if not 0 < rate <= self.max_rate:
+            raise ValueError(f"rate must be in (0, {self.max_rate}]")
+        with self._lock:
+            self.rate = float(rate)
+        self._wakeup.set()
+
+    def close(self):
+        """
+        停止解碼線程並通知觀眾結束串流
+
+        解碼器由解碼線程結束時自行釋放：join 逾時（線程仍卡在 cap.read()）時不可在此 release。
+        """
+        self._shutdown()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+            if self._thread.is_alive():
+                print(f"⚠️ Replay decoder still busy, releasing on exit: {self.game_id}/{self.name}")
+
+    def _shutdown(self):
+        """標記關閉並通知所有觀眾（可重複呼叫）"""
+        self._running = False
+        self._wakeup.set()
+        with self._lock:
+            self._closed = True
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.offer(None)
+
+    # ==================== 解碼線程 ====================
+
+    def _decode_loop(self):
+        try:
+            self._run_decoder()
+        except Exception as e:
+            print(f"❌ Replay decoder error ({self.game_id}/{self.name}): {e}")
+        finally:
+            # 解碼線程異常結束時觀眾也要收到結束訊號，否則串流會永遠等待
+            self._shutdown()
+            self._cap.release()
+
+    def _run_decoder(self):
+        next_deadline = time.monotonic()
+        last_sent = 0.0
+
+        while self._running:
+            with self._lock:
+                seek_to, self._seek_to = self._seek_to, None
+                paused = self.paused
+                interval = 1.0 / (self.fps * self.rate)
+                qualities = {s.quality for s in self._subscribers}
+                missing = [q for q in qualities if q not in self._last_jpeg]
+
+            if seek_to is not None:
+                seek_capture(self._cap, seek_to, self.seek_index)
+                self.position = seek_to
+                if paused and qualities:
+                    # 暫停中 seek：解碼一幀顯示，位置停在該幀之後
+                    self._advance(qualities)
+                next_deadline = time.monotonic()
+                continue
+
+            if not qualities:
+                # 沒有觀眾：不解碼，等待新觀眾或回收
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                next_deadline = time.monotonic()
+                continue
+
+            if paused:
+                now = time.monotonic()
+                if missing and self._last_index >= 0:
+                    self._publish_current(missing)
+                    last_sent = now
+                elif now - last_sent >= PAUSED_KEEPALIVE_SEC:
+                    self._republish(qualities)
+                    last_sent = now
+                self._wakeup.wait(PAUSED_KEEPALIVE_SEC)
+                self._wakeup.clear()
+                next_deadline = time.monotonic()
+                continue
+
+            now = time.monotonic()
+            if now < next_deadline:
+                # 以 Event 等待，控制命令可立即打斷
+                if self._wakeup.wait(next_deadline - now):
+                    self._wakeup.clear()
+                continue
+
+            self._advance(qualities)
+            last_sent = now
+
+            next_deadline += interval
+            if time.monotonic() - next_deadline > MAX_PACING_LAG_SEC:
+                next_deadline = time.monotonic()
+
+    def _advance(self, qualities: set):
+        """輸出目前位置的一幀並前進"""
+        index = self.position
+
+        # 所有需要的畫質都已在快取中：只 grab 不 retrieve，省去色彩轉換
+        lookups = {q: self.cache.get((self.game_id, index, q)) for q in qualities}
+        cached = {q: jpeg for q, jpeg in lookups.items() if jpeg}
+        if len(cached) == len(qualities):
+            if not self._cap.grab():
+                self._rewind()
+                return
+            self.frames_decoded += 1
+            self._last_frame = None
+            self._last_index = index
+            self._deliver(cached)
+            self.position = index + 1
+            return
+
+        ret, frame = self._cap.read()
+        if not ret:
+            self._rewind()
+            return
+        self.frames_decoded += 1
+        self._last_frame = frame
+        self._last_index = index
+        self._publish(index, frame, qualities, cached)
+        self.position = index + 1
+
+    def _publish_current(self, qualities):
+        """為新加入的畫質補送目前畫面（最後一幀走快取路徑時需重新解碼）"""
+        if self._last_frame is None:
+            seek_capture(self._cap, self._last_index, self.seek_index)
+            ret, frame = self._cap.read()
+            if not ret:
+                return
+            self._last_frame = frame
+        self._publish(self._last_index, self._last_frame, qualities)
+
+    def _rewind(self):
+        """影片結束，重新開始（循環播放）"""
+        self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.position = 0
+
+    def _publish(self, index: int, frame, qualities, cached: Optional[Dict[str, bytes]] = None):
+        """依畫質編碼（或取快取）並送給觀眾"""
+        encoded: Dict[str, bytes] = {}
+        for quality in qualities:
+            jpeg = (cached or {}).get(quality)
+            if jpeg is None:
+                ret, buffer = cv2.imencode(
+                    '.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), REPLAY_JPEG_QUALITY.get(quality, 75)]
+                )
+                if not ret:
+                    continue
+                jpeg = buffer.tobytes()
+                self.frames_encoded += 1
+                self.cache.put((self.game_id, index, quality), jpeg)
+            encoded[quality] = jpeg
+        self._deliver(encoded)
+
+    def _deliver(self, encoded: Dict[str, bytes]):
+        with self._lock:
+            self._last_jpeg = dict(encoded)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            jpeg = encoded.get(subscriber.quality)
+            if jpeg is not None:
+                subscriber.offer(jpeg)
+
+    def _republish(self, qualities: set):
+        """暫停中重送最後一幀"""
+        with self._lock:
+            encoded = {q: self._last_jpeg[q] for q in qualities if q in self._last_jpeg}
+        self._deliver(encoded)
+
+    def get_state(self) -> dict:
+        with self._lock:
+            # seek 由解碼線程非同步套用，尚未套用時回報目標位置
+            position = self._seek_to if self._seek_to is not None else self.position
+            return {
+                "game_id": self.game_id,
+                "session": self.name,
+                "position_frame": position,
+                "position_ms": round(position / self.fps * 1000.0, 1),
+                "frame_count": self.frame_count,
+                "fps": self.fps,
+                "paused": self.paused,
+                "rate": self.rate,
+                "viewers": len(self._subscribers),
+                "frames_decoded": self.frames_decoded,
+                "frames_encoded": self.frames_encoded,
+            }
+
+
+class ReplaySessionManager:
+    """回放管理器：依 (game_id, session) 共用解碼器，並回收閒置回放"""
+
+    def __init__(self, cache_mb: int = 64, idle_timeout_sec: float = 30.0, max_rate: float = 4.0):
+        """
+        初始化回放管理器
+
+        Args:
+            cache_mb: JPEG 快取上限（MB）
+            idle_timeout_sec: 無觀眾多久後釋放解碼器
+            max_rate: 最大播放速率
+        """
+        self.cache = EncodedFrameCache(cache_mb * 1024 * 1024)
+        self.idle_timeout_sec = idle_timeout_sec
+        self.max_rate = max_rate
+        self._sessions: Dict[Tuple[str, str], ReplaySession] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def get_or_create(
+        self,
+        game_id: str,
+        video_path: str,
+        name: str = "default",
+        fps: Optional[float] = None,
+        seek_index: Optional[SeekIndex] = None,
+        start_ms: Optional[float] = None
+    ) -> ReplaySession:
+        """
+        取得既有回放，或建立新的解碼器
+
+        start_ms 只在建立新回放時套用：加入既有回放的觀眾不會改變其他觀眾的播放位置。
+        """
+        key = (game_id, name)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and not session.alive:
+                # 解碼線程已結束（異常或已關閉）：換一個新的解碼器
+                del self._sessions[key]
+                session = None
+            if session is None:
+                session = ReplaySession(
+                    game_id, name, video_path, self.cache,
+                    fps=fps, max_rate=self.max_rate, seek_index=seek_index
+                )
+                if start_ms is not None:
+                    session.seek_ms(start_ms)
+                self._sessions[key] = session
+                print(f"🎞️ Replay session started: {game_id}/{name} ({session.fps:.1f} FPS)")
+            session.last_active = time.monotonic()
+            self._ensure_reaper()
+            return session
+
+    def get(self, game_id: str, name: str = "default") -> Optional[ReplaySession]:
+        with self._lock:
+            return self._sessions.get((game_id, name))
+
+    def close_game(self, game_id: str):
+        """關閉某場錄影的所有回放並清除快取（錄影刪除時使用）"""
+        with self._lock:
+            sessions = [s for key, s in self._sessions.items() if key[0] == game_id]
+            for session in sessions:
+                del self._sessions[(session.game_id, session.name)]
+        for session in sessions:
+            session.close()
+        self.cache.discard_game(game_id)
+
+    def close_all(self):
+        self._stop.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def _ensure_reaper(self):
+        if self._reaper is None or not self._reaper.is_alive():
+            self._stop.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, name="replay-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(5.0, self.idle_timeout_sec / 2))
+        while not self._stop.wait(interval):
+            now = time.monotonic()
+            with self._lock:
+                idle = [
+                    key for key, s in self._sessions.items()
+                    if s.viewer_count == 0 and now - s.last_active > self.idle_timeout_sec
+                ]
+                sessions = [self._sessions.pop(key) for key in idle]
+            for session in sessions:
+                session.close()
+                print(f"🧹 Replay session evicted: {session.game_id}/{session.name}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "sessions": [s.get_state() for s in sessions],
+            "cache": self.cache.get_stats(),
+        }
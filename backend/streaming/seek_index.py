@@ -0,0 +1,457 @@
+"""
+錄影跳轉索引 - 時間戳 / 幀號 → 關鍵幀位置
+
+錄影結束（轉檔完成）後建立 seek_index.json，放在 video.mp4 旁:
+- keyframes: 每個關鍵幀的 [幀號, 影片時間(秒), 檔案位元組偏移]（解析 MP4 stss/stco/stsz/stsc/stts）
+- frame_times_ms: 每一幀寫入時的牆鐘時間（相對 start_ts 的毫秒），
+  事件時間戳是牆鐘時間，實際錄影幀率不一定等於標稱 FPS，必須以此對應幀號
+
+用途:
+- 事件 → 幀號 → 前一個關鍵幀：回放只需從關鍵幀解碼到目標幀，不必從頭解碼
+- MP4 播放器可直接以 video_time 設定 currentTime，或以 byte_offset 發出 Range 請求
+"""
+
+import bisect
+import json
+import os
+import struct
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import cv2
+
+SEEK_INDEX_FILENAME = "seek_index.json"
+SEEK_INDEX_VERSION = 1
+
+# 需要往下解析的 MP4 容器 box
+_MP4_CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+# ==================== MP4 解析 ====================
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """迭代 [start, end) 範圍內的 box，回傳 (type, payload_start, box_end)"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            break
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _read_moov(path: str) -> Optional[bytes]:
+    """讀取檔案中的 moov box（OpenCV/FFmpeg 預設寫在檔尾）"""
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos + 8 <= file_size:
+            f.seek(pos)
+            header = f.read(16)
+            if len(header) < 8:
+                return None
+            size, box_type = struct.unpack_from(">I4s", header, 0)
+            header_size = 8
+            if size == 1:
+                if len(header) < 16:
+                    return None
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - pos
+            if size < header_size:
+                return None
+            if box_type == b"moov":
+                f.seek(pos)
+                return f.read(size)
+            pos += size
+    return None
+
+
+def is_finalized(video_path: str) -> bool:
+    """影片是否已寫完：MP4 在錄影結束（釋放 writer）時才寫入 moov，錄影中的檔案沒有 moov"""
+    if not video_path.lower().endswith(".mp4"):
+        return True
+    try:
+        return _read_moov(video_path) is not None
+    except (OSError, struct.error):
+        return False
+
+
+def _find_video_stbl(moov: bytes) -> Optional[Tuple[Dict[bytes, Tuple[int, int]], int]]:
+    """找出影片軌的 stbl 子 box 位置與 timescale"""
+    for box_type, start, end in _iter_boxes(moov, 8):
+        if box_type != b"trak":
+            continue
+        tables: Dict[bytes, Tuple[int, int]] = {}
+        handler = None
+        timescale = 0
+
+        def walk(s: int, e: int, tables: dict):
+            nonlocal handler, timescale
+            for child, cs, ce in _iter_boxes(moov, s, e):
+                if child in _MP4_CONTAINERS:
+                    walk(cs, ce, tables)
+                elif child == b"hdlr":
+                    handler = moov[cs + 8:cs + 12]
+                elif child == b"mdhd":
+                    version = moov[cs]
+                    timescale = struct.unpack_from(">I", moov, cs + (20 if version == 1 else 12))[0]
+                elif child in (b"stss", b"stco", b"co64", b"stsz", b"stsc", b"stts", b"ctts"):
+                    tables[child] = (cs, ce)
+
+        walk(start, end, tables)
+        if handler == b"vide" and timescale > 0:
+            return tables, timescale
+    return None
+
+
+def parse_mp4_keyframes(path: str) -> Dict[str, Any]:
+    """
+    解析 MP4 影片軌的關鍵幀位置
+
+    Returns:
+        {"frame_count", "timescale", "duration_sec", "keyframes": [[幀號, 影片時間(秒), 位元組偏移], ...]}
+
+    Raises:
+        ValueError: 不是可解析的 MP4
+    """
+    moov = _read_moov(path)
+    if moov is None:
+        raise ValueError(f"No moov box: {path}")
+    found = _find_video_stbl(moov)
+    if found is None:
+        raise ValueError(f"No video track: {path}")
+    tables, timescale = found
+    for required in (b"stsz", b"stsc", b"stts"):
+        if required not in tables:
+            raise ValueError(f"Missing {required.decode()} box: {path}")
+
+    def entries(box: bytes, fmt: str) -> List[tuple]:
+        start, _ = tables[box]
+        count = struct.unpack_from(">I", moov, start + 4)[0]
+        size = struct.calcsize(fmt)
+        return [struct.unpack_from(fmt, moov, start + 8 + i * size) for i in range(count)]
+
+    # 樣本大小
+    stsz_start, _ = tables[b"stsz"]
+    uniform_size, sample_count = struct.unpack_from(">II", moov, stsz_start + 4)
+    if uniform_size:
+        sizes = [uniform_size] * sample_count
+    else:
+        sizes = list(struct.unpack_from(f">{sample_count}I", moov, stsz_start + 12))
+
+    # chunk 偏移
+    if b"co64" in tables:
+        chunk_offsets = [e[0] for e in entries(b"co64", ">Q")]
+    elif b"stco" in tables:
+        chunk_offsets = [e[0] for e in entries(b"stco", ">I")]
+    else:
+        raise ValueError(f"Missing stco/co64 box: {path}")
+
+    # 關鍵幀（無 stss 表示每一幀都是關鍵幀，例如 MJPEG）
+    if b"stss" in tables:
+        sync_samples = {e[0] - 1 for e in entries(b"stss", ">I")}
+    else:
+        sync_samples = None
+
+    # 解碼時間（stts）與顯示偏移（ctts，B 幀時存在）
+    decode_times: List[int] = []
+    t = 0
+    for count, delta in entries(b"stts", ">II"):
+        for _ in range(count):
+            decode_times.append(t)
+            t += delta
+    composition = [0] * sample_count
+    if b"ctts" in tables:
+        i = 0
+        for count, offset in entries(b"ctts", ">Ii"):
+            for _ in range(count):
+                if i < sample_count:
+                    composition[i] = offset
+                i += 1
+    # 編輯清單通常抵銷第一幀的顯示延遲，這裡以相對值近似
+    base_offset = composition[0] if composition else 0
+
+    # 依 stsc 展開每個樣本的位元組偏移，只保留關鍵幀
+    stsc = entries(b"stsc", ">III")
+    keyframes: List[List[Any]] = []
+    sample = 0
+    for i, (first_chunk, samples_per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+        for chunk in range(first_chunk - 1, last_chunk):
+            offset = chunk_offsets[chunk]
+            for _ in range(samples_per_chunk):
+                if sample >= sample_count:
+                    break
+                if sync_samples is None or sample in sync_samples:
+                    pts = decode_times[sample] + composition[sample] - base_offset
+                    keyframes.append([sample, round(pts / timescale, 4), offset])
+                offset += sizes[sample]
+                sample += 1
+
+    return {
+        "frame_count": sample_count,
+        "timescale": timescale,
+        "duration_sec": round(t / timescale, 4),
+        "keyframes": keyframes,
+    }
+
+
+# ==================== 索引 ====================
+
+class KeyframeInfo(TypedDict):
+    frame: int
+    video_time: float
+    byte_offset: int
+
+
+class _SeekIndexSummaryBase(TypedDict):
+    frame_count: int
+    fps: float
+    start_ts: Optional[float]
+    keyframe_count: int
+    keyframes: List[KeyframeInfo]
+    has_frame_times: bool
+
+
+class SeekIndexSummary(_SeekIndexSummaryBase, total=False):
+    """GET /api/recordings/{game_id}/seek-index 的內容；frame_times_ms 只在要求時附上"""
+
+    frame_times_ms: Optional[List[int]]
+
+
+class SeekIndex:
+    """錄影跳轉索引"""
+
+    def __init__(
+        self,
+        frame_count: int,
+        fps: float,
+        keyframes: List[List[Any]],
+        start_ts: Optional[float] = None,
+        frame_times_ms: Optional[List[int]] = None,
+        video_size: int = 0,
+        video_mtime: float = 0.0,
+    ):
+        self.frame_count = frame_count
+        self.fps = float(fps) if fps else 30.0
+        self.keyframes = keyframes
+        self.start_ts = start_ts
+        self.frame_times_ms = frame_times_ms
+        self.video_size = video_size
+        self.video_mtime = video_mtime
+        self._keyframe_numbers = [k[0] for k in keyframes]
+
+    # ---------- 建立 / 存取 ----------
+
+    @classmethod
+    def build(
+        cls,
+        video_path: str,
+        fps: float,
+        frame_times: Optional[List[float]] = None,
+        start_ts: Optional[float] = None
+    ) -> "SeekIndex":
+        """
+        由影片檔建立索引
+
+        Args:
+            video_path: 影片路徑
+            fps: 錄影標稱幀率
+            frame_times: 每幀寫入時的牆鐘時間（time.time()），舊錄影可省略
+            start_ts: 第一幀牆鐘時間（frame_times 省略時使用）
+        """
+        stat_result = os.stat(video_path)
+        try:
+            parsed = parse_mp4_keyframes(video_path)
+            frame_count = parsed["frame_count"]
+            keyframes = parsed["keyframes"]
+        except (ValueError, struct.error):
+            # 非 MP4：沒有位元組偏移，只能依幀號跳轉
+            cap = cv2.VideoCapture(video_path)
+            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+            cap.release()
+            keyframes = []
+
+        frame_times_ms = None
+        if frame_times:
+            start_ts = frame_times[0]
+            # 取下整：事件時間戳緊接在寫入之後時仍對應到該幀
+            frame_times_ms = [int((t - start_ts) * 1000) for t in frame_times]
+
+        return cls(
+            frame_count=frame_count,
+            fps=fps,
+            keyframes=keyframes,
+            start_ts=start_ts,
+            frame_times_ms=frame_times_ms,
+            video_size=stat_result.st_size,
+            video_mtime=stat_result.st_mtime,
+        )
+
+    def save(self, path: str):
+        data = {
+            "version": SEEK_INDEX_VERSION,
+            "frame_count": self.frame_count,
+            "fps": self.fps,
+            "start_ts": self.start_ts,
+            "video_size": self.video_size,
+            "video_mtime": self.video_mtime,
+            "keyframes": self.keyframes,
+            "frame_times_ms": self.frame_times_ms,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SeekIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != SEEK_INDEX_VERSION:
+            raise ValueError(f"Unsupported seek index version: {data.get('version')}")
+        return cls(
+            frame_count=data["frame_count"],
+            fps=data["fps"],
+            keyframes=data["keyframes"],
+            start_ts=data.get("start_ts"),
+            frame_times_ms=data.get("frame_times_ms"),
+            video_size=data.get("video_size", 0),
+            video_mtime=data.get("video_mtime", 0.0),
+        )
+
+    def matches(self, video_path: str) -> bool:
+        """索引是否對應目前的影片檔（轉檔後會重建）"""
+        try:
+            stat_result = os.stat(video_path)
+        except OSError:
+            return False
+        return stat_result.st_size == self.video_size and abs(stat_result.st_mtime - self.video_mtime) < 1e-3
+
+    # ---------- 查詢 ----------
+
+    def frame_for_timestamp(self, timestamp: float) -> int:
+        """牆鐘時間戳 → 幀號（該時間點已寫入的最後一幀）"""
+        if self.start_ts is None:
+            raise ValueError("Seek index has no start timestamp")
+        offset_ms = (timestamp - self.start_ts) * 1000.0
+        if self.frame_times_ms:
+            frame = bisect.bisect_right(self.frame_times_ms, offset_ms) - 1
+        else:
+            frame = int(offset_ms / 1000.0 * self.fps)
+        return self._clamp(frame)
+
+    def frame_for_video_time(self, seconds: float) -> int:
+        """影片時間（秒）→ 幀號"""
+        return self._clamp(int(round(seconds * self.fps)))
+
+    def video_time(self, frame: int) -> float:
+        """幀號 → 影片時間（秒，播放器 currentTime）"""
+        return round(frame / self.fps, 4)
+
+    def keyframe_before(self, frame: int) -> Optional[KeyframeInfo]:
+        """目標幀之前（含）最近的關鍵幀"""
+        if not self.keyframes:
+            return None
+        i = bisect.bisect_right(self._keyframe_numbers, frame) - 1
+        number, video_time, byte_offset = self.keyframes[max(0, i)]
+        return {"frame": number, "video_time": video_time, "byte_offset": byte_offset}
+
+    def locate(self, frame: int) -> Dict[str, Any]:
+        """幀號 → 跳轉資訊"""
+        frame = self._clamp(frame)
+        return {
+            "frame": frame,
+            "video_time": self.video_time(frame),
+            "keyframe": self.keyframe_before(frame),
+        }
+
+    def summary(self, include_frame_times: bool = False) -> SeekIndexSummary:
+        data: SeekIndexSummary = {
+            "frame_count": self.frame_count,
+            "fps": self.fps,
+            "start_ts": self.start_ts,
+            "keyframe_count": len(self.keyframes),
+            "keyframes": [
+                {"frame": k[0], "video_time": k[1], "byte_offset": k[2]} for k in self.keyframes
+            ],
+            "has_frame_times": self.frame_times_ms is not None,
+        }
+        if include_frame_times:
+            data["frame_times_ms"] = self.frame_times_ms
+        return data
+
+    def _clamp(self, frame: int) -> int:
+        if self.frame_count > 0:
+            frame = min(frame, self.frame_count - 1)
+        return max(0, frame)
+
+
+def seek_capture(cap: "cv2.VideoCapture", frame: int, index: Optional[SeekIndex] = None):
+    """
+    將 VideoCapture 定位到指定幀：先跳到前一個關鍵幀，再往前 grab（不做色彩轉換）
+
+    定位後下一次 read() 即為目標幀
+    """
+    keyframe = index.keyframe_before(frame) if index is not None else None
+    if keyframe is None:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame)
+        return
+    cap.set(cv2.CAP_PROP_POS_FRAMES, keyframe["frame"])
+    for _ in range(frame - keyframe["frame"]):
+        if not cap.grab():
+            break
+
+
+def load_or_build_seek_index(
+    video_path: str,
+    fps: Optional[float] = None,
+    start_time: Optional[str] = None
+) -> SeekIndex:
+    """
+    讀取影片旁的 seek_index.json；不存在或與影片不符時重新建立（舊錄影沒有逐幀時間）
+
+    Args:
+        video_path: 影片路徑
+        fps: 錄影標稱幀率
+        start_time: 錄影開始時間（ISO 格式，舊錄影的時間基準）
+    """
+    index_path = os.path.join(os.path.dirname(video_path), SEEK_INDEX_FILENAME)
+    previous = None
+    if os.path.exists(index_path):
+        try:
+            previous = SeekIndex.load(index_path)
+            if previous.matches(video_path):
+                return previous
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            print(f"[SeekIndex] Ignoring invalid index {index_path}: {e}")
+
+    start_ts = None
+    if start_time:
+        try:
+            start_ts = datetime.fromisoformat(start_time).timestamp()
+        except ValueError:
+            pass
+
+    index = SeekIndex.build(video_path, fps or 30.0, start_ts=start_ts)
+    if not is_finalized(video_path):
+        # 錄影中（尚未寫入 moov）：索引只在本次使用，不寫入錄影資料夾
+        return index
+    if previous is not None and previous.frame_times_ms:
+        # 影片被重新轉檔：關鍵幀重新解析，逐幀時間沿用
+        index.start_ts = previous.start_ts
+        index.frame_times_ms = previous.frame_times_ms
+    try:
+        index.save(index_path)
+    except OSError as e:
+        print(f"[SeekIndex] Failed to save {index_path}: {e}")
+    return index
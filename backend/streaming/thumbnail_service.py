@@ -0,0 +1,316 @@
+"""
+縮圖服務 - 錄影縮圖的產生、快取與 sprite sheet
+
+- 多種尺寸（sm / md / lg）× 格式（JPEG / WebP），lg JPEG 即既有的 thumbnail.jpg
+- 錄影期間以 ThumbnailCollector 取樣畫面，結束時直接產生縮圖，不需重新解碼影片
+- sprite sheet：整場均勻取 N 張小圖拼成一張，供列表滑鼠移動預覽
+- 舊錄影缺少縮圖時按需產生（只解碼關鍵幀）
+- 記憶體 LRU 快取（位元組上限），ETag 以內容雜湊計算
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from streaming.seek_index import is_finalized, load_or_build_seek_index
+
+# 縮圖尺寸（16:9）
+THUMBNAIL_SIZES = {
+    "sm": (160, 90),
+    "md": (320, 180),
+    "lg": (640, 360),
+}
+
+# 格式 → (副檔名, MIME, 編碼參數)
+THUMBNAIL_FORMATS = {
+    "jpeg": ("jpg", "image/jpeg", [int(cv2.IMWRITE_JPEG_QUALITY), 85]),
+    "webp": ("webp", "image/webp", [int(cv2.IMWRITE_WEBP_QUALITY), 80]),
+}
+
+SPRITE_TILE_SIZE = THUMBNAIL_SIZES["sm"]
+SPRITE_COLUMNS = 10
+THUMBS_DIRNAME = "thumbs"
+
+
+class Thumbnail(NamedTuple):
+    """已編碼的縮圖"""
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def _make_thumbnail(content: bytes, media_type: str) -> Thumbnail:
+    etag = '"' + hashlib.md5(content).hexdigest()[:20] + '"'
+    return Thumbnail(content, media_type, etag)
+
+
+def thumbnail_path(recording_dir: str, size: str, fmt: str) -> str:
+    """縮圖檔案路徑（lg JPEG 沿用 thumbnail.jpg 以相容舊版）"""
+    if size == "lg" and fmt == "jpeg":
+        return os.path.join(recording_dir, "thumbnail.jpg")
+    ext = THUMBNAIL_FORMATS[fmt][0]
+    return os.path.join(recording_dir, THUMBS_DIRNAME, f"{size}.{ext}")
+
+
+def sprite_paths(recording_dir: str) -> Tuple[str, str]:
+    """sprite sheet 圖片與描述檔路徑"""
+    thumbs_dir = os.path.join(recording_dir, THUMBS_DIRNAME)
+    return os.path.join(thumbs_dir, "sprite.jpg"), os.path.join(thumbs_dir, "sprite.json")
+
+
+class ThumbnailCollector:
+    """
+    錄影期間的縮圖取樣器（由 RecordingManager.write_frame 呼叫）
+
+    - 封面：約 0.5 秒處的畫面（避開開頭黑畫面），錄影太短則用第一幀
+    - sprite 小圖：每 stride 幀取一張；數量達上限時丟掉一半並加倍 stride，
+      不論錄影多長都保持均勻分佈且記憶體固定
+    """
+
+    def __init__(self, fps: float, sprite_frames: int = 20):
+        self.sprite_frames = max(1, sprite_frames)
+        self.max_tiles = self.sprite_frames * 2
+        self.stride = max(1, int(round(fps)))
+        self.poster_at = max(0, int(fps // 2))
+        self.poster: Optional[np.ndarray] = None
+        self.tiles: List[Tuple[int, np.ndarray]] = []
+
+    def add(self, frame: np.ndarray, frame_index: int):
+        if frame is None or frame.size == 0:
+            return
+        if self.poster is None or frame_index == self.poster_at:
+            self.poster = cv2.resize(frame, THUMBNAIL_SIZES["lg"], interpolation=cv2.INTER_AREA)
+        if frame_index % self.stride == 0:
+            self.tiles.append((frame_index, cv2.resize(frame, SPRITE_TILE_SIZE, interpolation=cv2.INTER_AREA)))
+            if len(self.tiles) >= self.max_tiles:
+                self.tiles = self.tiles[::2]
+                self.stride *= 2
+
+    def select_tiles(self) -> List[Tuple[int, np.ndarray]]:
+        """均勻挑選 sprite_frames 張"""
+        if len(self.tiles) <= self.sprite_frames:
+            return list(self.tiles)
+        step = len(self.tiles) / self.sprite_frames
+        return [self.tiles[int(i * step)] for i in range(self.sprite_frames)]
+
+
+def write_thumbnails(
+    recording_dir: str,
+    poster: np.ndarray,
+    tiles: List[Tuple[int, np.ndarray]],
+    fps: float
+):
+    """
+    產生所有尺寸/格式的縮圖與 sprite sheet
+
+    Args:
+        recording_dir: 錄影資料夾
+        poster: 封面畫面（任意尺寸，會縮放）
+        tiles: [(幀號, 小圖)]，小圖尺寸須為 SPRITE_TILE_SIZE
+        fps: 錄影幀率（sprite 描述檔換算時間用）
+    """
+    os.makedirs(os.path.join(recording_dir, THUMBS_DIRNAME), exist_ok=True)
+
+    for size, dims in THUMBNAIL_SIZES.items():
+        image = poster if poster.shape[1::-1] == dims else cv2.resize(poster, dims, interpolation=cv2.INTER_AREA)
+        for fmt, (ext, _, params) in THUMBNAIL_FORMATS.items():
+            ret, buffer = cv2.imencode("." + ext, image, params)
+            if ret:
+                with open(thumbnail_path(recording_dir, size, fmt), "wb") as f:
+                    f.write(buffer.tobytes())
+
+    if not tiles:
+        return
+    tile_w, tile_h = SPRITE_TILE_SIZE
+    columns = min(SPRITE_COLUMNS, len(tiles))
+    rows = math.ceil(len(tiles) / columns)
+    sheet = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+    for i, (_, tile) in enumerate(tiles):
+        r, c = divmod(i, columns)
+        sheet[r * tile_h:(r + 1) * tile_h, c * tile_w:(c + 1) * tile_w] = tile
+
+    image_path, meta_path = sprite_paths(recording_dir)
+    ret, buffer = cv2.imencode(".jpg", sheet, THUMBNAIL_FORMATS["jpeg"][2])
+    if ret:
+        with open(image_path, "wb") as f:
+            f.write(buffer.tobytes())
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "tile_width": tile_w,
+            "tile_height": tile_h,
+            "columns": columns,
+            "rows": rows,
+            "frames": [index for index, _ in tiles],
+            "video_times": [round(index / fps, 3) for index, _ in tiles],
+        }, f)
+
+
+def generate_from_video(recording_dir: str, video_path: str, fps: float, sprite_frames: int = 20) -> bool:
+    """
+    由影片檔產生縮圖（舊錄影用）：封面沿用 thumbnail.jpg，sprite 只解碼均勻分佈的關鍵幀
+
+    Returns:
+        是否成功（錄影中的影片尚未寫完，不產生縮圖也不建立 seek index）
+    """
+    if not is_finalized(video_path):
+        return False
+    index = load_or_build_seek_index(video_path, fps)
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return False
+
+        poster = cv2.imread(os.path.join(recording_dir, "thumbnail.jpg"))
+
+        targets: List[int] = []
+        count = max(1, index.frame_count)
+        for i in range(sprite_frames):
+            frame = int((i + 0.5) * count / sprite_frames)
+            keyframe = index.keyframe_before(frame)
+            frame = keyframe["frame"] if keyframe else frame
+            if frame not in targets:
+                targets.append(frame)
+
+        tiles: List[Tuple[int, np.ndarray]] = []
+        for frame_index in targets:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            if poster is None:
+                poster = frame
+            tiles.append((frame_index, cv2.resize(frame, SPRITE_TILE_SIZE, interpolation=cv2.INTER_AREA)))
+
+        if poster is None:
+            return False
+        write_thumbnails(recording_dir, poster, tiles, index.fps)
+        return True
+    finally:
+        cap.release()
+
+
+class ThumbnailService:
+    """縮圖讀取服務（LRU 快取 + 按需產生）"""
+
+    def __init__(
+        self,
+        resolver: Callable[[str], Optional[Dict[str, Any]]],
+        cache_mb: int = 32,
+        sprite_frames: int = 20
+    ):
+        """
+        初始化縮圖服務
+
+        Args:
+            resolver: game_id → {"recording_dir", "video_path", "video_fps"}，找不到回傳 None
+            cache_mb: 記憶體快取上限（MB）
+            sprite_frames: sprite sheet 張數
+        """
+        self.resolver = resolver
+        self.max_bytes = cache_mb * 1024 * 1024
+        self.sprite_frames = sprite_frames
+        self._cache: "OrderedDict[Tuple[str, str], Thumbnail]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._generate_locks: Dict[str, threading.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    # ==================== 查詢 ====================
+
+    def get(self, game_id: str, size: str = "lg", fmt: str = "jpeg") -> Optional[Thumbnail]:
+        """取得縮圖（快取未命中時讀檔，檔案不存在時產生）"""
+        return self._get_cached(game_id, f"{size}.{fmt}", lambda d: (
+            thumbnail_path(d, size, fmt), THUMBNAIL_FORMATS[fmt][1]
+        ))
+
+    def get_sprite(self, game_id: str) -> Optional[Thumbnail]:
+        return self._get_cached(game_id, "sprite.jpg", lambda d: (sprite_paths(d)[0], "image/jpeg"))
+
+    def get_sprite_meta(self, game_id: str) -> Optional[Dict[str, Any]]:
+        thumb = self._get_cached(game_id, "sprite.json", lambda d: (sprite_paths(d)[1], "application/json"))
+        return json.loads(thumb.content) if thumb else None
+
+    def get_many(self, game_ids: List[str], size: str = "sm", fmt: str = "webp") -> Dict[str, Optional[Thumbnail]]:
+        return {game_id: self.get(game_id, size, fmt) for game_id in game_ids}
+
+    def invalidate(self, game_id: str):
+        """移除某場錄影的快取（錄影刪除時使用）"""
+        with self._lock:
+            self._generate_locks.pop(game_id, None)
+            for key in [k for k in self._cache if k[0] == game_id]:
+                self._bytes -= len(self._cache.pop(key).content)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+    # ==================== 內部 ====================
+
+    def _get_cached(self, game_id: str, kind: str, locate) -> Optional[Thumbnail]:
+        key = (game_id, kind)
+        with self._lock:
+            thumb = self._cache.get(key)
+            if thumb is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return thumb
+            self.misses += 1
+
+        recording = self.resolver(game_id)
+        if not recording:
+            return None
+        path, media_type = locate(recording["recording_dir"])
+
+        if not os.path.exists(path):
+            self._generate(game_id, recording, path)
+            if not os.path.exists(path):
+                return None
+
+        with open(path, "rb") as f:
+            thumb = _make_thumbnail(f.read(), media_type)
+        self._put(key, thumb)
+        return thumb
+
+    def _generate(self, game_id: str, recording: Dict[str, Any], path: str):
+        """舊錄影按需產生縮圖（同一場錄影同時只產生一次）"""
+        with self._lock:
+            lock = self._generate_locks.setdefault(game_id, threading.Lock())
+        with lock:
+            video_path = recording.get("video_path")
+            if os.path.exists(path) or not video_path or not os.path.exists(video_path):
+                return
+            try:
+                generate_from_video(
+                    recording["recording_dir"], video_path,
+                    recording.get("video_fps") or 30, self.sprite_frames
+                )
+                print(f"[Thumbnail] Generated thumbnails for {game_id}")
+            except Exception as e:
+                print(f"[Thumbnail] Generation error ({game_id}): {e}")
+
+    def _put(self, key: Tuple[str, str], thumb: Thumbnail):
+        if len(thumb.content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.content)
+            self._cache[key] = thumb
+            self._bytes += len(thumb.content)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._bytes -= len(evicted.content)
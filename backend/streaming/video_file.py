@@ -0,0 +1,315 @@
+"""
+影片檔案回應 - 錄影 MP4 的範圍請求與快取
+
+- 獨立的 ASGI 回應（只使用 Starlette Response 的公開介面，不依賴 FileResponse 內部方法）
+- 伺服器支援 http.response.pathsend 時整檔走零拷貝傳送
+- 其餘情況以 1 MiB 對齊區塊在線程池讀取（取代 8 KB generator）
+- 嚴格解析 Range：後綴範圍、超出檔尾截斷、多段排序合併、不可滿足回 416
+- ETag / Last-Modified 條件請求（If-None-Match / If-Modified-Since → 304，If-Range）
+- 客戶端中斷時立即停止讀檔
+- 長度以 stat 當下為準，錄影中的檔案持續成長也不會送出超過 Content-Length 的資料
+"""
+
+import hashlib
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from secrets import token_hex
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+# 單次讀取大小（對齊頁面大小的倍數）
+VIDEO_CHUNK_SIZE = 1024 * 1024
+
+# 單一請求允許的最大範圍段數（合併後），避免以大量小範圍放大負載
+MAX_RANGES = 16
+
+# 預設快取策略：可快取，過期後以 ETag 重新驗證
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+
+class MalformedRange(ValueError):
+    """Range 標頭格式錯誤（回 400）"""
+
+
+class RangeNotSatisfiable(ValueError):
+    """Range 沒有任何可滿足的範圍（回 416）"""
+
+    def __init__(self, file_size: int):
+        super().__init__(f"Range not satisfiable for size {file_size}")
+        self.file_size = file_size
+
+
+class VideoFileResponse(Response):
+    """錄影影片檔案回應（支援 Range / 條件請求）"""
+
+    chunk_size = VIDEO_CHUNK_SIZE
+
+    def __init__(
+        self,
+        path: str,
+        media_type: str = "video/mp4",
+        headers: Optional[Mapping[str, str]] = None,
+        stat_result: Optional[os.stat_result] = None,
+        cache_control: str = DEFAULT_CACHE_CONTROL,
+    ):
+        """
+        初始化影片回應
+
+        Args:
+            path: 影片檔案路徑
+            media_type: MIME 類型
+            headers: 額外回應標頭
+            stat_result: 已取得的 os.stat 結果（可選，未提供則在線程池中取得）
+            cache_control: Cache-Control 標頭
+        """
+        self.path = path
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.init_headers(headers)
+        self.headers.setdefault("accept-ranges", "bytes")
+        self.headers.setdefault("cache-control", cache_control)
+        self.stat_result = stat_result
+        if stat_result is not None:
+            self.set_stat_headers(stat_result)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        """Content-Length / Last-Modified / ETag（與 Starlette FileResponse 相同的 ETag 算法）"""
+        etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+        self.headers.setdefault("content-length", str(stat_result.st_size))
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+        self.headers.setdefault("etag", f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"')
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        stat_result = self.stat_result
+        if stat_result is None:
+            try:
+                stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+            except FileNotFoundError:
+                raise RuntimeError(f"File at path {self.path} does not exist.") from None
+            if not stat.S_ISREG(stat_result.st_mode):
+                raise RuntimeError(f"File at path {self.path} is not a file.")
+            self.stat_result = stat_result
+            self.set_stat_headers(stat_result)
+
+        request_headers = Headers(scope=scope)
+        file_size = stat_result.st_size
+        if self._is_not_modified(request_headers, stat_result.st_mtime):
+            response = Response(status_code=304, headers={
+                key: self.headers[key]
+                for key in ("etag", "last-modified", "cache-control", "accept-ranges")
+                if key in self.headers
+            })
+            return await response(scope, receive, send)
+
+        http_range = request_headers.get("range")
+        http_if_range = request_headers.get("if-range")
+        ranges = None
+        if http_range is not None and (http_if_range is None or self._should_use_range(http_if_range)):
+            try:
+                ranges = self._parse_range_header(http_range, file_size)
+            except MalformedRange as exc:
+                return await PlainTextResponse(str(exc), status_code=400)(scope, receive, send)
+            except RangeNotSatisfiable as exc:
+                response = PlainTextResponse(status_code=416, headers={"Content-Range": f"*/{exc.file_size}"})
+                return await response(scope, receive, send)
+
+        send_header_only = scope["method"].upper() == "HEAD"
+        send_pathsend = "http.response.pathsend" in scope.get("extensions", {})
+
+        # 與 StreamingResponse 相同：客戶端中斷（如拖曳進度條）時立即停止讀檔，
+        # 否則伺服器會在背景把剩餘檔案讀完並丟棄
+        async with anyio.create_task_group() as task_group:
+            async def transfer():
+                if ranges is None:
+                    await self._send_whole(send, file_size, send_header_only, send_pathsend)
+                elif len(ranges) == 1:
+                    start, end = ranges[0]
+                    await self._send_single_range(send, start, end, file_size, send_header_only)
+                else:
+                    await self._send_multiple_ranges(send, ranges, file_size, send_header_only)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(transfer)
+            await self._listen_for_disconnect(receive)
+            task_group.cancel_scope.cancel()
+
+    @staticmethod
+    async def _listen_for_disconnect(receive: Receive) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+
+    # ==================== 條件請求 ====================
+
+    def _is_not_modified(self, request_headers: Headers, mtime: float) -> bool:
+        """依 If-None-Match / If-Modified-Since 判斷是否回 304"""
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # If-None-Match 優先；比較時忽略弱驗證前綴
+            etag = self.headers["etag"]
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP 日期只有秒精度
+        return int(mtime) <= since
+
+    def _should_use_range(self, http_if_range: str) -> bool:
+        """If-Range 相符才回傳範圍：只接受強比較（弱 ETag 一律視為不相符，回傳完整檔案）或 HTTP 日期"""
+        if http_if_range.startswith("W/"):
+            return False
+        return http_if_range == self.headers["last-modified"] or http_if_range == self.headers["etag"]
+
+    # ==================== Range 解析 ====================
+
+    @classmethod
+    def _parse_range_header(cls, http_range: str, file_size: int) -> List[Tuple[int, int]]:
+        """
+        解析 Range 標頭
+
+        Returns:
+            排序且合併後的 [start, end) 列表
+
+        Raises:
+            MalformedRange: 格式錯誤（回 400）
+            RangeNotSatisfiable: 沒有任何可滿足的範圍（回 416）
+        """
+        units, sep, range_spec = http_range.partition("=")
+        if not sep or units.strip().lower() != "bytes":
+            raise MalformedRange("Only support bytes range")
+
+        ranges: List[Tuple[int, int]] = []
+        saw_spec = False
+        for part in range_spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            start_str, dash, end_str = part.partition("-")
+            start_str, end_str = start_str.strip(), end_str.strip()
+            if not dash or (not start_str and not end_str):
+                raise MalformedRange("Range header: invalid range spec")
+            if not (start_str or "0").isdigit() or not (end_str or "0").isdigit():
+                raise MalformedRange("Range header: range must be numeric")
+            saw_spec = True
+
+            if not start_str:
+                # 後綴範圍 "-N"：最後 N bytes，N 大於檔案時取整個檔案
+                suffix = int(end_str)
+                if suffix > 0 and file_size > 0:
+                    ranges.append((max(0, file_size - suffix), file_size))
+                continue
+
+            start = int(start_str)
+            if end_str and int(end_str) < start:
+                raise MalformedRange("Range header: start must be less than end")
+            if start >= file_size:
+                # 此段不可滿足，略過；全部不可滿足時才回 416
+                continue
+            end = min(int(end_str) + 1, file_size) if end_str else file_size
+            ranges.append((start, end))
+
+        if not saw_spec:
+            raise MalformedRange("Range header: range must be requested")
+        if not ranges:
+            raise RangeNotSatisfiable(file_size)
+
+        ranges.sort()
+        merged: List[Tuple[int, int]] = [ranges[0]]
+        for start, end in ranges[1:]:
+            last_start, last_end = merged[-1]
+            if start <= last_end:
+                merged[-1] = (last_start, max(last_end, end))
+            else:
+                merged.append((start, end))
+
+        if len(merged) > MAX_RANGES:
+            raise MalformedRange("Range header: too many ranges")
+        return merged
+
+    # ==================== 傳送 ====================
+
+    async def _send_whole(self, send: Send, file_size: int, send_header_only: bool, send_pathsend: bool) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif send_pathsend:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+        else:
+            await self._send_file_range(send, 0, file_size, last=True)
+
+    async def _send_single_range(
+        self, send: Send, start: int, end: int, file_size: int, send_header_only: bool
+    ) -> None:
+        self.headers["content-range"] = f"bytes {start}-{end - 1}/{file_size}"
+        self.headers["content-length"] = str(end - start)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        else:
+            await self._send_file_range(send, start, end, last=True)
+
+    async def _send_multiple_ranges(
+        self,
+        send: Send,
+        ranges: List[Tuple[int, int]],
+        file_size: int,
+        send_header_only: bool,
+    ) -> None:
+        boundary = token_hex(13)
+        part_type = self.headers["content-type"]
+        part_headers = [
+            (
+                f"--{boundary}\r\nContent-Type: {part_type}\r\n"
+                f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"--{boundary}--\r\n".encode("latin-1")
+        content_length = sum(
+            len(header) + (end - start) + 2
+            for header, (start, end) in zip(part_headers, ranges)
+        ) + len(closing)
+
+        # multipart/byteranges 放在 Content-Type（而非 Content-Range），分隔使用 CRLF
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        for header, (start, end) in zip(part_headers, ranges):
+            await send({"type": "http.response.body", "body": header, "more_body": True})
+            await self._send_file_range(send, start, end, last=False)
+            await send({"type": "http.response.body", "body": b"\r\n", "more_body": True})
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+    async def _send_file_range(self, send: Send, start: int, end: int, last: bool) -> None:
+        """以大區塊讀取 [start, end) 並傳送（讀取在線程池執行）"""
+        finished = False
+        async with await anyio.open_file(self.path, mode="rb", buffering=0) as file:
+            await file.seek(start)
+            while start < end:
+                chunk = await file.read(min(self.chunk_size, end - start))
+                if not chunk:
+                    break
+                start += len(chunk)
+                more_body = not last or start < end
+                await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                finished = not more_body
+        if last and not finished:
+            # 空檔案，或檔案在傳送途中被截斷：結束回應
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
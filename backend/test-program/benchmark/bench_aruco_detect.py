@@ -0,0 +1,96 @@
+"""
+ArUco 校正標記檢測效能測試 - 全解析度檢測與金字塔檢測的比較
+
+以合成畫面（投影的 4 個 ArUco 標記經透視變形、模糊、雜訊）比較:
+- full:    縮放倍率 1.0（舊做法：整張全解析度灰階掃描）
+- pyramid: 縮小畫面檢測 + 全解析度角點視窗精細化（ARUCO_DETECT_SCALE）
+
+輸出每次檢測耗時（p50 / p95）與標記中心點誤差（像素）。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/benchmark/bench_aruco_detect.py
+    python test-program/benchmark/bench_aruco_detect.py --scales 1.0 0.5 0.35 --noise 2 8
+"""
+
+import argparse
+import os
+import sys
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cv2
+import numpy as np
+
+from calibration.aruco_detector import ArucoDetector
+from core.instrumentation import LatencyHistogram
+
+MARKER_OFFSETS = [(-280, -280), (280, -280), (280, 280), (-280, 280)]
+
+
+def make_frame(width: int, height: int, noise: float, seed: int):
+    """投影畫面（灰底 + 4 個標記）→ 透視變形到相機畫面，回傳 (畫面, 真實標記中心)"""
+    dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_4X4_50)
+    projector = np.full((1080, 1920), 170, np.uint8)
+    cx, cy = 960, 540
+    for marker_id, (ox, oy) in enumerate(MARKER_OFFSETS):
+        marker = cv2.aruco.generateImageMarker(dictionary, marker_id, 100)
+        x, y = cx + ox - 50, cy + oy - 50
+        projector[y - 25:y + 125, x - 25:x + 125] = 255
+        projector[y:y + 100, x:x + 100] = marker
+    projector = cv2.cvtColor(projector, cv2.COLOR_GRAY2BGR)
+
+    rng = np.random.default_rng(seed)
+    corners = np.array([[0.08, 0.08], [0.93, 0.11], [0.95, 0.94], [0.06, 0.91]]) * [width, height]
+    corners = (corners + rng.uniform(-10, 10, corners.shape)).astype(np.float32)
+    matrix = cv2.getPerspectiveTransform(np.float32([[0, 0], [1920, 0], [1920, 1080], [0, 1080]]), corners)
+    frame = cv2.warpPerspective(projector, matrix, (width, height), borderValue=(40, 40, 40))
+    frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    frame = np.clip(frame.astype(np.int16) + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+
+    truth = np.float32([[[cx + ox, cy + oy] for ox, oy in MARKER_OFFSETS]])
+    return frame, cv2.perspectiveTransform(truth, matrix)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ArUco 校正標記檢測效能測試")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5])
+    parser.add_argument("--noise", type=float, nargs="+", default=[2.0, 6.0])
+    args = parser.parse_args()
+
+    print("=" * 72)
+    print(f"ArUco 檢測效能測試  {args.width}x{args.height}  每組 {args.frames} 幀")
+    print("=" * 72)
+    print(f"{'縮放':>6}{'雜訊':>6}{'成功':>8}{'p50 (ms)':>11}{'p95 (ms)':>11}{'誤差 (px)':>12}{'方式':>10}")
+    print("-" * 72)
+
+    for noise in args.noise:
+        frames = [make_frame(args.width, args.height, noise, seed) for seed in range(args.frames)]
+        for scale in args.scales:
+            detector = ArucoDetector(detect_scale=scale)
+            latency = LatencyHistogram()
+            errors = []
+            for frame, truth in frames:
+                detector.update(frame)
+                result = detector.last_result
+                latency.record(result.duration_ms / 1000)
+                if result.corners is not None:
+                    errors.append(float(np.abs(result.corners - truth).max()))
+            summary = latency.summary()
+            error = f"{np.mean(errors):.3f}" if errors else "-"
+            print(f"{scale:>6.2f}{noise:>6.1f}{len(errors):>5}/{len(frames):<2}"
+                  f"{summary['p50_ms']:>11.2f}{summary['p95_ms']:>11.2f}{error:>12}{result.mode:>10}")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+離線管線效能測試 - 不需要相機、GPU 或啟動後端
+
+以影片檔或合成球桌畫面餵入完整分析管線，量測每個階段的吞吐量與延遲分佈:
+- PoolTracker.process_frame（ROI 裁切、推論、顏色分類、預測、繪製；模型可用替身或真實 YOLO）
+- MJPEGStream.update_frame / get_frame（JPEG 編碼）
+- Calibrator.warp_frame_to_projector
+- RecordingManager.write_frame / stop_recording（暫存目錄）
+- 資料庫層 insert_events / get_events（暫存資料庫）
+
+整個管線重複執行 --repeats 次，每個階段的延遲取各次的中位數（單次量測的雜訊可達 ±30%）。
+結果以 JSON 輸出；與儲存的基準（baseline.json）比較:
+- 任一階段 p50 或 p95 退步超過容許範圍時以結束碼 1 結束
+- 找不到基準檔、或基準的來源 / 模型 / 解析度 / 幀數與本次不同時以結束碼 2 結束（不做比較）
+可放進 CI 或升級前檢查；基準在不同機器上量測時只提示，請在同一台機器以 --update-baseline 重建。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/benchmark/bench_pipeline.py                       # 合成畫面 + 模型替身
+    python test-program/benchmark/bench_pipeline.py --video clip.mp4      # 影片檔
+    python test-program/benchmark/bench_pipeline.py --model yolo-weight/pool.pt
+    python test-program/benchmark/bench_pipeline.py --update-baseline     # 以本次結果更新基準
+    python test-program/benchmark/bench_pipeline.py --output result.json --tolerance 0.3 --repeats 5
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cv2
+import numpy as np
+
+import config
+from calibration.calibration import Calibrator
+from core.instrumentation import LatencyHistogram
+from core.pipeline_profiler import profiler
+from database import Database
+from streaming.mjpeg_streamer import MJPEGStream
+from streaming.recording_manager import RecordingManager
+from tracking.synthetic_scene import SceneOptions, SyntheticCapture, SyntheticTableScene, TruthModel
+from tracking.tracking_engine import PoolTracker
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 低於此延遲的差異視為量測雜訊，不判定為退步
+NOISE_FLOOR_MS = 0.2
+
+# 每次執行樣本數少於此值的階段（如 recording.stop 只有 1 次）只列出，不判定退步
+MIN_COMPARE_SAMPLES = 20
+
+# 基準與本次結果必須相同才可比較的設定
+COMPARABLE_META = ("source", "model", "stub_infer_ms", "resolution", "frames")
+
+# 不同時只提示的環境資訊
+ENVIRONMENT_META = ("machine", "cpu_count", "python", "opencv")
+
+
+# ==================== 輸入來源 ====================
+
+class VideoFrames:
+    """影片檔來源（讀到結尾時回到開頭）"""
+
+    def __init__(self, path: str, width: int, height: int):
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"無法開啟影片: {path}")
+        self.size = (width, height)
+        self.last = None  # 影片沒有真實標註，模型替身不回傳任何框
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if ret and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size)
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+
+# ==================== 量測 ====================
+
+class StageTimer:
+    def __init__(self):
+        self.histograms = {}
+        self.busy = {}
+
+    def measure(self, name: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(elapsed)
+        self.busy[name] = self.busy.get(name, 0.0) + elapsed
+        return result
+
+    def report(self) -> dict:
+        stages = {}
+        for name, histogram in self.histograms.items():
+            summary = histogram.summary()
+            busy = self.busy[name]
+            summary["ops_per_sec"] = round(summary["count"] / busy, 1) if busy > 0 else None
+            stages[name] = summary
+        return stages
+
+
+def run(args) -> dict:
+    width, height = args.width, args.height
+    if args.video:
+        source = VideoFrames(args.video, width, height)
+    else:
+        scene = SyntheticTableScene(SceneOptions(width=width, height=height, balls=args.balls, seed=args.seed))
+        source = SyntheticCapture(scene, fps=0)
+
+    if args.model:
+        tracker = PoolTracker(model_path=args.model)
+        model_name = os.path.basename(args.model)
+    else:
+        stub = TruthModel(source, args.stub_infer_ms)
+        tracker = PoolTracker(model=stub)
+        stub.tracker = tracker
+        model_name = "stub"
+
+    mjpeg = MJPEGStream("bench", quality=config.JPEG_QUALITY)
+    calibrator = Calibrator()
+    calibrator.homography_matrix, _ = cv2.findHomography(
+        np.array([[200, 120], [width - 180, 100], [width - 150, height - 90], [170, height - 110]], np.float32),
+        np.array([[0, 0], [1920, 0], [1920, 1080], [0, 1080]], np.float32),
+    )
+
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    db = Database(os.path.join(workdir, "bench.db"))
+    db.upsert_recording({
+        "game_id": "bench",
+        "game_type": "benchmark",
+        "start_time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "video_path": os.path.join(workdir, "bench.mp4"),
+    })
+    recorder = RecordingManager(
+        recordings_dir=os.path.join(workdir, "recordings"),
+        db_path=os.path.join(workdir, "recorder.db"),
+    )
+
+    timer = StageTimer()
+    profiler.reset()
+    try:
+        # 暖身：球桌偵測、JIT/快取、模型第一次推論
+        for _ in range(args.warmup):
+            ok, frame = source.read()
+            tracker.process_frame(frame)
+        profiler.reset()
+
+        recorder.start_recording("benchmark", players=["bench"], resolution=(1920, 1080), fps=30)
+        events = []
+        wall_start = time.perf_counter()
+        for frame_id in range(1, args.frames + 1):
+            trace = profiler.begin_frame(frame_id)
+            ok, frame = timer.measure("source.read", source.read)
+            if not ok:
+                break
+
+            processed, data = timer.measure("tracker.process_frame", tracker.process_frame, frame)
+
+            timer.measure("calibrator.warp", calibrator.warp_frame_to_projector, processed)
+
+            monitor = cv2.resize(processed, (1920, 1080))
+            timer.measure("mjpeg.update_frame", mjpeg.update_frame, monitor)
+            timer.measure("mjpeg.get_frame", mjpeg.get_frame, config.JPEG_QUALITY)
+
+            timer.measure("recording.write_frame", recorder.write_frame, monitor)
+            profiler.end_frame(trace)
+
+            events.append({
+                "game_id": "bench",
+                "timestamp": time.time(),
+                "event_type": "frame_analyzed",
+                "data": {"frame_id": frame_id, "balls": len(data.get("balls", []))},
+            })
+            if len(events) >= config.EVENT_BATCH_SIZE:
+                timer.measure("db.insert_events", db.insert_events, events)
+                events = []
+        wall = time.perf_counter() - wall_start
+
+        timer.measure("recording.stop", recorder.stop_recording, total_rounds=0)
+        for _ in range(20):
+            timer.measure("db.get_events", db.get_events, "bench")
+    finally:
+        source.release()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    pipeline = profiler.get_stats()
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": args.video or f"synthetic ({args.balls} balls)",
+            "model": model_name,
+            "stub_infer_ms": None if args.model else args.stub_infer_ms,
+            "resolution": f"{width}x{height}",
+            "frames": args.frames,
+            "end_to_end_fps": round(args.frames / wall, 1) if wall > 0 else None,
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "stages": timer.report(),
+        "pipeline_stages": pipeline["stages"],
+    }
+
+
+def run_repeated(args) -> dict:
+    """重複執行 args.repeats 次，各階段的延遲與吞吐量取中位數（count 為單次執行的樣本數）"""
+    results = []
+    for i in range(args.repeats):
+        if args.repeats > 1:
+            print(f"[>] 第 {i + 1}/{args.repeats} 次執行")
+        results.append(run(args))
+
+    merged = results[0]
+    merged["meta"]["repeats"] = args.repeats
+    fps = [r["meta"]["end_to_end_fps"] for r in results if r["meta"]["end_to_end_fps"]]
+    merged["meta"]["end_to_end_fps"] = round(statistics.median(fps), 1) if fps else None
+    for section in ("stages", "pipeline_stages"):
+        for name, summary in merged[section].items():
+            for key in ("p50_ms", "p95_ms", "p99_ms", "ops_per_sec"):
+                values = [
+                    r[section][name][key] for r in results
+                    if name in r[section] and r[section][name].get(key) is not None
+                ]
+                if key in summary and values:
+                    summary[key] = round(statistics.median(values), 3)
+    return merged
+
+
+def baseline_mismatch(result: dict, baseline: dict) -> list:
+    """回傳與基準不同、無法比較的設定（空清單表示可比較）"""
+    current, base = result["meta"], baseline.get("meta", {})
+    return [
+        f"{key}: {base.get(key)!r} ≠ {current.get(key)!r}"
+        for key in COMPARABLE_META
+        if base.get(key) != current.get(key)
+    ]
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list:
+    """回傳退步的階段清單（先以 baseline_mismatch 確認設定相同）"""
+    regressions = []
+    for section in ("stages", "pipeline_stages"):
+        for name, base in baseline.get(section, {}).items():
+            current = result.get(section, {}).get(name)
+            if current is None:
+                continue
+            if base["count"] < MIN_COMPARE_SAMPLES:
+                continue
+            for key in ("p50_ms", "p95_ms"):
+                limit = base[key] * (1 + tolerance)
+                if current[key] > limit and current[key] - base[key] > NOISE_FLOOR_MS:
+                    regressions.append({
+                        "stage": name,
+                        "metric": key,
+                        "baseline": base[key],
+                        "current": current[key],
+                        "change": f"+{(current[key] / base[key] - 1) * 100:.0f}%" if base[key] else "n/a",
+                    })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線管線效能測試")
+    parser.add_argument("--video", help="影片檔路徑（預設使用合成畫面）")
+    parser.add_argument("--model", help="YOLO 權重路徑（預設使用模型替身）")
+    parser.add_argument("--stub-infer-ms", type=float, default=0.0, help="模型替身模擬的推論時間")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--balls", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    # 重複 3 次取中位數時，兩次相同執行的 p95 差異約在 20% 內
+    parser.add_argument("--tolerance", type=float, default=0.3, help="容許退步比例（0.3 = 30%%）")
+    parser.add_argument("--repeats", type=int, default=3, help="重複執行次數（延遲取中位數）")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="結果 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("離線管線效能測試")
+    print("=" * 70)
+    print(f"[>] 來源: {args.video or '合成畫面'}  模型: {args.model or '替身'}  幀數: {args.frames}"
+          f"  重複: {args.repeats}\n")
+
+    result = run_repeated(args)
+
+    print()
+    print(f"{'階段':<26}{'次數':>7}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'ops/s':>10}")
+    print("-" * 76)
+    for name, s in result["stages"].items():
+        print(f"{name:<26}{s['count']:>7}{s['p50_ms']:>11.3f}{s['p95_ms']:>11.3f}{s['p99_ms']:>11.3f}"
+              f"{s['ops_per_sec'] or 0:>10.1f}")
+    print("-" * 76)
+    for name, s in result["pipeline_stages"].items():
+        print(f"  {name:<24}{s['count']:>7}{s['p50_ms']:>11.3f}{s['p95_ms']:>11.3f}{s['p99_ms']:>11.3f}")
+    print(f"\n[>] 端到端: {result['meta']['end_to_end_fps']} FPS")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[>] 結果已寫入 {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"✅ 基準已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"❌ 找不到基準檔 {args.baseline}，未做比較；請先以 --update-baseline 建立")
+        return 2
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    mismatch = baseline_mismatch(result, baseline)
+    if mismatch:
+        print(f"❌ 基準設定與本次不同，無法比較（基準: {args.baseline}）")
+        for line in mismatch:
+            print(f"   {line}")
+        return 2
+    for key in ENVIRONMENT_META:
+        if baseline["meta"].get(key) != result["meta"].get(key):
+            print(f"⚠️ 基準量測環境不同 {key}: {baseline['meta'].get(key)} → {result['meta'].get(key)}")
+    regressions = compare(result, baseline, args.tolerance)
+    print("=" * 70)
+    if regressions:
+        print(f"❌ {len(regressions)} 項退步超過 {args.tolerance * 100:.0f}%（基準: {baseline['meta']['timestamp']}）")
+        for r in regressions:
+            print(f"   {r['stage']} {r['metric']}: {r['baseline']:.3f} → {r['current']:.3f} ms ({r['change']})")
+        return 1
+    print(f"✅ 無退步（容許 {args.tolerance * 100:.0f}%，基準: {baseline['meta']['timestamp']}）")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+投影變形效能測試 - cv2.warpPerspective 與預先計算 remap 表的比較
+
+比較每幀投影變形耗時（p50 / p95 / p99）:
+- before:   每幀完整 cv2.warpPerspective（舊做法）
+- maps:     Calibrator 快取的定點 remap 表，整張畫面
+- roi:      remap 表 + 只變形球桌 ROI 投影到的矩形
+- strips N: 上述再切成 N 條水平條帶平行處理
+- vector:   不變形像素，追蹤結果一次 perspectiveTransform 後由 ProjectorRenderer 繪製
+
+並檢查輸出與 warpPerspective 的像素差異（定點插值只有畫面邊緣少數像素不同）。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/benchmark/bench_projector_warp.py
+    python test-program/benchmark/bench_projector_warp.py --frames 300 --threads 1 2 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cv2
+import numpy as np
+
+from calibration.calibration import Calibrator
+from calibration.projector_renderer import ProjectorMode, ProjectorRenderer
+from core.instrumentation import LatencyHistogram
+from tracking.synthetic_scene import SceneOptions, SyntheticTableScene, TruthModel
+from tracking.tracking_engine import PoolTracker
+
+
+def make_calibrator(width: int, height: int, threads: int) -> Calibrator:
+    calibrator = Calibrator()
+    calibrator._warp_threads = threads
+    calibrator.homography_matrix, _ = cv2.findHomography(
+        np.array([[200, 120], [width - 180, 100], [width - 150, height - 90], [170, height - 110]], np.float32),
+        np.array([[0, 0], [1920, 0], [1920, 1080], [0, 1080]], np.float32),
+    )
+    return calibrator
+
+
+def measure(fn, frames: list, repeat: int) -> dict:
+    histogram = LatencyHistogram()
+    for i in range(repeat):
+        frame = frames[i % len(frames)]
+        start = time.perf_counter()
+        fn(frame)
+        histogram.record(time.perf_counter() - start)
+    return histogram.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="投影變形效能測試")
+    parser.add_argument("--frames", type=int, default=200, help="每種方式量測的幀數")
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--threads", type=int, nargs="+", default=[2, 4], help="條帶平行的線程數")
+    args = parser.parse_args()
+
+    scene = SyntheticTableScene(SceneOptions(width=args.width, height=args.height, seed=1))
+    rendered = [scene.render() for _ in range(10)]
+    frames = [item.image for item in rendered]
+
+    # 向量路徑的輸入：每幀的追蹤數據包
+    current = {}
+    tracker = PoolTracker(model=TruthModel(lambda: current.get("scene")))
+    packets = {}
+    for item in rendered:
+        current["scene"] = item
+        packets[id(item.image)] = tracker.process_frame(item.image)[1]
+    roi = list(scene.table)
+
+    base = make_calibrator(args.width, args.height, 1)
+    size = (base.projector_width, base.projector_height)
+
+    def before(frame):
+        return cv2.warpPerspective(frame, base.homography_matrix, size)
+
+    print("=" * 72)
+    print(f"投影變形效能測試  {args.width}x{args.height} → {size[0]}x{size[1]}  "
+          f"OpenCV 線程: {cv2.getNumThreads()}  CPU: {os.cpu_count()}")
+    print("=" * 72)
+
+    cases = [("before (warpPerspective)", before)]
+    cases.append(("maps", lambda f: base.warp_frame_to_projector(f)))
+    cases.append(("maps + roi", lambda f: base.warp_frame_to_projector(f, roi=roi)))
+    for threads in args.threads:
+        calibrator = make_calibrator(args.width, args.height, threads)
+        cases.append((f"maps + roi, strips {threads}", lambda f, c=calibrator: c.warp_frame_to_projector(f, roi=roi)))
+
+    renderer = ProjectorRenderer()
+    renderer.set_mode(ProjectorMode.GAME)
+
+    def vector(frame):
+        renderer.update_ar_data(base.project_scene(packets[id(frame)]))
+        return renderer.render()
+
+    cases.append(("vector (project + render)", vector))
+
+    # 正確性：與 warpPerspective 比較（ROI 外為黑色，只比較整張畫面版本）
+    reference = before(frames[0]).astype(np.int16)
+    remapped = base.warp_frame_to_projector(frames[0]).astype(np.int16)
+    diff = np.abs(reference - remapped)
+    print(f"[>] 與 warpPerspective 差異: max={diff.max()}  mean={diff.mean():.4f}")
+    print(f"[>] remap 表建立: {base.get_warp_stats()}\n")
+
+    print(f"{'方式':<30}{'p50 (ms)':>11}{'p95 (ms)':>11}{'p99 (ms)':>11}{'加速':>9}")
+    print("-" * 72)
+    baseline_p50 = None
+    for name, fn in cases:
+        fn(frames[0])  # 暖身（建立 remap 表、線程池）
+        summary = measure(fn, frames, args.frames)
+        if baseline_p50 is None:
+            baseline_p50 = summary["p50_ms"]
+        speedup = baseline_p50 / summary["p50_ms"] if summary["p50_ms"] else 0.0
+        print(f"{name:<30}{summary['p50_ms']:>11.3f}{summary['p95_ms']:>11.3f}{summary['p99_ms']:>11.3f}{speedup:>8.2f}x")
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
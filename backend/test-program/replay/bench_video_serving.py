@@ -0,0 +1,230 @@
+"""
+錄影影片傳送效能測試 - 舊版 generator vs VideoFileResponse
+
+測試項目:
+- 完整檔案下載吞吐量（MB/s）
+- 瀏覽器拖曳進度條模擬：隨機位置 "bytes=N-" 請求，讀取 256 KB 後中斷
+  （首位元組延遲 TTFB、完成延遲 p50/p95）
+- 行程 CPU 時間（伺服器與客戶端同一行程，僅供相對比較）
+
+不需要啟動後端，腳本會在本機隨機埠啟動只含兩個端點的 uvicorn 伺服器。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/replay/bench_video_serving.py
+    python test-program/replay/bench_video_serving.py --size-mb 256 --seeks 300
+    python test-program/replay/bench_video_serving.py --file recordings/game_xxx/video.mp4
+"""
+
+import argparse
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from streaming.video_file import VideoFileResponse
+
+SEEK_READ_BYTES = 256 * 1024
+
+
+def legacy_response(video_path: str, request: Request):
+    """重構前 get_video_file 的傳送方式（8 KB generator / 逐行迭代）"""
+    file_size = os.path.getsize(video_path)
+    range_header = request.headers.get("range")
+
+    if range_header:
+        range_match = range_header.replace("bytes=", "").split("-")
+        start = int(range_match[0]) if range_match[0] else 0
+        end = int(range_match[1]) if len(range_match) > 1 and range_match[1] else file_size - 1
+
+        def range_iterator():
+            with open(video_path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = f.read(min(8192, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        return StreamingResponse(
+            range_iterator(),
+            status_code=206,
+            media_type="video/mp4",
+            headers={
+                "Content-Range": f"bytes {start}-{end}/{file_size}",
+                "Accept-Ranges": "bytes",
+                "Content-Length": str(end - start + 1)
+            }
+        )
+
+    def file_iterator():
+        with open(video_path, "rb") as f:
+            yield from f
+
+    return StreamingResponse(
+        file_iterator(),
+        media_type="video/mp4",
+        headers={"Accept-Ranges": "bytes", "Content-Length": str(file_size)}
+    )
+
+
+def build_app(video_path: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/legacy")
+    async def legacy(request: Request):
+        return legacy_response(video_path, request)
+
+    @app.get("/new")
+    async def new():
+        return VideoFileResponse(video_path, stat_result=os.stat(video_path))
+
+    return app
+
+
+def start_server(app: FastAPI) -> tuple:
+    """於背景線程啟動 uvicorn，回傳 (server, base_url)"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def make_test_file(size_mb: int) -> str:
+    """產生含換行位元的隨機測試檔（逐行迭代時會切出大量小區塊，接近真實 MP4）"""
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    with os.fdopen(fd, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    return path
+
+
+def bench_full(client: httpx.Client, url: str, runs: int) -> dict:
+    """完整下載吞吐量"""
+    rates = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        total = 0
+        with client.stream("GET", url) as resp:
+            for chunk in resp.iter_raw():
+                total += len(chunk)
+        elapsed = time.perf_counter() - t0
+        rates.append(total / elapsed / (1024 * 1024))
+    return {"mb_per_s": statistics.median(rates), "bytes": total}
+
+
+def bench_seek(client: httpx.Client, url: str, file_size: int, seeks: int, seed: int) -> dict:
+    """隨機拖曳：bytes=N- 請求，讀取前 256 KB 後關閉連線"""
+    rng = random.Random(seed)
+    ttfb, done = [], []
+    for _ in range(seeks):
+        offset = rng.randrange(0, max(1, file_size - SEEK_READ_BYTES))
+        t0 = time.perf_counter()
+        received = 0
+        with client.stream("GET", url, headers={"Range": f"bytes={offset}-"}) as resp:
+            assert resp.status_code == 206, resp.status_code
+            for chunk in resp.iter_raw():
+                if received == 0:
+                    ttfb.append((time.perf_counter() - t0) * 1000)
+                received += len(chunk)
+                if received >= SEEK_READ_BYTES:
+                    break
+        done.append((time.perf_counter() - t0) * 1000)
+
+    def pct(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    return {
+        "ttfb_p50": pct(ttfb, 0.50),
+        "ttfb_p95": pct(ttfb, 0.95),
+        "seek_p50": pct(done, 0.50),
+        "seek_p95": pct(done, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="錄影影片傳送效能測試")
+    parser.add_argument("--file", default=None, help="使用既有影片檔（預設產生隨機測試檔）")
+    parser.add_argument("--size-mb", type=int, default=128, help="測試檔大小（MB）")
+    parser.add_argument("--runs", type=int, default=3, help="完整下載次數")
+    parser.add_argument("--seeks", type=int, default=200, help="隨機拖曳次數")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    video_path = args.file or make_test_file(args.size_mb)
+    file_size = os.path.getsize(video_path)
+
+    print("=" * 60)
+    print("錄影影片傳送效能測試")
+    print("=" * 60)
+    print(f"[>] 檔案: {video_path} ({file_size / 1024 / 1024:.1f} MB)\n")
+
+    server, base_url = start_server(build_app(video_path))
+    results = {}
+    try:
+        # 每次拖曳都會中斷連線，不使用連線池以免重用半讀取的連線
+        with httpx.Client(timeout=60.0, limits=httpx.Limits(max_keepalive_connections=0)) as client:
+            for name in ("legacy", "new"):
+                url = f"{base_url}/{name}"
+                print(f"[{name}] 測試中...")
+                cpu0 = time.process_time()
+                full = bench_full(client, url, args.runs)
+                cpu_full = time.process_time() - cpu0
+
+                cpu0 = time.process_time()
+                seek = bench_seek(client, url, file_size, args.seeks, args.seed)
+                cpu_seek = time.process_time() - cpu0
+
+                results[name] = {**full, **seek, "cpu_full": cpu_full, "cpu_seek": cpu_seek}
+    finally:
+        server.should_exit = True
+        if not args.file:
+            os.remove(video_path)
+
+    print()
+    print(f"{'指標':<24}{'legacy':>14}{'new':>14}")
+    print("-" * 52)
+    rows = [
+        ("完整下載 (MB/s)", "mb_per_s", "{:.1f}"),
+        ("完整下載 CPU (s)", "cpu_full", "{:.2f}"),
+        ("拖曳 TTFB p50 (ms)", "ttfb_p50", "{:.2f}"),
+        ("拖曳 TTFB p95 (ms)", "ttfb_p95", "{:.2f}"),
+        ("拖曳完成 p50 (ms)", "seek_p50", "{:.2f}"),
+        ("拖曳完成 p95 (ms)", "seek_p95", "{:.2f}"),
+        ("拖曳 CPU (s)", "cpu_seek", "{:.2f}"),
+    ]
+    for label, key, fmt in rows:
+        print(f"{label:<24}{fmt.format(results['legacy'][key]):>14}{fmt.format(results['new'][key]):>14}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
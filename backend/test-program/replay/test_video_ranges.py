@@ -0,0 +1,103 @@
+"""
+VideoFileResponse 範圍請求檢查 - 不需要啟動後端
+
+以 Starlette TestClient 對暫存檔案發送請求，驗證:
+- 完整檔案 / HEAD
+- 單段、後綴、超出檔尾截斷的範圍（206 + Content-Range）
+- 多段範圍（multipart/byteranges，重疊段合併）
+- 格式錯誤 400、不可滿足 416
+- If-Range（強 ETag 相符回範圍、弱 ETag 回完整檔案）
+- If-None-Match / If-Modified-Since 回 304
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/replay/test_video_ranges.py
+"""
+
+import os
+import sys
+import tempfile
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from streaming.video_file import VideoFileResponse
+
+FILE_SIZE = 3 * 1024 * 1024 + 123  # 跨越多個 1 MiB 讀取區塊
+
+
+def main() -> int:
+    data = os.urandom(FILE_SIZE)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "video.mp4")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        app = FastAPI()
+        app.add_api_route("/video", lambda: VideoFileResponse(path), methods=["GET", "HEAD"])
+        client = TestClient(app)
+        failures = []
+
+        def check(name: str, condition: bool):
+            print(f"{'✓' if condition else '✗'} {name}")
+            if not condition:
+                failures.append(name)
+
+        r = client.get("/video")
+        check("完整檔案 200", r.status_code == 200 and r.content == data)
+        check("完整檔案 Content-Length", r.headers["content-length"] == str(FILE_SIZE))
+        check("Accept-Ranges", r.headers.get("accept-ranges") == "bytes")
+        etag, last_modified = r.headers["etag"], r.headers["last-modified"]
+
+        r = client.head("/video")
+        check("HEAD 無內容", r.status_code == 200 and r.content == b"")
+
+        r = client.get("/video", headers={"Range": "bytes=100-1048676"})
+        check("單段範圍 206", r.status_code == 206 and r.content == data[100:1048677])
+        check("單段 Content-Range", r.headers["content-range"] == f"bytes 100-1048676/{FILE_SIZE}")
+
+        r = client.get("/video", headers={"Range": "bytes=-500"})
+        check("後綴範圍", r.status_code == 206 and r.content == data[-500:])
+
+        r = client.get("/video", headers={"Range": f"bytes={FILE_SIZE - 10}-{FILE_SIZE * 2}"})
+        check("超出檔尾截斷", r.status_code == 206 and r.content == data[-10:])
+
+        r = client.get("/video", headers={"Range": "bytes=0-9, 5-19, 100-109"})
+        body = r.content
+        check("多段範圍 multipart", r.status_code == 206
+              and r.headers["content-type"].startswith("multipart/byteranges; boundary="))
+        check("多段 Content-Length", r.headers["content-length"] == str(len(body)))
+        check("重疊段合併", body.count(b"Content-Range: ") == 2
+              and data[0:20] in body and data[100:110] in body)
+
+        r = client.get("/video", headers={"Range": "bytes=abc"})
+        check("格式錯誤 400", r.status_code == 400)
+        r = client.get("/video", headers={"Range": f"bytes={FILE_SIZE}-"})
+        check("不可滿足 416", r.status_code == 416 and r.headers["content-range"] == f"*/{FILE_SIZE}")
+
+        r = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": etag})
+        check("If-Range 強 ETag 相符", r.status_code == 206 and r.content == data[:10])
+        r = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": f"W/{etag}"})
+        check("If-Range 弱 ETag 回完整檔案", r.status_code == 200 and len(r.content) == FILE_SIZE)
+        r = client.get("/video", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        check("If-Range 不符回完整檔案", r.status_code == 200)
+
+        r = client.get("/video", headers={"If-None-Match": etag})
+        check("If-None-Match 304", r.status_code == 304 and r.headers["etag"] == etag)
+        r = client.get("/video", headers={"If-Modified-Since": last_modified})
+        check("If-Modified-Since 304", r.status_code == 304)
+
+    print(f"\n{'全部通過' if not failures else f'{len(failures)} 項失敗'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
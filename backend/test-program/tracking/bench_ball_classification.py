@@ -0,0 +1,122 @@
+"""
+球色 / 球號辨識準確度與效能測試 - 使用合成球桌場景
+
+對每顆球以真實框呼叫 PoolTracker._detect_ball_color_hsv 與 _classify_ball_number，統計:
+- 顏色、實心/花色、球號的準確率（各桌布顏色、各光照條件）
+- 每顆球的辨識耗時（p50 / p95 / p99）
+- 球號混淆（真實 → 辨識結果）
+
+不需要 YOLO 模型、相機或影片。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/tracking/bench_ball_classification.py
+    python test-program/tracking/bench_ball_classification.py --frames 200 --cloth green blue --noise 0 4 8
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import config
+from core.instrumentation import LatencyHistogram
+from tracking.synthetic_scene import SceneOptions, SyntheticTableScene, TruthModel
+from tracking.tracking_engine import PoolTracker
+
+
+def evaluate(tracker: PoolTracker, options: SceneOptions, frames: int) -> dict:
+    scene = SyntheticTableScene(options)
+    latency = LatencyHistogram()
+    total = color_ok = style_ok = number_ok = 0
+    confusion: Counter = Counter()
+
+    for _ in range(frames):
+        frame = scene.render()
+        for ball in frame.balls:
+            if ball.number == 0:
+                continue
+            start = time.perf_counter()
+            info = tracker._detect_ball_color_hsv(frame.image, ball.bbox)
+            number = tracker._classify_ball_number(info)
+            latency.record(time.perf_counter() - start)
+
+            total += 1
+            color_ok += info["label"] == ball.label
+            # 8 號球不分實心 / 花色
+            style_ok += ball.number == 8 or info["style"] == ball.style
+            number_ok += number == ball.number
+            if number != ball.number:
+                confusion[(ball.number, number)] += 1
+
+    return {
+        "balls": total,
+        "color_acc": color_ok / total if total else 0.0,
+        "style_acc": style_ok / total if total else 0.0,
+        "number_acc": number_ok / total if total else 0.0,
+        "latency": latency.summary(),
+        "confusion": confusion,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="球色 / 球號辨識準確度測試")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument(
+        "--cloth", nargs="+", default=[config.TABLE_CLOTH_COLOR], choices=list(config.TABLE_COLOR_PRESETS)
+    )
+    parser.add_argument("--noise", nargs="+", type=float, default=[0.0, 2.0, 4.0])
+    parser.add_argument("--brightness", type=float, default=0.1, help="有雜訊時的亮度變化幅度")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    tracker = PoolTracker(model=TruthModel(None))
+
+    print("=" * 84)
+    print("球色 / 球號辨識準確度測試（合成場景，15 顆彩球）")
+    print("=" * 84)
+    print(f"{'桌布':<8}{'雜訊':>6}{'球數':>8}{'顏色':>9}{'花色':>9}{'球號':>9}"
+          f"{'p50 (us)':>11}{'p95 (us)':>11}{'p99 (us)':>11}")
+    print("-" * 84)
+
+    overall: Counter = Counter()
+    for cloth in args.cloth:
+        for noise in args.noise:
+            options = SceneOptions(
+                cloth=cloth,
+                numbers=list(range(1, 16)),
+                noise_sigma=noise,
+                brightness_jitter=args.brightness if noise > 0 else 0.0,
+                vignette=0.2 if noise > 0 else 0.0,
+                shot_probability=0.05,
+                seed=args.seed,
+            )
+            result = evaluate(tracker, options, args.frames)
+            lat = result["latency"]
+            print(f"{cloth:<8}{noise:>6.1f}{result['balls']:>8}"
+                  f"{result['color_acc'] * 100:>8.1f}%{result['style_acc'] * 100:>8.1f}%"
+                  f"{result['number_acc'] * 100:>8.1f}%"
+                  f"{lat['p50_ms'] * 1000:>11.1f}{lat['p95_ms'] * 1000:>11.1f}{lat['p99_ms'] * 1000:>11.1f}")
+            overall.update(result["confusion"])
+
+    print("-" * 84)
+    if overall:
+        print("最常見的球號誤判（真實 → 辨識: 次數）:")
+        for (truth, predicted), count in overall.most_common(10):
+            print(f"   {truth:>2} → {predicted}: {count}")
+    else:
+        print("✅ 所有球號皆辨識正確")
+    print("=" * 84)
+
+
+if __name__ == "__main__":
+    main()
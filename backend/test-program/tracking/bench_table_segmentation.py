@@ -0,0 +1,185 @@
+"""
+球桌分割準確度與效能測試 - 全解析度路徑與縮小快速路徑的比較
+
+對同一批畫面分別以兩種方式偵測球桌幾何:
+- full: TABLE_SEGMENT_SCALE = 1.0（舊做法：全解析度 HSV + 開運算 + RETR_TREE）
+- fast: 縮小畫面 HSV + RETR_EXTERNAL，輪廓換回全解析度（預設 0.25）
+
+輸出每次偵測耗時（p50 / p95）、fast 與 full 的四角最大差異、ROI IoU、球袋中心差異；
+合成畫面另外輸出與真實四角的誤差。
+
+畫面來源（依序）：--video 影片檔、--images 圖片、backend/recordings 下的錄影；
+都沒有時使用合成球桌畫面（多種桌布顏色、雜訊、透視變形）。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/tracking/bench_table_segmentation.py
+    python test-program/tracking/bench_table_segmentation.py --video ../recordings/game.mp4 --samples 50
+    python test-program/tracking/bench_table_segmentation.py --images frame1.jpg frame2.jpg --cloth blue
+    python test-program/tracking/bench_table_segmentation.py --scales 0.5 0.25 0.2
+"""
+
+import argparse
+import glob
+import os
+import sys
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import cv2
+import numpy as np
+
+from core.instrumentation import LatencyHistogram
+from tracking.synthetic_scene import SceneOptions, SyntheticTableScene, TruthModel
+from tracking.tracking_engine import PoolTracker
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ==================== 畫面來源 ====================
+
+def sample_video(path: str, samples: int) -> list:
+    """影片平均取樣 samples 幀"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        print(f"⚠️ 無法開啟影片: {path}")
+        return []
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or samples
+    frames = []
+    for index in np.linspace(0, max(total - 1, 0), samples).astype(int):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+        ret, frame = cap.read()
+        if ret:
+            frames.append((f"{os.path.basename(path)}#{index}", frame, None))
+    cap.release()
+    return frames
+
+
+def synthetic_frames(cloths: list, count: int, width: int, height: int) -> list:
+    """合成球桌畫面經透視變形（模擬相機角度），回傳 (名稱, 畫面, 真實四角)"""
+    frames = []
+    rng = np.random.default_rng(7)
+    for cloth in cloths:
+        scene = SyntheticTableScene(SceneOptions(
+            width=width, height=height, cloth=cloth, noise_sigma=4.0, vignette=0.3, seed=len(frames),
+        ))
+        tx, ty, tw, th = scene.table
+        table = np.float32([[tx, ty], [tx + tw, ty], [tx + tw, ty + th], [tx, ty + th]])
+        for i in range(count):
+            image = scene.render().image
+            frame_corners = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+            jitter = rng.uniform(-0.04, 0.04, (4, 2)) * [width, height]
+            matrix = cv2.getPerspectiveTransform(frame_corners, (frame_corners + jitter).astype(np.float32))
+            warped = cv2.warpPerspective(image, matrix, (width, height), borderValue=(35, 35, 40))
+            truth = cv2.perspectiveTransform(table[None], matrix)[0]
+            frames.append((f"{cloth}#{i}", warped, truth))
+    return frames
+
+
+# ==================== 比較 ====================
+
+def roi_iou(a, b) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def measure(tracker: PoolTracker, frames: list, scale: float):
+    latency = LatencyHistogram()
+    results = []
+    for _, frame, _ in frames:
+        geometry = tracker._detect_table_geometry(frame, scale)
+        latency.record(tracker.last_table_detection["ms"] / 1000)
+        results.append(geometry)
+    return results, latency.summary()
+
+
+def truth_error(results: list, frames: list) -> str:
+    """合成畫面：偵測四角與真實四角的平均最大誤差（沒有真值時為 "-"）"""
+    errors = [
+        float(np.abs(g.corners - truth).max())
+        for g, (_, _, truth) in zip(results, frames)
+        if g is not None and truth is not None
+    ]
+    return f"{np.mean(errors):.2f}" if errors else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="球桌分割準確度與效能測試")
+    parser.add_argument("--video", nargs="*", default=[], help="影片檔（平均取樣 --samples 幀）")
+    parser.add_argument("--images", nargs="*", default=[], help="圖片檔")
+    parser.add_argument("--samples", type=int, default=20, help="每部影片取樣幀數")
+    parser.add_argument("--cloth", nargs="+", default=["green", "blue", "gray"],
+                        help="桌布顏色（影片 / 圖片只使用第一個；合成畫面每色各 --samples 幀）")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 0.25])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    args = parser.parse_args()
+
+    videos = list(args.video)
+    if not videos and not args.images:
+        videos = sorted(glob.glob(os.path.join(BACKEND_DIR, "recordings", "**", "*.mp4"), recursive=True))
+
+    groups = {}
+    recorded = []
+    for path in videos:
+        recorded.extend(sample_video(path, args.samples))
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is not None:
+            recorded.append((os.path.basename(path), image, None))
+    if recorded:
+        groups[args.cloth[0]] = recorded
+    else:
+        print("[>] 沒有錄影 / 圖片，使用合成球桌畫面（透視變形 + 雜訊 + 暗角）")
+        for cloth in args.cloth:
+            groups[cloth] = synthetic_frames([cloth], args.samples, args.width, args.height)
+
+    tracker = PoolTracker(model=TruthModel(lambda: None))
+
+    print("=" * 96)
+    print(f"球桌分割測試  {sum(len(f) for f in groups.values())} 幀")
+    print("=" * 96)
+    print(f"{'桌布':<8}{'縮放':>6}{'偵測':>8}{'p50 (ms)':>11}{'p95 (ms)':>11}"
+          f"{'四角差 max':>12}{'ROI IoU':>10}{'球袋差':>9}{'真值誤差':>11}")
+    print("-" * 96)
+
+    for cloth, frames in groups.items():
+        tracker.update_table_color(cloth)
+        reference, summary = measure(tracker, frames, 1.0)
+
+        found = sum(g is not None for g in reference)
+        print(f"{cloth:<8}{1.0:>6.2f}{found:>5}/{len(frames):<3}{summary['p50_ms']:>11.2f}{summary['p95_ms']:>11.2f}"
+              f"{'-':>12}{'-':>10}{'-':>9}{truth_error(reference, frames):>11}")
+
+        for scale in args.scales:
+            results, summary = measure(tracker, frames, scale)
+            corner_diff, ious, pocket_diff = [], [], []
+            for fast, full in zip(results, reference):
+                if fast is None or full is None:
+                    continue
+                corner_diff.append(float(np.abs(fast.corners - full.corners).max()))
+                ious.append(roi_iou(fast.roi, full.roi))
+                pocket_diff.append(float(np.abs(np.float32(fast.pockets) - np.float32(full.pockets)).max()))
+            found = sum(g is not None for g in results)
+            if corner_diff:
+                diffs = f"{max(corner_diff):>12.2f}{min(ious):>10.4f}{max(pocket_diff):>9.1f}"
+            else:
+                diffs = f"{'-':>12}{'-':>10}{'-':>9}"
+            print(f"{'':<8}{scale:>6.2f}{found:>5}/{len(frames):<3}{summary['p50_ms']:>11.2f}{summary['p95_ms']:>11.2f}"
+                  f"{diffs}{truth_error(results, frames):>11}")
+    print("=" * 96)
+    print("四角差 / 球袋差：與 1.0 全解析度路徑比較的最大像素差；ROI IoU 取最小值；真值誤差：合成畫面四角平均誤差")
+
+
+if __name__ == "__main__":
+    main()
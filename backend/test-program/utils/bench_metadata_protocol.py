@@ -0,0 +1,220 @@
+"""
+metadata 協議效能測試 - v1 JSON vs v2 MessagePack 差量
+
+模擬球桌場景（多數球靜止帶有偵測抖動，偶爾一顆球滾動），
+透過 MetadataHub 推播給多個模擬客戶端，比較:
+- 每位客戶端每秒位元組數
+- 每次推播的序列化時間 / 每位客戶端的組裝時間
+- v2 解碼還原是否與量化後的真實狀態一致
+
+不需要啟動後端或網路連線。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/utils/bench_metadata_protocol.py
+    python test-program/utils/bench_metadata_protocol.py --clients 50 --seconds 30 --balls 15
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from streaming.metadata_codec import HAS_MSGPACK, DeltaMetadataEncoder
+from streaming.metadata_hub import MetadataHub
+
+if HAS_MSGPACK:
+    import msgpack
+
+RATE_HZ = 10
+
+
+class TableScene:
+    """模擬球桌：靜止球 ±1 px 偵測抖動，偶爾一顆球滾動數秒"""
+
+    def __init__(self, balls: int, seed: int):
+        self.rng = random.Random(seed)
+        self.balls = [
+            {"x": self.rng.randint(100, 1700), "y": self.rng.randint(100, 900), "vx": 0.0, "vy": 0.0,
+             "color": "Red", "style": "Solid", "number": i + 1}
+            for i in range(balls)
+        ]
+
+    def step(self) -> dict:
+        if self.rng.random() < 0.02:
+            ball = self.rng.choice(self.balls)
+            ball["vx"], ball["vy"] = self.rng.uniform(-30, 30), self.rng.uniform(-30, 30)
+        detections = []
+        for ball in self.balls:
+            ball["x"] += ball["vx"]
+            ball["y"] += ball["vy"]
+            ball["vx"] *= 0.9
+            ball["vy"] *= 0.9
+            detections.append({
+                "x": int(ball["x"] + self.rng.choice((-1, 0, 1))),
+                "y": int(ball["y"] + self.rng.choice((-1, 0, 1))),
+                "w": 36 + self.rng.choice((-1, 0, 1)),
+                "h": 36 + self.rng.choice((-1, 0, 1)),
+                "radius": 18.0 + self.rng.uniform(-0.4, 0.4),
+                "conf": 0.9 + self.rng.uniform(-0.02, 0.02),
+                "color": ball["color"],
+                "style": ball["style"],
+                "number": ball["number"],
+            })
+        return {"data": {"balls": detections, "prediction": None}, "ar_paths": []}
+
+
+def render(snapshot: dict, seq: int, now: float) -> dict:
+    """與 main.render_control_metadata 相同的欄位"""
+    data_packet = snapshot.get("data") or {}
+    balls = data_packet.get("balls", [])
+    return {
+        "frame_id": seq,
+        "ts_backend": int(now * 1000),
+        "detected_count": len(balls),
+        "tracking_state": "active",
+        "detections": balls,
+        "prediction": data_packet.get("prediction"),
+        "ar_paths": snapshot.get("ar_paths", []),
+        "bbox": None,
+        "keypoints": None,
+        "rate_hz": RATE_HZ,
+    }
+
+
+class V2Client:
+    """v2 解碼：狀態 = keyframe 套用最新 delta"""
+
+    def __init__(self):
+        self.key = None
+        self.state = None
+
+    def apply(self, frame: bytes):
+        envelope = msgpack.unpackb(frame, strict_map_key=False)
+        payload = envelope["payload"]
+        if payload["k"] == 1:
+            self.key = payload
+            self.state = dict(payload["balls"])
+            return
+        assert self.key is not None and payload["key"] == self.key["seq"], "delta 基準 keyframe 不符"
+        balls = dict(self.key["balls"])
+        for ball_id in payload["removed"]:
+            balls.pop(ball_id, None)
+        balls.update(payload["balls"])
+        self.state = balls
+
+
+async def run(version: int, args) -> dict:
+    hub = MetadataHub(keepalive_sec=1.0)
+    channel = "control_v2" if version == 2 else "control"
+    encoder = DeltaMetadataEncoder(keyframe_sec=2.0, quant_px=2) if version == 2 else None
+    hub.add_channel(channel, RATE_HZ, render, envelope_type="metadata.update", encoder=encoder)
+    hub.attach_loop(asyncio.get_running_loop())
+
+    scene = TableScene(args.balls, args.seed)
+    hub.publish(scene.step())
+    subscribers = [hub.subscribe(channel, f"s-{i}", "camera1") for i in range(args.clients)]
+    received = [0] * args.clients
+    clients = [V2Client() for _ in range(args.clients)]
+    assemble_time = 0.0
+
+    async def drain(i, sub):
+        nonlocal assemble_time
+        while True:
+            message = await sub.queue.get()
+            if message is None:
+                return
+            t0 = time.perf_counter()
+            frames = message.frames(sub)
+            assemble_time += time.perf_counter() - t0
+            for frame in frames:
+                received[i] += len(frame)
+                if version == 2:
+                    clients[i].apply(frame)
+
+    tasks = [asyncio.create_task(drain(i, sub)) for i, sub in enumerate(subscribers)]
+
+    # 模擬捕獲線程依推送頻率發布新結果
+    steps = int(args.seconds * RATE_HZ)
+    cpu0 = time.process_time()
+    for _ in range(steps):
+        hub.publish(scene.step())
+        await asyncio.sleep(1.0 / RATE_HZ)
+    cpu = time.process_time() - cpu0
+
+    stats = hub.get_stats()["channels"][channel]
+    hub.close()
+    await asyncio.gather(*tasks)
+
+    if version == 2:
+        # 驗證：解碼狀態與編碼器最後送出的量化狀態一致
+        expected = {i: t for i, t in encoder._emitted.items()}
+        mismatched = sum(1 for c in clients if c.state != expected)
+    else:
+        mismatched = 0
+
+    return {
+        "bytes_per_client_s": sum(received) / args.clients / args.seconds,
+        "serialize_ms": stats["serialize_ms_total"] / max(1, stats["broadcasts"] + stats["skipped_unchanged"]),
+        "assemble_us": assemble_time / max(1, args.clients * stats["broadcasts"]) * 1e6,
+        "broadcasts": stats["broadcasts"],
+        "cpu": cpu,
+        "mismatched": mismatched,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="metadata 協議效能測試")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--balls", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("metadata 協議效能測試")
+    print("=" * 60)
+    if not HAS_MSGPACK:
+        print("❌ 未安裝 msgpack，無法測試 v2（pip install msgpack）")
+        return
+    print(f"[>] 客戶端: {args.clients}  球數: {args.balls}  時長: {args.seconds}s  頻率: {RATE_HZ} Hz\n")
+
+    results = {}
+    for version in (1, 2):
+        print(f"[v{version}] 測試中...")
+        results[version] = asyncio.run(run(version, args))
+
+    print()
+    print(f"{'指標':<28}{'v1 JSON':>14}{'v2 msgpack':>14}")
+    print("-" * 56)
+    rows = [
+        ("每客戶端頻寬 (B/s)", "bytes_per_client_s", "{:.0f}"),
+        ("每次推播序列化 (ms)", "serialize_ms", "{:.3f}"),
+        ("每客戶端組裝 (us)", "assemble_us", "{:.1f}"),
+        ("實際推播次數", "broadcasts", "{}"),
+        ("行程 CPU (s)", "cpu", "{:.2f}"),
+    ]
+    for label, key, fmt in rows:
+        print(f"{label:<28}{fmt.format(results[1][key]):>14}{fmt.format(results[2][key]):>14}")
+    print("-" * 56)
+    ratio = results[1]["bytes_per_client_s"] / max(1.0, results[2]["bytes_per_client_s"])
+    print(f"頻寬減少: {ratio:.1f}x")
+    if results[2]["mismatched"]:
+        print(f"❌ v2 解碼狀態不一致的客戶端: {results[2]['mismatched']}")
+    else:
+        print("✅ v2 解碼狀態與伺服器一致")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
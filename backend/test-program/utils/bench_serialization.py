@@ -0,0 +1,169 @@
+"""
+JSON 序列化效能測試 - 標準 json vs core.serialization
+
+代表性封包:
+- metadata.update envelope（10 顆球 + 預測路徑 + AR 路徑）
+- /ws/video 分析封包（含 table_roi、holes 等 numpy 數值）
+- /ws/analytics 封包（含 MJPEG 統計）
+- 遊戲事件（events.jsonl / SQLite data 欄位）
+- 校準點陣列（numpy ndarray）
+
+標準 json 無法直接處理 numpy，測試時先做 .tolist() / float() 轉換（舊程式的做法），
+該轉換時間計入標準 json。
+
+使用方式（於 backend 資料夾執行）:
+    python test-program/utils/bench_serialization.py
+    python test-program/utils/bench_serialization.py --iterations 20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# 設定 UTF-8 編碼（Windows 相容）
+if sys.platform == "win32":
+    import io
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# 將 backend 加入 sys.path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import numpy as np
+
+from core import serialization
+from core.serialization import HAS_ORJSON
+
+
+def to_builtin(obj):
+    """舊做法：序列化前把 numpy 轉成內建型別"""
+    if isinstance(obj, dict):
+        return {k: to_builtin(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_builtin(v) for v in obj]
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def make_packets() -> dict:
+    rng = np.random.default_rng(42)
+    balls = [
+        {
+            "x": np.int32(rng.integers(0, 1920)), "y": np.int32(rng.integers(0, 1080)),
+            "w": 36, "h": 36, "radius": np.float32(18.2), "conf": np.float32(0.91),
+            "color": "Red", "style": "Solid", "number": i + 1,
+        }
+        for i in range(10)
+    ]
+    paths = rng.integers(0, 1920, size=(12, 2)).tolist()
+    metadata = {
+        "v": 1, "type": "metadata.update", "ts": 1768462148873,
+        "session_id": "s-abc", "stream_id": "camera1",
+        "payload": {
+            "frame_id": 1234, "ts_backend": 1768462148873, "detected_count": 10,
+            "tracking_state": "active", "detections": balls,
+            "prediction": {"prediction": True, "paths": paths, "color": [0, 255, 0]},
+            "ar_paths": paths, "bbox": None, "keypoints": None, "rate_hz": 10,
+        },
+    }
+    video = {
+        "data": {
+            "timestamp": time.time(), "status": "analyzing",
+            "white_ball": [np.int64(400), np.int64(300), 36, 36],
+            "balls": balls, "cue": None,
+            "prediction": {"prediction": False, "paths": paths},
+            "table_roi": np.array([120, 80, 1800, 1000], dtype=np.int32),
+            "holes": np.array([[120, 80], [960, 70], [1800, 80], [120, 1000], [960, 1010], [1800, 1000]]),
+        },
+        "ar_paths": paths, "status": "Analyzing", "current_device_id": 0, "is_switching": False,
+        "frame_count": 9876, "consecutive_successes": 9876,
+        "perf": {"yolo_ms": np.float64(23.4), "encode_ms": 6.1},
+    }
+    analytics = {
+        "data": video["data"], "ar_paths": paths, "status": "Analyzing", "is_analyzing": True,
+        "timestamp": time.time(),
+        "mjpeg_stats": {
+            name: {"fps": 29.8, "quality": 80, "clients": 3, "bytes_sent": 123456789, "avg_frame_kb": 142.3}
+            for name in ("monitor", "projector")
+        },
+    }
+    event = {
+        "timestamp": time.time(), "event": "ball_potted",
+        "data": {
+            "player": "玩家1", "potted_ball": np.int64(7), "target_ball": 7,
+            "position": [np.float32(512.5), 300.0],
+        },
+    }
+    calibration = {
+        "src_points": rng.random((4, 2), dtype=np.float32),
+        "homography": rng.random((3, 3)),
+        "grid": rng.random((40, 2), dtype=np.float32),
+    }
+    return {
+        "metadata.update": metadata,
+        "/ws/video": video,
+        "/ws/analytics": analytics,
+        "event": event,
+        "calibration": calibration,
+    }
+
+
+def same(a, b) -> bool:
+    """比較解析結果（float32 在 orjson 以最短表示輸出，允許微小誤差）"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list) and isinstance(b, list):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if isinstance(a, float) or isinstance(b, float):
+        return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+    return a == b
+
+
+def bench(fn, obj, iterations: int) -> float:
+    """回傳每次呼叫的微秒數（取 3 輪最佳）"""
+    best = float("inf")
+    for _ in range(3):
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn(obj)
+        best = min(best, (time.perf_counter() - t0) / iterations)
+    return best * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON 序列化效能測試")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("JSON 序列化效能測試")
+    print("=" * 70)
+    print(f"[>] 後端: {'orjson' if HAS_ORJSON else '標準 json（未安裝 orjson）'}  每項 {args.iterations} 次\n")
+
+    def stdlib_text(obj):
+        return json.dumps(to_builtin(obj))
+
+    def stdlib_bytes(obj):
+        return json.dumps(to_builtin(obj)).encode("utf-8")
+
+    print(f"{'封包':<18}{'大小 (B)':>10}{'json (us)':>12}{'dumps (us)':>12}{'dumps_text (us)':>17}{'加速':>8}")
+    print("-" * 77)
+    for name, packet in make_packets().items():
+        # 正確性：兩種輸出解析後相同
+        assert same(serialization.loads(serialization.dumps(packet)), json.loads(stdlib_text(packet))), name
+
+        size = len(serialization.dumps(packet))
+        t_std = bench(stdlib_bytes, packet, args.iterations)
+        t_fast = bench(serialization.dumps, packet, args.iterations)
+        t_text = bench(serialization.dumps_text, packet, args.iterations)
+        print(f"{name:<18}{size:>10}{t_std:>12.2f}{t_fast:>12.2f}{t_text:>17.2f}{t_std / t_fast:>7.1f}x")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
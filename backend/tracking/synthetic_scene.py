@@ -0,0 +1,439 @@
+"""
+合成球桌場景 - 可重現的俯視球桌畫面與真實標註
+
+用途:
+- 不需要實拍影片即可做效能測試與辨識準確度回歸（_detect_ball_color_hsv / _classify_ball_number）
+- SyntheticCapture 模擬 cv2.VideoCapture，VIDEO_SOURCE=synthetic 時驅動捕獲循環（任意 FPS）
+- TruthModel 模擬 YOLO 介面，直接回傳真實框，讓 PoolTracker 在沒有模型時也能完整執行
+
+可控制參數: 桌布顏色（config.TABLE_COLOR_PRESETS）、球數與球號、實心/花色、球桿、球體運動、
+光照變化（整體亮度、暗角、雜訊）。同一個 seed 產生完全相同的畫面序列。
+"""
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+# 球號 → (顏色名稱, HSV)；HSV 取在 PoolTracker._hue_to_name 各色範圍中央
+BALL_COLORS_HSV: Dict[str, Tuple[int, int, int]] = {
+    "Yellow": (32, 230, 245),
+    "Blue": (110, 230, 200),
+    "Red": (0, 230, 210),
+    "Purple": (142, 200, 170),
+    "Orange": (15, 240, 250),
+    "Green": (65, 220, 150),
+    "Brown": (14, 200, 105),
+    "Black": (0, 0, 42),
+    "White": (0, 0, 245),
+}
+
+BALL_NUMBER_COLORS = {
+    0: "White",
+    1: "Yellow", 2: "Blue", 3: "Red", 4: "Purple", 5: "Orange", 6: "Green", 7: "Brown", 8: "Black",
+    9: "Yellow", 10: "Blue", 11: "Red", 12: "Purple", 13: "Orange", 14: "Green", 15: "Brown",
+}
+
+
+def ball_style(number: int) -> str:
+    if number == 0:
+        return "Cue"
+    return "Stripe" if number >= 9 else "Solid"
+
+
+def hsv_to_bgr(hsv: Sequence[int]) -> Tuple[int, int, int]:
+    pixel = np.array([[list(hsv)]], dtype=np.uint8)
+    b, g, r = cv2.cvtColor(pixel, cv2.COLOR_HSV2BGR)[0, 0]
+    return int(b), int(g), int(r)
+
+
+def cloth_bgr(cloth: str) -> Tuple[int, int, int]:
+    """桌布顏色：取 TABLE_COLOR_PRESETS 該色 HSV 範圍的中央"""
+    preset = config.TABLE_COLOR_PRESETS.get(cloth, config.TABLE_COLOR_PRESETS["green"])
+    lower = np.asarray(preset["hsv_lower"], dtype=np.float32)
+    upper = np.asarray(preset["hsv_upper"], dtype=np.float32)
+    h = (lower[0] + upper[0]) / 2
+    s = lower[1] + (upper[1] - lower[1]) * 0.6
+    v = lower[2] + (upper[2] - lower[2]) * 0.5
+    return hsv_to_bgr((int(h), int(s), int(v)))
+
+
+@dataclass
+class BallTruth:
+    """單顆球的真實標註（全圖座標）"""
+    number: int
+    label: str
+    style: str
+    x: float
+    y: float
+    radius: int
+
+    @property
+    def bbox(self) -> List[int]:
+        """[x, y, w, h]，與 PoolTracker 輸出相同格式"""
+        r = self.radius
+        return [int(round(self.x)) - r, int(round(self.y)) - r, 2 * r, 2 * r]
+
+
+@dataclass
+class SceneFrame:
+    """一幀合成畫面與其真實標註"""
+    frame_id: int
+    image: np.ndarray
+    balls: List[BallTruth]
+    cue: Optional[List[int]]  # [x1, y1, x2, y2]
+    table: Tuple[int, int, int, int]  # [x, y, w, h]
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class SceneOptions:
+    width: int = 1920
+    height: int = 1080
+    cloth: str = "green"
+    balls: int = 10
+    numbers: Optional[List[int]] = None  # 指定球號（預設 1..balls）
+    ball_radius: Optional[int] = None  # 預設依球桌高度
+    show_cue: bool = True
+    motion: bool = True
+    shot_probability: float = 0.01  # 每幀白球被擊出的機率
+    brightness_jitter: float = 0.0  # 每幀整體亮度變化幅度（0.1 = ±10%）
+    vignette: float = 0.0  # 暗角強度（0~1）
+    noise_sigma: float = 0.0  # 高斯雜訊標準差（像素值）
+    seed: int = 0
+
+
+class SyntheticTableScene:
+    """俯視球桌場景產生器"""
+
+    FRICTION = 0.985
+
+    def __init__(self, options: Optional[SceneOptions] = None, **overrides: Any):
+        self.options = options or SceneOptions()
+        for key, value in overrides.items():
+            setattr(self.options, key, value)
+        opts = self.options
+        self.rng = np.random.default_rng(opts.seed)
+        self.frame_id = 0
+
+        margin_x, margin_y = opts.width // 10, opts.height // 10
+        self.table = (margin_x, margin_y, opts.width - 2 * margin_x, opts.height - 2 * margin_y)
+        tx, ty, tw, th = self.table
+        self.radius = opts.ball_radius or max(8, th // 40)
+
+        numbers = opts.numbers if opts.numbers is not None else list(range(1, opts.balls + 1))
+        self.numbers = [0] + [n for n in numbers if n != 0]
+        self.positions = self._place_balls(len(self.numbers))
+        self.velocity = np.zeros_like(self.positions)
+        self.cue_angle = float(self.rng.uniform(0, 2 * math.pi))
+
+        # 靜態背景：木框 + 桌布 + 球袋
+        self.background = np.full((opts.height, opts.width, 3), (30, 45, 70), np.uint8)
+        cv2.rectangle(self.background, (tx, ty), (tx + tw, ty + th), cloth_bgr(opts.cloth), -1)
+        pocket_r = int(self.radius * 1.8)
+        for px, py in self.pocket_centers():
+            cv2.circle(self.background, (px, py), pocket_r, (10, 10, 10), -1)
+
+        self._sprites = {n: self._ball_sprite(n) for n in set(self.numbers)}
+        self._lighting = self._vignette_mask() if opts.vignette > 0 else None
+
+    # ------------------------------------------------------------------
+    # 場景建構
+    # ------------------------------------------------------------------
+
+    def pocket_centers(self) -> List[Tuple[int, int]]:
+        tx, ty, tw, th = self.table
+        return [
+            (tx, ty), (tx + tw // 2, ty), (tx + tw, ty),
+            (tx, ty + th), (tx + tw // 2, ty + th), (tx + tw, ty + th),
+        ]
+
+    def _place_balls(self, count: int) -> np.ndarray:
+        """隨機擺放，球與球不重疊"""
+        tx, ty, tw, th = self.table
+        r = self.radius
+        placed: List[Tuple[float, float]] = []
+        attempts = 0
+        while len(placed) < count and attempts < 10000:
+            attempts += 1
+            x = float(self.rng.uniform(tx + 3 * r, tx + tw - 3 * r))
+            y = float(self.rng.uniform(ty + 3 * r, ty + th - 3 * r))
+            if all((x - px) ** 2 + (y - py) ** 2 > (2.5 * r) ** 2 for px, py in placed):
+                placed.append((x, y))
+        if len(placed) < count:
+            raise ValueError(f"球桌放不下 {count} 顆球")
+        return np.array(placed, dtype=np.float64)
+
+    def _ball_sprite(self, number: int) -> Tuple[np.ndarray, np.ndarray]:
+        """預先繪製單顆球（含陰影、高光、號碼圓點），回傳 (BGR, alpha 遮罩)"""
+        r = self.radius
+        size = 2 * r + 1
+        sprite = np.zeros((size, size, 3), np.uint8)
+        mask = np.zeros((size, size), np.uint8)
+        center = (r, r)
+        cv2.circle(mask, center, r, 255, -1, lineType=cv2.LINE_AA)
+
+        label = BALL_NUMBER_COLORS[number]
+        base = hsv_to_bgr(BALL_COLORS_HSV[label])
+        white = hsv_to_bgr(BALL_COLORS_HSV["White"])
+        if ball_style(number) == "Stripe":
+            # 花色球：白底 + 中央色帶（約佔一半面積）
+            cv2.circle(sprite, center, r, white, -1)
+            band = int(r * 0.55)
+            cv2.rectangle(sprite, (0, r - band), (size, r + band), base, -1)
+        else:
+            cv2.circle(sprite, center, r, base, -1)
+        if 0 < number:
+            # 號碼白點
+            cv2.circle(sprite, center, max(2, r // 3), white, -1)
+
+        # 立體感：下緣變暗、左上高光
+        yy, xx = np.mgrid[0:size, 0:size].astype(np.float32)
+        shade = 1.0 - 0.35 * np.clip((yy - r) / r, 0, 1)
+        sprite = (sprite.astype(np.float32) * shade[..., None]).astype(np.uint8)
+        highlight = (int(r * 0.6), int(r * 0.6))
+        cv2.circle(sprite, highlight, max(1, r // 5), (255, 255, 255), -1)
+        return sprite, mask
+
+    def _vignette_mask(self) -> np.ndarray:
+        opts = self.options
+        yy, xx = np.mgrid[0:opts.height, 0:opts.width].astype(np.float32)
+        cx, cy = opts.width / 2, opts.height / 2
+        dist = np.sqrt(((xx - cx) / cx) ** 2 + ((yy - cy) / cy) ** 2) / math.sqrt(2)
+        return (1.0 - opts.vignette * dist ** 2).astype(np.float32)[..., None]
+
+    # ------------------------------------------------------------------
+    # 模擬
+    # ------------------------------------------------------------------
+
+    def _step_motion(self):
+        opts = self.options
+        if self.rng.random() < opts.shot_probability:
+            speed = float(self.rng.uniform(15, 40))
+            self.velocity[0] = (-math.cos(self.cue_angle) * speed, -math.sin(self.cue_angle) * speed)
+
+        self.positions += self.velocity
+        self.velocity *= self.FRICTION
+        self.velocity[np.abs(self.velocity) < 0.05] = 0.0
+
+        tx, ty, tw, th = self.table
+        r = self.radius
+        for axis, low, high in ((0, tx + r, tx + tw - r), (1, ty + r, ty + th - r)):
+            out = (self.positions[:, axis] < low) | (self.positions[:, axis] > high)
+            self.velocity[out, axis] *= -1
+            np.clip(self.positions[:, axis], low, high, out=self.positions[:, axis])
+
+        # 球與球碰撞（等質量彈性碰撞）
+        count = len(self.positions)
+        for i in range(count):
+            for j in range(i + 1, count):
+                delta = self.positions[j] - self.positions[i]
+                dist = float(np.hypot(*delta))
+                if 0 < dist < 2 * r:
+                    normal = delta / dist
+                    approach = float(np.dot(self.velocity[i] - self.velocity[j], normal))
+                    if approach > 0:
+                        self.velocity[i] -= approach * normal
+                        self.velocity[j] += approach * normal
+                    overlap = 2 * r - dist
+                    self.positions[i] -= normal * overlap / 2
+                    self.positions[j] += normal * overlap / 2
+
+        # 白球靜止時球桿緩慢轉動
+        if not self.velocity[0].any():
+            self.cue_angle += float(self.rng.normal(0, 0.02))
+
+    def _cue_segment(self) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        r = self.radius
+        wx, wy = self.positions[0]
+        dx, dy = math.cos(self.cue_angle), math.sin(self.cue_angle)
+        tip = (int(wx + dx * 2 * r), int(wy + dy * 2 * r))
+        butt = (int(wx + dx * 14 * r), int(wy + dy * 14 * r))
+        return tip, butt
+
+    def render(self) -> SceneFrame:
+        """產生下一幀"""
+        opts = self.options
+        if opts.motion and self.frame_id > 0:
+            self._step_motion()
+        self.frame_id += 1
+
+        image = self.background.copy()
+        r = self.radius
+        balls: List[BallTruth] = []
+        for number, (x, y) in zip(self.numbers, self.positions):
+            sprite, mask = self._sprites[number]
+            x0, y0 = int(round(x)) - r, int(round(y)) - r
+            region = image[y0:y0 + 2 * r + 1, x0:x0 + 2 * r + 1]
+            if region.shape[:2] != mask.shape:
+                continue
+            cv2.copyTo(sprite, mask, region)
+            balls.append(BallTruth(
+                number=number,
+                label=BALL_NUMBER_COLORS[number],
+                style=ball_style(number),
+                x=float(x),
+                y=float(y),
+                radius=r,
+            ))
+
+        cue = None
+        if opts.show_cue and not self.velocity[0].any():
+            tip, butt = self._cue_segment()
+            cv2.line(image, tip, butt, (70, 140, 200), max(3, r // 3), lineType=cv2.LINE_AA)
+            cue = [min(tip[0], butt[0]), min(tip[1], butt[1]), max(tip[0], butt[0]), max(tip[1], butt[1])]
+
+        image = self._apply_lighting(image)
+        return SceneFrame(self.frame_id, image, balls, cue, self.table)
+
+    def _apply_lighting(self, image: np.ndarray) -> np.ndarray:
+        opts = self.options
+        if self._lighting is None and opts.brightness_jitter <= 0 and opts.noise_sigma <= 0:
+            return image
+        out = image.astype(np.float32)
+        if opts.brightness_jitter > 0:
+            out *= 1.0 + float(self.rng.uniform(-opts.brightness_jitter, opts.brightness_jitter))
+        if self._lighting is not None:
+            out *= self._lighting
+        if opts.noise_sigma > 0:
+            out += self.rng.normal(0, opts.noise_sigma, out.shape).astype(np.float32)
+        return np.clip(out, 0, 255).astype(np.uint8)
+
+
+class SyntheticCapture:
+    """
+    以合成場景模擬 cv2.VideoCapture（read / isOpened / get / set / release）
+
+    fps > 0 時 read() 依固定節奏阻塞，模擬實體相機；fps <= 0 時不限速
+    """
+
+    def __init__(self, scene: SyntheticTableScene, fps: float = 30.0):
+        self.scene = scene
+        self.fps = fps
+        self.last: Optional[SceneFrame] = None
+        self._opened = True
+        self._next_time = time.perf_counter()
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        if self.fps > 0:
+            now = time.perf_counter()
+            if self._next_time > now:
+                time.sleep(self._next_time - now)
+            # 落後超過一幀時不追趕（與實體相機丟幀行為一致）
+            self._next_time = max(self._next_time, time.perf_counter() - 1.0 / self.fps) + 1.0 / self.fps
+        self.last = self.scene.render()
+        return True, self.last.image
+
+    def get(self, prop: int) -> float:
+        opts = self.scene.options
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(opts.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(opts.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.scene.frame_id)
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        return False
+
+    def release(self):
+        self._opened = False
+
+
+# ==================== YOLO 替身 ====================
+
+class _TruthBox:
+    __slots__ = ("xyxy", "conf", "cls")
+
+    def __init__(self, cls_id: int, box: Sequence[float], conf: float):
+        self.xyxy = [np.array(box, dtype=np.float32)]
+        self.conf = [np.float32(conf)]
+        self.cls = [np.float32(cls_id)]
+
+
+class _TruthResult:
+    __slots__ = ("boxes",)
+
+    def __init__(self, boxes: List[_TruthBox]):
+        self.boxes = boxes
+
+
+class TruthModel:
+    """
+    模擬 ultralytics YOLO 的 predict()，回傳目前場景的真實框（ROI 座標）
+
+    tracker 設定後依 tracker.table_roi 換算 ROI 位移（rectified_roi 時換到校正後的桌面畫面）；
+    infer_ms 可模擬推論耗時
+    """
+
+    names = {0: "white-ball", 1: "color-ball", 2: "cue"}
+
+    def __init__(self, source: Any, infer_ms: float = 0.0):
+        """
+        Args:
+            source: 提供最新 SceneFrame 的物件（SyntheticCapture 的 .last，或直接傳 SceneFrame 的 callable）
+        """
+        self.source = source
+        self.infer_ms = infer_ms
+        self.tracker: Any = None
+
+    def _current(self) -> Optional[SceneFrame]:
+        if callable(self.source):
+            return self.source()
+        return getattr(self.source, "last", None)
+
+    def predict(self, roi_img: np.ndarray, **kwargs) -> List[_TruthResult]:
+        if self.infer_ms > 0:
+            time.sleep(self.infer_ms / 1000)
+        scene = self._current()
+        if scene is None:
+            return [_TruthResult([])]
+        roi = getattr(self.tracker, "table_roi", None) or [0, 0]
+        tx, ty = roi[0], roi[1]
+        labeled = []
+        for ball in scene.balls:
+            x, y, w, h = ball.bbox
+            labeled.append((0 if ball.number == 0 else 1, [x, y, x + w, y + h], 0.9))
+        if scene.cue is not None:
+            labeled.append((2, list(scene.cue), 0.8))
+        if not labeled:
+            return [_TruthResult([])]
+
+        xyxy = np.array([box for _, box, _ in labeled], dtype=np.float32)
+        space = getattr(self.tracker, "table_space", None)
+        if space is not None and getattr(self.tracker, "rectified_roi", False):
+            # 推論輸入為校正後的桌面畫面：框四角換到校正畫面再取外接矩形
+            corners = space.rectified_points(xyxy[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2)).reshape(-1, 4, 2)
+            xyxy = np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+        else:
+            xyxy -= np.array([tx, ty, tx, ty], dtype=np.float32)
+        return [_TruthResult([
+            _TruthBox(cls_id, box, conf) for (cls_id, _, conf), box in zip(labeled, xyxy)
+        ])]
+
+
+def create_capture_from_config() -> SyntheticCapture:
+    """VIDEO_SOURCE=synthetic 時由 open_camera 呼叫"""
+    scene = SyntheticTableScene(SceneOptions(
+        width=config.CAMERA_WIDTH,
+        height=config.CAMERA_HEIGHT,
+        cloth=config.TABLE_CLOTH_COLOR,
+        balls=config.SYNTHETIC_BALLS,
+        seed=config.SYNTHETIC_SEED,
+        shot_probability=0.01,
+        noise_sigma=config.SYNTHETIC_NOISE,
+    ))
+    return SyntheticCapture(scene, fps=config.SYNTHETIC_FPS)
@@ -0,0 +1,434 @@
+"""
+球桌幾何 - 快取球桌四角 / ROI / 球袋，背景漂移檢查，變更時通知所有消費者
+
+- 球桌四角由桌布輪廓的凸包擬合：先 approxPolyDP 取四邊形，再以凸包上最長且平行的邊精修
+  （球袋缺口只會切掉角落，不影響四邊的直線），四條邊兩兩相交得到角點
+- 球袋位置由四角推得：角袋為四角，中袋為長邊在透視下的中點（單位矩形 → 四角的 homography）
+- 背景線程每 check_interval 秒在縮小的最新畫面上量一次四角，與發布當下的量測比較；
+  移動超過門檻（相機被碰到、球桌移動）才完整重新偵測，連續兩次結果一致才發布，避免人手遮擋誤判
+- 發布時版本號 +1 並呼叫所有 listener（PoolTracker 於下一幀套用，API 直接讀取 current）
+"""
+
+import logging
+import math
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 單位矩形（左上、右上、右下、左下），用來求中袋在透視下的位置
+_UNIT_RECT = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=np.float32)
+
+
+@dataclass(frozen=True)
+class TableGeometry:
+    """球桌幾何（全圖座標）"""
+
+    corners: np.ndarray  # 4x2 float32，順序：左上、右上、右下、左下
+    roi: List[int]  # [x, y, w, h]，四角的外接矩形（已裁切到畫面內）
+    pockets: List[List[int]]  # 6 個球袋中心：左上、左下、右上、右下、中上、中下（直立球桌為中左、中右）
+    pocket_radius: int  # 袋口半徑（像素）
+    frame_size: Tuple[int, int]  # (寬, 高)
+    source: str = "detected"  # detected / fallback
+    version: int = 0
+    detected_at: float = field(default_factory=time.time)
+
+    @property
+    def capture_radius(self) -> int:
+        """球心進入此範圍（袋口半徑 + 約一顆球的半徑）視為進袋"""
+        return int(self.pocket_radius * 1.5)
+
+    def shift_from(self, other: Optional["TableGeometry"]) -> float:
+        """兩組四角的最大位移（像素）；other 為 None 時為無限大"""
+        if other is None:
+            return math.inf
+        return float(np.abs(self.corners - other.corners).max())
+
+    def to_dict(self) -> dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "corners": [[round(float(x), 1), round(float(y), 1)] for x, y in self.corners],
+            "roi": list(self.roi),
+            "pockets": [list(p) for p in self.pockets],
+            "pocket_radius": self.pocket_radius,
+            "frame_size": list(self.frame_size),
+            "detected_at": self.detected_at,
+        }
+
+
+# ==================== 幾何推導 ====================
+
+def order_corners(points: np.ndarray) -> np.ndarray:
+    """四點排序為左上、右上、右下、左下"""
+    pts = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    s = pts.sum(axis=1)
+    d = pts[:, 1] - pts[:, 0]
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+
+def _intersect(p1, p2, q1, q2) -> Optional[np.ndarray]:
+    """直線 p1p2 與 q1q2 的交點（平行時為 None）"""
+    d1 = p2 - p1
+    d2 = q2 - q1
+    denom = d1[0] * d2[1] - d1[1] * d2[0]
+    if abs(denom) < 1e-9:
+        return None
+    t = ((q1[0] - p1[0]) * d2[1] - (q1[1] - p1[1]) * d2[0]) / denom
+    return p1 + t * d1
+
+
+def _refine_corners(quad: np.ndarray, hull: np.ndarray) -> np.ndarray:
+    """以凸包上與四邊平行的最長邊重新求角點（消除球袋缺口造成的斜角）"""
+    pts = hull.reshape(-1, 2).astype(np.float64)
+    count = len(pts)
+    if count < 4:
+        return quad
+    edges = [(pts[i], pts[(i + 1) % count]) for i in range(count)]
+    corners = quad.astype(np.float64)
+    max_sin = math.sin(math.radians(10))
+
+    lines = []
+    for i in range(4):
+        a, b = corners[i], corners[(i + 1) % 4]
+        side = float(np.hypot(*(b - a)))
+        if side < 1:
+            return quad
+        direction = (b - a) / side
+        normal = np.array([-direction[1], direction[0]])
+        best, best_len = None, 0.2 * side
+        for p, q in edges:
+            e = q - p
+            length = float(np.hypot(*e))
+            if length <= best_len:
+                continue
+            if abs(direction[0] * e[1] - direction[1] * e[0]) / length > max_sin:
+                continue
+            if abs(float(np.dot((p + q) / 2 - a, normal))) > 0.1 * side:
+                continue
+            best, best_len = (p, q), length
+        if best is None:
+            return quad
+        lines.append(best)
+
+    refined = []
+    diagonal = float(np.hypot(*(corners[2] - corners[0])))
+    for i in range(4):
+        point = _intersect(*lines[i - 1], *lines[i])
+        if point is None or np.hypot(*(point - corners[i])) > 0.15 * diagonal:
+            return quad
+        refined.append(point)
+    return np.array(refined, dtype=np.float32)
+
+
+def quad_from_contour(contour: np.ndarray) -> np.ndarray:
+    """桌布輪廓 → 四角（左上、右上、右下、左下）"""
+    hull = cv2.convexHull(contour)
+    perimeter = cv2.arcLength(hull, True)
+    quad = None
+    for eps in (0.01, 0.02, 0.03, 0.05, 0.08):
+        poly = cv2.approxPolyDP(hull, eps * perimeter, True)
+        if len(poly) == 4:
+            quad = poly.reshape(4, 2)
+            break
+        if len(poly) < 4:
+            break
+    if quad is None:
+        quad = cv2.boxPoints(cv2.minAreaRect(contour))
+    return _refine_corners(order_corners(quad), hull)
+
+
+def estimate_pockets(corners: np.ndarray) -> Tuple[List[List[int]], int]:
+    """由四角推得 6 個球袋中心與袋口半徑"""
+    tl, tr, br, bl = corners
+    horizontal = (np.hypot(*(tr - tl)) + np.hypot(*(br - bl))) / 2
+    vertical = (np.hypot(*(bl - tl)) + np.hypot(*(br - tr))) / 2
+    long_side = max(horizontal, vertical)
+
+    # 中袋在長邊的「桌面」中點；透視下不是影像上的中點，以 homography 換算
+    matrix = cv2.getPerspectiveTransform(_UNIT_RECT, np.asarray(corners, dtype=np.float32))
+    if horizontal >= vertical:
+        middles = np.array([[[0.5, 0.0], [0.5, 1.0]]], dtype=np.float32)
+    else:
+        middles = np.array([[[0.0, 0.5], [1.0, 0.5]]], dtype=np.float32)
+    mid = cv2.perspectiveTransform(middles, matrix)[0]
+
+    pockets = [
+        [int(round(x)), int(round(y))]
+        for x, y in (tl, bl, tr, br, mid[0], mid[1])
+    ]
+    radius = max(8, int(round(long_side * config.TABLE_POCKET_RADIUS_RATIO)))
+    return pockets, radius
+
+
+def geometry_from_corners(corners: np.ndarray, frame_size: Tuple[int, int], source: str = "detected") -> TableGeometry:
+    width, height = frame_size
+    corners = np.array(corners, dtype=np.float32).reshape(4, 2)
+    x0, y0 = np.floor(corners.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(corners.max(axis=0)).astype(int)
+    x0, y0 = max(0, int(x0)), max(0, int(y0))
+    x1, y1 = min(width, int(x1)), min(height, int(y1))
+    pockets, radius = estimate_pockets(corners)
+    return TableGeometry(
+        corners=corners,
+        roi=[x0, y0, x1 - x0, y1 - y0],
+        pockets=pockets,
+        pocket_radius=radius,
+        frame_size=(width, height),
+        source=source,
+    )
+
+
+def geometry_from_contour(contour: np.ndarray, frame_size: Tuple[int, int]) -> TableGeometry:
+    return geometry_from_corners(quad_from_contour(contour), frame_size)
+
+
+def fallback_geometry(frame_size: Tuple[int, int], margin: int = 50) -> TableGeometry:
+    """找不到桌布時以整個畫面（扣除邊緣）當作球桌"""
+    width, height = frame_size
+    corners = np.array([
+        [margin, margin], [width - margin, margin],
+        [width - margin, height - margin], [margin, height - margin],
+    ], dtype=np.float32)
+    return geometry_from_corners(corners, frame_size, source="fallback")
+
+
+def downscale(frame: np.ndarray, scale: float) -> np.ndarray:
+    """
+    INTER_AREA 縮小；先逐次減半（OpenCV 對 2 倍縮小有快速路徑，直接縮 4 倍約慢 3 倍）
+
+    每次減半的像素中心對應關係不變，座標換回全圖仍為 (x + 0.5) / scale - 0.5。
+    """
+    if scale >= 1.0:
+        return frame
+    h, w = frame.shape[:2]
+    target = (max(1, round(w * scale)), max(1, round(h * scale)))
+    small = frame
+    while small.shape[1] // 2 >= target[0] and small.shape[0] // 2 >= target[1]:
+        small = cv2.resize(small, (small.shape[1] // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+    if (small.shape[1], small.shape[0]) != target:
+        small = cv2.resize(small, target, interpolation=cv2.INTER_AREA)
+    return small
+
+
+def segment_cloth(
+    frame: np.ndarray,
+    mask_fn: Callable[[np.ndarray], np.ndarray],
+    scale: float,
+    min_area: float = 0.0,
+) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+    """
+    快速桌布分割：縮小後才轉 HSV / inRange，只取最外層輪廓，輪廓換回全圖座標
+
+    Returns:
+        (面積最大且超過 min_area（全圖像素）的輪廓（float32，全圖座標）或 None, 統計)
+    """
+    mask = mask_fn(downscale(frame, scale))
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    info: Dict[str, Any] = {
+        "cloth_ratio": round(np.count_nonzero(mask) / mask.size, 4),
+        "contours": len(contours),
+        "area": 0.0,
+    }
+    if not contours:
+        return None, info
+    contour = max(contours, key=cv2.contourArea)
+    area = cv2.contourArea(contour) / (scale * scale)
+    info["area"] = round(area, 1)
+    if area < min_area:
+        return None, info
+    # 縮小畫面的像素中心 → 全圖座標（INTER_AREA 縮小）
+    return (contour.astype(np.float32) + 0.5) / scale - 0.5, info
+
+
+def coarse_corners(
+    frame: np.ndarray,
+    mask_fn: Callable[[np.ndarray], np.ndarray],
+    scale: float,
+    min_area: float = 0.0,
+) -> Optional[np.ndarray]:
+    """縮小畫面上的桌布四角（全圖座標）；找不到面積超過 min_area 的桌布時為 None"""
+    contour, _ = segment_cloth(frame, mask_fn, scale, min_area)
+    return quad_from_contour(contour) if contour is not None else None
+
+
+# ==================== 快取 + 漂移檢查 ====================
+
+class TableGeometryService:
+    """
+    球桌幾何快取
+
+    Args:
+        detector: frame → TableGeometry 或 None（完整偵測，發布前的確認）
+        mask_fn: BGR 畫面 → 桌布遮罩（uint8，與畫面同尺寸），漂移檢查在縮小畫面上呼叫
+    """
+
+    def __init__(
+        self,
+        detector: Callable[[np.ndarray], Optional[TableGeometry]],
+        mask_fn: Callable[[np.ndarray], np.ndarray],
+        check_interval: float = 2.0,
+        check_scale: float = 0.25,
+        min_shift_px: float = 6.0,
+        min_area: float = 0.0,
+    ):
+        self.detector = detector
+        self.mask_fn = mask_fn
+        self.check_interval = check_interval
+        self.check_scale = check_scale
+        self.min_shift_px = min_shift_px
+        self.min_area = min_area
+
+        self._lock = threading.Lock()
+        self._current: Optional[TableGeometry] = None
+        self._version = 0
+        self._listeners: List[Callable[[Optional[TableGeometry]], None]] = []
+        # 發布當下在縮小畫面上量到的四角；之後只和它比較，抵消低解析度的系統誤差
+        self._reference: Optional[np.ndarray] = None
+        self._candidate: Optional[TableGeometry] = None  # 等待第二次確認的新幾何
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stats: Dict[str, Any] = {
+            "checks": 0,
+            "redetections": 0,
+            "published": 0,
+            "last_shift_px": None,
+            "last_check_ms": None,
+            "last_redetect_ms": None,
+        }
+
+    # ------------------------------------------------------------------
+    # 發布
+    # ------------------------------------------------------------------
+
+    @property
+    def current(self) -> Optional[TableGeometry]:
+        return self._current
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def add_listener(self, listener: Callable[[Optional[TableGeometry]], None]):
+        self._listeners.append(listener)
+
+    def publish(self, geometry: TableGeometry, frame: Optional[np.ndarray] = None) -> TableGeometry:
+        """發布新幾何（版本號 +1）；提供 frame 時記錄當下的低解析度四角作為漂移檢查的基準"""
+        reference = None
+        if frame is not None and geometry.source == "detected":
+            reference = coarse_corners(frame, self.mask_fn, self.check_scale, self.min_area)
+        with self._lock:
+            self._version += 1
+            geometry = replace(geometry, version=self._version)
+            self._current = geometry
+            self._candidate = None
+            self._reference = reference
+            self._stats["published"] += 1
+        self._notify(geometry)
+        return geometry
+
+    def invalidate(self):
+        """清除快取（桌布顏色改變等），下一幀重新偵測"""
+        with self._lock:
+            self._version += 1
+            self._current = None
+            self._candidate = None
+            self._reference = None
+        self._notify(None)
+
+    def _notify(self, geometry: Optional[TableGeometry]):
+        for listener in list(self._listeners):
+            try:
+                listener(geometry)
+            except Exception as e:
+                logger.warning("⚠️ Table geometry listener error: %s", e)
+
+    # ------------------------------------------------------------------
+    # 漂移檢查
+    # ------------------------------------------------------------------
+
+    def check(self, frame: np.ndarray, force: bool = False) -> Optional[TableGeometry]:
+        """
+        檢查一次（背景線程呼叫）；幾何有變化且已確認時發布並回傳新幾何
+
+        force=True 時略過低解析度判斷與二次確認，直接重新偵測
+        """
+        current = self._current
+        if current is None and not force:
+            return None
+
+        self._stats["checks"] += 1
+        reference = self._reference
+        if current is not None and reference is not None and not force:
+            start = time.perf_counter()
+            corners = coarse_corners(frame, self.mask_fn, self.check_scale, self.min_area)
+            self._stats["last_check_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            shift = float(np.abs(corners - reference).max()) if corners is not None else math.inf
+            self._stats["last_shift_px"] = round(shift, 1) if corners is not None else None
+            if shift < self.min_shift_px:
+                self._candidate = None
+                return None
+
+        # 低解析度四角明顯移動（或目前為備用幾何）：完整重新偵測
+        redetect_start = time.perf_counter()
+        geometry = self.detector(frame)
+        self._stats["redetections"] += 1
+        self._stats["last_redetect_ms"] = round((time.perf_counter() - redetect_start) * 1000, 2)
+        if geometry is None or geometry.shift_from(current) < self.min_shift_px:
+            # 位置沒變（低解析度的移動來自遮擋或光線）
+            self._candidate = None
+            return None
+
+        if not force and geometry.shift_from(self._candidate) >= self.min_shift_px:
+            # 第一次看到新位置：等下一次檢查確認，避免人手短暫遮擋造成誤判
+            self._candidate = geometry
+            return None
+
+        logger.info("📐 Table geometry changed (shift %.1fpx): roi=%s", geometry.shift_from(current), geometry.roi)
+        return self.publish(geometry, frame)
+
+    def start(self, frame_source: Callable[[], Optional[np.ndarray]]):
+        """啟動背景漂移檢查；frame_source 回傳最新畫面（沒有時為 None）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(self.check_interval):
+                if self._current is None:
+                    continue
+                frame = frame_source()
+                if frame is None:
+                    continue
+                try:
+                    self.check(frame)
+                except Exception as e:
+                    logger.warning("⚠️ Table drift check error: %s", e)
+
+        self._thread = threading.Thread(target=run, name="table-geometry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def get_stats(self) -> dict:
+        current = self._current
+        return {
+            **self._stats,
+            "version": self._version,
+            "check_interval_sec": self.check_interval,
+            "pending_confirmation": self._candidate is not None,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "geometry": current.to_dict() if current is not None else None,
+        }
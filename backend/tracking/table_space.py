@@ -0,0 +1,188 @@
+"""
+球桌座標系 - 以偵測到的球桌四角，把相機像素校正成以公釐為單位的球桌平面
+
+- TableSpace 由 TableGeometry 建立（幾何版本改變才重建），包含相機 → 球桌、球桌 → 相機兩個 homography
+- 物理（白球射線、碰撞、庫邊反彈、進袋、瞄準輔助）全部在球桌座標進行：
+  庫邊是球桌矩形內縮一個球半徑，不受相機傾斜影響，不需要以像素估計的邊距
+- 點的轉換以一次 cv2.perspectiveTransform 處理整批，結果只在繪製 / 輸出時換回相機座標
+- rectify() 以預先計算的 remap 表輸出校正後的桌面畫面（只含桌面），可作為推論的裁切
+
+座標：原點為球桌左上角（影像中的左上角），x 沿影像上緣（左上 → 右上），單位公釐。
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import config
+from tracking.table_geometry import TableGeometry
+
+
+@dataclass(frozen=True)
+class TableSpace:
+    """球桌平面座標（公釐）與相機座標的對應"""
+
+    size: Tuple[float, float]  # (寬, 高) 公釐；長邊在影像中橫放時寬為球桌長度
+    to_table: np.ndarray  # 3x3：相機像素 → 球桌公釐
+    to_image: np.ndarray  # 3x3：球桌公釐 → 相機像素
+    pockets: np.ndarray  # 6x2 公釐，順序同 TableGeometry.pockets
+    capture_radius: float  # 球心進入此距離（公釐）視為進袋
+    ball_radius: float  # 公釐
+    px_per_mm: float  # 長邊的平均解析度；校正畫面以此解析度輸出
+    geometry_version: int = 0
+    _maps: dict = field(default_factory=dict, repr=False, compare=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @classmethod
+    def from_geometry(
+        cls,
+        geometry: TableGeometry,
+        length_mm: Optional[float] = None,
+        width_mm: Optional[float] = None,
+        ball_diameter_mm: Optional[float] = None,
+    ) -> "TableSpace":
+        length = length_mm or config.TABLE_LENGTH_MM
+        width = width_mm or config.TABLE_WIDTH_MM
+        ball_radius = (ball_diameter_mm or config.BALL_DIAMETER_MM) / 2
+
+        corners = np.asarray(geometry.corners, dtype=np.float32)
+        tl, tr, br, bl = corners
+        horizontal = (np.hypot(*(tr - tl)) + np.hypot(*(br - bl))) / 2
+        vertical = (np.hypot(*(bl - tl)) + np.hypot(*(br - tr))) / 2
+        if horizontal >= vertical:
+            w, h = length, width
+            middles = [[w / 2, 0.0], [w / 2, h]]
+        else:
+            w, h = width, length
+            middles = [[0.0, h / 2], [w, h / 2]]
+        rect = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float32)
+        to_table = cv2.getPerspectiveTransform(corners, rect)
+        px_per_mm = float(max(horizontal, vertical) / length)
+
+        return cls(
+            size=(float(w), float(h)),
+            to_table=to_table,
+            to_image=np.linalg.inv(to_table),
+            pockets=np.array([[0, 0], [0, h], [w, 0], [w, h]] + middles, dtype=np.float32),
+            capture_radius=geometry.capture_radius / px_per_mm,
+            ball_radius=float(ball_radius),
+            px_per_mm=px_per_mm,
+            geometry_version=geometry.version,
+        )
+
+    # ==================== 座標轉換 ====================
+    def table_points(self, points) -> np.ndarray:
+        """相機像素 (N, 2) → 球桌公釐 (N, 2)，一次轉換整批"""
+        pts = np.asarray(points, dtype=np.float32).reshape(1, -1, 2)
+        if pts.shape[1] == 0:
+            return pts.reshape(0, 2)
+        return cv2.perspectiveTransform(pts, self.to_table)[0]
+
+    def image_points(self, points) -> np.ndarray:
+        """球桌公釐 (N, 2) → 相機像素 (N, 2)"""
+        pts = np.asarray(points, dtype=np.float32).reshape(1, -1, 2)
+        if pts.shape[1] == 0:
+            return pts.reshape(0, 2)
+        return cv2.perspectiveTransform(pts, self.to_image)[0]
+
+    def image_int_points(self, points) -> List[List[int]]:
+        """球桌公釐 → 相機像素（整數 list，供繪製與數據包）"""
+        return np.round(self.image_points(points)).astype(int).tolist()
+
+    # ==================== 物理 ====================
+    @property
+    def cushion_bounds(self) -> Tuple[float, float, float, float]:
+        """球心可到達的範圍（球桌內縮一個球半徑）：(x0, y0, x1, y1)"""
+        r = self.ball_radius
+        return r, r, self.size[0] - r, self.size[1] - r
+
+    def cushion_path(self, start: np.ndarray, direction: np.ndarray, bounces: int) -> np.ndarray:
+        """
+        從 start 沿 direction 前進，遇庫邊鏡面反彈
+
+        Returns:
+            (bounces + 2, 2) 路徑點：起點、每次碰庫點、最後一段的終點（也在庫邊上）；
+            direction 為零向量時只有起點
+        """
+        x0, y0, x1, y1 = self.cushion_bounds
+        pos = np.clip(np.asarray(start, dtype=np.float64), (x0, y0), (x1, y1))
+        d = np.asarray(direction, dtype=np.float64)
+        norm = float(np.hypot(*d))
+        if norm == 0:
+            return pos.reshape(1, 2)
+        d = d / norm
+        low, high = np.array([x0, y0]), np.array([x1, y1])
+
+        path = [pos]
+        for _ in range(bounces + 1):
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t_axis = np.where(d > 0, (high - pos) / d, np.where(d < 0, (low - pos) / d, np.inf))
+            t = float(t_axis.min())
+            pos = np.clip(pos + d * t, low, high)
+            path.append(pos)
+            # 碰到的庫邊（角落同時碰到兩邊）反轉該方向
+            d = np.where(t_axis <= t + 1e-6, -d, d)
+        return np.array(path, dtype=np.float32)
+
+    def pocket_on_segment(self, start: np.ndarray, end: np.ndarray) -> Optional[int]:
+        """線段經過的第一個球袋（球心距袋口中心在 capture_radius 內）；沒有為 None"""
+        a = np.asarray(start, dtype=np.float32)
+        ab = np.asarray(end, dtype=np.float32) - a
+        length2 = float(ab @ ab)
+        ap = self.pockets - a
+        t = np.clip(ap @ ab / length2, 0.0, 1.0) if length2 > 0 else np.zeros(len(self.pockets), np.float32)
+        distance = np.hypot(*(ap - t[:, None] * ab).T)
+        hits = np.flatnonzero(distance <= self.capture_radius)
+        if len(hits) == 0:
+            return None
+        return int(hits[np.argmin(t[hits])])
+
+    def nearest_pocket(self, point: np.ndarray) -> Tuple[int, float]:
+        """最近的球袋 (索引, 距離公釐)"""
+        distance = np.hypot(*(self.pockets - np.asarray(point, dtype=np.float32)).T)
+        index = int(np.argmin(distance))
+        return index, float(distance[index])
+
+    # ==================== 校正畫面 ====================
+    @property
+    def rectified_size(self) -> Tuple[int, int]:
+        """校正畫面大小（像素）：球桌尺寸 × px_per_mm"""
+        return (
+            max(1, int(round(self.size[0] * self.px_per_mm))),
+            max(1, int(round(self.size[1] * self.px_per_mm))),
+        )
+
+    def rectified_points(self, points) -> np.ndarray:
+        """相機像素 → 校正畫面像素"""
+        return self.table_points(points) * self.px_per_mm
+
+    def rectify(self, frame: np.ndarray) -> np.ndarray:
+        """以 remap 表輸出只含桌面的校正畫面（remap 表依畫面大小建立一次）"""
+        key = frame.shape[:2]
+        maps = self._maps.get(key)
+        if maps is None:
+            with self._lock:
+                maps = self._maps.get(key)
+                if maps is None:
+                    maps = self._maps[key] = self._build_maps()
+        return cv2.remap(frame, maps[0], maps[1], cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+    def _build_maps(self):
+        width, height = self.rectified_size
+        xs, ys = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        grid = np.stack([xs, ys], axis=-1).reshape(1, -1, 2) / self.px_per_mm
+        source = cv2.perspectiveTransform(grid, self.to_image).reshape(height, width, 2)
+        return cv2.convertMaps(source[..., 0], source[..., 1], cv2.CV_16SC2)
+
+    def to_dict(self) -> dict:
+        return {
+            "size_mm": [round(self.size[0], 1), round(self.size[1], 1)],
+            "px_per_mm": round(self.px_per_mm, 4),
+            "ball_radius_mm": round(self.ball_radius, 2),
+            "capture_radius_mm": round(self.capture_radius, 1),
+            "rectified_size": list(self.rectified_size),
+            "geometry_version": self.geometry_version,
+        }
@@ -4,24 +4,45 @@ Enhanced Pool Tracker with Full Physics Simulation
 遵照 v1.5 技術文檔規範
 """
 
+import logging
 import math
-from typing import Optional, List, Tuple, Dict, Any
+import time  # ✅ 添加 time 模組
+from typing import Any, Dict, List, Optional, Tuple
 
-import config
 import cv2
 import numpy as np
-import time  # ✅ 添加 time 模組
-from ultralytics import YOLO
 
+import config
+from core.pipeline_profiler import profiler
+from tracking.table_geometry import (
+    TableGeometry,
+    TableGeometryService,
+    fallback_geometry,
+    geometry_from_contour,
+    segment_cloth,
+)
+from tracking.table_space import TableSpace
+
+logger = logging.getLogger(__name__)
 
-class PoolTracker:
-    def __init__(self, model_path=None):
-        if model_path is None:
-            model_path = config.MODEL_PATH
 
+class PoolTracker:
+    def __init__(self, model_path=None, model=None):
+        """
+        Args:
+            model_path: YOLO 權重路徑（預設 config.MODEL_PATH）
+            model: 已建立的模型物件（需提供 predict() 與 names）；
+                   傳入時不載入 ultralytics，供離線效能測試使用
+        """
         # --- 1. 初始化 YOLO 模型 ---
-        print(f"✅ Loading YOLO model from: {model_path}")
-        self.model = YOLO(model_path)
+        if model is None:
+            if model_path is None:
+                model_path = config.MODEL_PATH
+            from ultralytics import YOLO  # 延遲載入：未安裝 ultralytics 時仍可匯入本模組
+
+            print(f"✅ Loading YOLO model from: {model_path}")
+            model = YOLO(model_path)
+        self.model = model
 
         # --- 2. 系統參數 ---
         self.conf_thr = config.CONF_THR
@@ -33,8 +54,22 @@ class PoolTracker:
         # --- 3. 狀態變數 ---
         self.table_roi: Optional[List[int]] = None  # [x, y, w, h]
         self.holes: List[List[int]] = []  # 球袋位置（全圖座標）
-        self.hole_bboxes: List[List[int]] = []  # 球袋碰撞箱 [x1,y1,x2,y2]
-        self.table_rects: List[List[int]] = []  # 球桌邊界
+        self.table_geometry: Optional[TableGeometry] = None  # 目前套用的球桌幾何（四角、球袋）
+        self.table_space: Optional[TableSpace] = None  # 球桌平面座標（公釐），物理預測在此進行
+        self.rectified_roi = config.TRACK_RECTIFIED_ROI  # 推論輸入改用校正後的桌面畫面
+        self._pending_geometry: Optional[TableGeometry] = None  # 背景漂移檢查發布、等待下一幀套用
+        self.last_table_detection: Dict[str, Any] = {}  # 最近一次桌布分割統計（模式、耗時、輪廓數）
+
+        # 球桌幾何快取 + 背景漂移檢查（start() 由捕獲系統呼叫）
+        self.geometry = TableGeometryService(
+            detector=self._detect_table_geometry,
+            mask_fn=self._table_mask,
+            check_interval=config.TABLE_DRIFT_CHECK_SEC,
+            check_scale=config.TABLE_DRIFT_CHECK_SCALE,
+            min_shift_px=config.TABLE_DRIFT_MIN_SHIFT_PX,
+            min_area=config.TABLE_MIN_AREA,
+        )
+        self.geometry.add_listener(self._on_table_geometry)
 
         # 擊球預測狀態
         self.last_point_history: List[List[int]] = []
@@ -42,6 +77,7 @@ class PoolTracker:
         self.shot_points: List[List[int]] = []
         self.possibility: List[Optional[Dict]] = []
         self.prediction_mode = True
+        self.aim_assist_enabled = False
 
         # --- 4. 顏色映射 (從 poolShotPredictor.py) ---
         self.COLOR_TO_NUM = {
@@ -84,10 +120,7 @@ class PoolTracker:
         self.current_table_color = color_name
 
         # 清除之前偵測到的球桌區域，強制重新偵測
-        self.table_roi = None
-        self.holes = []
-        self.hole_bboxes = []
-        self.table_rects = []
+        self._reset_table()
 
         print(f"✅ Table color updated to: {color_preset['name']} ({color_name})")
         print(f"   HSV_LOWER: {self.hsv_lower}, HSV_UPPER: {self.hsv_upper}")
@@ -106,10 +139,7 @@ class PoolTracker:
             self.current_table_color = "custom"
 
             # 清除之前偵測到的球桌區域，強制重新偵測
-            self.table_roi = None
-            self.holes = []
-            self.hole_bboxes = []
-            self.table_rects = []
+            self._reset_table()
 
             print(f"✅ Custom HSV range updated")
             print(f"   HSV_LOWER: {self.hsv_lower}, HSV_UPPER: {self.hsv_upper}")
@@ -119,107 +149,104 @@ class PoolTracker:
             return False
 
     # ==================== 球桌偵測 ====================
-    def detect_table(self, frame: np.ndarray) -> Tuple[bool, Optional[List[int]]]:
-        """
-        使用 HSV 綠色檢測找出球桌區域
-        返回: (成功與否, 球桌bbox [x,y,w,h])
-        """
-        print(f"🔍 Detecting table... Frame shape: {frame.shape}")
-        print(f"   HSV_LOWER: {self.hsv_lower}, HSV_UPPER: {self.hsv_upper}")
-        print(f"   TABLE_MIN_AREA: {config.TABLE_MIN_AREA}")
-
+    def _table_mask(self, frame: np.ndarray) -> np.ndarray:
+        """桌布顏色遮罩"""
         hsv_img = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv_img, self.hsv_lower, self.hsv_upper)
+        return cv2.inRange(hsv_img, self.hsv_lower, self.hsv_upper)
+
+    def _segment_table(
+        self,
+        frame: np.ndarray,
+        scale: Optional[float] = None,
+    ) -> Tuple[Optional[np.ndarray], Dict[str, Any]]:
+        """
+        HSV 桌布分割，回傳面積最大（且超過 TABLE_MIN_AREA）的輪廓（全圖座標）與統計
 
-        # 計算綠色像素比例
-        green_pixels = np.count_nonzero(mask)
-        total_pixels = mask.size
-        green_ratio = green_pixels / total_pixels
-        print(f"   Green pixels: {green_pixels} / {total_pixels} ({green_ratio*100:.2f}%)")
+        scale < 1（TABLE_SEGMENT_SCALE）：縮小後才轉 HSV，RETR_EXTERNAL 只取最外層輪廓；
+        scale = 1：舊版全解析度 + 開運算 + RETR_TREE。
+        """
+        scale = config.TABLE_SEGMENT_SCALE if scale is None else scale
+        if scale < 1.0:
+            return segment_cloth(frame, self._table_mask, scale, config.TABLE_MIN_AREA)
 
+        mask = self._table_mask(frame)
+        info: Dict[str, Any] = {"cloth_ratio": round(np.count_nonzero(mask) / mask.size, 4)}
         kernel = np.ones((5, 5), np.uint8)
         mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
         contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-
-        print(f"   Found {len(contours)} contours")
+        info["contours"] = len(contours)
 
         max_area = 0.0
-        best_rect = None
-        all_areas = []
-
+        best_contour = None
         for contour in contours:
             area = cv2.contourArea(contour)
-            all_areas.append(area)
-            if area > config.TABLE_MIN_AREA:
-                if area > max_area:
-                    max_area = area
-                    best_rect = cv2.boundingRect(contour)
-
-        if all_areas:
-            all_areas.sort(reverse=True)
-            print(f"   Top 3 areas: {all_areas[:3]}")
-            print(f"   Max area: {max_area}, Min required: {config.TABLE_MIN_AREA}")
-
-        if best_rect:
-            x, y, w, h = best_rect
-            self.table_roi = [x, y, w, h]
-            self.table_rects = [[x, y, w, h]]
-
-            # 定義 6 個球袋中心點（全圖座標）
-            self.holes = [
-                [x + 52, y + 52],                    # 左上
-                [x + 52, y + h - 52],                # 左下
-                [x + w - 52, y + 52],                # 右上
-                [x + w - 52, y + h - 52],            # 右下
-                [x + (w - 12) // 2, y + 40],         # 中上
-                [x + (w - 12) // 2, y + h - 40],     # 中下
-            ]
-
-            # 定義球袋碰撞箱（半徑 50px）
-            self.hole_bboxes = []
-            for hole in self.holes:
-                cx, cy = hole
-                radius = 50
-                x1, y1 = cx - radius, cy - radius
-                x2, y2 = cx + radius, cy + radius
-                self.hole_bboxes.append([x1, y1, x2, y2])
-
-            print(f"✅ Table detected: x={x}, y={y}, w={w}, h={h}")
-            return True, [x, y, w, h]
-
-        # 備用方案：如果找不到綠色區域，使用整個畫面
-        print(f"⚠️  No green table found, using entire frame as fallback")
+            if area > config.TABLE_MIN_AREA and area > max_area:
+                max_area = area
+                best_contour = contour
+        info["area"] = round(max_area, 1)
+        return best_contour, info
+
+    def _detect_table_geometry(self, frame: np.ndarray, scale: Optional[float] = None) -> Optional[TableGeometry]:
+        """桌布輪廓 → 球桌幾何（四角、ROI、球袋）；找不到桌布時為 None"""
+        scale = config.TABLE_SEGMENT_SCALE if scale is None else scale
+        start = time.perf_counter()
+        contour, info = self._segment_table(frame, scale)
         h, w = frame.shape[:2]
-        # 使用畫面的 90% 作為球桌區域（排除邊緣）
-        margin = 50
-        x, y = margin, margin
-        w_table = w - 2 * margin
-        h_table = h - 2 * margin
-
-        self.table_roi = [x, y, w_table, h_table]
-        self.table_rects = [[x, y, w_table, h_table]]
-
-        # 定義 6 個球袋中心點（全圖座標）
-        self.holes = [
-            [x + 52, y + 52],                    # 左上
-            [x + 52, y + h_table - 52],          # 左下
-            [x + w_table - 52, y + 52],          # 右上
-            [x + w_table - 52, y + h_table - 52],# 右下
-            [x + (w_table - 12) // 2, y + 40],   # 中上
-            [x + (w_table - 12) // 2, y + h_table - 40],  # 中下
-        ]
-
-        # 定義球袋碰撞箱（半徑 50px）
-        self.hole_bboxes = []
-        for hole in self.holes:
-            cx, cy = hole
-            radius = 50
-            x1, y1 = cx - radius, cy - radius
-            x2, y2 = cx + radius, cy + radius
-            self.hole_bboxes.append([x1, y1, x2, y2])
+        geometry = geometry_from_contour(contour, (w, h)) if contour is not None else None
+        info.update(
+            mode="fast" if scale < 1.0 else "full",
+            scale=scale,
+            found=geometry is not None,
+            ms=round((time.perf_counter() - start) * 1000, 2),
+        )
+        self.last_table_detection = info
+        logger.debug(
+            "table_detect mode=%s scale=%.2f found=%s cloth_ratio=%.3f contours=%d area=%.0f min_area=%s ms=%.2f",
+            info["mode"], scale, info["found"], info["cloth_ratio"], info["contours"],
+            info["area"], config.TABLE_MIN_AREA, info["ms"],
+        )
+        return geometry
 
-        print(f"🔄 Using fallback table: x={x}, y={y}, w={w_table}, h={h_table}")
-        return True, [x, y, w_table, h_table]
+    def detect_table(self, frame: np.ndarray) -> Tuple[bool, Optional[List[int]]]:
+        """
+        使用 HSV 綠色檢測找出球桌區域，並發布給所有消費者
+        返回: (成功與否, 球桌bbox [x,y,w,h])
+        """
+        geometry = self._detect_table_geometry(frame)
+        if geometry is None:
+            # 備用方案：如果找不到綠色區域，使用整個畫面（排除 50px 邊緣）
+            logger.warning("⚠️  No green table found, using entire frame as fallback")
+            h, w = frame.shape[:2]
+            geometry = fallback_geometry((w, h))
+
+        geometry = self.geometry.publish(geometry, frame)
+        self._apply_table_geometry(geometry)
+
+        x, y, w, h = geometry.roi
+        if geometry.source == "fallback":
+            logger.warning("🔄 Using fallback table: x=%d, y=%d, w=%d, h=%d", x, y, w, h)
+        else:
+            logger.info("✅ Table detected: x=%d, y=%d, w=%d, h=%d", x, y, w, h)
+        return True, list(geometry.roi)
+
+    def _on_table_geometry(self, geometry: Optional[TableGeometry]):
+        """TableGeometryService listener：可能在背景線程呼叫，下一幀才套用"""
+        self._pending_geometry = geometry
+
+    def _apply_table_geometry(self, geometry: TableGeometry):
+        self.table_geometry = geometry
+        self.table_roi = list(geometry.roi)
+        # 6 個球袋中心點（全圖座標）
+        self.holes = [list(p) for p in geometry.pockets]
+        self.table_space = TableSpace.from_geometry(geometry)
+
+    def _reset_table(self):
+        self.geometry.invalidate()
+        self._pending_geometry = None
+        self.table_geometry = None
+        self.table_roi = None
+        self.holes = []
+        self.table_space = None
 
     # ==================== 主處理函式 ====================
     def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, Dict[str, Any]]:
@@ -231,75 +258,109 @@ class PoolTracker:
         4. 解析球體並進行物理預測
         5. 繪製結果
         """
-        # 1. 檢查球桌
+        # 1. 檢查球桌（背景漂移檢查發布的新幾何在幀與幀之間套用）
+        pending = self._pending_geometry
+        if pending is not None and pending is not self.table_geometry:
+            self._apply_table_geometry(pending)
+
         if not self.table_roi:
-            success, _ = self.detect_table(frame)
+            with profiler.stage("track.detect_table"):
+                success, _ = self.detect_table(frame)
             if not success:
                 print("⚠️  Table not detected, scanning...")
                 return frame, {"status": "scanning_table"}
-            else:
-                print(f"✅ Table detected: {self.table_roi}")
 
-        # 2. 裁切 ROI
+        # 2. 裁切 ROI（rectified_roi 時為校正後只含桌面的畫面）
         assert self.table_roi is not None
         tx, ty, tw, th = self.table_roi
-        roi_img = frame[ty:ty+th, tx:tx+tw].copy()
+        space = self.table_space if self.rectified_roi else None
+        rectified = space is not None
+        with profiler.stage("track.roi_crop"):
+            if space is not None:
+                roi_img = space.rectify(frame)
+            else:
+                roi_img = frame[ty:ty+th, tx:tx+tw].copy()
 
         # 3. YOLO 推論
-        results = self.model.predict(
-            roi_img,
-            imgsz=config.IMG_SIZE,
-            conf=self.conf_thr,
-            iou=self.iou_thr,
-            verbose=False,
-            stream=False
-        )
+        with profiler.stage("track.inference"):
+            results = self.model.predict(
+                roi_img,
+                imgsz=config.IMG_SIZE,
+                conf=self.conf_thr,
+                iou=self.iou_thr,
+                verbose=False,
+                stream=False
+            )
 
-        # 4. 解析球體
-        data_packet = self._analyze_balls(results, roi_img, offset=(tx, ty))
+        # 4. 解析球體（含顏色分類、物理預測）
+        with profiler.stage("track.analyze"):
+            data_packet = self._analyze_balls(results, roi_img, offset=(tx, ty), rectified=rectified)
 
         # 5. 繪製到原圖
-        final_frame = frame.copy()
-        self._draw_annotations(final_frame, data_packet)
+        with profiler.stage("track.draw"):
+            final_frame = frame.copy()
+            self._draw_annotations(final_frame, data_packet)
 
         return final_frame, data_packet
 
     # ==================== 球體解析 ====================
-    def _analyze_balls(self, results, roi_img: np.ndarray, offset: Tuple[int, int]) -> Dict[str, Any]:
+    def _analyze_balls(
+        self,
+        results,
+        roi_img: np.ndarray,
+        offset: Tuple[int, int],
+        rectified: bool = False,
+    ) -> Dict[str, Any]:
         """
         整合 poolShotPredictor.py 的 machinelearning() 邏輯
+
+        框換回相機座標（數據包、繪製），球心換到球桌座標（物理預測）；rectified 時 roi_img 為校正後的桌面畫面
         """
         tx, ty = offset
-        white_balls: List[List] = []
-        color_balls: List[List] = []
-        cue_pos: Optional[List[int]] = None
-        cue_center: Optional[Tuple[int, int]] = None
+        space = self.table_space
 
-        # 收集所有球體
+        # 收集所有偵測框（roi_img 座標）
+        detections = []
         for r in results:
-            boxes = r.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
-                w, h = x2 - x1, y2 - y1
-                conf = float(box.conf[0])
+            for box in r.boxes:
                 cls_id = int(box.cls[0])
-                label = self.model.names[cls_id]
+                detections.append((self.model.names[cls_id], float(box.conf[0]), [float(v) for v in box.xyxy[0]]))
+        roi_boxes = np.array([d[2] for d in detections], dtype=np.float32).reshape(-1, 4)
+
+        # 轉換為全圖座標
+        if rectified and space is not None and len(roi_boxes):
+            # 校正畫面的框四角 → 相機座標外接矩形（一次轉換）
+            corners = roi_boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 2) / space.px_per_mm
+            projected = space.image_points(corners).reshape(-1, 4, 2)
+            image_boxes = np.concatenate([projected.min(axis=1), projected.max(axis=1)], axis=1)
+        else:
+            image_boxes = roi_boxes + np.array([tx, ty, tx, ty], dtype=np.float32)
 
-                # 轉換為全圖座標
-                gx, gy = x1 + tx, y1 + ty
+        white_balls: List[List] = []
+        color_balls: List[List] = []
+        cue_pos: Optional[List[int]] = None
+        cue_center: Optional[Tuple[int, int]] = None
 
-                if label == "white-ball":
-                    white_balls.append([gx, gy, w, h, conf])
-                elif label == "color-ball":
-                    radius = max(1, min(w, h) // 2)
-                    # 執行 HSV 顏色檢測
-                    color_info = self._detect_ball_color_hsv(roi_img, [x1, y1, w, h])
+        for (label, conf, roi_box), image_box in zip(detections, image_boxes):
+            gx, gy, x2, y2 = map(int, image_box)
+            w, h = x2 - gx, y2 - gy
+
+            if label == "white-ball":
+                white_balls.append([gx, gy, w, h, conf])
+            elif label == "color-ball":
+                radius = max(1, min(w, h) // 2)
+                # 執行 HSV 顏色檢測（roi_img 座標）
+                x1, y1 = int(roi_box[0]), int(roi_box[1])
+                with profiler.stage("track.color_classify"):
+                    color_info = self._detect_ball_color_hsv(
+                        roi_img, [x1, y1, int(roi_box[2]) - x1, int(roi_box[3]) - y1]
+                    )
                     ball_num = self._classify_ball_number(color_info)
 
-                    color_balls.append([gx, gy, w, h, radius, conf, color_info, ball_num])
-                elif label == "cue" and not cue_pos:
-                    cue_pos = [gx, gy, w, h]
-                    cue_center = (gx + w // 2, gy + h // 2)
+                color_balls.append([gx, gy, w, h, radius, conf, color_info, ball_num])
+            elif label == "cue" and not cue_pos:
+                cue_pos = [gx, gy, w, h]
+                cue_center = (gx + w // 2, gy + h // 2)
 
         # 選擇主要白球（信心度最高）
         white_primary: Optional[List[int]] = None
@@ -324,28 +385,53 @@ class PoolTracker:
 
             color_primary = color_balls[0]
 
-        # 執行物理預測
-        prediction_result = None
-        aim_assist_data = None # Initialize aim_assist_data
+        shot_point = None
         if white_primary and color_primary and cue_pos:
             shot_point = self._find_shot_point(cue_pos, white_primary)
-            prediction_result = self._pool_shot_prediction(shot_point, white_primary, color_primary)
+
+        # 球心（含擊球點）→ 球桌座標：一次轉換
+        table_points = None
+        if space is not None:
+            centers = [[b[0] + b[2] / 2, b[1] + b[3] / 2] for b in color_balls]
+            if white_primary:
+                centers.append([white_primary[0] + white_primary[2] / 2, white_primary[1] + white_primary[3] / 2])
+            if shot_point:
+                centers.append(shot_point)
+            table_points = space.table_points(centers)
+
+        # 執行物理預測（球桌座標）
+        prediction_result = None
+        aim_assist_data = None
+        white_table = None
+        if table_points is not None and white_primary:
+            white_table = table_points[len(color_balls)]
+        if shot_point and table_points is not None and white_table is not None:
+            with profiler.stage("track.prediction"):
+                # 白球射線最先碰到的彩球為目標球；都沒碰到時沿用上面選出的主要彩球
+                shot_table = table_points[-1]
+                target = self._first_collision(white_table, white_table - shot_table, table_points[:len(color_balls)])
+                target = 0 if target is None else target
+                color_table = table_points[target]
+                prediction_result = self._pool_shot_prediction(
+                    shot_table, white_table, color_table, color_balls[target]
+                )
             # 瞄準輔助數據 (如果啟用)
-            aim_assist_data = None  # ✅ 預設值
-            if self.aim_assist_enabled and cue_pos and target_ball: # Assuming target_ball, cue_ball, pockets, obstacles are defined elsewhere or will be added
+            if self.aim_assist_enabled:
                 try:
-                    aim_assist_data = self._calculate_aim_assist(
-                        cue_ball, target_ball, pockets, obstacles
-                    )
+                    aim_assist_data = self._calculate_aim_assist(white_table, color_table)
                 except Exception as e:
                     print(f"⚠️ Aim assist calculation error: {e}")
                     aim_assist_data = None
 
+        def table_pos(point):
+            return [round(float(point[0]), 1), round(float(point[1]), 1)] if point is not None else None
+
         # 構造回傳數據包（遵照 v1.5 規範）
         return {
             "timestamp": time.time(),
             "status": "analyzing",
             "white_ball": white_primary,
+            "white_table_pos": table_pos(white_table),
             "balls": [
                 {
                     "x": ball[0],
@@ -357,14 +443,19 @@ class PoolTracker:
                     "color": ball[6].get("label", "Unknown"),
                     "style": ball[6].get("style", "Unknown"),
                     "number": ball[7],
+                    "table_pos": table_pos(table_points[i] if table_points is not None else None),
                 }
-                for ball in color_balls
+                for i, ball in enumerate(color_balls)
             ],
             "cue": cue_pos,
             "prediction": prediction_result,
             "aim_assist": aim_assist_data,
             "table_roi": self.table_roi,
             "holes": self.holes,
+            "table_corners": self.table_geometry.to_dict()["corners"] if self.table_geometry else None,
+            "pocket_radius": self.table_geometry.pocket_radius if self.table_geometry else None,
+            "table_version": self.table_geometry.version if self.table_geometry else None,
+            "table_size_mm": list(space.size) if space is not None else None,
         }
 
     # ==================== HSV 顏色檢測 (from poolShotPredictor.py) ====================
@@ -537,179 +628,110 @@ class PoolTracker:
             cosinus = 0
         return sinus, cosinus
 
-    def _find_line(self, p1: List[int], p2: List[int]) -> Tuple[Optional[float], float]:
-        """計算兩點間直線的斜率和截距"""
-        x1, y1 = p1
-        x2, y2 = p2
-        try:
-            m = (y2 - y1) / (x2 - x1)
-        except ZeroDivisionError:
-            m = (y2 - y1) / (x2 - x1 + 1)
-        c = y1 - (m * x1)
-        return m, c
-
-    def _collision(self, white_ball: List[int], color_ball: List) -> Tuple[bool, List[int]]:
-        """檢測白球與彩球碰撞"""
-        white_ball_list = []
-        color_ball_list = []
-
-        # 白球周圍點
-        radius = (white_ball[2] - white_ball[0]) // 2
-        LX = white_ball[0] + (white_ball[2] - white_ball[0]) // 2
-        LY = white_ball[1] + (white_ball[3] - white_ball[1]) // 2
-        for the in range(0, 360):
-            sinus, cosinus = self._find_angle(the)
-            DX = int(cosinus * radius)
-            DY = int(sinus * radius)
-            white_ball_list.append([LX + DX, LY + DY])
-
-        # 彩球周圍點
-        radius = color_ball[4]
-        LX = color_ball[0] + color_ball[2] // 2
-        LY = color_ball[1] + color_ball[3] // 2
-        for the in range(0, 360):
-            sinus, cosinus = self._find_angle(the)
-            DX = int(cosinus * radius)
-            DY = int(sinus * radius)
-            color_ball_list.append([LX + DX, LY + DY])
-
-        # 找交集
-        colls_points = []
-        for point in white_ball_list:
-            if point in color_ball_list:
-                colls_points.append(point)
-
-        if len(colls_points) > 0:
-            xPoint = sum(p[0] for p in colls_points) // len(colls_points)
-            yPoint = sum(p[1] for p in colls_points) // len(colls_points)
-            return True, [xPoint, yPoint]
-
-        return False, []
+    def _collision(
+        self,
+        white: np.ndarray,
+        direction: np.ndarray,
+        target: np.ndarray,
+    ) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        白球沿射線前進，兩球球心距離為一顆球直徑時碰撞（球桌座標）
 
-    def _bounce_detection(self, point: List[int], radius: int) -> Tuple[Tuple[int, int, int], bool]:
-        """檢測球是否進袋"""
-        color = (80, 145, 75)
-        in_hole = False
-
-        for hole in self.hole_bboxes:
-            p = point[0] - radius
-            q = point[1] - radius
-            r = point[0] + radius
-            s = point[1] + radius
-            if p >= hole[0] and q >= hole[1] and r <= hole[2] and s <= hole[3]:
-                in_hole = True
-                color = (80, 145, 75)
-                break
-
-        return color, in_hole
-
-    def _path_line(self, colls_point: List[int], color_ball: List, paths: List[List[int]]) -> Tuple[List[List[int]], Tuple, bool]:
-        """計算彩球反彈路徑"""
+        Returns:
+            (是否碰撞, 碰撞點：兩球接觸點)
+        """
+        assert self.table_space is not None
+        contact_dist = 2 * self.table_space.ball_radius
+        norm = float(np.hypot(*direction))
+        if norm == 0:
+            return False, None
+        d = direction / norm
+        to_target = target - white
+        along = float(to_target @ d)
+        miss2 = float(to_target @ to_target) - along * along
+        if along <= 0 or miss2 > contact_dist * contact_dist:
+            return False, None
+
+        # 碰撞瞬間的白球球心（ghost ball），接觸點在兩球心中點
+        ghost = white + d * max(0.0, along - math.sqrt(contact_dist * contact_dist - miss2))
+        return True, (ghost + target) / 2
+
+    def _first_collision(self, white: np.ndarray, direction: np.ndarray, targets: np.ndarray) -> Optional[int]:
+        """白球射線最先碰到的球（targets 索引）；都沒碰到為 None"""
+        first, first_dist = None, math.inf
+        for i, target in enumerate(targets):
+            colls, colls_point = self._collision(white, direction, target)
+            if colls and colls_point is not None:
+                dist = float(np.hypot(*(colls_point - white)))
+                if dist < first_dist:
+                    first, first_dist = i, dist
+        return first
+
+    def _bounce_detection(self, start: np.ndarray, end: np.ndarray) -> Tuple[Tuple[int, int, int], Optional[int]]:
+        """檢測球沿線段（球桌座標）是否進袋；回傳 (路徑顏色, 球袋索引或 None)"""
         color = (80, 145, 75)
-        in_hole = False
-
-        color_ball_center = [color_ball[0] + color_ball[2] // 2, color_ball[1] + color_ball[3] // 2]
-        m2, c2 = self._find_line(colls_point, color_ball_center)
-
-        if not self.table_rects:
-            return paths, color, in_hole
-
-        for rects in self.table_rects:
-            if colls_point[0] > color_ball_center[0]:
-                xLast = rects[0] + 40
-            else:
-                xLast = rects[0] + rects[2] - 40
-
-            for i in range(0, 2):  # 最多反彈2次
-                x2 = xLast
-                y2 = int((m2 * x2) + c2)
-
-                # 邊界限制
-                if y2 >= rects[1] + rects[3] - 40:
-                    y2 = rects[1] + rects[3] - 40
-                    x2 = int((y2 - c2) / m2) if m2 != 0 else x2
-                if y2 <= rects[1] + 40:
-                    y2 = rects[1] + 40
-                    x2 = int((y2 - c2) / m2) if m2 != 0 else x2
-                if x2 >= rects[0] + rects[2] - 40:
-                    x2 = rects[0] + rects[2] - 40
-                    y2 = int((m2 * x2) + c2)
-                    xLast = rects[0] + 40
-                if x2 <= rects[0] + 40:
-                    x2 = rects[0] + 40
-                    y2 = int((m2 * x2) + c2)
-                    xLast = rects[0] + rects[2] - 40
-
-                paths.append([x2, y2])
-                color, in_hole = self._bounce_detection(paths[-1], 6)
-
-                if in_hole:
-                    return paths, color, in_hole
-                else:
-                    m2 = -m2
-                    c2 = y2 - (m2 * x2)
+        assert self.table_space is not None
+        return color, self.table_space.pocket_on_segment(start, end)
 
-        return paths, color, in_hole
+    def _path_line(self, colls_point: np.ndarray, color_center: np.ndarray) -> Tuple[np.ndarray, Tuple, bool]:
+        """計算彩球反彈路徑（球桌座標，最多反彈 1 次，經過袋口即進袋）"""
+        assert self.table_space is not None
+        color = (80, 145, 75)
+        paths = self.table_space.cushion_path(color_center, color_center - colls_point, bounces=1)
+
+        for i in range(len(paths) - 1):
+            color, pocket = self._bounce_detection(paths[i], paths[i + 1])
+            if pocket is not None:
+                return np.vstack([paths[:i + 1], self.table_space.pockets[pocket:pocket + 1]]), color, True
+
+        return paths, color, False
+
+    def _pool_shot_prediction(
+        self,
+        shot_point: np.ndarray,
+        white_ball: np.ndarray,
+        color_ball: np.ndarray,
+        color_meta: List,
+    ) -> Optional[Dict]:
+        """
+        完整的撞球預測邏輯（球桌座標）
 
-    def _pool_shot_prediction(self, shot_point: List[int], white_ball: List[int], color_ball: List) -> Optional[Dict]:
-        """完整的撞球預測邏輯"""
+        Args:
+            shot_point / white_ball / color_ball: 擊球點、白球球心、彩球球心（公釐）
+            color_meta: 彩球偵測資料（顏色、球號）
+        """
+        space = self.table_space
+        if space is None:
+            return None
         try:
-            # 1. 白球射線方程
-            m1, c1 = self._find_line(
-                shot_point,
-                [white_ball[0] + white_ball[2] // 2, white_ball[1] + white_ball[3] // 2]
-            )
+            # 1. 白球射線（擊球點 → 白球）與彩球碰撞
+            colls, colls_point = self._collision(white_ball, white_ball - shot_point, color_ball)
+            if not colls or colls_point is None:
+                return None
+
+            # 2. 計算彩球路徑
+            paths, color_result, in_hole = self._path_line(colls_point, color_ball)
+
+            # 3. 換回相機座標（繪製 / 數據包）
+            image_points = space.image_int_points(np.vstack([colls_point[None], paths]))
+
+            # 4. 取得彩球顏色資訊
+            ball_color_info = color_meta[6] if len(color_meta) > 6 else {"label": "Unknown", "style": "Unknown"}
+            ball_number = color_meta[7] if len(color_meta) > 7 else None
+
+            return {
+                "prediction": in_hole,
+                "paths": image_points[1:],
+                "color": color_result,
+                "collision_point": image_points[0],
+                "ball_color": f"{ball_color_info.get('label', 'Unknown')} - {ball_color_info.get('style', 'Unknown')}",
+                "ball_number": ball_number,
+                "ball_color_meta": ball_color_info,
+            }
 
-            points = []
-            xLast = color_ball[0] + color_ball[2] // 2
-            section = 1 if xLast >= white_ball[0] + white_ball[2] // 2 else -1
-
-            for x in range(white_ball[0] + white_ball[2] // 2, xLast, section):
-                y = int((m1 * x) + c1)
-                points.append([x, y])
-
-            # 2. 碰撞檢測
-            for point in points:
-                p = point[0] - white_ball[2] // 2
-                q = point[1] - white_ball[3] // 2
-                r = point[0] + white_ball[2] // 2
-                s = point[1] + white_ball[3] // 2
-                box = [p, q, r, s]
-
-                color_ball_point = [
-                    color_ball[0],
-                    color_ball[1],
-                    color_ball[0] + color_ball[2],
-                    color_ball[1] + color_ball[3],
-                    color_ball[4] if len(color_ball) > 4 else 0
-                ]
-
-                colls, colls_point = self._collision(box, color_ball_point)
-
-                if colls:
-                    # 3. 計算彩球路徑
-                    paths = [[color_ball[0] + color_ball[2] // 2, color_ball[1] + color_ball[3] // 2]]
-                    paths, color_result, in_hole = self._path_line(colls_point, color_ball, paths)
-
-                    # 4. 取得彩球顏色資訊
-                    ball_color_info = color_ball[6] if len(color_ball) > 6 else {"label": "Unknown", "style": "Unknown"}
-                    ball_number = color_ball[7] if len(color_ball) > 7 else None
-
-                    return {
-                        "prediction": in_hole,
-                        "paths": paths,
-                        "color": color_result,
-                        "collision_point": colls_point,
-                        "ball_color": f"{ball_color_info.get('label', 'Unknown')} - {ball_color_info.get('style', 'Unknown')}",
-                        "ball_number": ball_number,
-                        "ball_color_meta": ball_color_info,
-                    }
-
-        except (TypeError, IndexError, ZeroDivisionError) as e:
+        except (TypeError, IndexError, ValueError) as e:
             print(f"⚠️ Prediction error: {e}")
             return None
-
-        return None
     
     def _calculate_bank_shot(
         self, 
@@ -717,133 +739,38 @@ class PoolTracker:
         ball_velocity: List[float],  # [vx, vy] 速度向量
     ) -> List[List[int]]:
         """
-        計算反彈路徑 (最多3次反彈)
+        計算反彈路徑（最多碰庫 3 次：反彈 2 次，終點為第 3 次碰庫點），於球桌座標計算，庫邊為球桌內縮一個球半徑
         
         Args:
-            ball_pos: 球心位置 [cx, cy]
-            ball_velocity: 速度向量 [vx, vy]
+            ball_pos: 球心位置 [cx, cy]（相機座標）
+            ball_velocity: 速度向量 [vx, vy]（相機座標）
         
         Returns:
-            路徑點列表 [[x1,y1], [x2,y2], [x3,y3], ...]
+            路徑點列表 [[x1,y1], [x2,y2], [x3,y3], ...]（相機座標）
         """
-        if not self.table_roi:
-            return [[ball_pos[0], ball_pos[1]]]
-        
-        # 球桌邊界
-        tx, ty, tw, th = self.table_roi
-        x1, y1 = tx + 25, ty + 25  # 內縮邊界
-        x2, y2 = tx + tw - 25, ty + th - 25
-        
+        space = self.table_space
         cx, cy = ball_pos
         vx, vy = ball_velocity
-        
-        # 正規化速度向量
         v_mag = math.sqrt(vx*vx + vy*vy)
-        if v_mag == 0:
+        if space is None or v_mag == 0:
             return [[cx, cy]]
-        vx, vy = vx/v_mag, vy/v_mag
-        
-        path = [[cx, cy]]
-        max_bounces = 3  # 最多3次反彈
-        bounce_count = 0
-        
-        # 當前位置和速度
-        curr_x, curr_y = float(cx), float(cy)
-        curr_vx, curr_vy = vx, vy
-        
-        while bounce_count < max_bounces:
-            # 計算下一個碰撞點
-            t_min = float('inf')
-            hit_wall = None
-            
-            # 上邊界 (y = y1)
-            if curr_vy < 0:
-                t = (y1 - curr_y) / curr_vy
-                if t > 0 and t < t_min:
-                    hit_x = curr_x + curr_vx * t
-                    if x1 <= hit_x <= x2:
-                        t_min = t
-                        hit_wall = 'top'
-            
-            # 下邊界 (y = y2)
-            if curr_vy > 0:
-                t = (y2 - curr_y) / curr_vy
-                if t > 0 and t < t_min:
-                    hit_x = curr_x + curr_vx * t
-                    if x1 <= hit_x <= x2:
-                        t_min = t
-                        hit_wall = 'bottom'
-            
-            # 左邊界 (x = x1)
-            if curr_vx < 0:
-                t = (x1 - curr_x) / curr_vx
-                if t > 0 and t < t_min:
-                    hit_y = curr_y + curr_vy * t
-                    if y1 <= hit_y <= y2:
-                        t_min = t
-                        hit_wall = 'left'
-            
-            # 右邊界 (x = x2)
-            if curr_vx > 0:
-                t = (x2 - curr_x) / curr_vx
-                if t > 0 and t < t_min:
-                    hit_y = curr_y + curr_vy * t
-                    if y1 <= hit_y <= y2:
-                        t_min = t
-                        hit_wall = 'right'
-            
-            if hit_wall is None or t_min == float('inf'):
-                # 沒有碰撞,直接延伸一段距離後結束
-                extend_dist = 200
-                end_x = int(curr_x + curr_vx * extend_dist)
-                end_y = int(curr_y + curr_vy * extend_dist)
-                # 確保不超出邊界
-                end_x = max(x1, min(x2, end_x))
-                end_y = max(y1, min(y2, end_y))
-                path.append([end_x, end_y])
-                break
-            
-            # 計算碰撞點
-            bounce_x = curr_x + curr_vx * t_min
-            bounce_y = curr_y + curr_vy * t_min
-            path.append([int(bounce_x), int(bounce_y)])
-            
-            # 更新位置
-            curr_x, curr_y = bounce_x, bounce_y
-            
-            # 反彈: 反轉對應方向的速度
-            if hit_wall in ['top', 'bottom']:
-                curr_vy = -curr_vy
-            else:  # left, right
-                curr_vx = -curr_vx
-            
-            bounce_count += 1
-            
-            # 添加反彈後的一小段路徑
-            extend_dist = 150
-            end_x = int(curr_x + curr_vx * extend_dist)
-            end_y = int(curr_y + curr_vy * extend_dist)
-            # 確保不超出邊界
-            end_x = max(x1, min(x2, end_x))
-            end_y = max(y1, min(y2, end_y))
-            
-            if bounce_count < max_bounces:
-                # 不是最後一次,繼續計算
-                path.append([end_x, end_y])
-        
-        return path
+
+        # 起點與前方一點一起換到球桌座標，透視下的方向才正確
+        start, ahead = space.table_points([[cx, cy], [cx + vx / v_mag * 10, cy + vy / v_mag * 10]])
+        path = space.cushion_path(start, ahead - start, bounces=2)
+        return space.image_int_points(path)
     
     def _calculate_aim_assist(
         self, 
-        white_ball: Dict[str, int], 
-        target_ball: Dict[str, Any]
+        white_ball: np.ndarray,
+        target_ball: np.ndarray,
     ) -> Optional[Dict[str, Any]]:
         """
-        計算瞄準輔助線 (類似 8 Ball Pool)
+        計算瞄準輔助線 (類似 8 Ball Pool)，於球桌座標計算，角度不受相機傾斜影響
         
         Args:
-            white_ball: 母球 bbox {x, y, w, h}
-            target_ball: 目標球 {x, y, w, h, radius}
+            white_ball: 母球球心（球桌座標，公釐）
+            target_ball: 目標球球心（球桌座標，公釐）
         
         Returns:
             {
@@ -854,85 +781,43 @@ class PoolTracker:
                 "success_probability": 0.85,           # 成功率
                 "cut_angle": 30.0                      # 切球角度 (度)
             }
+            點皆為相機座標
         """
-        if not self.holes:
+        space = self.table_space
+        if space is None or not self.holes:
             return None
         
-        # 1. 計算球心
-        white_cx = white_ball['x'] + white_ball['w'] // 2
-        white_cy = white_ball['y'] + white_ball['h'] // 2
-        
-        target_cx = target_ball['x'] + target_ball['w'] // 2
-        target_cy = target_ball['y'] + target_ball['h'] // 2
-        target_r = target_ball.get('radius', target_ball['w'] // 2)
-        
-        # 2. 找到最近的洞口
-        min_dist = float('inf')
-        nearest_hole = None
-        
-        for hole in self.holes:
-            dx = hole[0] - target_cx
-            dy = hole[1] - target_cy
-            dist = math.sqrt(dx*dx + dy*dy)
-            
-            if dist < min_dist:
-                min_dist = dist
-                nearest_hole = hole
-        
-        if not nearest_hole:
-            return None
-        
-        # 3. 計算目標球→洞口的方向向量
-        hole_dx = nearest_hole[0] - target_cx
-        hole_dy = nearest_hole[1] - target_cy
-        hole_dist = math.sqrt(hole_dx*hole_dx + hole_dy*hole_dy)
-        
+        # 1. 找到最近的洞口
+        hole_index, hole_dist = space.nearest_pocket(target_ball)
         if hole_dist == 0:
             return None
         
-        # 正規化方向向量
-        hole_dir_x = hole_dx / hole_dist
-        hole_dir_y = hole_dy / hole_dist
-        
-        # 4. 計算撞擊點 (目標球背面,沿反方向一個球半徑)
-        impact_x = target_cx - hole_dir_x * target_r
-        impact_y = target_cy - hole_dir_y * target_r
+        # 2. 目標球→洞口的方向向量（正規化）
+        hole_dir = (space.pockets[hole_index] - target_ball) / hole_dist
         
-        # 5. 計算切球角度
-        white_to_target_dx = target_cx - white_cx
-        white_to_target_dy = target_cy - white_cy
-        white_to_target_dist = math.sqrt(
-            white_to_target_dx*white_to_target_dx + 
-            white_to_target_dy*white_to_target_dy
-        )
+        # 3. 計算撞擊點 (目標球背面,沿反方向一個球半徑)
+        impact = target_ball - hole_dir * space.ball_radius
         
+        # 4. 計算切球角度
+        white_to_target = target_ball - white_ball
+        white_to_target_dist = float(np.hypot(*white_to_target))
         if white_to_target_dist == 0:
             return None
         
-        # 計算夾角 (點積 / 模長乘積)
-        cos_angle = (
-            white_to_target_dx * hole_dir_x + 
-            white_to_target_dy * hole_dir_y
-        ) / white_to_target_dist
+        # 計算夾角 (點積 / 模長乘積)，防止數值誤差
+        cos_angle = max(-1.0, min(1.0, float(white_to_target @ hole_dir) / white_to_target_dist))
+        cut_angle_deg = math.degrees(math.acos(cos_angle))
         
-        # 防止數值誤差
-        cos_angle = max(-1.0, min(1.0, cos_angle))
-        cut_angle_rad = math.acos(cos_angle)
-        cut_angle_deg = math.degrees(cut_angle_rad)
-        
-        # 6. 計算成功率 (角度越小越容易進)
+        # 5. 計算成功率 (角度越小越容易進)
         success_prob = max(0.0, (90.0 - cut_angle_deg) / 90.0)
         
+        # 6. 換回相機座標
+        white_px, target_px, impact_px = space.image_int_points([white_ball, target_ball, impact])
+        nearest_hole = self.holes[hole_index]
         return {
-            "cue_to_target": [
-                [white_cx, white_cy],
-                [int(impact_x), int(impact_y)]
-            ],
-            "target_to_hole": [
-                [target_cx, target_cy],
-                nearest_hole
-            ],
-            "impact_point": [int(impact_x), int(impact_y)],
+            "cue_to_target": [white_px, impact_px],
+            "target_to_hole": [target_px, nearest_hole],
+            "impact_point": impact_px,
             "target_hole": nearest_hole,
             "success_probability": round(success_prob, 2),
             "cut_angle": round(cut_angle_deg, 1)
@@ -1044,14 +929,18 @@ class PoolTracker:
     # ==================== 繪製結果 ====================
     def _draw_annotations(self, img: np.ndarray, data: Dict[str, Any]):
         """在影像上繪製所有標註"""
-        # 1. 繪製球桌框
-        if self.table_roi:
+        # 1. 繪製球桌框（實際四角）
+        geometry = self.table_geometry
+        if geometry is not None:
+            cv2.polylines(img, [np.round(geometry.corners).astype(np.int32)], True, (0, 255, 0), 2)
+        elif self.table_roi:
             tx, ty, tw, th = self.table_roi
             cv2.rectangle(img, (tx, ty), (tx + tw, ty + th), (0, 255, 0), 2)
 
         # 2. 繪製球袋
+        pocket_radius = geometry.pocket_radius if geometry is not None else 50
         for hole in self.holes:
-            cv2.circle(img, tuple(hole), 50, (255, 0, 0), 2)
+            cv2.circle(img, tuple(hole), pocket_radius, (255, 0, 0), 2)
 
         # 3. 繪製白球
         if data.get("white_ball"):